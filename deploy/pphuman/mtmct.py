@@ -14,6 +14,7 @@
 
 import motmetrics as mm
 from pptracking.python.mot.visualize import plot_tracking
+from python.video_sink import VideoSink
 import os
 import re
 import cv2
@@ -121,8 +122,7 @@ def save_mtmct_vis_results(camera_results, captures, output_dir):
         height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fps = int(capture.get(cv2.CAP_PROP_FPS))
         frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
-        fourcc = cv2.VideoWriter_fourcc(* 'mp4v')
-        writer = cv2.VideoWriter(out_path, fourcc, fps, (width, height))
+        writer = VideoSink(out_path, fps)
         frame_id = 0
         while (1):
             if frame_id % 50 == 0:
@@ -188,11 +188,8 @@ def get_dist_mat(x, y, func_name="euclidean"):
 
 
 def intracam_ignore(st_mask, cid_tids):
-    count = len(cid_tids)
-    for i in range(count):
-        for j in range(count):
-            if cid_tids[i][1] == cid_tids[j][1]:
-                st_mask[i, j] = 0.
+    cids = np.array([cid_tid[1] for cid_tid in cid_tids])
+    st_mask[cids[:, None] == cids[None, :]] = 0.
     return st_mask
 
 
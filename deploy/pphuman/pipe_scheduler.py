@@ -0,0 +1,564 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import copy
+import time
+import queue
+import threading
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+# add deploy path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 2)))
+sys.path.insert(0, parent_path)
+# trackers of pptracking are imported as `mot` package
+sys.path.insert(0, os.path.join(parent_path, 'pptracking', 'python'))
+
+from python.infer import queue_put, queue_get
+from python.keypoint_postprocess import translate_to_ori_images
+from python.action_utils import KeyPointBuff, ActionVisualHelper
+from python.video_sink import VideoSink
+from mot.tracker.base_jde_tracker import BaseTrack
+from mot.utils import flow_statistic
+
+from datacollector import DataCollector, Result
+from pipe_utils import crop_image_with_mot, parse_mot_res, parse_mot_keypoint
+from pipe_utils import AttrResultCache, CropBatcher
+
+__all__ = ['StreamContext', 'FrameTask', 'StageScheduler']
+
+# marks the end of the input of a stage
+END = object()
+
+
+class StreamContext(object):
+    """
+    States of one video source served by StageScheduler, models are shared
+    by all streams, while tracker, flow statistic, keypoint buffer and
+    results are kept per stream.
+
+    Args:
+        stream_id (int): index of the stream
+        source (str|int): path of video file or device id of camera
+        predictor (PipePredictor): predictor which holds the models
+    """
+
+    def __init__(self, stream_id, source, predictor):
+        self.stream_id = stream_id
+        self.source = source
+        self.capture = cv2.VideoCapture(source)
+        if isinstance(source, str):
+            self.file_name = os.path.split(source)[-1]
+            video_out_name = self.file_name
+        else:
+            # use camera id
+            self.file_name = None
+            video_out_name = 'output_{}.mp4'.format(source)
+
+        self.width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = int(self.capture.get(cv2.CAP_PROP_FPS))
+        frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        print("stream {}: {}, video fps: {}, frame_count: {}".format(
+            stream_id, source, self.fps, frame_count))
+
+        self.writer = None
+        self.out_path = None
+        if predictor.cfg['visual']:
+            if not os.path.exists(predictor.output_dir):
+                os.makedirs(predictor.output_dir)
+            self.out_path = os.path.join(predictor.output_dir, video_out_name)
+            self.writer = VideoSink(
+                self.out_path, self.fps, scale=predictor.vis_scale)
+
+        # each stream tracks with its own copy of the tracker, track ids of
+        # JDETracker are counted by BaseTrack._count_dict, which is swapped
+        # per stream before tracking
+        self.tracker = copy.deepcopy(predictor.mot_predictor.tracker)
+        self.track_count = defaultdict(int)
+
+        self.center_traj = [{}] if predictor.draw_center_traj else None
+        self.entrance = [0, self.height / 2., self.width, self.height / 2.]
+        self.id_set = set()
+        self.interval_id_set = set()
+        self.in_id_list = list()
+        self.out_id_list = list()
+        self.prev_center = dict()
+        self.records = list()
+
+        if predictor.with_action:
+            action_cfg = predictor.cfg['ACTION']
+            self.kpt_buff = KeyPointBuff(action_cfg['max_frames'])
+            self.action_visual_helper = ActionVisualHelper(action_cfg[
+                'display_frames'])
+
+        if predictor.with_attr:
+            self.attr_cache = AttrResultCache(predictor.cfg['ATTR'].get(
+                'refresh_interval', 1))
+
+        self.pipeline_res = Result()
+        self.collector = DataCollector()
+
+        self.read_num = 0
+        # frames are finished out of order by stage workers, they are
+        # buffered until all previous frames of the stream are finished
+        self.next_frame_id = 0
+        self.reorder_buff = {}
+        self.start_time = None
+        self.done_num = 0
+
+    def release(self):
+        self.capture.release()
+        if self.writer is not None:
+            self.writer.release()
+
+
+class FrameTask(object):
+    """
+    A frame of a stream passing through the stages, results of stages are
+    filled in by the stage workers.
+    """
+
+    def __init__(self, stream, frame_id, frame):
+        self.stream = stream
+        self.frame_id = frame_id
+        self.frame = frame
+        self.mot_res = None
+        self.crops = []
+        self.new_bboxes = []
+        self.ori_bboxes = []
+        self.track_ids = []
+        # crops to predict and extra infos of each stage
+        self.stage_crops = {}
+        self.stage_infos = {}
+        self.attr_res = None
+        self.kpt_res = None
+        self.reid_res = None
+        self.records = None
+        # number of stages which have not finished the task
+        self.pending = 0
+
+
+class StageScheduler(object):
+    """
+    Stage-parallel scheduler of PP-Human pipeline for multiple video sources.
+
+    Every model runs in its own worker thread and consumes tasks from a
+    bounded queue:
+
+        capture (one thread per stream) -> mot -> attr / kpt / reid -> collect
+
+    MOT predicts frame by frame since SDE_Detector only supports batch size
+    1, the crops of tasks in the queue of attr, kpt and reid, which may come
+    from different frames and streams, are batched by CropBatcher. Action
+    recognition, visualization and result collection run in the current
+    thread in the frame order of each stream.
+
+    Args:
+        predictor (PipePredictor): predictor which holds the models
+        sources (list): paths of video files or device ids of cameras
+        queue_size (int): capacity of queues between stages
+    """
+
+    def __init__(self, predictor, sources, queue_size=16):
+        self.predictor = predictor
+        self.cfg = predictor.cfg
+        self.pipe_timer = predictor.pipe_timer
+        self.queue_size = queue_size
+        self.streams = [
+            StreamContext(i, source, predictor)
+            for i, source in enumerate(sources)
+        ]
+
+        self.mot_queue = queue.Queue(maxsize=queue_size)
+        self.done_queue = queue.Queue()
+        self.stage_queues = {}
+        if predictor.with_attr:
+            self.stage_queues['attr'] = queue.Queue(maxsize=queue_size)
+        if predictor.with_action:
+            self.stage_queues['kpt'] = queue.Queue(maxsize=queue_size)
+        if predictor.with_mtmct:
+            self.stage_queues['reid'] = queue.Queue(maxsize=queue_size)
+        self.stage_funcs = {
+            'attr': (self.prepare_attr, self.predict_attr),
+            'kpt': (self.prepare_kpt, self.predict_kpt),
+            'reid': (self.prepare_reid, self.predict_reid)
+        }
+
+        self.stop_event = threading.Event()
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def run(self):
+        """
+        Run all streams until they end.
+
+        Returns:
+            streams (list[StreamContext]): contexts of the streams, results
+                of each stream are collected in `stream.collector`
+        """
+        workers = [
+            threading.Thread(
+                target=self._run_worker,
+                args=(self.capture_frames, stream),
+                daemon=True) for stream in self.streams
+        ]
+        workers.append(
+            threading.Thread(
+                target=self._run_worker, args=(self.track_frames, ),
+                daemon=True))
+        for name in self.stage_queues:
+            workers.append(
+                threading.Thread(
+                    target=self._run_worker,
+                    args=(self.predict_crops, name),
+                    daemon=True))
+
+        self.pipe_timer.total_time.start()
+        start_time = time.time()
+        for stream in self.streams:
+            stream.start_time = start_time
+        for worker in workers:
+            worker.start()
+
+        try:
+            self.collect_frames()
+        finally:
+            self.stop_event.set()
+            for worker in workers:
+                worker.join()
+            self.pipe_timer.total_time.end()
+            for stream in self.streams:
+                stream.release()
+        if len(self.errors) > 0:
+            raise self.errors[0]
+        return self.streams
+
+    def _run_worker(self, func, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            self.errors.append(e)
+            self.stop_event.set()
+
+    def capture_frames(self, stream):
+        while not self.stop_event.is_set():
+            ret, frame = stream.capture.read()
+            if not ret:
+                break
+            task = FrameTask(stream, stream.read_num, frame)
+            stream.read_num += 1
+            queue_put(self.mot_queue, task, self.stop_event)
+        queue_put(self.mot_queue, END, self.stop_event)
+
+    def track_frames(self):
+        mot_predictor = self.predictor.mot_predictor
+        end_num = 0
+        while end_num < len(self.streams):
+            task = queue_get(self.mot_queue, self.stop_event)
+            if task is None:
+                return
+            if task is END:
+                end_num += 1
+                continue
+            self.pipe_timer.record_queue('mot', self.mot_queue.qsize())
+            stream = task.stream
+
+            self.pipe_timer.module_time['mot'].start()
+            mot_predictor.tracker = stream.tracker
+            BaseTrack._count_dict = stream.track_count
+            res = mot_predictor.predict_image([task.frame], visual=False)
+            self.pipe_timer.module_time['mot'].end()
+
+            # mot output format: id, class, score, xmin, ymin, xmax, ymax
+            task.mot_res = parse_mot_res(res)
+
+            # flow_statistic only support single class MOT
+            boxes, scores, ids = res[0]  # batch size = 1 in MOT
+            mot_result = (task.frame_id + 1, boxes[0], scores[0],
+                          ids[0])  # single class
+            statistic = flow_statistic(
+                mot_result, self.predictor.secs_interval,
+                self.predictor.do_entrance_counting, stream.fps,
+                stream.entrance, stream.id_set, stream.interval_id_set,
+                stream.in_id_list, stream.out_id_list, stream.prev_center,
+                stream.records)
+            stream.records = statistic['records']
+            # the stream runs ahead of visualization, keep the record of
+            # this frame, only the last record is drawn
+            task.records = stream.records[-1:]
+
+            stages = []
+            if len(task.mot_res['boxes']) > 0:
+                stages = [name for name in ['attr', 'kpt'] \
+                          if name in self.stage_queues]
+                if 'reid' in self.stage_queues and task.frame_id % 10 == 0:
+                    stages.append('reid')
+            if 'attr' in stages or 'kpt' in stages:
+                task.crops, task.new_bboxes, task.ori_bboxes, task.track_ids = \
+                    crop_image_with_mot(task.frame, task.mot_res, with_ids=True)
+
+            task.pending = len(stages)
+            if task.pending == 0:
+                self.done_queue.put(task)
+            for name in stages:
+                queue_put(self.stage_queues[name], task, self.stop_event)
+
+        for name in self.stage_queues:
+            queue_put(self.stage_queues[name], END, self.stop_event)
+        self.done_queue.put(END)
+
+    def predict_crops(self, name):
+        """
+        Worker of attr, kpt or reid stage. Crops of tasks in the queue, which
+        may come from different frames and streams, are collected by
+        CropBatcher and predicted in one call, when the number of crops
+        reaches the batch size of the model or the max_wait_ms of the model
+        is passed since the first task is taken.
+        """
+        in_queue = self.stage_queues[name]
+        model_cfg = self.cfg[name.upper()]
+        batcher = CropBatcher(model_cfg['batch_size'],
+                              model_cfg.get('max_wait_ms', 0) / 1000.)
+        prepare, predict = self.stage_funcs[name]
+        while not self.stop_event.is_set():
+            time_left = batcher.time_left()
+            try:
+                if time_left is None:
+                    task = in_queue.get(timeout=0.1)
+                elif time_left > 0:
+                    task = in_queue.get(timeout=time_left)
+                else:
+                    task = in_queue.get_nowait()
+            except queue.Empty:
+                time_left = batcher.time_left()
+                if time_left is not None and time_left <= 0:
+                    self._predict_batch(name, predict, batcher.flush())
+                continue
+            if task is END:
+                if len(batcher.tasks) > 0:
+                    self._predict_batch(name, predict, batcher.flush())
+                self.done_queue.put(END)
+                return
+            self.pipe_timer.record_queue(name, in_queue.qsize())
+            batcher.add(task, prepare(task))
+            if batcher.full():
+                self._predict_batch(name, predict, batcher.flush())
+
+    def _predict_batch(self, name, predict, tasks):
+        self.pipe_timer.module_time[name].start()
+        predict(tasks)
+        self.pipe_timer.module_time[name].end()
+        for task in tasks:
+            self._finish(task)
+
+    def _finish(self, task):
+        with self.lock:
+            task.pending -= 1
+            done = task.pending == 0
+        if done:
+            self.done_queue.put(task)
+
+    @staticmethod
+    def _gather(name, tasks):
+        crops, counts = [], []
+        for task in tasks:
+            crops.extend(task.stage_crops[name])
+            counts.append(len(task.stage_crops[name]))
+        return crops, counts
+
+    @staticmethod
+    def _split(items, tasks, counts):
+        start = 0
+        for task, num in zip(tasks, counts):
+            yield task, items[start:start + num]
+            start += num
+
+    def prepare_attr(self, task):
+        # tracks predicted recently reuse cached results, the cache is
+        # looked up in the frame order of the stream
+        holders, crops, new_holders = task.stream.attr_cache.lookup(
+            task.frame_id, task.track_ids, task.crops)
+        task.stage_crops['attr'] = crops
+        task.stage_infos['attr'] = (holders, new_holders)
+        return len(crops)
+
+    def predict_attr(self, tasks):
+        crops, counts = self._gather('attr', tasks)
+        outputs = []
+        if len(crops) > 0:
+            attr_res = self.predictor.attr_predictor.predict_image(
+                crops, visual=False)
+            outputs = attr_res['output']
+        for task, output in self._split(outputs, tasks, counts):
+            holders, new_holders = task.stage_infos['attr']
+            AttrResultCache.fill(new_holders, output)
+            task.attr_res = AttrResultCache.resolve(holders)
+
+    def prepare_kpt(self, task):
+        task.stage_crops['kpt'] = task.crops
+        return len(task.crops)
+
+    def predict_kpt(self, tasks):
+        crops, counts = self._gather('kpt', tasks)
+        if len(crops) > 0:
+            kpt_pred = self.predictor.kpt_predictor.predict_image(
+                crops, visual=False)
+            keypoints = np.asarray(kpt_pred['keypoint'])
+            scores = np.asarray(kpt_pred['score'])
+        start = 0
+        for task, num in zip(tasks, counts):
+            keypoint_vector = []
+            if num > 0:
+                keypoint_vector, score_vector = translate_to_ori_images(
+                    {
+                        'keypoint': keypoints[start:start + num],
+                        'score': scores[start:start + num]
+                    }, np.array(task.new_bboxes))
+            start += num
+            kpt_res = {}
+            kpt_res['keypoint'] = [
+                keypoint_vector.tolist(), score_vector.tolist()
+            ] if len(keypoint_vector) > 0 else [[], []]
+            kpt_res['bbox'] = task.ori_bboxes
+            task.kpt_res = kpt_res
+
+    def prepare_reid(self, task):
+        crop_input, img_qualities, rects = \
+            self.predictor.reid_predictor.crop_image_with_mot(
+                task.frame, task.mot_res)
+        task.stage_crops['reid'] = crop_input
+        task.stage_infos['reid'] = (img_qualities, rects)
+        return len(crop_input)
+
+    def predict_reid(self, tasks):
+        reid_predictor = self.predictor.reid_predictor
+        crops, counts = self._gather('reid', tasks)
+        features = []
+        if len(crops) > 0:
+            features = reid_predictor.predict_batch(
+                crops, batch_size=reid_predictor.batch_size)
+        for task, feature in self._split(features, tasks, counts):
+            img_qualities, rects = task.stage_infos['reid']
+            task.reid_res = {
+                'features': feature,
+                "qualities": img_qualities,
+                "rects": rects
+            }
+
+    def collect_frames(self):
+        end_num = 0
+        # mot and every crop stage put an END when they finish
+        total_end = 1 + len(self.stage_queues)
+        while end_num < total_end:
+            task = queue_get(self.done_queue, self.stop_event)
+            if task is None:
+                return
+            if task is END:
+                end_num += 1
+                continue
+            stream = task.stream
+            stream.reorder_buff[task.frame_id] = task
+            while stream.next_frame_id in stream.reorder_buff:
+                task = stream.reorder_buff.pop(stream.next_frame_id)
+                stream.next_frame_id += 1
+                if not self.finish_frame(task):
+                    self.stop_event.set()
+                    return
+
+    def finish_frame(self, task):
+        """
+        Sequential part of the pipeline of a frame, run in frame order of its
+        stream. Returns False if the user quits from the camera window.
+        """
+        predictor = self.predictor
+        stream = task.stream
+        frame_id = task.frame_id
+        mot_res = task.mot_res
+        pipeline_res = stream.pipeline_res
+        if frame_id % 10 == 0:
+            print('stream: {}, frame id: {}'.format(stream.stream_id,
+                                                    frame_id))
+        stream.done_num += 1
+        self.pipe_timer.img_num += 1
+
+        # nothing detected
+        if len(mot_res['boxes']) == 0:
+            return self.visualize_frame(task, mot_res, with_statistic=False)
+
+        pipeline_res.update(mot_res, 'mot')
+        if task.attr_res is not None:
+            pipeline_res.update(task.attr_res, 'attr')
+
+        if task.kpt_res is not None:
+            pipeline_res.update(task.kpt_res, 'kpt')
+            stream.kpt_buff.update(task.kpt_res,
+                                   mot_res)  # collect kpt output
+            state = stream.kpt_buff.get_state(
+            )  # whether frame num is enough or lost tracker
+
+            action_res = {}
+            if state:
+                self.pipe_timer.module_time['action'].start()
+                collected_keypoint = stream.kpt_buff.get_collected_keypoint(
+                )  # reoragnize kpt output with ID
+                action_input = parse_mot_keypoint(collected_keypoint,
+                                                  predictor.coord_size)
+                action_res = predictor.action_predictor.predict_skeleton_with_mot(
+                    action_input)
+                self.pipe_timer.module_time['action'].end()
+                pipeline_res.update(action_res, 'action')
+
+            if self.cfg['visual']:
+                stream.action_visual_helper.update(action_res)
+
+        if task.reid_res is not None:
+            pipeline_res.update(task.reid_res, 'reid')
+        else:
+            pipeline_res.clear('reid')
+
+        stream.collector.append(frame_id, pipeline_res)
+        return self.visualize_frame(task, pipeline_res)
+
+    def visualize_frame(self, task, result, with_statistic=True):
+        if not self.cfg['visual']:
+            return True
+        stream = task.stream
+        elapsed = time.time() - stream.start_time
+        fps = stream.done_num / elapsed if elapsed > 0 else 0
+        entrance, records, center_traj = None, None, None
+        if with_statistic:
+            entrance = stream.entrance
+            records = task.records
+            center_traj = stream.center_traj
+        im = self.predictor.visualize_video(
+            task.frame,
+            result,
+            task.frame_id + 1,
+            fps,
+            entrance,
+            records,
+            center_traj,
+            action_visual_helper=getattr(stream, 'action_visual_helper',
+                                         None))
+        stream.writer.write(im)
+        if stream.file_name is None:  # use camera_id
+            cv2.imshow('PPHuman-{}'.format(stream.source), im)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                return False
+        return True
@@ -123,6 +123,23 @@ def argsparser():
         "--draw_center_traj",
         action='store_true',
         help="Whether drawing the trajectory of center")
+    parser.add_argument(
+        "--vis_scale",
+        type=float,
+        default=1.,
+        help="Scale of the output video, frames are drawn on the downscaled "
+        "copies when < 1.")
+    parser.add_argument(
+        "--stage_parallel",
+        type=ast.literal_eval,
+        default=False,
+        help="Whether run models of video pipeline in parallel stages, "
+        "all videos in `video_dir` are predicted concurrently.")
+    parser.add_argument(
+        "--queue_size",
+        type=int,
+        default=16,
+        help="Capacity of queues between stages when stage_parallel is True.")
     return parser
 
 
@@ -165,8 +182,33 @@ class PipeTimer(Times):
             'action': Times(),
             'reid': Times()
         }
+        # queue depth samples of each stage in stage-parallel pipeline,
+        # name -> [sum of depth, number of samples, max depth]
+        self.queue_depth = {}
         self.img_num = 0
 
+    def record_queue(self, name, depth):
+        stat = self.queue_depth.setdefault(name, [0, 0, 0])
+        stat[0] += depth
+        stat[1] += 1
+        stat[2] = max(stat[2], depth)
+
+    def queue_info(self):
+        """
+        Returns:
+            info (dict): name -> (average depth, max depth, utilisation) of
+                stages, utilisation is the ratio of the busy time of the
+                stage to the total time
+        """
+        total_time = self.total_time.value()
+        info = {}
+        for name, (depth_sum, num, depth_max) in self.queue_depth.items():
+            busy_time = self.module_time[name].value(
+            ) if name in self.module_time else 0.
+            utilisation = busy_time / total_time if total_time > 0 else 0.
+            info[name] = (depth_sum / max(1, num), depth_max, utilisation)
+        return info
+
     def get_total_time(self):
         total_time = self.total_time.value()
         total_time = round(total_time, 4)
@@ -187,6 +229,10 @@ class PipeTimer(Times):
             if v_time > 0:
                 print("{} time(ms): {}".format(k, v_time * 1000))
 
+        for k, (depth_avg, depth_max, util) in self.queue_info().items():
+            print("{} queue depth avg: {:.2f}, max: {}, utilisation: {:.2%}".
+                  format(k, depth_avg, depth_max, util))
+
         print("average latency time(ms): {:.2f}, QPS: {:2f}".format(
             average_latency * 1000, qps))
         return qps
@@ -322,11 +368,12 @@ def normal_crop(image, rect):
     return image[ymin:ymax, xmin:xmax, :], [xmin, ymin, xmax, ymax], org_rect
 
 
-def crop_image_with_mot(input, mot_res, expand=True):
+def crop_image_with_mot(input, mot_res, expand=True, with_ids=False):
     res = mot_res['boxes']
     crop_res = []
     new_bboxes = []
     ori_bboxes = []
+    track_ids = []
     for box in res:
         if expand:
             crop_image, new_bbox, ori_bbox = expand_crop(input, box[1:])
@@ -336,9 +383,107 @@ def crop_image_with_mot(input, mot_res, expand=True):
             crop_res.append(crop_image)
             new_bboxes.append(new_bbox)
             ori_bboxes.append(ori_bbox)
+            track_ids.append(int(box[0]))
+    if with_ids:
+        return crop_res, new_bboxes, ori_bboxes, track_ids
     return crop_res, new_bboxes, ori_bboxes
 
 
+class AttrResultCache(object):
+    """
+    Attribute results cached by track id of one video stream, attributes
+    of a track are predicted again only after refresh_interval frames.
+
+    Results are kept in holders, i.e. lists of one item, a holder is cached
+    before its crop is predicted, so later frames of the same track in the
+    same batch reuse it too. refresh_interval <= 1 disables the cache.
+
+    Args:
+        refresh_interval (int): frames between two predictions of a track
+    """
+
+    def __init__(self, refresh_interval=1):
+        self.refresh_interval = refresh_interval
+        # track id -> (frame id of prediction, holder)
+        self.cache = {}
+
+    def lookup(self, frame_id, track_ids, crops):
+        """
+        Returns:
+            holders (list): holders of results of all crops
+            new_crops (list): crops to be predicted
+            new_holders (list): holders of new_crops, to be filled by `fill`
+        """
+        if self.refresh_interval <= 1:
+            new_holders = [[None] for _ in crops]
+            return new_holders, list(crops), new_holders
+
+        for track_id in list(self.cache.keys()):
+            if frame_id - self.cache[track_id][0] >= self.refresh_interval:
+                del self.cache[track_id]
+        holders, new_crops, new_holders = [], [], []
+        for track_id, crop in zip(track_ids, crops):
+            if track_id in self.cache:
+                holders.append(self.cache[track_id][1])
+                continue
+            holder = [None]
+            self.cache[track_id] = (frame_id, holder)
+            holders.append(holder)
+            new_crops.append(crop)
+            new_holders.append(holder)
+        return holders, new_crops, new_holders
+
+    @staticmethod
+    def fill(holders, outputs):
+        for holder, output in zip(holders, outputs):
+            holder[0] = output
+
+    @staticmethod
+    def resolve(holders):
+        return {'output': [holder[0] for holder in holders]}
+
+
+class CropBatcher(object):
+    """
+    Collect tasks of crops for a model, the batch is flushed when the number
+    of crops reaches batch_size, or max_wait seconds after the first task
+    is added. max_wait = 0 flushes as soon as no more task is waiting.
+
+    Args:
+        batch_size (int): number of crops to flush the batch
+        max_wait (float): seconds to wait for more crops
+    """
+
+    def __init__(self, batch_size, max_wait=0.):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.tasks = []
+        self.crop_num = 0
+        self.start_time = None
+
+    def add(self, task, crop_num):
+        if len(self.tasks) == 0:
+            self.start_time = time.time()
+        self.tasks.append(task)
+        self.crop_num += crop_num
+
+    def full(self):
+        return self.crop_num >= self.batch_size
+
+    def time_left(self):
+        """seconds before the deadline, None if the batch is empty"""
+        if len(self.tasks) == 0:
+            return None
+        return self.start_time + self.max_wait - time.time()
+
+    def flush(self):
+        tasks = self.tasks
+        self.tasks = []
+        self.crop_num = 0
+        self.start_time = None
+        return tasks
+
+
 def parse_mot_res(input):
     mot_res = []
     boxes, scores, ids = input[0]
@@ -41,13 +41,17 @@ from python.action_utils import KeyPointBuff, ActionVisualHelper
 
 from pipe_utils import argsparser, print_arguments, merge_cfg, PipeTimer
 from pipe_utils import get_test_images, crop_image_with_det, crop_image_with_mot, parse_mot_res, parse_mot_keypoint
+from pipe_utils import AttrResultCache
 from python.preprocess import decode_image
 from python.visualize import visualize_box_mask, visualize_attr, visualize_pose, visualize_action
+from python.video_sink import VideoSink
 
 from pptracking.python.mot_sde_infer import SDE_Detector
 from pptracking.python.mot.visualize import plot_tracking_dict
 from pptracking.python.mot.utils import flow_statistic
 
+from pipe_scheduler import StageScheduler
+
 
 class Pipeline(object):
     """
@@ -79,6 +83,12 @@ class Pipeline(object):
         do_entrance_counting(bool): Whether counting the numbers of identifiers entering 
             or getting out from the entrance, default as False，only support single class
             counting in MOT.
+        stage_parallel (bool): Whether run the models of video pipeline in
+            parallel stages by StageScheduler, all videos of video_dir are
+            predicted concurrently, default as False
+        queue_size (int): capacity of queues between stages, default as 16
+        vis_scale (float): scale of the output video, frames are drawn on
+            the downscaled copies when < 1, default as 1
     """
 
     def __init__(self,
@@ -101,14 +111,37 @@ class Pipeline(object):
                  output_dir='output',
                  draw_center_traj=False,
                  secs_interval=10,
-                 do_entrance_counting=False):
+                 do_entrance_counting=False,
+                 stage_parallel=False,
+                 queue_size=16,
+                 vis_scale=1.):
         self.multi_camera = False
         self.is_video = False
         self.output_dir = output_dir
         self.vis_result = cfg['visual']
         self.input = self._parse_input(image_file, image_dir, video_file,
                                        video_dir, camera_id)
-        if self.multi_camera:
+        self.stage_parallel = stage_parallel and self.is_video
+        self.queue_size = queue_size
+        if self.multi_camera and self.stage_parallel:
+            # models are shared by all cameras
+            self.predictor = PipePredictor(
+                cfg,
+                is_video=True,
+                multi_camera=True,
+                enable_attr=enable_attr,
+                enable_action=enable_action,
+                device=device,
+                run_mode=run_mode,
+                trt_min_shape=trt_min_shape,
+                trt_max_shape=trt_max_shape,
+                trt_opt_shape=trt_opt_shape,
+                cpu_threads=cpu_threads,
+                enable_mkldnn=enable_mkldnn,
+                output_dir=output_dir,
+                vis_scale=vis_scale)
+
+        elif self.multi_camera:
             self.predictor = []
             for name in self.input:
                 predictor_item = PipePredictor(
@@ -124,7 +157,8 @@ class Pipeline(object):
                     trt_opt_shape=trt_opt_shape,
                     cpu_threads=cpu_threads,
                     enable_mkldnn=enable_mkldnn,
-                    output_dir=output_dir)
+                    output_dir=output_dir,
+                    vis_scale=vis_scale)
                 predictor_item.set_file_name(name)
                 self.predictor.append(predictor_item)
 
@@ -145,7 +179,8 @@ class Pipeline(object):
                 output_dir=output_dir,
                 draw_center_traj=draw_center_traj,
                 secs_interval=secs_interval,
-                do_entrance_counting=do_entrance_counting)
+                do_entrance_counting=do_entrance_counting,
+                vis_scale=vis_scale)
             if self.is_video:
                 self.predictor.set_file_name(video_file)
 
@@ -193,7 +228,17 @@ class Pipeline(object):
         return input
 
     def run(self):
-        if self.multi_camera:
+        if self.stage_parallel:
+            sources = self.input if self.multi_camera else [self.input]
+            multi_res = self.predictor.run_streams(sources, self.queue_size)
+            if self.multi_camera:
+                mtmct_process(
+                    multi_res,
+                    self.input,
+                    mtmct_vis=self.vis_result,
+                    output_dir=self.output_dir)
+
+        elif self.multi_camera:
             multi_res = []
             for predictor, input in zip(self.predictor, self.input):
                 predictor.run(input)
@@ -249,6 +294,8 @@ class PipePredictor(object):
         do_entrance_counting(bool): Whether counting the numbers of identifiers entering 
             or getting out from the entrance, default as False，only support single class
             counting in MOT.
+        vis_scale (float): scale of the output video, frames are drawn on
+            the downscaled copies when < 1, default as 1
     """
 
     def __init__(self,
@@ -268,7 +315,8 @@ class PipePredictor(object):
                  output_dir='output',
                  draw_center_traj=False,
                  secs_interval=10,
-                 do_entrance_counting=False):
+                 do_entrance_counting=False,
+                 vis_scale=1.):
 
         if enable_attr and not cfg.get('ATTR', False):
             ValueError(
@@ -301,6 +349,7 @@ class PipePredictor(object):
         self.draw_center_traj = draw_center_traj
         self.secs_interval = secs_interval
         self.do_entrance_counting = do_entrance_counting
+        self.vis_scale = vis_scale
 
         self.warmup_frame = self.cfg['warmup_frame']
         self.pipeline_res = Result()
@@ -353,6 +402,8 @@ class PipePredictor(object):
                     model_dir, device, run_mode, batch_size, trt_min_shape,
                     trt_max_shape, trt_opt_shape, trt_calib_mode, cpu_threads,
                     enable_mkldnn)
+                self.attr_cache = AttrResultCache(
+                    attr_cfg.get('refresh_interval', 1))
             if self.with_action:
                 kpt_cfg = self.cfg['KPT']
                 kpt_model_dir = kpt_cfg['model_dir']
@@ -419,6 +470,22 @@ class PipePredictor(object):
             self.predict_image(input)
         self.pipe_timer.info()
 
+    def run_streams(self, sources, queue_size=16):
+        """
+        Predict multiple video sources concurrently by StageScheduler.
+
+        Args:
+            sources (list): paths of video files or device ids of cameras
+            queue_size (int): capacity of queues between stages
+        Returns:
+            results (list): results collected by DataCollector of each source
+        """
+        assert self.is_video, "run_streams only supports video input"
+        scheduler = StageScheduler(self, sources, queue_size)
+        streams = scheduler.run()
+        self.pipe_timer.info()
+        return [stream.collector.get_res() for stream in streams]
+
     def predict_image(self, input):
         # det
         # det -> attr
@@ -484,8 +551,7 @@ class PipePredictor(object):
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
         out_path = os.path.join(self.output_dir, video_out_name)
-        fourcc = cv2.VideoWriter_fourcc(* 'mp4v')
-        writer = cv2.VideoWriter(out_path, fourcc, fps, (width, height))
+        writer = VideoSink(out_path, fps, scale=self.vis_scale)
         frame_id = 0
 
         entrance, records, center_traj = None, None, None
@@ -510,8 +576,7 @@ class PipePredictor(object):
             if frame_id > self.warmup_frame:
                 self.pipe_timer.total_time.start()
                 self.pipe_timer.module_time['mot'].start()
-            res = self.mot_predictor.predict_image(
-                [copy.deepcopy(frame)], visual=False)
+            res = self.mot_predictor.predict_image([frame], visual=False)
 
             if frame_id > self.warmup_frame:
                 self.pipe_timer.module_time['mot'].end()
@@ -549,14 +614,20 @@ class PipePredictor(object):
 
             self.pipeline_res.update(mot_res, 'mot')
             if self.with_attr or self.with_action:
-                crop_input, new_bboxes, ori_bboxes = crop_image_with_mot(
-                    frame, mot_res)
+                crop_input, new_bboxes, ori_bboxes, track_ids = crop_image_with_mot(
+                    frame, mot_res, with_ids=True)
 
             if self.with_attr:
                 if frame_id > self.warmup_frame:
                     self.pipe_timer.module_time['attr'].start()
-                attr_res = self.attr_predictor.predict_image(
-                    crop_input, visual=False)
+                # tracks predicted in recent frames reuse cached results
+                holders, attr_input, new_holders = self.attr_cache.lookup(
+                    frame_id, track_ids, crop_input)
+                if len(attr_input) > 0:
+                    attr_res = self.attr_predictor.predict_image(
+                        attr_input, visual=False)
+                    AttrResultCache.fill(new_holders, attr_res['output'])
+                attr_res = AttrResultCache.resolve(holders)
                 if frame_id > self.warmup_frame:
                     self.pipe_timer.module_time['attr'].end()
                 self.pipeline_res.update(attr_res, 'attr')
@@ -646,8 +717,28 @@ class PipePredictor(object):
                         fps,
                         entrance=None,
                         records=None,
-                        center_traj=None):
+                        center_traj=None,
+                        action_visual_helper=None):
         mot_res = copy.deepcopy(result.get('mot'))
+        kpt_res = result.get('kpt')
+        scale = self.vis_scale
+        if scale != 1.:
+            # draw on the downscaled copy with coordinates scaled to match
+            image = cv2.resize(
+                image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            if mot_res is not None and len(mot_res['boxes']) > 0:
+                mot_res['boxes'][:, 3:] *= scale
+            if entrance is not None:
+                entrance = [x * scale for x in entrance]
+            if kpt_res is not None:
+                skeletons = np.array(kpt_res['keypoint'][0])
+                if len(skeletons) > 0:
+                    skeletons[..., :2] *= scale
+                kpt_res = {
+                    'keypoint': [skeletons.tolist(), kpt_res['keypoint'][1]],
+                    'bbox': [[x * scale for x in box]
+                             for box in kpt_res['bbox']]
+                }
         if mot_res is not None:
             ids = mot_res['boxes'][:, 0]
             scores = mot_res['boxes'][:, 2]
@@ -688,7 +779,6 @@ class PipePredictor(object):
             image = visualize_attr(image, attr_res, boxes)
             image = np.array(image)
 
-        kpt_res = result.get('kpt')
         if kpt_res is not None:
             image = visualize_pose(
                 image,
@@ -698,8 +788,10 @@ class PipePredictor(object):
 
         action_res = result.get('action')
         if action_res is not None:
+            if action_visual_helper is None:
+                action_visual_helper = self.action_visual_helper
             image = visualize_action(image, mot_res['boxes'],
-                                     self.action_visual_helper, "Falling")
+                                     action_visual_helper, "Falling")
 
         return image
 
@@ -742,7 +834,8 @@ def main():
         FLAGS.enable_action, FLAGS.device, FLAGS.run_mode, FLAGS.trt_min_shape,
         FLAGS.trt_max_shape, FLAGS.trt_opt_shape, FLAGS.trt_calib_mode,
         FLAGS.cpu_threads, FLAGS.enable_mkldnn, FLAGS.output_dir,
-        FLAGS.draw_center_traj, FLAGS.secs_interval, FLAGS.do_entrance_counting)
+        FLAGS.draw_center_traj, FLAGS.secs_interval, FLAGS.do_entrance_counting,
+        FLAGS.stage_parallel, FLAGS.queue_size, FLAGS.vis_scale)
 
     pipeline.run()
 
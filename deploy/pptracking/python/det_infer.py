@@ -35,6 +35,7 @@ from picodet_postprocess import PicoDetPostProcess
 from preprocess import preprocess, Resize, NormalizeImage, Permute, PadStride, LetterBoxResize, decode_image
 from mot.visualize import visualize_box_mask
 from mot_utils import argsparser, Timer, get_current_memory_mb
+from video_sink import VideoSink
 
 # Global dictionary
 SUPPORT_MODELS = {
@@ -269,8 +270,7 @@ class Detector(object):
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
         out_path = os.path.join(self.output_dir, video_out_name)
-        fourcc = cv2.VideoWriter_fourcc(* 'mp4v')
-        writer = cv2.VideoWriter(out_path, fourcc, fps, (width, height))
+        writer = VideoSink(out_path, fps)
         index = 1
         while (1):
             ret, frame = capture.read()
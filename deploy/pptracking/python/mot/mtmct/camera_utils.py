@@ -32,122 +32,132 @@ CAM_DIST = [[0, 40, 55, 100, 120, 145], [40, 0, 15, 60, 80, 105],
             [55, 15, 0, 40, 65, 90], [100, 60, 40, 0, 20, 45],
             [120, 80, 65, 20, 0, 25], [145, 105, 90, 45, 25, 0]]
 
-
-def st_filter(st_mask, cid_tids, cid_tid_dict):
+# Camera topology of AIC21 S06, the default one of st_filter.
+#   cam_ids: camera ids in order along the road, zone 3 goes to the next
+#       camera and zone 4 goes to the previous one.
+#   cam_dist: travel time between cameras, in units of io_time.
+#   start_time, end_time: io_time of tracklets at the start and the end of
+#       the videos.
+S06_TOPOLOGY = {
+    'cam_ids': [41, 42, 43, 44, 45, 46],
+    'cam_dist': CAM_DIST,
+    'start_time': 1,
+    'end_time': 199,
+}
+
+
+def get_st_attrs(cid_tids, cid_tid_dict, cam_topology):
+    """
+    Pack camera order, in/out times and in/out zones of tracklets into arrays.
+    """
+    cam_ids = np.asarray(cam_topology['cam_ids'])
+    tracklets = [cid_tid_dict[cid_tid] for cid_tid in cid_tids]
+    cids = np.array([tracklet['cam'] for tracklet in tracklets])
+    order = np.argsort(cam_ids)
+    pos = np.searchsorted(cam_ids, cids, sorter=order)
+    pos = order[np.clip(pos, 0, len(cam_ids) - 1)]
+    unknown = cam_ids[pos] != cids
+    if np.any(unknown):
+        raise ValueError("cameras {} are not in the camera topology {}".format(
+            sorted(set(cids[unknown].tolist())), cam_ids.tolist()))
+    iot = np.array(
+        [tracklet['io_time'] for tracklet in tracklets],
+        dtype=np.float64).reshape([-1, 2])
+    # zone 0 or None is not in any crossroad
+    dire = np.array(
+        [[
+            zone or 0
+            for zone in get_dire(tracklet['zone_list'], tracklet['cam'])
+        ] for tracklet in tracklets],
+        dtype=np.int64).reshape([-1, 2])
+    return pos, iot, dire
+
+
+def st_mismatch(pos, iot, dire, j_pos, j_iot, j_dire, cam_topology):
+    """
+    Mismatch of tracklets i as rows and tracklets j as columns by the rules of
+    st_filter, each rule is a broadcast boolean operation of all pairs.
+    """
+    cam_dist = np.asarray(cam_topology['cam_dist'], dtype=np.float64)
+    start_time = cam_topology['start_time']
+    end_time = cam_topology['end_time']
+    last_pos = len(cam_topology['cam_ids']) - 1
+
+    pos = pos[:, None]
+    dist = cam_dist[pos, j_pos[None, :]]
+    i_in, i_out = iot[:, 0:1], iot[:, 1:2]
+    j_in, j_out = j_iot[None, :, 0], j_iot[None, :, 1]
+    zs, ze = dire[:, 0:1], dire[:, 1:2]
+    gt = pos > j_pos[None, :]
+    lt = pos < j_pos[None, :]
+
+    # going from the camera of i to the one of j, or coming from it
+    to_j_s = ((zs == 3) & lt) | ((zs == 4) & gt)
+    from_j_s = ((zs == 3) & gt) | ((zs == 4) & lt)
+    to_j_e = ((ze == 3) & lt) | ((ze == 4) & gt)
+    from_j_e = ((ze == 3) & gt) | ((ze == 4) & lt)
+    i_leave = i_in < j_out + dist
+
+    # if time overlapped
+    mismatch = ((i_in - dist < j_in) & (j_in < i_out + dist)) | (
+        (i_in - dist < j_out) & (j_out < i_out + dist))
+    # not match after go out
+    mismatch |= np.isin(ze, [1, 2]) & (i_leave | from_j_s)
+    mismatch |= ((pos == 0) & (ze == 4)) & (i_leave | (i_out > end_time))
+    mismatch |= ((pos == last_pos) & (ze == 3)) & i_leave
+    # match after come into
+    mismatch |= np.isin(zs, [1, 2]) & ((i_out > j_in - dist) | from_j_e)
+
+    i_turn = (zs == ze) & np.isin(zs, [3, 4])
+    j_turn = (j_dire[:, 0] == j_dire[:, 1]) & np.isin(j_dire[:, 0], [3, 4])
+    is_ignore = i_turn | j_turn[None, :]
+    # direction conflict
+    pass_mismatch = ((zs == 3) & (j_dire[None, :, 0] == 4)) | (
+        (ze == 3) & (j_dire[None, :, 1] == 4))
+    # filter before going next scene
+    pass_mismatch |= to_j_e & (i_out > j_out - dist)
+    pass_mismatch |= to_j_s & (i_in < j_in + dist)
+    pass_mismatch |= from_j_s & (i_out > j_in - dist)
+    pass_mismatch |= from_j_e & i_leave
+    turn_mismatch = (i_out > end_time) & (
+        (to_j_s & (i_in < j_in + dist)) | from_j_s)
+    turn_mismatch |= (i_in < start_time) & from_j_e
+    mismatch |= np.where(is_ignore, turn_mismatch, pass_mismatch)
+    return mismatch
+
+
+def st_filter(st_mask,
+              cid_tids,
+              cid_tid_dict,
+              cam_topology=None,
+              block_size=1024):
+    """
+    Mask out pairs of tracklets that can not be the same object in the camera
+    topology by their in/out times and zones. Attributes of tracklets are
+    packed into arrays once, and the rules are evaluated for blocks of
+    block_size rows against all tracklets.
+
+    Args:
+        st_mask (np.ndarray): [N, N] mask of tracklet pairs.
+        cid_tids (list): (camera id, track id) of N tracklets.
+        cid_tid_dict (dict): tracklets with 'cam', 'io_time' and 'zone_list'.
+        cam_topology (dict): keys as S06_TOPOLOGY, default S06_TOPOLOGY.
+        block_size (int): number of rows evaluated at once.
+    """
+    if cam_topology is None:
+        cam_topology = S06_TOPOLOGY
     count = len(cid_tids)
-    for i in range(count):
-        i_tracklet = cid_tid_dict[cid_tids[i]]
-        i_cid = i_tracklet['cam']
-        i_dire = get_dire(i_tracklet['zone_list'], i_cid)
-        i_iot = i_tracklet['io_time']
-        for j in range(count):
-            j_tracklet = cid_tid_dict[cid_tids[j]]
-            j_cid = j_tracklet['cam']
-            j_dire = get_dire(j_tracklet['zone_list'], j_cid)
-            j_iot = j_tracklet['io_time']
-
-            match_dire = True
-            cam_dist = CAM_DIST[i_cid - 41][j_cid - 41]
-            # if time overlopped
-            if i_iot[0] - cam_dist < j_iot[0] and j_iot[0] < i_iot[
-                    1] + cam_dist:
-                match_dire = False
-            if i_iot[0] - cam_dist < j_iot[1] and j_iot[1] < i_iot[
-                    1] + cam_dist:
-                match_dire = False
-
-            # not match after go out
-            if i_dire[1] in [1, 2]:  # i out
-                if i_iot[0] < j_iot[1] + cam_dist:
-                    match_dire = False
-
-            if i_dire[1] in [1, 2]:
-                if i_dire[0] in [3] and i_cid > j_cid:
-                    match_dire = False
-                if i_dire[0] in [4] and i_cid < j_cid:
-                    match_dire = False
-
-            if i_cid in [41] and i_dire[1] in [4]:
-                if i_iot[0] < j_iot[1] + cam_dist:
-                    match_dire = False
-                if i_iot[1] > 199:
-                    match_dire = False
-            if i_cid in [46] and i_dire[1] in [3]:
-                if i_iot[0] < j_iot[1] + cam_dist:
-                    match_dire = False
-
-            # match after come into
-            if i_dire[0] in [1, 2]:
-                if i_iot[1] > j_iot[0] - cam_dist:
-                    match_dire = False
-
-            if i_dire[0] in [1, 2]:
-                if i_dire[1] in [3] and i_cid > j_cid:
-                    match_dire = False
-                if i_dire[1] in [4] and i_cid < j_cid:
-                    match_dire = False
-
-            is_ignore = False
-            if ((i_dire[0] == i_dire[1] and i_dire[0] in [3, 4]) or
-                (j_dire[0] == j_dire[1] and j_dire[0] in [3, 4])):
-                is_ignore = True
-
-            if not is_ignore:
-                # direction conflict
-                if (i_dire[0] in [3] and j_dire[0] in [4]) or (
-                        i_dire[1] in [3] and j_dire[1] in [4]):
-                    match_dire = False
-                # filter before going next scene
-                if i_dire[1] in [3] and i_cid < j_cid:
-                    if i_iot[1] > j_iot[1] - cam_dist:
-                        match_dire = False
-                if i_dire[1] in [4] and i_cid > j_cid:
-                    if i_iot[1] > j_iot[1] - cam_dist:
-                        match_dire = False
-
-                if i_dire[0] in [3] and i_cid < j_cid:
-                    if i_iot[0] < j_iot[0] + cam_dist:
-                        match_dire = False
-                if i_dire[0] in [4] and i_cid > j_cid:
-                    if i_iot[0] < j_iot[0] + cam_dist:
-                        match_dire = False
-                ## 3-30
-                ## 4-1
-                if i_dire[0] in [3] and i_cid > j_cid:
-                    if i_iot[1] > j_iot[0] - cam_dist:
-                        match_dire = False
-                if i_dire[0] in [4] and i_cid < j_cid:
-                    if i_iot[1] > j_iot[0] - cam_dist:
-                        match_dire = False
-                # filter before going next scene
-                ## 4-7
-                if i_dire[1] in [3] and i_cid > j_cid:
-                    if i_iot[0] < j_iot[1] + cam_dist:
-                        match_dire = False
-                if i_dire[1] in [4] and i_cid < j_cid:
-                    if i_iot[0] < j_iot[1] + cam_dist:
-                        match_dire = False
-            else:
-                if i_iot[1] > 199:
-                    if i_dire[0] in [3] and i_cid < j_cid:
-                        if i_iot[0] < j_iot[0] + cam_dist:
-                            match_dire = False
-                    if i_dire[0] in [4] and i_cid > j_cid:
-                        if i_iot[0] < j_iot[0] + cam_dist:
-                            match_dire = False
-                    if i_dire[0] in [3] and i_cid > j_cid:
-                        match_dire = False
-                    if i_dire[0] in [4] and i_cid < j_cid:
-                        match_dire = False
-                if i_iot[0] < 1:
-                    if i_dire[1] in [3] and i_cid > j_cid:
-                        match_dire = False
-                    if i_dire[1] in [4] and i_cid < j_cid:
-                        match_dire = False
-
-            if not match_dire:
-                st_mask[i, j] = 0.0
-                st_mask[j, i] = 0.0
+    if count == 0:
+        return st_mask
+    pos, iot, dire = get_st_attrs(cid_tids, cid_tid_dict, cam_topology)
+    mismatch = np.zeros((count, count), dtype=bool)
+    for start in range(0, count, block_size):
+        end = min(start + block_size, count)
+        mismatch[start:end] = st_mismatch(pos[start:end], iot[start:end],
+                                          dire[start:end], pos, iot, dire,
+                                          cam_topology)
+    mismatch |= mismatch.T
+    st_mask[mismatch] = 0.0
     return st_mask
 
 
@@ -201,7 +211,8 @@ def get_sim_matrix(cid_tid_dict,
                    cid_tids,
                    use_ff=True,
                    use_rerank=True,
-                   use_st_filter=False):
+                   use_st_filter=False,
+                   cam_topology=None):
     # Note: camera releated get_sim_matrix function,
     # which is different from the one in utils.py.
     count = len(cid_tids)
@@ -218,7 +229,7 @@ def get_sim_matrix(cid_tid_dict,
 
     # different from utils.py
     if use_st_filter:
-        st_mask = st_filter(st_mask, cid_tids, cid_tid_dict)
+        st_mask = st_filter(st_mask, cid_tids, cid_tid_dict, cam_topology)
 
     visual_sim_matrix = visual_rerank(
         q_arr, g_arr, cid_tids, use_ff=use_ff, use_rerank=use_rerank)
@@ -235,7 +246,8 @@ def get_labels_with_camera(cid_tid_dict,
                            cid_tids,
                            use_ff=True,
                            use_rerank=True,
-                           use_st_filter=False):
+                           use_st_filter=False,
+                           cam_topology=None):
     # 1st cluster
     sub_cid_tids = subcam_list(cid_tid_dict, cid_tids)
     sub_labels = dict()
@@ -247,7 +259,8 @@ def get_labels_with_camera(cid_tid_dict,
             sub_cid_tids[sub_c_to_c],
             use_ff=use_ff,
             use_rerank=use_rerank,
-            use_st_filter=use_st_filter)
+            use_st_filter=use_st_filter,
+            cam_topology=cam_topology)
         cluster_labels = AgglomerativeClustering(
             n_clusters=None,
             distance_threshold=1 - dis_thrs[i],
@@ -268,7 +281,8 @@ def get_labels_with_camera(cid_tid_dict,
             sub_cid_tids[sub_c_to_c],
             use_ff=use_ff,
             use_rerank=use_rerank,
-            use_st_filter=use_st_filter)
+            use_st_filter=use_st_filter,
+            cam_topology=cam_topology)
         cluster_labels = AgglomerativeClustering(
             n_clusters=None,
             distance_threshold=1 - 0.1,
@@ -95,10 +95,12 @@ def sub_cluster(cid_tid_dict,
                 use_ff=True,
                 use_rerank=True,
                 use_camera=False,
-                use_st_filter=False):
+                use_st_filter=False,
+                cam_topology=None):
     '''
     cid_tid_dict: all camera_id and track_id
     scene_cluster: like [41, 42, 43, 44, 45, 46] in AIC21 MTMCT S06 test videos
+    cam_topology: camera topology of st_filter, default AIC21 MTMCT S06 one
     '''
     assert (len(scene_cluster) != 0), "Error: scene_cluster length equals 0"
     cid_tids = sorted(
@@ -109,7 +111,8 @@ def sub_cluster(cid_tid_dict,
             cid_tids,
             use_ff=use_ff,
             use_rerank=use_rerank,
-            use_st_filter=use_st_filter)
+            use_st_filter=use_st_filter,
+            cam_topology=cam_topology)
     else:
         clu = get_labels(
             cid_tid_dict,
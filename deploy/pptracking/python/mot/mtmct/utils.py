@@ -18,13 +18,13 @@ This code is based on https://github.com/LCFractal/AIC21-MTMC/tree/main/reid/rei
 import os
 import re
 import cv2
-import gc
+import multiprocessing
 import numpy as np
+from scipy import sparse
 from sklearn import preprocessing
 from sklearn.cluster import AgglomerativeClustering
 import motmetrics as mm
 import pandas as pd
-from tqdm import tqdm
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -102,11 +102,8 @@ def get_dire(zone_list, cid):
 
 
 def intracam_ignore(st_mask, cid_tids):
-    count = len(cid_tids)
-    for i in range(count):
-        for j in range(count):
-            if cid_tids[i][0] == cid_tids[j][0]:
-                st_mask[i, j] = 0.
+    cids = np.array([cid_tid[0] for cid_tid in cid_tids])
+    st_mask[cids[:, None] == cids[None, :]] = 0.
     return st_mask
 
 
@@ -213,137 +210,216 @@ def find_topk(a, k, axis=-1, largest=True, sorted=True):
     return topk_values, topk_indices
 
 
-def batch_numpy_topk(qf, gf, k1, N=6000):
-    m = qf.shape[0]
-    n = gf.shape[0]
-    initial_rank = []
-    for j in range(n // N + 1):
-        temp_gf = gf[j * N:j * N + N]
-        temp_qd = []
-        for i in range(m // N + 1):
-            temp_qf = qf[i * N:i * N + N]
-            temp_d = euclidean_distance(temp_qf, temp_gf)
-            temp_qd.append(temp_d)
-        temp_qd = np.concatenate(temp_qd, axis=0)
-        temp_qd = temp_qd / (np.max(temp_qd, axis=0)[0])
-        temp_qd = temp_qd.T
-        initial_rank.append(
-            find_topk(temp_qd, k=k1, axis=1, largest=False, sorted=True)[1])
-    del temp_qd
-    del temp_gf
-    del temp_qf
-    del temp_d
-    initial_rank = np.concatenate(initial_rank, axis=0)
-    return initial_rank
-
-
-def batch_euclidean_distance(qf, gf, N=6000):
-    m = qf.shape[0]
-    n = gf.shape[0]
-    dist_mat = []
-    for j in range(n // N + 1):
-        temp_gf = gf[j * N:j * N + N]
-        temp_qd = []
-        for i in range(m // N + 1):
-            temp_qf = qf[i * N:i * N + N]
-            temp_d = euclidean_distance(temp_qf, temp_gf)
-            temp_qd.append(temp_d)
-        temp_qd = np.concatenate(temp_qd, axis=0)
-        temp_qd = temp_qd / (np.max(temp_qd, axis=0)[0])
-        dist_mat.append(temp_qd.T)
-    del temp_qd
-    del temp_gf
-    del temp_qf
-    del temp_d
-    dist_mat = np.concatenate(dist_mat, axis=0)
-    return dist_mat
+_SHARED_RERANK = None
 
 
-def batch_v(feat, R, all_num):
-    V = np.zeros((all_num, all_num), dtype=np.float32)
-    m = feat.shape[0]
-    for i in tqdm(range(m)):
-        temp_gf = feat[i].reshape(1, -1)
-        temp_qd = euclidean_distance(temp_gf, feat)
-        temp_qd = temp_qd / (np.max(temp_qd))
-        temp_qd = temp_qd.reshape(-1)
-        temp_qd = temp_qd[R[i].tolist()]
-        weight = np.exp(-temp_qd)
-        weight = weight / np.sum(weight)
-        V[i, R[i]] = weight.astype(np.float32)
-    return V
+def _map_blocks(func, blocks, num_workers):
+    # map blocks in forked processes, which share _SHARED_RERANK
+    if num_workers > 1 and len(blocks) > 1 and \
+            'fork' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(min(num_workers, len(blocks))) as pool:
+            return pool.map(func, blocks, chunksize=1)
+    return [func(bounds) for bounds in blocks]
 
 
-def k_reciprocal_neigh(initial_rank, i, k1):
-    forward_k_neigh_index = initial_rank[i, :k1 + 1]
-    backward_k_neigh_index = initial_rank[forward_k_neigh_index, :k1 + 1]
-    fi = np.where(backward_k_neigh_index == i)[0]
-    return forward_k_neigh_index[fi]
+def _topk_block(bounds):
+    start, end = bounds
+    feat, k = _SHARED_RERANK
+    dist = euclidean_distance(feat[start:end], feat)
+    topk_index = find_topk(dist, k=k, axis=1, largest=False, sorted=True)[1]
+    return topk_index, np.max(dist, axis=1)
 
 
-def ReRank2(probFea, galFea, k1=20, k2=6, lambda_value=0.3):
+def batch_topk_and_max(feat, k, max_memory=1 << 30, num_workers=0):
+    """
+    Indices of the k nearest features of each feature sorted by distance,
+    and the max distance of each feature. Distances are computed block by
+    block of rows, so a block is in max_memory bytes.
+    """
+    global _SHARED_RERANK
+    num = feat.shape[0]
+    block = max(1, max_memory // max(1, num_workers) //
+                (num * (feat.itemsize + 8) * 2))
+    blocks = [(i, min(i + block, num)) for i in range(0, num, block)]
+    _SHARED_RERANK = (feat, k)
+    try:
+        results = _map_blocks(_topk_block, blocks, num_workers)
+    finally:
+        _SHARED_RERANK = None
+    initial_rank = np.concatenate([r[0] for r in results], axis=0)
+    max_dist = np.concatenate([r[1] for r in results], axis=0)
+    return initial_rank, max_dist
+
+
+def k_reciprocal_neigh(initial_rank, k1, max_memory=1 << 30):
+    """
+    k-reciprocal neighbors of all features as a boolean CSR matrix, j is a
+    neighbor of i if i and j are in the k1 + 1 nearest ones of each other.
+    """
+    num = initial_rank.shape[0]
+    forward_k_neigh_index = initial_rank[:, :k1 + 1]
+    is_reciprocal = np.zeros(forward_k_neigh_index.shape, dtype=bool)
+    block = max(1, max_memory // ((k1 + 1)**2 * 9))
+    for start in range(0, num, block):
+        end = min(start + block, num)
+        backward_k_neigh_index = forward_k_neigh_index[forward_k_neigh_index[
+            start:end]]
+        is_reciprocal[start:end] = np.any(
+            backward_k_neigh_index == np.arange(start, end)[:, None, None],
+            axis=2)
+    indptr = np.zeros((num + 1, ), dtype=np.int64)
+    indptr[1:] = np.cumsum(is_reciprocal.sum(axis=1))
+    return sparse.csr_matrix(
+        (np.ones(
+            (indptr[-1], ), dtype=bool),
+         forward_k_neigh_index[is_reciprocal], indptr),
+        shape=(num, num))
+
+
+def k_reciprocal_expansion(initial_rank, k1, max_memory=1 << 30):
+    """
+    k-reciprocal neighbors of each feature, expanded by the k1 / 2
+    reciprocal neighbors of a candidate if more than 2 / 3 of them are
+    in the k-reciprocal neighbors, as a boolean CSR matrix.
+    """
+    num = initial_rank.shape[0]
+    reciprocal = k_reciprocal_neigh(initial_rank, k1,
+                                    max_memory).astype(np.float32)
+    half_reciprocal = k_reciprocal_neigh(
+        initial_rank, int(np.around(k1 / 2)), max_memory).astype(np.float32)
+    half_size = np.diff(half_reciprocal.indptr)
+    half_reciprocal_t = half_reciprocal.T.tocsr()
+    block = max(1, max_memory // ((k1 + 1)**2 * 32))
+    expansion = []
+    for start in range(0, num, block):
+        end = min(start + block, num)
+        neigh = reciprocal[start:end]
+        # number of the k1 / 2 reciprocal neighbors of each candidate,
+        # which are in the k-reciprocal neighbors
+        overlap = neigh.dot(half_reciprocal_t).multiply(neigh).tocoo()
+        keep = overlap.data > 2. / 3 * half_size[overlap.col]
+        candidate = sparse.csr_matrix(
+            (np.ones(
+                (keep.sum(), ), dtype=np.float32),
+             (overlap.row[keep], overlap.col[keep])),
+            shape=(end - start, num))
+        expansion.append(neigh + candidate.dot(half_reciprocal))
+    expansion = sparse.vstack(expansion).tocsr()
+    return expansion.astype(bool)
+
+
+def sparse_v(feat, expansion, max_dist, max_memory=1 << 30):
+    """
+    Gaussian weights of the expanded k-reciprocal neighbors of each
+    feature, normalized to sum 1 in each row, as a CSR matrix.
+    """
+    num = feat.shape[0]
+    expansion = expansion.tocoo()
+    rows, cols = expansion.row, expansion.col
+    dist = np.zeros(rows.shape, dtype=feat.dtype)
+    block = max(1, max_memory // (feat.shape[1] * feat.itemsize * 2))
+    for start in range(0, rows.shape[0], block):
+        end = start + block
+        dist[start:end] = 2 - 2 * np.einsum(
+            'ij,ij->i', feat[rows[start:end]], feat[cols[start:end]])
+    weight = np.exp(-dist / max_dist[rows])
+    weight = weight / np.bincount(rows, weights=weight, minlength=num)[rows]
+    return sparse.csr_matrix(
+        (weight.astype(np.float32), (rows, cols)), shape=(num, num))
+
+
+def _split_rows(row_bytes, max_memory):
+    # contiguous blocks of rows, each in max_memory bytes or of one row
+    bounds = [0]
+    total = 0
+    for i, nbytes in enumerate(row_bytes):
+        if total + nbytes > max_memory and i > bounds[-1]:
+            bounds.append(i)
+            total = 0
+        total += nbytes
+    bounds.append(len(row_bytes))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _rerank_block(bounds):
+    start, end = bounds
+    V, V_gal, feat, query_num, scale, lambda_value = _SHARED_RERANK
+    num_gal = V_gal.shape[0]
+    block = V[start:end].tocoo()
+    # pairs of a nonzero of query i and the nonzeros of the same column
+    col_nnz = np.diff(V_gal.indptr)
+    counts = col_nnz[block.col]
+    total = counts.sum()
+    offsets = np.repeat(V_gal.indptr[block.col] - np.cumsum(counts) + counts,
+                        counts) + np.arange(total)
+    temp_min = np.bincount(
+        np.repeat(block.row, counts) * num_gal + V_gal.indices[offsets],
+        weights=np.minimum(np.repeat(block.data, counts), V_gal.data[offsets]),
+        minlength=(end - start) * num_gal).reshape((end - start, num_gal))
+    temp_min = temp_min.astype(np.float32)
+    jaccard_dist = 1 - temp_min / (2. - temp_min)
+    original_dist = euclidean_distance(feat[start:end], feat[query_num:])
+    original_dist = original_dist / scale[start:end, None]
+    return jaccard_dist * (1 - lambda_value) + original_dist * lambda_value
+
+
+def ReRank2(probFea,
+            galFea,
+            k1=20,
+            k2=6,
+            lambda_value=0.3,
+            max_memory_mb=1024,
+            num_workers=0):
+    """
+    k-reciprocal re-ranking of gallery features for probe features. The
+    neighbors, weights V and its query expansion are sparse matrices, and
+    the jaccard distances are computed block by block of probes, each in
+    max_memory_mb, and in num_workers forked processes if num_workers > 1.
+
+    Returns:
+        final_dist (np.ndarray): distances, shape [num_probe, num_gallery].
+    """
+    global _SHARED_RERANK
     query_num = probFea.shape[0]
-    all_num = query_num + galFea.shape[0]
     feat = np.concatenate((probFea, galFea), axis=0)
+    all_num = feat.shape[0]
+    max_memory = int(max_memory_mb) << 20
+
+    initial_rank, max_dist = batch_topk_and_max(feat, k1 + 1, max_memory,
+                                                num_workers)
+    expansion = k_reciprocal_expansion(initial_rank, k1, max_memory)
+    V = sparse_v(feat, expansion, max_dist, max_memory)
+    del expansion
 
-    initial_rank = batch_numpy_topk(feat, feat, k1 + 1, N=6000)
-    del probFea
-    del galFea
-    gc.collect()  # empty memory
-    R = []
-    for i in tqdm(range(all_num)):
-        # k-reciprocal neighbors
-        k_reciprocal_index = k_reciprocal_neigh(initial_rank, i, k1)
-        k_reciprocal_expansion_index = k_reciprocal_index
-        for j in range(len(k_reciprocal_index)):
-            candidate = k_reciprocal_index[j]
-            candidate_k_reciprocal_index = k_reciprocal_neigh(
-                initial_rank, candidate, int(np.around(k1 / 2)))
-            if len(
-                    np.intersect1d(candidate_k_reciprocal_index,
-                                   k_reciprocal_index)) > 2. / 3 * len(
-                                       candidate_k_reciprocal_index):
-                k_reciprocal_expansion_index = np.append(
-                    k_reciprocal_expansion_index, candidate_k_reciprocal_index)
-        k_reciprocal_expansion_index = np.unique(k_reciprocal_expansion_index)
-        R.append(k_reciprocal_expansion_index)
-
-    gc.collect()  # empty memory
-    V = batch_v(feat, R, all_num)
-    del R
-    gc.collect()  # empty memory
-    initial_rank = initial_rank[:, :k2]
-
-    # Faster version
     if k2 != 1:
-        V_qe = np.zeros_like(V, dtype=np.float16)
-        for i in range(all_num):
-            V_qe[i, :] = np.mean(V[initial_rank[i], :], axis=0)
-        V = V_qe
-        del V_qe
+        query_expansion = sparse.csr_matrix(
+            (np.ones(
+                (all_num * k2, ), dtype=np.float32),
+             (np.repeat(np.arange(all_num), k2),
+              initial_rank[:, :k2].reshape(-1))),
+            shape=(all_num, all_num))
+        V = query_expansion.dot(V) / float(k2)
     del initial_rank
-    gc.collect()  # empty memory
-    invIndex = []
-    for i in range(all_num):
-        invIndex.append(np.where(V[:, i] != 0)[0])
-    jaccard_dist = np.zeros((query_num, all_num), dtype=np.float32)
-    for i in tqdm(range(query_num)):
-        temp_min = np.zeros(shape=[1, all_num], dtype=np.float32)
-        indNonZero = np.where(V[i, :] != 0)[0]
-        indImages = [invIndex[ind] for ind in indNonZero]
-        for j in range(len(indNonZero)):
-            temp_min[0, indImages[j]] = temp_min[0, indImages[j]] + np.minimum(
-                V[i, indNonZero[j]], V[indImages[j], indNonZero[j]])
-        jaccard_dist[i] = 1 - temp_min / (2. - temp_min)
-    del V
-    gc.collect()  # empty memory
-    original_dist = batch_euclidean_distance(feat, feat[:query_num, :])
-    final_dist = jaccard_dist * (1 - lambda_value
-                                 ) + original_dist * lambda_value
-    del original_dist
-    del jaccard_dist
-    final_dist = final_dist[:query_num, query_num:]
-    return final_dist
+
+    V = V.tocsr()
+    V_gal = V[query_num:].tocsc()
+    # original distances are normalized as probes in blocks of 6000, by
+    # the max distance of the first probe of the block
+    scale = max_dist[np.arange(query_num) // 6000 * 6000]
+    # bytes of temporary arrays of each probe, the dense rows and the pairs
+    # of the nonzeros in the same columns
+    num_pairs = (V[:query_num] != 0).dot(np.diff(V_gal.indptr))
+    row_bytes = (all_num - query_num) * (feat.itemsize * 3 + 16) + \
+        num_pairs * 48
+
+    blocks = _split_rows(row_bytes, max_memory // max(1, num_workers))
+    _SHARED_RERANK = (V, V_gal, feat, query_num, scale, lambda_value)
+    try:
+        final_dist = _map_blocks(_rerank_block, blocks, num_workers)
+    finally:
+        _SHARED_RERANK = None
+    return np.concatenate(final_dist, axis=0)
 
 
 def visual_rerank(prb_feats,
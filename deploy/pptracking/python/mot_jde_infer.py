@@ -24,6 +24,7 @@ from benchmark_utils import PaddleInferBenchmark
 from preprocess import decode_image
 from mot_utils import argsparser, Timer, get_current_memory_mb
 from det_infer import Detector, get_test_images, print_arguments, bench_log, PredictConfig
+from video_sink import VideoSink
 
 # add python path
 import sys
@@ -287,9 +288,7 @@ class JDE_Detector(Detector):
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
         out_path = os.path.join(self.output_dir, video_out_name)
-        video_format = 'mp4v'
-        fourcc = cv2.VideoWriter_fourcc(*video_format)
-        writer = cv2.VideoWriter(out_path, fourcc, fps, (width, height))
+        writer = VideoSink(out_path, fps)
 
         frame_id = 1
         timer = MOTTimer()
@@ -32,6 +32,7 @@ sys.path.insert(0, parent_path)
 
 from det_infer import Detector, get_test_images, print_arguments, bench_log, PredictConfig, load_predictor
 from mot_utils import argsparser, Timer, get_current_memory_mb, video2frames, _is_valid_video
+from video_sink import VideoSink
 from mot.tracker import JDETracker, DeepSORTTracker
 from mot.utils import MOTTimer, write_mot_results, get_crops, clip_box, flow_statistic
 from mot.visualize import plot_tracking, plot_tracking_dict
@@ -477,9 +478,7 @@ class SDE_Detector(Detector):
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
         out_path = os.path.join(self.output_dir, video_out_name)
-        video_format = 'mp4v'
-        fourcc = cv2.VideoWriter_fourcc(*video_format)
-        writer = cv2.VideoWriter(out_path, fourcc, fps, (width, height))
+        writer = VideoSink(out_path, fps)
 
         frame_id = 1
         timer = MOTTimer()
@@ -601,6 +600,7 @@ class SDE_Detector(Detector):
         # 3.camera releated parameters
         use_camera = mtmct_cfg.get('use_camera', False)
         use_st_filter = mtmct_cfg.get('use_st_filter', False)
+        cam_topology = mtmct_cfg.get('cam_topology', None)
 
         # 4.zone releated parameters
         use_roi = mtmct_cfg.get('use_roi', False)
@@ -659,7 +659,8 @@ class SDE_Detector(Detector):
             use_ff=use_ff,
             use_rerank=use_rerank,
             use_camera=use_camera,
-            use_st_filter=use_st_filter)
+            use_st_filter=use_st_filter,
+            cam_topology=cam_topology)
 
         pred_mtmct_file = os.path.join(output_dir, 'mtmct_result.txt')
         if use_camera:
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from functools import lru_cache
+
 import numpy as np
 from scipy.special import softmax
 
@@ -78,6 +80,85 @@ def area_of(left_top, right_bottom):
     return hw[..., 0] * hw[..., 1]
 
 
+@lru_cache(maxsize=32, typed=True)
+def get_centers(input_h, input_w, stride):
+    """
+    Centers of the feature map of a stride, [h * w, 4] in (x, y, x, y),
+    cached for each input shape.
+    """
+    fm_h = input_h / stride
+    fm_w = input_w / stride
+    h_range = np.arange(fm_h)
+    w_range = np.arange(fm_w)
+    ww, hh = np.meshgrid(w_range, h_range)
+    ct_row = (hh.flatten() + 0.5) * stride
+    ct_col = (ww.flatten() + 0.5) * stride
+    center = np.stack((ct_col, ct_row, ct_col, ct_row), axis=1)
+    center.setflags(write=False)
+    return center
+
+
+def batched_hard_nms(boxes,
+                     scores,
+                     groups,
+                     iou_threshold,
+                     top_k=-1,
+                     candidate_size=200,
+                     max_iou_size=2**22):
+    """
+    hard_nms of all groups (e.g. each class of each image) at once. The
+    candidates of each group are padded to a row, and in each step every
+    group picks its best remaining box and suppresses the boxes overlapped
+    in its row, so the steps are the max number of boxes picked in a group.
+    The picked boxes are the same as hard_nms of each group.
+
+    Args:
+        boxes (M, 4): boxes in corner-form.
+        scores (M): probabilities.
+        groups (M): group index of each box, boxes are sorted by groups.
+        iou_threshold: intersection over union threshold.
+        top_k: keep top_k results of each group. If k <= 0, keep all.
+        candidate_size: only consider the candidates with the highest scores
+            in each group.
+        max_iou_size (int): max size of IoU matrices of groups computed at
+            once, to bound memory.
+    Returns:
+        picked: indexes of the kept boxes, sorted by groups and descending
+            scores in each group.
+    """
+    if len(groups) == 0:
+        return np.zeros((0, ), dtype=np.int64)
+    _, starts, counts = np.unique(groups, return_index=True, return_counts=True)
+    num_cand = min(int(counts.max()), candidate_size)
+    # candidates in the order of hard_nms, descending scores
+    cand = np.full((len(counts), num_cand), -1, dtype=np.int64)
+    for i, (start, count) in enumerate(zip(starts, counts)):
+        order = np.argsort(scores[start:start + count])
+        order = order[-candidate_size:][::-1] + start
+        cand[i, :len(order)] = order
+
+    picked = np.zeros(cand.shape, dtype=bool)
+    chunk = max(1, max_iou_size // (num_cand * num_cand))
+    for begin in range(0, len(counts), chunk):
+        chunk_cand = cand[begin:begin + chunk]
+        cand_boxes = boxes[np.maximum(chunk_cand, 0)]
+        iou = iou_of(cand_boxes[:, :, None, :], cand_boxes[:, None, :, :])
+        rows = np.arange(len(chunk_cand))
+        alive = chunk_cand >= 0
+        num_picked = np.zeros((len(chunk_cand), ), dtype=np.int64)
+        chunk_picked = picked[begin:begin + chunk]
+        while alive.any():
+            active = rows[alive.any(axis=1)]
+            current = np.argmax(alive[active], axis=1)
+            chunk_picked[active, current] = True
+            num_picked[active] += 1
+            alive[active, current] = False
+            alive[active] &= iou[active, current] <= iou_threshold
+            if top_k > 0:
+                alive[num_picked >= top_k] = False
+    return cand[picked]
+
+
 class PicoDetPostProcess(object):
     """
     Args:
@@ -132,96 +213,69 @@ class PicoDetPostProcess(object):
     def __call__(self, scores, raw_boxes):
         batch_size = raw_boxes[0].shape[0]
         reg_max = int(raw_boxes[0].shape[-1] / 4 - 1)
-        out_boxes_num = []
-        out_boxes_list = []
-        for batch_id in range(batch_size):
-            # generate centers
-            decode_boxes = []
-            select_scores = []
-            for stride, box_distribute, score in zip(self.strides, raw_boxes,
-                                                     scores):
-                box_distribute = box_distribute[batch_id]
-                score = score[batch_id]
-                # centers
-                fm_h = self.input_shape[0] / stride
-                fm_w = self.input_shape[1] / stride
-                h_range = np.arange(fm_h)
-                w_range = np.arange(fm_w)
-                ww, hh = np.meshgrid(w_range, h_range)
-                ct_row = (hh.flatten() + 0.5) * stride
-                ct_col = (ww.flatten() + 0.5) * stride
-                center = np.stack((ct_col, ct_row, ct_col, ct_row), axis=1)
-
-                # box distribution to distance
-                reg_range = np.arange(reg_max + 1)
-                box_distance = box_distribute.reshape((-1, reg_max + 1))
-                box_distance = softmax(box_distance, axis=1)
-                box_distance = box_distance * np.expand_dims(reg_range, axis=0)
-                box_distance = np.sum(box_distance, axis=1).reshape((-1, 4))
-                box_distance = box_distance * stride
-
-                # top K candidate
-                topk_idx = np.argsort(score.max(axis=1))[::-1]
-                topk_idx = topk_idx[:self.nms_top_k]
-                center = center[topk_idx]
-                score = score[topk_idx]
-                box_distance = box_distance[topk_idx]
-
-                # decode box
-                decode_box = center + [-1, -1, 1, 1] * box_distance
-
-                select_scores.append(score)
-                decode_boxes.append(decode_box)
-
-            # nms
-            bboxes = np.concatenate(decode_boxes, axis=0)
-            confidences = np.concatenate(select_scores, axis=0)
-            picked_box_probs = []
-            picked_labels = []
-            for class_index in range(0, confidences.shape[1]):
-                probs = confidences[:, class_index]
-                mask = probs > self.score_threshold
-                probs = probs[mask]
-                if probs.shape[0] == 0:
-                    continue
-                subset_boxes = bboxes[mask, :]
-                box_probs = np.concatenate(
-                    [subset_boxes, probs.reshape(-1, 1)], axis=1)
-                box_probs = hard_nms(
-                    box_probs,
-                    iou_threshold=self.nms_threshold,
-                    top_k=self.keep_top_k, )
-                picked_box_probs.append(box_probs)
-                picked_labels.extend([class_index] * box_probs.shape[0])
-
-            if len(picked_box_probs) == 0:
-                out_boxes_list.append(np.empty((0, 4)))
-                out_boxes_num.append(0)
-
-            else:
-                picked_box_probs = np.concatenate(picked_box_probs)
-
-                # resize output boxes
-                picked_box_probs[:, :4] = self.warp_boxes(
-                    picked_box_probs[:, :4], self.ori_shape[batch_id])
-                im_scale = np.concatenate([
-                    self.scale_factor[batch_id][::-1],
-                    self.scale_factor[batch_id][::-1]
-                ])
-                picked_box_probs[:, :4] /= im_scale
-                # clas score box
-                out_boxes_list.append(
-                    np.concatenate(
-                        [
-                            np.expand_dims(
-                                np.array(picked_labels),
-                                axis=-1), np.expand_dims(
-                                    picked_box_probs[:, 4], axis=-1),
-                            picked_box_probs[:, :4]
-                        ],
-                        axis=1))
-                out_boxes_num.append(len(picked_labels))
-
-        out_boxes_list = np.concatenate(out_boxes_list, axis=0)
-        out_boxes_num = np.asarray(out_boxes_num).astype(np.int32)
+        num_classes = scores[0].shape[-1]
+        reg_range = np.arange(reg_max + 1)
+        decode_boxes = []
+        select_scores = []
+        for stride, box_distribute, score in zip(self.strides, raw_boxes,
+                                                 scores):
+            # top K candidate of all images, before decoding distributions
+            topk_idx = np.argsort(score.max(axis=2), axis=1)[:, ::-1]
+            topk_idx = topk_idx[:, :self.nms_top_k]
+            score = np.take_along_axis(score, topk_idx[:, :, None], axis=1)
+            box_distribute = np.take_along_axis(
+                box_distribute, topk_idx[:, :, None], axis=1)
+            center = get_centers(self.input_shape[0], self.input_shape[1],
+                                 stride)[topk_idx]
+
+            # box distribution to distance
+            box_distance = box_distribute.reshape(
+                (batch_size, -1, reg_max + 1))
+            box_distance = softmax(box_distance, axis=2)
+            box_distance = box_distance * reg_range
+            box_distance = np.sum(box_distance, axis=2).reshape(
+                (batch_size, -1, 4))
+            box_distance = box_distance * stride
+
+            # decode box
+            decode_box = center + [-1, -1, 1, 1] * box_distance
+
+            select_scores.append(score)
+            decode_boxes.append(decode_box)
+
+        # nms of each class of each image in one call
+        bboxes = np.concatenate(decode_boxes, axis=1)
+        confidences = np.concatenate(select_scores, axis=1)
+        im_ids, class_ids, box_ids = np.nonzero(
+            (confidences > self.score_threshold).transpose((0, 2, 1)))
+        groups = im_ids * num_classes + class_ids
+        cand_boxes = bboxes[im_ids, box_ids]
+        cand_scores = confidences[im_ids, box_ids, class_ids]
+        keep = batched_hard_nms(
+            cand_boxes,
+            cand_scores,
+            groups,
+            iou_threshold=self.nms_threshold,
+            top_k=self.keep_top_k)
+        out_boxes_num = np.bincount(
+            im_ids[keep], minlength=batch_size).astype(np.int32)
+        if len(keep) == 0:
+            return np.empty((0, 4)), out_boxes_num
+
+        # resize output boxes
+        im_ids = im_ids[keep]
+        ori_shape = np.asarray(self.ori_shape)[im_ids]
+        picked_boxes = self.warp_boxes(cand_boxes[keep],
+                                       ori_shape.T[:, :, None])
+        scale_factor = np.asarray(self.scale_factor)[im_ids]
+        im_scale = np.concatenate(
+            [scale_factor[:, ::-1], scale_factor[:, ::-1]], axis=1)
+        picked_boxes = picked_boxes.astype(np.float64) / im_scale
+        # clas score box
+        out_boxes_list = np.concatenate(
+            [
+                class_ids[keep][:, None].astype(np.float64),
+                cand_scores[keep][:, None], picked_boxes
+            ],
+            axis=1)
         return out_boxes_list, out_boxes_num
@@ -0,0 +1,164 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import queue
+import threading
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+__all__ = ['VideoSink']
+
+# marks the end of the frames
+_END = object()
+
+
+def scale_tlwhs(tlwhs, scale):
+    """
+    Scale boxes in format `(top left x, top left y, width, height)` to draw
+    them on the frames downscaled by `VideoSink.resize`. tlwhs is a list of
+    boxes, or a dict of lists of boxes by class id.
+    """
+    if scale == 1.:
+        return tlwhs
+    if isinstance(tlwhs, dict):
+        return defaultdict(list, {
+            cls_id: scale_tlwhs(cls_tlwhs, scale)
+            for cls_id, cls_tlwhs in tlwhs.items()
+        })
+    return [np.asarray(tlwh) * scale for tlwh in tlwhs]
+
+
+class VideoSink(object):
+    """
+    Encode frames to a video file on a worker thread. Frames are passed by
+    a bounded queue, `write` blocks when it is full, so no frame is dropped
+    and at most `queue_size` frames are kept in memory. The writer is opened
+    with the size of the first frame, and frames of other sizes are resized
+    to it.
+
+    Args:
+        out_path (str): path of the output video.
+        fps (int|float): frame rate of the output video.
+        scale (float): scale of the frames to draw on, see `resize`. Frames
+            are expected to be drawn at this scale, the output video is
+            encoded at the size of the first frame written.
+        fourcc (str): four character code of the codec.
+        queue_size (int): max number of frames waiting to be encoded.
+    """
+
+    def __init__(self,
+                 out_path,
+                 fps=30,
+                 scale=1.,
+                 fourcc='mp4v',
+                 queue_size=16):
+        self.out_path = out_path
+        self.fps = fps
+        self.scale = scale
+        self.fourcc = fourcc
+        self.frame_num = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        # opened by the worker with the first frame, released by _close
+        self._writer = None
+        out_dir = os.path.dirname(os.path.abspath(out_path))
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def resize(self, image):
+        """
+        Return a copy of image downscaled by `scale` to draw on, or image
+        itself if scale is 1.
+        """
+        if self.scale == 1.:
+            return image
+        return cv2.resize(
+            image,
+            None,
+            fx=self.scale,
+            fy=self.scale,
+            interpolation=cv2.INTER_AREA)
+
+    def write(self, frame):
+        """
+        Queue a BGR frame to be encoded, the frame should not be modified
+        after it is written.
+        """
+        self._put(frame)
+        self.frame_num += 1
+
+    def release(self):
+        """Wait for the queued frames to be encoded and close the video."""
+        if self._worker is None:
+            return
+        try:
+            self._put(_END)
+        finally:
+            self._close()
+        print('save result to {}'.format(self.out_path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def _close(self):
+        """Join the worker and release the writer, also on errors."""
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+
+    def _put(self, item):
+        while True:
+            if self._error is not None:
+                self._close()
+                raise self._error
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self):
+        size = None
+        try:
+            while True:
+                frame = self._queue.get()
+                if frame is _END:
+                    break
+                if self._writer is None:
+                    size = (frame.shape[1], frame.shape[0])
+                    self._writer = cv2.VideoWriter(
+                        self.out_path,
+                        cv2.VideoWriter_fourcc(*self.fourcc), self.fps, size)
+                elif (frame.shape[1], frame.shape[0]) != size:
+                    frame = cv2.resize(frame, size)
+                self._writer.write(frame)
+        except Exception as e:
+            self._error = e
+            # unblock the producer, frames left are discarded
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
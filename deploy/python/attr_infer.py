@@ -33,7 +33,7 @@ from benchmark_utils import PaddleInferBenchmark
 from preprocess import preprocess, Resize, NormalizeImage, Permute, PadStride, LetterBoxResize, WarpAffine
 from visualize import visualize_attr
 from utils import argsparser, Timer, get_current_memory_mb
-from infer import Detector, get_test_images, print_arguments, load_predictor
+from infer import Detector, InputBuffer, get_test_images, print_arguments, load_predictor
 
 from PIL import Image, ImageDraw, ImageFont
 
@@ -83,6 +83,8 @@ class AttrDetector(Detector):
             enable_mkldnn=enable_mkldnn,
             output_dir=output_dir,
             threshold=threshold, )
+        # crops are resized to a fixed shape, reuse the input arrays
+        self.input_buffer = InputBuffer()
 
     def get_label(self):
         return self.pred_config.labels
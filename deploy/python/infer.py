@@ -16,6 +16,9 @@ import os
 import yaml
 import glob
 import json
+import time
+import queue
+import threading
 from pathlib import Path
 from functools import reduce
 
@@ -36,7 +39,9 @@ from picodet_postprocess import PicoDetPostProcess
 from preprocess import preprocess, Resize, NormalizeImage, Permute, PadStride, LetterBoxResize, WarpAffine, Pad, decode_image
 from keypoint_preprocess import EvalAffine, TopDownEvalAffine, expand_crop
 from visualize import visualize_box_mask
-from utils import argsparser, Timer, get_current_memory_mb
+from mask_postprocess import paste_masks_in_box
+from utils import argsparser, Timer, Times, get_current_memory_mb
+from video_sink import VideoSink
 
 # Global dictionary
 SUPPORT_MODELS = {
@@ -137,37 +142,60 @@ class Detector(object):
         self.batch_size = batch_size
         self.output_dir = output_dir
         self.threshold = threshold
+        # set to InputBuffer to build inputs in preallocated arrays, only if
+        # inputs are fed before the next batch is built
+        self.input_buffer = None
 
     def set_config(self, model_dir):
         return PredictConfig(model_dir)
 
-    def preprocess(self, image_list):
+    def create_preprocess_ops(self):
         preprocess_ops = []
         for op_info in self.pred_config.preprocess_infos:
             new_op_info = op_info.copy()
             op_type = new_op_info.pop('type')
             preprocess_ops.append(eval(op_type)(**new_op_info))
+        return preprocess_ops
 
+    def build_inputs(self, image_list, preprocess_ops=None,
+                     reuse_buffer=True):
+        if preprocess_ops is None:
+            preprocess_ops = self.create_preprocess_ops()
         input_im_lst = []
         input_im_info_lst = []
         for im_path in image_list:
             im, im_info = preprocess(im_path, preprocess_ops)
             input_im_lst.append(im)
             input_im_info_lst.append(im_info)
-        inputs = create_inputs(input_im_lst, input_im_info_lst)
+        input_buffer = self.input_buffer if reuse_buffer else None
+        return create_inputs(input_im_lst, input_im_info_lst, input_buffer)
+
+    def feed_inputs(self, inputs):
         input_names = self.predictor.get_input_names()
         for i in range(len(input_names)):
             input_tensor = self.predictor.get_input_handle(input_names[i])
             input_tensor.copy_from_cpu(inputs[input_names[i]])
 
+    def preprocess(self, image_list):
+        inputs = self.build_inputs(image_list)
+        self.feed_inputs(inputs)
         return inputs
 
     def postprocess(self, inputs, result):
         # postprocess output of predictor
         np_boxes_num = result['boxes_num']
-        if np_boxes_num[0] <= 0:
+        if np.sum(np_boxes_num) <= 0:
             print('[WARNNING] No object detected.')
-            result = {'boxes': np.zeros([0, 6]), 'boxes_num': [0]}
+            result = {
+                'boxes': np.zeros([0, 6]),
+                'boxes_num': [0] * max(1, len(np_boxes_num))
+            }
+        elif self.pred_config.mask_paste_in_box and \
+                result.get('masks') is not None:
+            origin_shape = np.floor(inputs['im_shape'] / inputs[
+                'scale_factor'] + 0.5)
+            result['masks'] = paste_masks_in_box(
+                result['masks'], result['boxes'], np_boxes_num, origin_shape)
         result = {k: v for k, v in result.items() if v is not None}
         return result
 
@@ -303,7 +331,7 @@ class Detector(object):
         results = self.merge_batch_result(results)
         return results
 
-    def predict_video(self, video_file, camera_id):
+    def predict_video(self, video_file, camera_id, pipeline=False):
         video_out_name = 'output.mp4'
         if camera_id != -1:
             capture = cv2.VideoCapture(camera_id)
@@ -320,8 +348,11 @@ class Detector(object):
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
         out_path = os.path.join(self.output_dir, video_out_name)
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        writer = cv2.VideoWriter(out_path, fourcc, fps, (width, height))
+        writer = VideoSink(out_path, fps)
+        if pipeline:
+            self.predict_video_pipeline(capture, writer, camera_id)
+            writer.release()
+            return
         index = 1
         while (1):
             ret, frame = capture.read()
@@ -344,6 +375,136 @@ class Detector(object):
                     break
         writer.release()
 
+    def predict_video_pipeline(self, capture, writer, camera_id,
+                               queue_size=8):
+        """
+        Predict video frames with 3 worker threads and the current thread
+        as a pipeline, connected by bounded queues:
+        capture -> preprocess -> inference and postprocess -> visualize and
+        write. Frames waiting in the queue are predicted in a batch of at most
+        `batch_size` frames, the pipeline never waits to fill a batch. Frames
+        are written in capture order.
+        """
+        preprocess_ops = self.create_preprocess_ops()
+        frame_queue = queue.Queue(maxsize=queue_size)
+        input_queue = queue.Queue(maxsize=queue_size)
+        result_queue = queue.Queue(maxsize=queue_size)
+        stop_event = threading.Event()
+        errors = []
+        read_times, visual_times = Times(), Times()
+
+        def capture_frames():
+            while not stop_event.is_set():
+                read_times.start()
+                ret, frame = capture.read()
+                read_times.end()
+                if not ret:
+                    break
+                queue_put(frame_queue, frame, stop_event)
+            queue_put(frame_queue, None, stop_event)
+
+        def preprocess_frames():
+            end = False
+            while not end:
+                frame = queue_get(frame_queue, stop_event)
+                if frame is None:
+                    break
+                frames = [frame]
+                while len(frames) < self.batch_size:
+                    try:
+                        frame = frame_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if frame is None:
+                        end = True
+                        break
+                    frames.append(frame)
+                self.det_times.preprocess_time_s.start()
+                # inputs are queued, never build them in shared buffers
+                inputs = self.build_inputs(
+                    frames, preprocess_ops, reuse_buffer=False)
+                self.det_times.preprocess_time_s.end()
+                queue_put(input_queue, (frames, inputs), stop_event)
+            queue_put(input_queue, None, stop_event)
+
+        def predict_frames():
+            while True:
+                item = queue_get(input_queue, stop_event)
+                if item is None:
+                    break
+                frames, inputs = item
+                self.det_times.inference_time_s.start()
+                self.feed_inputs(inputs)
+                result = self.predict()
+                self.det_times.inference_time_s.end()
+
+                self.det_times.postprocess_time_s.start()
+                result = self.postprocess(inputs, result)
+                results = split_batch_result(result, len(frames))
+                self.det_times.postprocess_time_s.end()
+                self.det_times.img_num += len(frames)
+                queue_put(result_queue, (frames, results), stop_event)
+            queue_put(result_queue, None, stop_event)
+
+        def run_worker(func):
+            try:
+                func()
+            except Exception as e:
+                errors.append(e)
+                stop_event.set()
+
+        workers = [
+            threading.Thread(
+                target=run_worker, args=(func, ), daemon=True)
+            for func in [capture_frames, preprocess_frames, predict_frames]
+        ]
+        start_time = time.time()
+        for worker in workers:
+            worker.start()
+
+        index = 1
+        while True:
+            item = queue_get(result_queue, stop_event)
+            if item is None:
+                break
+            for frame, result in zip(*item):
+                print('detect frame: %d' % (index))
+                index += 1
+                visual_times.start()
+                im = visualize_box_mask(
+                    frame,
+                    result,
+                    self.pred_config.labels,
+                    threshold=self.threshold)
+                im = np.array(im)
+                writer.write(im)
+                visual_times.end()
+                if camera_id != -1:
+                    cv2.imshow('Mask Detection', im)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        stop_event.set()
+                        break
+
+        stop_event.set()
+        for worker in workers:
+            worker.join()
+        if len(errors) > 0:
+            raise errors[0]
+
+        frame_num = max(1, index - 1)
+        total_time = time.time() - start_time
+        print("------------------ Video Pipeline Info ----------------------")
+        print("frames: {}, total_time(s): {:.2f}, fps: {:.2f}".format(
+            index - 1, total_time, (index - 1) / max(total_time, 1e-6)))
+        print("stage latency per frame(ms): capture: {:.2f}, preprocess: "
+              "{:.2f}, inference: {:.2f}, postprocess: {:.2f}, visualize: "
+              "{:.2f}".format(
+                  read_times.time * 1000 / frame_num,
+                  self.det_times.preprocess_time_s.time * 1000 / frame_num,
+                  self.det_times.inference_time_s.time * 1000 / frame_num,
+                  self.det_times.postprocess_time_s.time * 1000 / frame_num,
+                  visual_times.time * 1000 / frame_num))
+
     @staticmethod
     def format_coco_results(image_list, results, save_file=None):
         coco_results = []
@@ -574,14 +735,96 @@ class DetectorPicoDet(Detector):
         return result
 
 
-def create_inputs(imgs, im_info):
+def queue_put(q, item, stop_event, timeout=0.1):
+    """put item to a bounded queue, give up when stop_event is set"""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=timeout)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def queue_get(q, stop_event, timeout=0.1):
+    """get item from a queue, return None when stop_event is set"""
+    while not stop_event.is_set():
+        try:
+            return q.get(timeout=timeout)
+        except queue.Empty:
+            continue
+    return None
+
+
+def split_batch_result(result, batch_size):
+    """
+    split the result of a batch into results of each image
+    Args:
+        result (dict): result of postprocess, 'boxes_num' is the number of
+            boxes of each image, other items whose first dim equals to the
+            total number of boxes are split by images
+        batch_size (int): number of images in the batch
+    Returns:
+        results (list[dict]): result of each image
+    """
+    if batch_size == 1:
+        return [result]
+    boxes_num = np.asarray(result['boxes_num']).reshape([-1])
+    if len(boxes_num) != batch_size:
+        boxes_num = np.zeros([batch_size], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(boxes_num)])
+    results = []
+    for i in range(batch_size):
+        res = {}
+        for k, v in result.items():
+            if k == 'boxes_num':
+                res[k] = boxes_num[i:i + 1]
+            elif isinstance(v, np.ndarray) and v.ndim > 0 and \
+                    v.shape[0] == offsets[-1]:
+                res[k] = v[offsets[i]:offsets[i + 1]]
+            else:
+                res[k] = v
+        results.append(res)
+    return results
+
+
+class InputBuffer(object):
+    """
+    Preallocated input arrays reused by batches. An array is reallocated
+    only when a larger batch or another image shape comes, so batches of
+    fixed size crops, e.g. inputs of attribute and keypoint models, are
+    built without allocation. Arrays returned are views of the buffers,
+    they are overwritten by the next batch.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, name, shape, dtype='float32'):
+        shape = tuple(shape)
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape[1:] != shape[1:] or \
+                buf.shape[0] < shape[0] or buf.dtype != np.dtype(dtype):
+            num = shape[0]
+            if buf is not None and buf.shape[1:] == shape[1:]:
+                num = max(num, buf.shape[0])
+            buf = np.empty((num, ) + shape[1:], dtype=dtype)
+            self.buffers[name] = buf
+        return buf[:shape[0]]
+
+
+def create_inputs(imgs, im_info, input_buffer=None):
     """generate input for different model type
     Args:
         imgs (list(numpy)): list of images (np.ndarray)
         im_info (list(dict)): list of image info
+        input_buffer (InputBuffer|None): build inputs in preallocated arrays
+            of input_buffer if not None
     Returns:
         inputs (dict): input of model
     """
+    if input_buffer is not None:
+        return create_inputs_in_buffer(imgs, im_info, input_buffer)
     inputs = {}
 
     im_shape = []
@@ -615,6 +858,31 @@ def create_inputs(imgs, im_info):
     return inputs
 
 
+def create_inputs_in_buffer(imgs, im_info, input_buffer):
+    """same as create_inputs, but inputs are written to input_buffer"""
+    num = len(imgs)
+    inputs = {}
+    im_shape = input_buffer.get('im_shape', (num, 2))
+    scale_factor = input_buffer.get('scale_factor', (num, 2))
+    for i, e in enumerate(im_info):
+        im_shape[i] = e['im_shape']
+        scale_factor[i] = e['scale_factor']
+    inputs['im_shape'] = im_shape
+    inputs['scale_factor'] = scale_factor
+
+    im_c = imgs[0].shape[0]
+    max_shape_h = max([e.shape[1] for e in imgs])
+    max_shape_w = max([e.shape[2] for e in imgs])
+    image = input_buffer.get('image', (num, im_c, max_shape_h, max_shape_w))
+    for i, img in enumerate(imgs):
+        im_h, im_w = img.shape[1:]
+        if im_h != max_shape_h or im_w != max_shape_w:
+            image[i] = 0.
+        image[i, :, :im_h, :im_w] = img
+    inputs['image'] = image
+    return inputs
+
+
 class PredictConfig():
     """set config of preprocess, postprocess and visualize
     Args:
@@ -635,6 +903,7 @@ class PredictConfig():
         self.use_dynamic_shape = yml_conf['use_dynamic_shape']
         if 'mask' in yml_conf:
             self.mask = yml_conf['mask']
+        self.mask_paste_in_box = yml_conf.get('mask_paste_in_box', False)
         self.tracker = None
         if 'tracker' in yml_conf:
             self.tracker = yml_conf['tracker']
@@ -870,7 +1139,10 @@ def main():
 
     # predict from video file or camera video stream
     if FLAGS.video_file is not None or FLAGS.camera_id != -1:
-        detector.predict_video(FLAGS.video_file, FLAGS.camera_id)
+        detector.predict_video(
+            FLAGS.video_file,
+            FLAGS.camera_id,
+            pipeline=FLAGS.video_pipeline)
     else:
         # predict from image
         if FLAGS.image_dir is None and FLAGS.image_file is not None:
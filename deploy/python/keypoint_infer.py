@@ -36,8 +36,9 @@ from visualize import visualize_pose
 from paddle.inference import Config
 from paddle.inference import create_predictor
 from utils import argsparser, Timer, get_current_memory_mb
+from video_sink import VideoSink
 from benchmark_utils import PaddleInferBenchmark
-from infer import Detector, get_test_images, print_arguments
+from infer import Detector, InputBuffer, get_test_images, print_arguments
 
 # Global dictionary
 KEYPOINT_SUPPORT_MODELS = {
@@ -91,6 +92,8 @@ class KeyPointDetector(Detector):
             output_dir=output_dir,
             threshold=threshold, )
         self.use_dark = use_dark
+        # crops are resized to a fixed shape, reuse the input arrays
+        self.input_buffer = InputBuffer()
 
     def set_config(self, model_dir):
         return PredictConfig_KeyPoint(model_dir)
@@ -257,8 +260,7 @@ class KeyPointDetector(Detector):
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
         out_path = os.path.join(self.output_dir, video_name)
-        fourcc = cv2.VideoWriter_fourcc(* 'mp4v')
-        writer = cv2.VideoWriter(out_path, fourcc, fps, (width, height))
+        writer = VideoSink(out_path, fps)
         index = 1
         while (1):
             ret, frame = capture.read()
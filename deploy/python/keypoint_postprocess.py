@@ -13,10 +13,9 @@
 # limitations under the License.
 
 from scipy.optimize import linear_sum_assignment
-from collections import abc, defaultdict
+from collections import abc
 import cv2
 import numpy as np
-import math
 import paddle
 import paddle.nn as nn
 from keypoint_preprocess import get_affine_mat_kernel, get_affine_transform
@@ -56,117 +55,177 @@ class HrHRNetPostProcess(object):
                             -0.25)
         return offset_y + 0.5, offset_x + 0.5
 
-    def __call__(self, heatmap, tagmap, heat_k, inds_k, original_height,
-                 original_width):
+    def group(self, heats, tags, coords):
+        """
+        Group the top k joints of N images to people by their tags, joint
+        type by joint type. Clusters of all images are kept in fixed-shape
+        arrays with the running sum and number of their tags, so centroids
+        are updated in place instead of recomputed from lists of tags, and
+        distances to centroids are computed for all images at once.
 
-        N, J, H, W = heatmap.shape
-        assert N == 1, "only support batch size 1"
-        heatmap = heatmap[0]
-        tagmap = tagmap[0]
-        heats = heat_k[0]
-        inds_np = inds_k[0]
-        y = inds_np // W
-        x = inds_np % W
-        tags = tagmap[np.arange(J)[None, :].repeat(self.max_num_people),
-                      y.flatten(), x.flatten()].reshape(J, -1, tagmap.shape[-1])
-        coords = np.stack((y, x), axis=2)
-        # threshold
+        Args:
+            heats (np.ndarray): [N, J, K], heat values of the top k joints
+            tags (np.ndarray): [N, J, K, D], tags of the top k joints
+            coords (np.ndarray): [N, J, K, 2], (y, x) of the top k joints
+        Returns:
+            list of (tag_mean [P, D], coords [P, J, 2], scores [P, J]) of the
+            P people in each image
+        """
+        N, J, K, D = tags.shape
+        size = J * K
+        tag_sum = np.zeros((N, size, D), dtype=np.float64)
+        tag_num = np.zeros((N, size), dtype=np.int64)
+        pose_coords = np.zeros((N, size, J, 2), dtype=np.float32)
+        pose_scores = np.zeros((N, size, J), dtype=np.float32)
+        num_clusters = np.zeros((N, ), dtype=np.int64)
+        # clusters are identified by the first tag, as keys of a dict
+        keys = [{} for _ in range(N)]
         mask = heats > self.heat_thresh
-        # cluster
-        cluster = defaultdict(lambda: {
-            'coords': np.zeros((J, 2), dtype=np.float32),
-            'scores': np.zeros(J, dtype=np.float32),
-            'tags': []
-        })
-        for jid, m in enumerate(mask):
-            num_valid = m.sum()
-            if num_valid == 0:
+        num_cand = min(self.max_num_people, size)
+        for jid in range(J):
+            images = np.nonzero(mask[:, jid].any(axis=1))[0]
+            if len(images) == 0:
                 continue
-            valid_inds = np.where(m)[0]
-            valid_tags = tags[jid, m, :]
-            if len(cluster) == 0:  # initialize
-                for i in valid_inds:
-                    tag = tags[jid, i]
-                    key = tag[0]
-                    cluster[key]['tags'].append(tag)
-                    cluster[key]['scores'][jid] = heats[jid, i]
-                    cluster[key]['coords'][jid] = coords[jid, i]
-                continue
-            candidates = list(cluster.keys())[:self.max_num_people]
-            centroids = [
-                np.mean(
-                    cluster[k]['tags'], axis=0) for k in candidates
-            ]
-            num_clusters = len(centroids)
-            # shape is (num_valid, num_clusters, tag_dim)
-            dist = valid_tags[:, None, :] - np.array(centroids)[None, ...]
-            l2_dist = np.linalg.norm(dist, ord=2, axis=2)
-            # modulate dist with heat value, see `use_detection_val`
-            cost = np.round(l2_dist) * 100 - heats[jid, m, None]
-            # pad the cost matrix, otherwise new pose are ignored
-            if num_valid > num_clusters:
-                cost = np.pad(cost, ((0, 0), (0, num_valid - num_clusters)),
-                              'constant',
-                              constant_values=((0, 0), (0, 1e-10)))
-            rows, cols = linear_sum_assignment(cost)
-            for y, x in zip(rows, cols):
-                tag = tags[jid, y]
-                if y < num_valid and x < num_clusters and \
-                   l2_dist[y, x] < self.tag_thresh:
-                    key = candidates[x]  # merge to cluster
+            # shape is (N, K, num_cand)
+            centroids = tag_sum[images, :num_cand] / np.maximum(
+                tag_num[images, :num_cand, None], 1)
+            dist = tags[images, jid, :, None, :] - \
+                centroids.astype(np.float32)[:, None]
+            l2_dist = np.linalg.norm(dist, ord=2, axis=3)
+            for n, l2 in zip(images, l2_dist):
+                valid_inds = np.where(mask[n, jid])[0]
+                num_valid = len(valid_inds)
+                num_cluster = min(num_clusters[n], num_cand)
+                if num_cluster == 0:  # initialize
+                    rows = valid_inds
+                    merged = np.zeros((num_valid, ), dtype=bool)
+                    cols = merged.astype(np.int64)
                 else:
-                    key = tag[0]  # initialize new cluster
-                cluster[key]['tags'].append(tag)
-                cluster[key]['scores'][jid] = heats[jid, y]
-                cluster[key]['coords'][jid] = coords[jid, y]
-
-        # shape is [k, J, 2] and [k, J]
-        pose_tags = np.array([cluster[k]['tags'] for k in cluster])
-        pose_coords = np.array([cluster[k]['coords'] for k in cluster])
-        pose_scores = np.array([cluster[k]['scores'] for k in cluster])
-        valid = pose_scores > 0
-
-        pose_kpts = np.zeros((pose_scores.shape[0], J, 3), dtype=np.float32)
-        if valid.sum() == 0:
-            return pose_kpts, pose_kpts
-
-        # refine coords
-        valid_coords = pose_coords[valid].astype(np.int32)
-        y = valid_coords[..., 0].flatten()
-        x = valid_coords[..., 1].flatten()
-        _, j = np.nonzero(valid)
-        offsets = self.lerp(j, y, x, heatmap)
-        pose_coords[valid, 0] += offsets[0]
-        pose_coords[valid, 1] += offsets[1]
-
-        # mean score before salvage
-        mean_score = pose_scores.mean(axis=1)
-        pose_kpts[valid, 2] = pose_scores[valid]
-
-        # salvage missing joints
-        if True:
-            for pid, coords in enumerate(pose_coords):
-                tag_mean = np.array(pose_tags[pid]).mean(axis=0)
-                norm = np.sum((tagmap - tag_mean)**2, axis=3)**0.5
-                score = heatmap - np.round(norm)  # (J, H, W)
-                flat_score = score.reshape(J, -1)
-                max_inds = np.argmax(flat_score, axis=1)
-                max_scores = np.max(flat_score, axis=1)
-                salvage_joints = (pose_scores[pid] == 0) & (max_scores > 0)
-                if salvage_joints.sum() == 0:
-                    continue
-                y = max_inds[salvage_joints] // W
-                x = max_inds[salvage_joints] % W
-                offsets = self.lerp(salvage_joints.nonzero()[0], y, x, heatmap)
-                y = y.astype(np.float32) + offsets[0]
-                x = x.astype(np.float32) + offsets[1]
-                pose_coords[pid][salvage_joints, 0] = y
-                pose_coords[pid][salvage_joints, 1] = x
-                pose_kpts[pid][salvage_joints, 2] = max_scores[salvage_joints]
-        pose_kpts[..., :2] = transpred(pose_coords[..., :2][..., ::-1],
-                                       original_height, original_width,
-                                       min(H, W))
-        return pose_kpts, mean_score
+                    l2 = l2[valid_inds, :num_cluster]
+                    # modulate dist with heat value, see `use_detection_val`
+                    cost = np.round(l2) * 100 - heats[n, jid, valid_inds, None]
+                    # pad the cost matrix, otherwise new pose are ignored
+                    if num_valid > num_cluster:
+                        cost = np.pad(
+                            cost, ((0, 0), (0, num_valid - num_cluster)),
+                            'constant',
+                            constant_values=((0, 0), (0, 1e-10)))
+                    rows, cols = linear_sum_assignment(cost)
+                    merged = cols < num_cluster
+                    merged[merged] = l2[rows[merged], cols[merged]] < \
+                        self.tag_thresh
+                slots = cols.copy()
+                for i in np.nonzero(~merged)[0]:
+                    # initialize new cluster
+                    key = tags[n, jid, rows[i], 0]
+                    if key not in keys[n]:
+                        keys[n][key] = num_clusters[n]
+                        num_clusters[n] += 1
+                    slots[i] = keys[n][key]
+                np.add.at(tag_sum[n], slots, tags[n, jid, rows])
+                np.add.at(tag_num[n], slots, 1)
+                pose_scores[n, slots, jid] = heats[n, jid, rows]
+                pose_coords[n, slots, jid] = coords[n, jid, rows]
+
+        results = []
+        for n in range(N):
+            num = num_clusters[n]
+            tag_mean = tag_sum[n, :num] / np.maximum(tag_num[n, :num, None], 1)
+            results.append((tag_mean.astype(np.float32), pose_coords[n, :num],
+                            pose_scores[n, :num]))
+        return results
+
+    def salvage(self, pose_coords, pose_scores, pose_kpts, tag_mean, heatmap,
+                tagmap):
+        """
+        Salvage the missing joints of people at the max of heatmap - tag
+        distance, which is computed only for the missing joints.
+        """
+        J, H, W = heatmap.shape
+        pids, jids = np.nonzero(pose_scores == 0)
+        if len(pids) == 0:
+            return
+        max_inds = np.zeros((len(pids), ), dtype=np.int64)
+        max_scores = np.zeros((len(pids), ), dtype=heatmap.dtype)
+        # in chunks of joints to keep temporary maps small
+        chunk = max(1, 2**20 // (H * W))
+        for i in range(0, len(pids), chunk):
+            p, j = pids[i:i + chunk], jids[i:i + chunk]
+            diff = tagmap[j] - tag_mean[p, None, None, :]
+            norm = np.sum(np.square(diff, out=diff), axis=3)
+            np.sqrt(norm, out=norm)
+            score = np.subtract(heatmap[j], np.round(norm, out=norm), out=norm)
+            flat_score = score.reshape(len(j), -1)
+            max_inds[i:i + chunk] = np.argmax(flat_score, axis=1)
+            max_scores[i:i + chunk] = np.max(flat_score, axis=1)
+        salvage_joints = max_scores > 0
+        if salvage_joints.sum() == 0:
+            return
+        pids, jids = pids[salvage_joints], jids[salvage_joints]
+        y = max_inds[salvage_joints] // W
+        x = max_inds[salvage_joints] % W
+        offsets = self.lerp(jids, y, x, heatmap)
+        pose_coords[pids, jids, 0] = y.astype(np.float32) + offsets[0]
+        pose_coords[pids, jids, 1] = x.astype(np.float32) + offsets[1]
+        pose_kpts[pids, jids, 2] = max_scores[salvage_joints]
+
+    def __call__(self, heatmap, tagmap, heat_k, inds_k, original_height,
+                 original_width):
+        """
+        Args:
+            heatmap (np.ndarray): [N, J, H, W]
+            tagmap (np.ndarray): [N, J, H, W, D]
+            heat_k, inds_k (np.ndarray): [N, J, K], values and indexes of
+                the top k joints
+            original_height, original_width (float|list): the original image
+                size, or the sizes of each image
+        Returns:
+            keypoints [P, J, 3] and scores [P] of people in the image if
+            N is 1, otherwise lists of them of each image
+        """
+        N, J, H, W = heatmap.shape
+        y = inds_k // W
+        x = inds_k % W
+        tags = np.take_along_axis(
+            tagmap.reshape((N, J, H * W, -1)), inds_k[..., None], axis=2)
+        coords = np.stack((y, x), axis=3)
+        heights = np.broadcast_to(original_height, (N, ))
+        widths = np.broadcast_to(original_width, (N, ))
+
+        all_kpts, all_scores = [], []
+        for n, (tag_mean, pose_coords, pose_scores) in enumerate(
+                self.group(heat_k, tags, coords)):
+            valid = pose_scores > 0
+            pose_kpts = np.zeros(
+                (pose_scores.shape[0], J, 3), dtype=np.float32)
+            if valid.sum() == 0:
+                all_kpts.append(pose_kpts)
+                all_scores.append(pose_kpts)
+                continue
+
+            # refine coords
+            valid_coords = pose_coords[valid].astype(np.int32)
+            y = valid_coords[..., 0].flatten()
+            x = valid_coords[..., 1].flatten()
+            _, j = np.nonzero(valid)
+            offsets = self.lerp(j, y, x, heatmap[n])
+            pose_coords[valid, 0] += offsets[0]
+            pose_coords[valid, 1] += offsets[1]
+
+            # mean score before salvage
+            mean_score = pose_scores.mean(axis=1)
+            pose_kpts[valid, 2] = pose_scores[valid]
+
+            # salvage missing joints
+            self.salvage(pose_coords, pose_scores, pose_kpts, tag_mean,
+                         heatmap[n], tagmap[n])
+            pose_kpts[..., :2] = transpred(pose_coords[..., :2][..., ::-1],
+                                           heights[n], widths[n], min(H, W))
+            all_kpts.append(pose_kpts)
+            all_scores.append(mean_score)
+        if N == 1:
+            return all_kpts[0], all_scores[0]
+        return all_kpts, all_scores
 
 
 def transpred(kpts, h, w, s):
@@ -247,55 +306,71 @@ class HRNetPostProcess(object):
 
         return preds, maxvals
 
-    def gaussian_blur(self, heatmap, kernel):
+    def gaussian_blur(self, heatmap, kernel, chunk_size=64):
+        """
+        Blur heatmaps in place with the max of each one kept. Heatmaps are
+        padded by zeros and stacked to one image of `chunk_size` heatmaps,
+        the border of the padding splits them, so it is the same as
+        blurring them one by one.
+        """
         border = (kernel - 1) // 2
-        batch_size = heatmap.shape[0]
-        num_joints = heatmap.shape[1]
-        height = heatmap.shape[2]
-        width = heatmap.shape[3]
-        for i in range(batch_size):
-            for j in range(num_joints):
-                origin_max = np.max(heatmap[i, j])
-                dr = np.zeros((height + 2 * border, width + 2 * border))
-                dr[border:-border, border:-border] = heatmap[i, j].copy()
-                dr = cv2.GaussianBlur(dr, (kernel, kernel), 0)
-                heatmap[i, j] = dr[border:-border, border:-border].copy()
-                heatmap[i, j] *= origin_max / np.max(heatmap[i, j])
+        batch_size, num_joints, height, width = heatmap.shape
+        heatmaps = heatmap.reshape((-1, height, width))
+        origin_max = heatmaps.max(axis=(1, 2))
+        num_chunk = min(chunk_size, heatmaps.shape[0])
+        dr = np.zeros((num_chunk, height + 2 * border, width + 2 * border))
+        for start in range(0, heatmaps.shape[0], chunk_size):
+            chunk = heatmaps[start:start + chunk_size]
+            num = chunk.shape[0]
+            dr[:num, border:-border, border:-border] = chunk
+            blur = cv2.GaussianBlur(dr[:num].reshape((-1, dr.shape[2])),
+                                    (kernel, kernel), 0)
+            blur = blur.reshape((num, ) + dr.shape[1:])
+            chunk[...] = blur[:, border:-border, border:-border]
+        ratio = origin_max / heatmaps.max(axis=(1, 2))
+        heatmaps *= ratio[:, None, None]
+        heatmap[...] = heatmaps.reshape(heatmap.shape)
         return heatmap
 
-    def dark_parse(self, hm, coord):
-        heatmap_height = hm.shape[0]
-        heatmap_width = hm.shape[1]
-        px = int(coord[0])
-        py = int(coord[1])
-        if 1 < px < heatmap_width - 2 and 1 < py < heatmap_height - 2:
-            dx = 0.5 * (hm[py][px + 1] - hm[py][px - 1])
-            dy = 0.5 * (hm[py + 1][px] - hm[py - 1][px])
-            dxx = 0.25 * (hm[py][px + 2] - 2 * hm[py][px] + hm[py][px - 2])
-            dxy = 0.25 * (hm[py+1][px+1] - hm[py-1][px+1] - hm[py+1][px-1] \
-                + hm[py-1][px-1])
-            dyy = 0.25 * (
-                hm[py + 2 * 1][px] - 2 * hm[py][px] + hm[py - 2 * 1][px])
-            derivative = np.matrix([[dx], [dy]])
-            hessian = np.matrix([[dxx, dxy], [dxy, dyy]])
-            if dxx * dyy - dxy**2 != 0:
-                hessianinv = hessian.I
-                offset = -hessianinv * derivative
-                offset = np.squeeze(np.array(offset.T), axis=0)
-                coord += offset
-        return coord
-
     def dark_postprocess(self, hm, coords, kernelsize):
         """
         refer to https://github.com/ilovepose/DarkPose/lib/core/inference.py
 
+        The Taylor expansion of DARK is done for all keypoints at once,
+        keypoints too close to the border or with a singular hessian are
+        kept. The log of heatmaps is only taken at the points used.
         """
         hm = self.gaussian_blur(hm, kernelsize)
-        hm = np.maximum(hm, 1e-10)
-        hm = np.log(hm)
-        for n in range(coords.shape[0]):
-            for p in range(coords.shape[1]):
-                coords[n, p] = self.dark_parse(hm[n][p], coords[n][p])
+        heatmap_height, heatmap_width = hm.shape[2:]
+        px = coords[..., 0].astype(np.int64)
+        py = coords[..., 1].astype(np.int64)
+        valid = (1 < px) & (px < heatmap_width - 2) & (1 < py) & (
+            py < heatmap_height - 2)
+        n, p = np.nonzero(valid)
+        if n.shape[0] == 0:
+            return coords
+        px, py = px[n, p], py[n, p]
+        # log of the blurred heatmaps is only needed around the keypoints
+        offsets = [(0, 0), (0, 1), (0, -1), (1, 0), (-1, 0), (0, 2), (0, -2),
+                   (2, 0), (-2, 0), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+        dy, dx = np.array(offsets).T[:, :, None]
+        log_hm = np.log(np.maximum(hm[n, p, py + dy, px + dx], 1e-10))
+        at = dict(zip(offsets, log_hm))
+        dx = 0.5 * (at[0, 1] - at[0, -1])
+        dy = 0.5 * (at[1, 0] - at[-1, 0])
+        dxx = 0.25 * (at[0, 2] - 2 * at[0, 0] + at[0, -2])
+        dxy = 0.25 * (at[1, 1] - at[-1, 1] - at[1, -1] + at[-1, -1])
+        dyy = 0.25 * (at[2, 0] - 2 * at[0, 0] + at[-2, 0])
+        invertible = dxx * dyy - dxy**2 != 0
+        if not invertible.any():
+            return coords
+        derivative = np.stack((dx, dy), axis=-1)[invertible, :, None]
+        hessian = np.stack(
+            (np.stack(
+                (dxx, dxy), axis=-1), np.stack(
+                    (dxy, dyy), axis=-1)), axis=-2)[invertible]
+        offset = np.matmul(-np.linalg.inv(hessian), derivative)[..., 0]
+        coords[n[invertible], p[invertible]] += offset
         return coords
 
     def get_final_preds(self, heatmaps, center, scale, kernelsize=3):
@@ -320,23 +395,22 @@ class HRNetPostProcess(object):
         if self.use_dark:
             coords = self.dark_postprocess(heatmaps, coords, kernelsize)
         else:
-            for n in range(coords.shape[0]):
-                for p in range(coords.shape[1]):
-                    hm = heatmaps[n][p]
-                    px = int(math.floor(coords[n][p][0] + 0.5))
-                    py = int(math.floor(coords[n][p][1] + 0.5))
-                    if 1 < px < heatmap_width - 1 and 1 < py < heatmap_height - 1:
-                        diff = np.array([
-                            hm[py][px + 1] - hm[py][px - 1],
-                            hm[py + 1][px] - hm[py - 1][px]
-                        ])
-                        coords[n][p] += np.sign(diff) * .25
-        preds = coords.copy()
+            px = np.floor(coords[..., 0] + 0.5).astype(np.int64)
+            py = np.floor(coords[..., 1] + 0.5).astype(np.int64)
+            valid = (1 < px) & (px < heatmap_width - 1) & (1 < py) & (
+                py < heatmap_height - 1)
+            n, p = np.nonzero(valid)
+            px, py = px[n, p], py[n, p]
+            diff = np.stack(
+                (heatmaps[n, p, py, px + 1] - heatmaps[n, p, py, px - 1],
+                 heatmaps[n, p, py + 1, px] - heatmaps[n, p, py - 1, px]),
+                axis=-1)
+            coords[n, p] += np.sign(diff) * .25
 
         # Transform back
-        for i in range(coords.shape[0]):
-            preds[i] = transform_preds(coords[i], center[i], scale[i],
-                                       [heatmap_width, heatmap_height])
+        preds = batch_transform_preds(coords, center, scale,
+                                      [heatmap_width, heatmap_height])
+        preds = preds.astype(coords.dtype)
 
         return preds, maxvals
 
@@ -355,6 +429,20 @@ def transform_preds(coords, center, scale, output_size):
     return target_coords
 
 
+def batch_transform_preds(coords, center, scale, output_size):
+    """
+    transform_preds of a batch, coords ([N, J, 2]) of each person are
+    transformed by its affine matrix at once.
+    """
+    trans = np.stack([
+        get_affine_transform(c, s * 200, 0, output_size, inv=1)
+        for c, s in zip(center, scale)
+    ]) if len(coords) > 0 else np.zeros((0, 2, 3))
+    coords = coords[..., :2].astype(np.float64)
+    return np.matmul(coords, trans[:, :, :2].transpose(
+        (0, 2, 1))) + trans[:, None, :, 2]
+
+
 def affine_transform(pt, t):
     new_pt = np.array([pt[0], pt[1], 1.]).T
     new_pt = np.dot(t, new_pt)
@@ -0,0 +1,86 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+
+def interp_weights(grid, size):
+    """
+    Weights of bilinear sampling as grid_sample with align_corners=False
+    and zeros padding, [len(grid), size].
+    """
+    coord = ((grid + 1) * size - 1) / 2
+    low = np.floor(coord)
+    high_w = coord - low
+    low = low.astype('int64')
+    weights = np.zeros((grid.shape[0], size), dtype=np.float32)
+    rows = np.arange(grid.shape[0])
+    for idx, w in [(low, 1 - high_w), (low + 1, high_w)]:
+        valid = (idx >= 0) & (idx < size)
+        weights[rows[valid], idx[valid]] = w[valid]
+    return weights
+
+
+def mask_window(box, mask_h, mask_w, im_h, im_w):
+    """
+    The window of box padded by the reach of bilinear sampling, pixels out
+    of it are 0 after pasting.
+    """
+    x0, y0, x1, y1 = box
+    pad_x = (x1 - x0) / (2. * mask_w) + 1
+    pad_y = (y1 - y0) / (2. * mask_h) + 1
+    wx0 = int(min(max(np.floor(x0 - pad_x), 0), im_w))
+    wy0 = int(min(max(np.floor(y0 - pad_y), 0), im_h))
+    wx1 = int(min(max(np.ceil(x1 + pad_x), 0), im_w))
+    wy1 = int(min(max(np.ceil(y1 + pad_y), 0), im_h))
+    return wx0, wy0, wx1, wy1
+
+
+def paste_masks_in_box(masks, boxes, boxes_num, origin_shape, threshold=0.5):
+    """
+    Paste mask probabilities output by models exported with
+    MaskPostProcess.paste_in_box. Each mask is only sampled in its padded
+    box, as a separable bilinear interpolation.
+
+    Args:
+        masks (np.ndarray): mask probabilities in shape [N, M, M]
+        boxes (np.ndarray): [N, 6], [class, score, x_min, y_min, x_max, y_max]
+        boxes_num (np.ndarray): number of boxes of each image
+        origin_shape (np.ndarray): [batch_size, 2], [h, w] of origin images
+        threshold (float): threshold to binarize masks
+    Returns:
+        pasted masks (np.ndarray): uint8 binary masks in shape
+            [N, max_h, max_w], pixels out of each origin image are 0
+    """
+    num, mask_h, mask_w = masks.shape
+    origin_shape = np.asarray(origin_shape).astype('int64')
+    max_h, max_w = origin_shape.max(axis=0).tolist()
+    result = np.zeros((num, max_h, max_w), dtype=np.uint8)
+    im_idx = np.repeat(np.arange(len(boxes_num)), boxes_num)
+    for i in range(num):
+        im_h, im_w = origin_shape[im_idx[i]].tolist()
+        x0, y0, x1, y1 = boxes[i, 2:6].tolist()
+        if x1 <= x0 or y1 <= y0:
+            continue
+        wx0, wy0, wx1, wy1 = mask_window((x0, y0, x1, y1), mask_h, mask_w,
+                                         im_h, im_w)
+        if wx1 <= wx0 or wy1 <= wy0:
+            continue
+        img_x = (np.arange(wx0, wx1) + 0.5 - x0) / (x1 - x0) * 2 - 1
+        img_y = (np.arange(wy0, wy1) + 0.5 - y0) / (y1 - y0) * 2 - 1
+        weight_x = interp_weights(img_x, mask_w)
+        weight_y = interp_weights(img_y, mask_h)
+        mask = weight_y.dot(masks[i].astype(np.float32)).dot(weight_x.T)
+        result[i, wy0:wy1, wx0:wx1] = mask >= threshold
+    return result
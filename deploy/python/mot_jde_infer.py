@@ -23,6 +23,7 @@ import paddle
 from benchmark_utils import PaddleInferBenchmark
 from preprocess import decode_image
 from utils import argsparser, Timer, get_current_memory_mb
+from video_sink import VideoSink, scale_tlwhs
 from infer import Detector, get_test_images, print_arguments, bench_log, PredictConfig
 
 # add python path
@@ -258,7 +259,7 @@ class JDE_Detector(Detector):
             mot_results.append([online_tlwhs, online_scores, online_ids])
         return mot_results
 
-    def predict_video(self, video_file, camera_id):
+    def predict_video(self, video_file, camera_id, vis_scale=1.):
         video_out_name = 'mot_output.mp4'
         if camera_id != -1:
             capture = cv2.VideoCapture(camera_id)
@@ -275,9 +276,7 @@ class JDE_Detector(Detector):
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
         out_path = os.path.join(self.output_dir, video_out_name)
-        video_format = 'mp4v'
-        fourcc = cv2.VideoWriter_fourcc(*video_format)
-        writer = cv2.VideoWriter(out_path, fourcc, fps, (width, height))
+        writer = VideoSink(out_path, fps, scale=vis_scale)
 
         frame_id = 1
         timer = MOTTimer()
@@ -307,9 +306,9 @@ class JDE_Detector(Detector):
 
             fps = 1. / timer.duration
             im = plot_tracking_dict(
-                frame,
+                writer.resize(frame),
                 num_classes,
-                online_tlwhs,
+                scale_tlwhs(online_tlwhs, vis_scale),
                 online_ids,
                 online_scores,
                 frame_id=frame_id,
@@ -351,7 +350,8 @@ def main():
 
     # predict from video file or camera video stream
     if FLAGS.video_file is not None or FLAGS.camera_id != -1:
-        detector.predict_video(FLAGS.video_file, FLAGS.camera_id)
+        detector.predict_video(FLAGS.video_file, FLAGS.camera_id,
+                               FLAGS.vis_scale)
     else:
         # predict from image
         img_list = get_test_images(FLAGS.image_dir, FLAGS.image_file)
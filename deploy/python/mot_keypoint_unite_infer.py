@@ -32,6 +32,7 @@ from det_keypoint_unite_infer import predict_with_given_det
 from visualize import visualize_pose
 from benchmark_utils import PaddleInferBenchmark
 from utils import get_current_memory_mb
+from video_sink import VideoSink
 from keypoint_postprocess import translate_to_ori_images
 
 # add python path
@@ -147,8 +148,7 @@ def mot_topdown_unite_predict_video(mot_detector,
     if not os.path.exists(FLAGS.output_dir):
         os.makedirs(FLAGS.output_dir)
     out_path = os.path.join(FLAGS.output_dir, video_name)
-    fourcc = cv2.VideoWriter_fourcc(* 'mp4v')
-    writer = cv2.VideoWriter(out_path, fourcc, fps, (width, height))
+    writer = VideoSink(out_path, fps)
     frame_id = 0
     timer_mot, timer_kp, timer_mot_kp = FPSTimer(), FPSTimer(), FPSTimer()
 
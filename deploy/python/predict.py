@@ -39,6 +39,7 @@ from keypoint_preprocess import EvalAffine, TopDownEvalAffine, expand_crop
 from visualize import visualize_box_mask
 from generate_predict import generate_box_mask
 from utils import argsparser, Timer, get_current_memory_mb
+from video_sink import VideoSink
 from ppdet.utils.logger import setup_logger as get_logger
 import argparse
 import logging
@@ -337,8 +338,7 @@ class Detector(object):
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
         out_path = os.path.join(self.output_dir, video_out_name)
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        writer = cv2.VideoWriter(out_path, fourcc, fps, (width, height))
+        writer = VideoSink(out_path, fps)
         index = 1
         while (1):
             ret, frame = capture.read()
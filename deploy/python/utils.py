@@ -47,6 +47,13 @@ def argsparser():
         type=int,
         default=-1,
         help="device id of camera to predict.")
+    parser.add_argument(
+        "--video_pipeline",
+        type=ast.literal_eval,
+        default=False,
+        help="Whether to predict video with capture, preprocess, inference "
+        "and visualization overlapped in threads, frames are predicted in "
+        "batches of at most batch_size.")
     parser.add_argument(
         "--threshold", type=float, default=0.5, help="Threshold of score.")
     parser.add_argument(
@@ -113,6 +120,12 @@ def argsparser():
         '--save_mot_txts',
         action='store_true',
         help='Save tracking results (txt).')
+    parser.add_argument(
+        '--vis_scale',
+        type=float,
+        default=1.,
+        help='Scale of the output video, frames are drawn on the downscaled '
+        'copies when < 1.')
     parser.add_argument(
         '--save_mot_txt_per_img',
         action='store_true',
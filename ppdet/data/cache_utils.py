@@ -0,0 +1,234 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import hashlib
+import contextlib
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from ppdet.utils.logger import setup_logger
+logger = setup_logger(__name__)
+
+__all__ = ['SharedImageCache']
+
+# [ shared decoded image cache ]
+# Decoded images are saved as one .npy file per image under cache_root,
+# which is expected to be a tmpfs directory such as /dev/shm, so all
+# DataLoader workers share the same page cache backed entries.
+# 1. entries are keyed by sha1 of full image path, mtime and file size,
+#    so files with the same name in different directories and modified
+#    files never collide.
+# 2. entries are written to a temporary file and renamed, readers never
+#    see partial entries and do not need any lock.
+# 3. a hit touches the mtime of the entry, when the held bytes exceed
+#    cache_size the least recently used entries are removed until held
+#    bytes drop under low_watermark * cache_size.
+# 4. hit/miss counters, held bytes and entry number are kept in a small
+#    shared stats file, updated under an flock lock, so they can be read
+#    by the trainer process for logging. It is initialized once when it is
+#    created, caches constructed later on the same cache_root keep it.
+
+STATS_FILE = 'stats.bin'
+LOCK_FILE = 'index.lock'
+ENTRY_SUFFIX = '.npy'
+HITS, MISSES, BYTES, ENTRIES = range(4)
+
+
+class SharedImageCache(object):
+    """
+    Bounded decoded image cache shared by multi-process DataLoader workers.
+
+    Args:
+        cache_root (str): directory of cache entries, a tmpfs directory
+            such as /dev/shm/ppdet_cache is recommended.
+        cache_size (int): byte budget of the cache.
+        low_watermark (float): ratio of cache_size to keep after eviction.
+        flush_iter (int): flush local hit/miss counters to the shared
+            stats file every flush_iter lookups.
+    """
+
+    def __init__(self,
+                 cache_root,
+                 cache_size=4 * 1024**3,
+                 low_watermark=0.9,
+                 flush_iter=64):
+        assert fcntl is not None, \
+            "SharedImageCache is only supported on Linux-like system"
+        assert cache_size > 0, "cache_size should be larger than 0"
+        self.cache_root = cache_root
+        self.cache_size = int(cache_size)
+        self.low_watermark = low_watermark
+        self.flush_iter = flush_iter
+        if not os.path.exists(cache_root):
+            os.makedirs(cache_root, exist_ok=True)
+
+        self._pid = None
+        self._lock_fd = None
+        self._stats = None
+        self._local = np.zeros((2, ), dtype=np.int64)
+
+        with self._locked():
+            # the stats file is shared by all caches of cache_root, only
+            # initialize it when it is created, entries may be left by last
+            # run without it, so count them
+            created = not os.path.exists(
+                os.path.join(cache_root, STATS_FILE))
+            stats = self._get_stats()
+            if created:
+                sizes = [size for _, _, size in self._scan()]
+                stats[:] = [0, 0, sum(sizes), len(sizes)]
+                stats.flush()
+
+    @staticmethod
+    def key(im_file):
+        st = os.stat(im_file)
+        raw = '{}_{}_{}'.format(
+            os.path.abspath(im_file), st.st_mtime_ns, st.st_size)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_root, key + ENTRY_SUFFIX)
+
+    def _check_pid(self):
+        # lock fd and stats map are opened per process, flock locks are held
+        # by open file descriptions, which are shared after fork
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock_fd = os.open(
+                os.path.join(self.cache_root, LOCK_FILE),
+                os.O_RDWR | os.O_CREAT)
+            self._stats = None
+            self._local[:] = 0
+
+    def _get_stats(self):
+        self._check_pid()
+        if self._stats is None:
+            path = os.path.join(self.cache_root, STATS_FILE)
+            mode = 'r+' if os.path.exists(path) else 'w+'
+            self._stats = np.memmap(path, dtype=np.int64, mode=mode, shape=(4, ))
+        return self._stats
+
+    @contextlib.contextmanager
+    def _locked(self):
+        self._check_pid()
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _scan(self):
+        entries = []
+        for entry in os.scandir(self.cache_root):
+            if not entry.name.endswith(ENTRY_SUFFIX):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, entry.path, st.st_size))
+        return entries
+
+    def _flush(self, stats):
+        stats[HITS] += self._local[0]
+        stats[MISSES] += self._local[1]
+        self._local[:] = 0
+
+    def _count(self, hit):
+        self._check_pid()
+        self._local[0 if hit else 1] += 1
+        if self._local.sum() >= self.flush_iter:
+            with self._locked():
+                self._flush(self._get_stats())
+
+    def get(self, key):
+        """Return the cached image of key, or None if not cached."""
+        path = self._entry_path(key)
+        try:
+            im = np.load(path)
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            # not cached, or removed by eviction of another worker
+            self._count(False)
+            return None
+        self._count(True)
+        return im
+
+    def put(self, key, im):
+        """Save decoded image of key, evict LRU entries if over budget."""
+        if im.nbytes > self.cache_size:
+            return
+        path = self._entry_path(key)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, im, allow_pickle=False)
+            size = os.path.getsize(tmp_path)
+            with self._locked():
+                stats = self._get_stats()
+                if os.path.exists(path):
+                    os.remove(tmp_path)
+                else:
+                    os.replace(tmp_path, path)
+                    stats[BYTES] += size
+                    stats[ENTRIES] += 1
+                    if stats[BYTES] > self.cache_size:
+                        self._evict(stats)
+                self._flush(stats)
+        except OSError as e:
+            logger.warning('cache image to {} failed with error: {}'.format(
+                path, str(e)))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _evict(self, stats):
+        target = int(self.cache_size * self.low_watermark)
+        for _, path, size in sorted(self._scan()):
+            if stats[BYTES] <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            stats[BYTES] -= size
+            stats[ENTRIES] -= 1
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): hits, misses, hit_rate, bytes held and entries
+                of the cache across all processes.
+        """
+        stats = np.array(self._get_stats())
+        hits, misses = int(stats[HITS]), int(stats[MISSES])
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': float(hits) / total if total > 0 else 0.,
+            'bytes': int(stats[BYTES]),
+            'entries': int(stats[ENTRIES]),
+        }
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pid'] = None
+        state['_lock_fd'] = None
+        state['_stats'] = None
+        return state
@@ -161,6 +161,9 @@ class BaseDataLoader(object):
         self.dataset = dataset
         self.dataset.check_or_download_dataset()
         self.dataset.parse_dataset()
+        # pack roidbs before DataLoader workers fork, so that they share it
+        if hasattr(self.dataset, 'compact_roidbs'):
+            self.dataset.compact_roidbs()
         # get data
         self.dataset.set_transform(self._sample_transforms)
         # set kwargs
@@ -13,13 +13,23 @@
 # limitations under the License.
 
 import os
+import time
+import json
+import pickle
+import hashlib
 import numpy as np
 from ppdet.core.workspace import register, serializable
+from ppdet.utils.checkpoint import _get_unique_endpoints
 from .dataset import DetDataset
 
 from ppdet.utils.logger import setup_logger
 logger = setup_logger(__name__)
 
+# bump the version when the format of parsed records changes
+COCO_CACHE_VERSION = 2
+# seconds to wait for the parsed annotation cache built by another trainer
+CACHE_WAIT_TIMEOUT = 1800
+
 
 @register
 @serializable
@@ -39,6 +49,9 @@ class COCODataSet(DetDataset):
         empty_ratio (float): the ratio of empty record number to total 
             record's, if empty_ratio is out of [0. ,1.), do not sample the 
             records and use all the empty entries. 1. as default
+        cache_dir (str): directory to cache the parsed annotations, which is
+            keyed by annotation file md5 and parse options, so that later
+            launches and other trainers skip parsing. None means no cache.
     """
 
     def __init__(self,
@@ -49,7 +62,8 @@ class COCODataSet(DetDataset):
                  sample_num=-1,
                  load_crowd=False,
                  allow_empty=False,
-                 empty_ratio=1.):
+                 empty_ratio=1.,
+                 cache_dir=None):
         super(COCODataSet, self).__init__(dataset_dir, image_dir, anno_path,
                                           data_fields, sample_num)
         self.load_image_only = False
@@ -57,6 +71,7 @@ class COCODataSet(DetDataset):
         self.load_crowd = load_crowd
         self.allow_empty = allow_empty
         self.empty_ratio = empty_ratio
+        self.cache_dir = cache_dir
 
     def _sample_empty(self, records, num):
         # if empty_ratio is out of [0. ,1.), do not sample the records
@@ -74,28 +89,103 @@ class COCODataSet(DetDataset):
 
         assert anno_path.endswith('.json'), \
             'invalid coco annotation file: ' + anno_path
-        from pycocotools.coco import COCO
-        coco = COCO(anno_path)
-        img_ids = coco.getImgIds()
-        img_ids.sort()
-        cat_ids = coco.getCatIds()
-        records = []
-        empty_records = []
-        ct = 0
-
-        self.catid2clsid = dict({catid: i for i, catid in enumerate(cat_ids)})
-        self.cname2cid = dict({
-            coco.loadCats(catid)[0]['name']: clsid
-            for catid, clsid in self.catid2clsid.items()
-        })
+        if self.cache_dir:
+            parsed = self._load_or_build_cache(anno_path, image_dir)
+        else:
+            parsed = self._parse_anno(anno_path, image_dir)
 
-        if 'annotations' not in coco.dataset:
-            self.load_image_only = True
+        self.catid2clsid = parsed['catid2clsid']
+        self.cname2cid = parsed['cname2cid']
+        self.load_image_only = parsed['load_image_only']
+        if self.load_image_only:
             logger.warning('Annotation file: {} does not contains ground truth '
                            'and load image information only.'.format(anno_path))
+        records = parsed['records']
+        empty_records = parsed['empty_records']
+        ct = len(records) + len(empty_records)
+        assert ct > 0, 'not found any coco record in %s' % (anno_path)
+        logger.debug('{} samples in file {}'.format(ct, anno_path))
+        if self.allow_empty and len(empty_records) > 0:
+            empty_records = self._sample_empty(empty_records, len(records))
+            records += empty_records
+        self.roidbs = records
+
+    def _cache_key(self, anno_path, image_dir):
+        md5 = hashlib.md5()
+        with open(anno_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 22), b''):
+                md5.update(chunk)
+        options = [
+            COCO_CACHE_VERSION, self.__class__.__name__, image_dir,
+            sorted(self.data_fields), self.load_crowd, self.allow_empty,
+            self.sample_num, self.load_semantic
+        ]
+        md5.update(json.dumps(options).encode('utf-8'))
+        return md5.hexdigest()
 
-        for img_id in img_ids:
-            img_anno = coco.loadImgs([img_id])[0]
+    def _load_or_build_cache(self, anno_path, image_dir):
+        """
+        Load parsed annotations from cache_dir, which is keyed by the md5 of
+        annotation file and parse options. In distributed training, the first
+        trainer of each node builds the cache and the others load it.
+        """
+        key = self._cache_key(anno_path, image_dir)
+        cache_file = os.path.join(self.cache_dir, 'coco_{}.pkl'.format(key))
+        if not os.path.exists(cache_file) and not _is_cache_builder():
+            waited = 0
+            while not os.path.exists(cache_file) and \
+                    waited < CACHE_WAIT_TIMEOUT:
+                time.sleep(0.5)
+                waited += 0.5
+        if os.path.exists(cache_file):
+            with open(cache_file, 'rb') as f:
+                parsed = pickle.load(f)
+            if parsed.get('version') == COCO_CACHE_VERSION:
+                logger.info('Load parsed annotations from cache {}'.format(
+                    cache_file))
+                return parsed
+            logger.warning('Ignore cache {} of version {}, expect {}'.format(
+                cache_file, parsed.get('version'), COCO_CACHE_VERSION))
+
+        parsed = self._parse_anno(anno_path, image_dir)
+        parsed['version'] = COCO_CACHE_VERSION
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+        logger.info('Save parsed annotations to cache {}'.format(cache_file))
+        return parsed
+
+    def _parse_anno(self, anno_path, image_dir):
+        with open(anno_path, 'r') as f:
+            dataset = json.load(f)
+
+        # repeated ids are kept once with the last entry as COCO indexes them
+        cats = list({cat['id']: cat
+                     for cat in dataset.get('categories', [])}.values())
+        catid2clsid = dict({cat['id']: i for i, cat in enumerate(cats)})
+        cname2cid = dict({cat['name']: catid2clsid[cat['id']] for cat in cats})
+        load_image_only = 'annotations' not in dataset
+
+        images = sorted(
+            {im['id']: im
+             for im in dataset.get('images', [])}.values(),
+            key=lambda x: x['id'])
+        exist_files = _list_image_files(image_dir, images)
+
+        if not load_image_only:
+            anns = dataset['annotations']
+            if not self.load_crowd:
+                anns = [a for a in anns if a.get('iscrowd', 0) == 0]
+            groups = self._group_anns(anns, catid2clsid, images)
+
+        records = []
+        empty_records = []
+        ct = 0
+        for i, img_anno in enumerate(images):
+            img_id = img_anno['id']
             im_fname = img_anno['file_name']
             im_w = float(img_anno['width'])
             im_h = float(img_anno['height'])
@@ -103,7 +193,7 @@ class COCODataSet(DetDataset):
             im_path = os.path.join(image_dir,
                                    im_fname) if image_dir else im_fname
             is_empty = False
-            if not os.path.exists(im_path):
+            if im_path not in exist_files and not os.path.exists(im_path):
                 logger.warning('Illegal image file: {}, and it will be '
                                'ignored'.format(im_path))
                 continue
@@ -121,106 +211,11 @@ class COCODataSet(DetDataset):
                 'w': im_w,
             } if 'image' in self.data_fields else {}
 
-            if not self.load_image_only:
-                ins_anno_ids = coco.getAnnIds(
-                    imgIds=[img_id], iscrowd=None if self.load_crowd else False)
-                instances = coco.loadAnns(ins_anno_ids)
-
-                bboxes = []
-                is_rbox_anno = False
-                for inst in instances:
-                    # check gt bbox
-                    if inst.get('ignore', False):
-                        continue
-                    if 'bbox' not in inst.keys():
-                        continue
-                    else:
-                        if not any(np.array(inst['bbox'])):
-                            continue
-
-                    # read rbox anno or not
-                    is_rbox_anno = True if len(inst['bbox']) == 5 else False
-                    if is_rbox_anno:
-                        xc, yc, box_w, box_h, angle = inst['bbox']
-                        x1 = xc - box_w / 2.0
-                        y1 = yc - box_h / 2.0
-                        x2 = x1 + box_w
-                        y2 = y1 + box_h
-                    else:
-                        x1, y1, box_w, box_h = inst['bbox']
-                        x2 = x1 + box_w
-                        y2 = y1 + box_h
-                    eps = 1e-5
-                    if inst['area'] > 0 and x2 - x1 > eps and y2 - y1 > eps:
-                        inst['clean_bbox'] = [
-                            round(float(x), 3) for x in [x1, y1, x2, y2]
-                        ]
-                        if is_rbox_anno:
-                            inst['clean_rbox'] = [xc, yc, box_w, box_h, angle]
-                        bboxes.append(inst)
-                    else:
-                        logger.warning(
-                            'Found an invalid bbox in annotations: im_id: {}, '
-                            'area: {} x1: {}, y1: {}, x2: {}, y2: {}.'.format(
-                                img_id, float(inst['area']), x1, y1, x2, y2))
-
-                num_bbox = len(bboxes)
-                if num_bbox <= 0 and not self.allow_empty:
+            if not load_image_only:
+                gt_rec = self._build_gt(groups, i)
+                if gt_rec is None:
                     continue
-                elif num_bbox <= 0:
-                    is_empty = True
-
-                gt_bbox = np.zeros((num_bbox, 4), dtype=np.float32)
-                if is_rbox_anno:
-                    gt_rbox = np.zeros((num_bbox, 5), dtype=np.float32)
-                gt_theta = np.zeros((num_bbox, 1), dtype=np.int32)
-                gt_class = np.zeros((num_bbox, 1), dtype=np.int32)
-                is_crowd = np.zeros((num_bbox, 1), dtype=np.int32)
-                gt_poly = [None] * num_bbox
-
-                has_segmentation = False
-                for i, box in enumerate(bboxes):
-                    catid = box['category_id']
-                    gt_class[i][0] = self.catid2clsid[catid]
-                    gt_bbox[i, :] = box['clean_bbox']
-                    # xc, yc, w, h, theta
-                    if is_rbox_anno:
-                        gt_rbox[i, :] = box['clean_rbox']
-                    is_crowd[i][0] = box['iscrowd']
-                    # check RLE format 
-                    if 'segmentation' in box and box['iscrowd'] == 1:
-                        gt_poly[i] = [[0.0, 0.0, 0.0, 0.0, 0.0, 0.0]]
-                    elif 'segmentation' in box and box['segmentation']:
-                        if not np.array(box['segmentation']
-                                        ).size > 0 and not self.allow_empty:
-                            bboxes.pop(i)
-                            gt_poly.pop(i)
-                            np.delete(is_crowd, i)
-                            np.delete(gt_class, i)
-                            np.delete(gt_bbox, i)
-                        else:
-                            gt_poly[i] = box['segmentation']
-                        has_segmentation = True
-
-                if has_segmentation and not any(
-                        gt_poly) and not self.allow_empty:
-                    continue
-
-                if is_rbox_anno:
-                    gt_rec = {
-                        'is_crowd': is_crowd,
-                        'gt_class': gt_class,
-                        'gt_bbox': gt_bbox,
-                        'gt_rbox': gt_rbox,
-                        'gt_poly': gt_poly,
-                    }
-                else:
-                    gt_rec = {
-                        'is_crowd': is_crowd,
-                        'gt_class': gt_class,
-                        'gt_bbox': gt_bbox,
-                        'gt_poly': gt_poly,
-                    }
+                is_empty = len(gt_rec['gt_bbox']) == 0
 
                 for k, v in gt_rec.items():
                     if k in self.data_fields:
@@ -241,9 +236,162 @@ class COCODataSet(DetDataset):
             ct += 1
             if self.sample_num > 0 and ct >= self.sample_num:
                 break
-        assert ct > 0, 'not found any coco record in %s' % (anno_path)
-        logger.debug('{} samples in file {}'.format(ct, anno_path))
-        if self.allow_empty and len(empty_records) > 0:
-            empty_records = self._sample_empty(empty_records, len(records))
-            records += empty_records
-        self.roidbs = records
+
+        return {
+            'catid2clsid': catid2clsid,
+            'cname2cid': cname2cid,
+            'load_image_only': load_image_only,
+            'records': records,
+            'empty_records': empty_records,
+        }
+
+    def _group_anns(self, anns, catid2clsid, images):
+        """
+        Check and convert all annotations at once, then group them by image
+        in file order with numpy.
+        """
+        num = len(anns)
+        boxes = [a.get('bbox', []) for a in anns]
+        box_lens = np.array([len(b) for b in boxes], dtype=np.int64)
+        raw = np.zeros((num, 5), dtype=np.float64)
+        for n in [4, 5]:
+            idx = np.nonzero(box_lens == n)[0]
+            if len(idx) > 0:
+                raw[idx, :n] = np.array([boxes[j] for j in idx], np.float64)
+        is_rbox = box_lens == 5
+
+        ignore = np.array(
+            [bool(a.get('ignore', False)) for a in anns], dtype=bool)
+        area = np.array([a.get('area', 0) for a in anns], dtype=np.float64)
+        keep = ~ignore & (box_lens > 0) & np.any(raw != 0, axis=1)
+
+        x1 = np.where(is_rbox, raw[:, 0] - raw[:, 2] / 2.0, raw[:, 0])
+        y1 = np.where(is_rbox, raw[:, 1] - raw[:, 3] / 2.0, raw[:, 1])
+        x2 = x1 + raw[:, 2]
+        y2 = y1 + raw[:, 3]
+        eps = 1e-5
+        valid = keep & (area > 0) & (x2 - x1 > eps) & (y2 - y1 > eps)
+        for j in np.nonzero(keep & ~valid)[0]:
+            logger.warning(
+                'Found an invalid bbox in annotations: im_id: {}, '
+                'area: {} x1: {}, y1: {}, x2: {}, y2: {}.'.format(anns[j][
+                    'image_id'], area[j], x1[j], y1[j], x2[j], y2[j]))
+
+        query = np.array([im['id'] for im in images], dtype=np.int64)
+        # an image has rboxes if its last annotation with a box has, invalid
+        # boxes included
+        idx = np.nonzero(keep)[0]
+        img_ids = np.array(
+            [anns[j]['image_id'] for j in idx], dtype=np.int64)
+        order = np.argsort(img_ids, kind='stable')
+        idx, img_ids = idx[order], img_ids[order]
+        ends = np.searchsorted(img_ids, query, side='right')
+        has_box = ends > np.searchsorted(img_ids, query, side='left')
+        img_is_rbox = np.zeros((len(images), ), dtype=bool)
+        img_is_rbox[has_box] = is_rbox[idx[ends[has_box] - 1]]
+
+        idx = np.nonzero(valid)[0]
+        img_ids = np.array(
+            [anns[j]['image_id'] for j in idx], dtype=np.int64)
+        order = np.argsort(img_ids, kind='stable')
+        idx, img_ids = idx[order], img_ids[order]
+        starts = np.searchsorted(img_ids, query, side='left')
+        ends = np.searchsorted(img_ids, query, side='right')
+
+        # python round, which is exact in decimal unlike np.round
+        bbox = [[round(x, 3) for x in box]
+                for box in np.stack(
+                    [x1, y1, x2, y2], axis=1)[idx].tolist()]
+        return {
+            'anns': [anns[j] for j in idx],
+            'starts': starts,
+            'ends': ends,
+            'gt_bbox': np.array(
+                bbox, dtype=np.float32).reshape(-1, 4),
+            'gt_rbox': raw[idx].astype(np.float32),
+            'is_rbox': img_is_rbox,
+            'gt_class': np.array(
+                [catid2clsid[anns[j]['category_id']] for j in idx],
+                dtype=np.int32).reshape(-1, 1),
+            'is_crowd': np.array(
+                [anns[j].get('iscrowd', 0) for j in idx],
+                dtype=np.int32).reshape(-1, 1),
+        }
+
+    def _build_gt(self, groups, i):
+        """
+        Ground truth of the i-th image. Instances whose segmentation only has
+        empty polygons are dropped with their boxes if not allow_empty, the
+        previous parser meant to but left their boxes and shifted the rest.
+        """
+        start, end = groups['starts'][i], groups['ends'][i]
+        num_bbox = end - start
+        if num_bbox <= 0 and not self.allow_empty:
+            return None
+
+        is_crowd = groups['is_crowd'][start:end]
+        gt_poly = [None] * num_bbox
+        keep = np.ones((num_bbox, ), dtype=bool)
+        has_segmentation = False
+        for k, inst in enumerate(groups['anns'][start:end]):
+            # check RLE format
+            if 'segmentation' in inst and is_crowd[k][0] == 1:
+                gt_poly[k] = [[0.0, 0.0, 0.0, 0.0, 0.0, 0.0]]
+            elif 'segmentation' in inst and inst['segmentation']:
+                if _segm_nonempty(inst['segmentation']) or self.allow_empty:
+                    gt_poly[k] = inst['segmentation']
+                else:
+                    keep[k] = False
+                has_segmentation = True
+
+        if has_segmentation and not any(gt_poly) and not self.allow_empty:
+            return None
+
+        gt_rec = {
+            'is_crowd': is_crowd,
+            'gt_class': groups['gt_class'][start:end],
+            'gt_bbox': groups['gt_bbox'][start:end],
+            'gt_poly': gt_poly,
+        }
+        if groups['is_rbox'][i]:
+            gt_rec['gt_rbox'] = groups['gt_rbox'][start:end]
+        if not keep.all():
+            gt_rec = {
+                k: [p for p, kept in zip(v, keep) if kept]
+                if k == 'gt_poly' else v[keep]
+                for k, v in gt_rec.items()
+            }
+        return gt_rec
+
+
+def _segm_nonempty(segm):
+    if isinstance(segm, dict):
+        return len(segm) > 0
+    return any(
+        len(poly) > 0 if isinstance(poly, (list, tuple)) else True
+        for poly in segm)
+
+
+def _list_image_files(image_dir, images):
+    # list each image directory once instead of calling os.path.exists for
+    # every image, missed files are checked again by os.path.exists
+    dirs = set()
+    for img_anno in images:
+        im_path = os.path.join(image_dir, img_anno['file_name']) \
+            if image_dir else img_anno['file_name']
+        dirs.add(os.path.dirname(im_path))
+    files = set()
+    for d in dirs:
+        if os.path.isdir(d or '.'):
+            files.update(os.path.join(d, f) for f in os.listdir(d or '.'))
+    return files
+
+
+def _is_cache_builder():
+    env = os.environ
+    if int(env.get('PADDLE_TRAINERS_NUM', 1)) <= 1:
+        return True
+    from paddle.distributed import ParallelEnv
+    unique_endpoints = _get_unique_endpoints(ParallelEnv()
+                                             .trainer_endpoints[:])
+    return ParallelEnv().current_endpoint in unique_endpoints
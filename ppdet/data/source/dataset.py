@@ -22,6 +22,7 @@ except Exception:
 from paddle.io import Dataset
 from ppdet.core.workspace import register, serializable
 from ppdet.utils.download import get_dataset_path
+from .roidb import CompactRoidb
 import copy
 
 
@@ -30,6 +31,10 @@ class DetDataset(Dataset):
     """
     Load detection dataset.
 
+    Records in self.roidbs are packed into CompactRoidb when reading, set
+    use_compact_roidb to False in subclasses which do not read samples by
+    DetDataset.__getitem__.
+
     Args:
         dataset_dir (str): root directory for dataset.
         image_dir (str): directory for images.
@@ -38,6 +43,8 @@ class DetDataset(Dataset):
         sample_num (int): number of samples to load, -1 means all.
         use_default_label (bool): whether to load default label list.
     """
+    use_compact_roidb = True
+    _compact_roidbs = None
 
     def __init__(self,
                  dataset_dir=None,
@@ -62,20 +69,19 @@ class DetDataset(Dataset):
 
     def __getitem__(self, idx):
         # data batch
-        roidb = copy.deepcopy(self.roidbs[idx])
+        roidb = self._get_roidb(idx)
         if self.mixup_epoch == 0 or self._epoch < self.mixup_epoch:
             n = len(self.roidbs)
             idx = np.random.randint(n)
-            roidb = [roidb, copy.deepcopy(self.roidbs[idx])]
+            roidb = [roidb, self._get_roidb(idx)]
         elif self.cutmix_epoch == 0 or self._epoch < self.cutmix_epoch:
             n = len(self.roidbs)
             idx = np.random.randint(n)
-            roidb = [roidb, copy.deepcopy(self.roidbs[idx])]
+            roidb = [roidb, self._get_roidb(idx)]
         elif self.mosaic_epoch == 0 or self._epoch < self.mosaic_epoch:
             n = len(self.roidbs)
             roidb = [roidb, ] + [
-                copy.deepcopy(self.roidbs[np.random.randint(n)])
-                for _ in range(4)
+                self._get_roidb(np.random.randint(n)) for _ in range(4)
             ]
         if isinstance(roidb, Sequence):
             for r in roidb:
@@ -86,6 +92,30 @@ class DetDataset(Dataset):
 
         return self.transform(roidb)
 
+    def _get_roidb(self, idx):
+        self.compact_roidbs()
+        if self._compact_roidbs is not None:
+            return self._compact_roidbs[idx]
+        return copy.deepcopy(self.roidbs[idx])
+
+    def compact_roidbs(self):
+        """
+        Pack roidbs into CompactRoidb, samples are got as copy-on-write
+        views of it instead of deepcopy of the record dicts. Called by the
+        reader before DataLoader workers fork. The record dicts are dropped
+        and self.roidbs is the CompactRoidb afterwards, it is packed again
+        whenever self.roidbs is replaced by a list.
+        """
+        roidbs = getattr(self, 'roidbs', None)
+        if not self.use_compact_roidb:
+            self._compact_roidbs = None
+            return
+        if isinstance(roidbs, list):
+            self._compact_roidbs = CompactRoidb(roidbs)
+            self.roidbs = self._compact_roidbs
+        elif roidbs is not self._compact_roidbs:
+            self._compact_roidbs = None
+
     def check_or_download_dataset(self):
         self.dataset_dir = get_dataset_path(self.dataset_dir, self.anno_path,
                                             self.image_dir)
@@ -0,0 +1,246 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Packed binary record store.
+#
+# A record directory holds the roidbs of one dataset split into shards:
+#   record_dir
+#   |——————meta.pkl            dataset level info, shard names and sizes
+#   |——————part-00000.bin      encoded image bytes and pickled annotations
+#   |——————part-00000.idx.npy  (n, 4) int64 offset index of the shard,
+#   |                          [img_offset, img_size, anno_offset, anno_size]
+#   |——————......
+#
+# Images are stored as the original encoded bytes, so `Decode` in the sample
+# transforms works unchanged: it decodes sample['image'] instead of reading
+# sample['im_file'] from disk.
+
+import os
+import copy
+import pickle
+import numpy as np
+
+from ppdet.core.workspace import register, serializable
+from .dataset import DetDataset
+
+from ppdet.utils.logger import setup_logger
+logger = setup_logger(__name__)
+
+__all__ = ['RecordDataSet', 'RecordReader', 'write_records']
+
+RECORD_VERSION = 1
+RECORD_META = 'meta.pkl'
+RECORD_PREFIX = 'part'
+
+# dataset level attributes which are saved with the records, so that the
+# record dataset can be used in place of the original one
+DATASET_ATTRS = ['cname2cid', 'catid2clsid', 'num_identities_dict']
+
+
+def _shard_names(shard_id):
+    name = '{}-{:05d}'.format(RECORD_PREFIX, shard_id)
+    return name + '.bin', name + '.idx.npy'
+
+
+def write_records(dataset, output_dir, shard_size=1024):
+    """
+    Pack the roidbs of a parsed dataset into record shards.
+
+    Args:
+        dataset (DetDataset): dataset whose `parse_dataset` has been called,
+            e.g. COCODataSet, VOCDataSet or MOTDataSet.
+        output_dir (str): directory to save the record shards.
+        shard_size (int): number of records in each shard.
+
+    Returns:
+        num (int): number of records written.
+    """
+    assert shard_size > 0, "shard_size should be larger than 0"
+    roidbs = dataset.roidbs
+    assert roidbs is not None and len(roidbs) > 0, \
+        "dataset should be parsed before writing records"
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    shards = []
+    for start in range(0, len(roidbs), shard_size):
+        shard_id = len(shards)
+        bin_name, idx_name = _shard_names(shard_id)
+        chunk = roidbs[start:start + shard_size]
+        index = np.zeros((len(chunk), 4), dtype=np.int64)
+        offset = 0
+        with open(os.path.join(output_dir, bin_name), 'wb') as f:
+            for i, rec in enumerate(chunk):
+                rec = dict(rec)
+                im_file = rec.pop('im_file', None)
+                if 'image' in rec:
+                    im = rec.pop('image')
+                elif im_file is not None:
+                    with open(im_file, 'rb') as im_f:
+                        im = im_f.read()
+                else:
+                    im = b''
+                anno = pickle.dumps(rec, protocol=pickle.HIGHEST_PROTOCOL)
+                f.write(im)
+                f.write(anno)
+                index[i] = [offset, len(im), offset + len(im), len(anno)]
+                offset += len(im) + len(anno)
+        np.save(os.path.join(output_dir, idx_name), index)
+        shards.append((bin_name, idx_name, len(chunk)))
+        logger.info('Write {} records to {}'.format(
+            len(chunk), os.path.join(output_dir, bin_name)))
+
+    attrs = {}
+    for k in DATASET_ATTRS:
+        if getattr(dataset, k, None) is not None:
+            attrs[k] = copy.deepcopy(getattr(dataset, k))
+    meta = {
+        'version': RECORD_VERSION,
+        'num_records': len(roidbs),
+        'shards': shards,
+        'attrs': attrs,
+    }
+    with open(os.path.join(output_dir, RECORD_META), 'wb') as f:
+        pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return len(roidbs)
+
+
+class RecordReader(object):
+    """
+    Random access reader of record shards, it behaves like the roidbs list
+    of other datasets: `len(reader)` and `reader[idx]` which returns a new
+    record dict with encoded image bytes in 'image'.
+
+    Shards are memory mapped lazily and re-mapped after fork, so it can be
+    shared by DataLoader workers.
+
+    Args:
+        record_dir (str): directory of record shards.
+        sample_num (int): number of records to load, -1 means all.
+    """
+
+    def __init__(self, record_dir, sample_num=-1):
+        self.record_dir = record_dir
+        meta_path = os.path.join(record_dir, RECORD_META)
+        assert os.path.isfile(meta_path), \
+            "record meta file {} not found".format(meta_path)
+        with open(meta_path, 'rb') as f:
+            self.meta = pickle.load(f)
+        assert self.meta['version'] == RECORD_VERSION, \
+            "record version {} is not supported, expect {}".format(
+                self.meta['version'], RECORD_VERSION)
+
+        self.shards = self.meta['shards']
+        self.indexes = [
+            np.load(os.path.join(record_dir, idx_name))
+            for _, idx_name, _ in self.shards
+        ]
+        self.starts = np.cumsum([0] + [n for _, _, n in self.shards])
+        self.num = int(self.starts[-1])
+        if sample_num > 0:
+            self.num = min(self.num, sample_num)
+
+        self._pid = None
+        self._maps = None
+
+    @property
+    def attrs(self):
+        return self.meta['attrs']
+
+    def _get_map(self, shard_id):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._maps = [None] * len(self.shards)
+        if self._maps[shard_id] is None:
+            bin_path = os.path.join(self.record_dir, self.shards[shard_id][0])
+            if os.path.getsize(bin_path) == 0:
+                self._maps[shard_id] = np.zeros((0, ), dtype=np.uint8)
+            else:
+                self._maps[shard_id] = np.memmap(
+                    bin_path, dtype=np.uint8, mode='r')
+        return self._maps[shard_id]
+
+    def __len__(self):
+        return self.num
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self.num
+        if idx < 0 or idx >= self.num:
+            raise IndexError("record index {} out of range".format(idx))
+        shard_id = int(np.searchsorted(self.starts, idx, side='right')) - 1
+        im_offset, im_size, anno_offset, anno_size = \
+            self.indexes[shard_id][idx - self.starts[shard_id]]
+        data = self._get_map(shard_id)
+        rec = pickle.loads(data[anno_offset:anno_offset + anno_size].tobytes())
+        if im_size > 0:
+            rec['image'] = data[im_offset:im_offset + im_size].tobytes()
+        return rec
+
+    def __getstate__(self):
+        # memory maps are not picklable, re-map them in the new process
+        state = self.__dict__.copy()
+        state['_pid'] = None
+        state['_maps'] = None
+        return state
+
+
+@register
+@serializable
+class RecordDataSet(DetDataset):
+    """
+    Load dataset from packed binary record shards, which are converted from
+    other datasets by `tools/convert_records.py`. Encoded image bytes are
+    read from memory mapped shards instead of one file per image.
+
+    Args:
+        dataset_dir (str): root directory for dataset.
+        record_dir (str): directory of record shards, relative to dataset_dir.
+        anno_path (str): original annotation file path, only used by metrics,
+            e.g. the json file for COCO or the label list file for VOC.
+        data_fields (list): key name of data dictionary, at least have 'image'.
+        sample_num (int): number of samples to load, -1 means all.
+    """
+
+    def __init__(self,
+                 dataset_dir=None,
+                 record_dir=None,
+                 anno_path=None,
+                 data_fields=['image'],
+                 sample_num=-1,
+                 **kwargs):
+        super(RecordDataSet, self).__init__(
+            dataset_dir=dataset_dir,
+            anno_path=anno_path,
+            data_fields=data_fields,
+            sample_num=sample_num)
+        self.record_dir = record_dir if record_dir is not None else ''
+        self.roidbs = None
+
+    def check_or_download_dataset(self):
+        record_dir = os.path.join(self.dataset_dir, self.record_dir)
+        if not os.path.isdir(record_dir):
+            raise ValueError("record_dir {} does not exist".format(
+                record_dir))
+
+    def parse_dataset(self):
+        record_dir = os.path.join(self.dataset_dir, self.record_dir)
+        self.roidbs = RecordReader(record_dir, self.sample_num)
+        for k, v in self.roidbs.attrs.items():
+            setattr(self, k, v)
+        logger.debug('{} samples in record directory {}'.format(
+            len(self.roidbs), record_dir))
+
+    def get_label_list(self):
+        return self.get_anno()
@@ -0,0 +1,177 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import numpy as np
+
+__all__ = ['CompactRoidb', 'CowSample']
+
+# fields which transforms never modify in place, they are shared by samples
+# instead of copied, e.g. gt_poly is a list of polygons (or RLE dicts) and
+# all segmentation transforms build new lists
+SHARED_FIELDS = ['gt_poly']
+
+# python objects which are immutable and can be shared by samples
+IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None), np.generic)
+
+
+class CowSample(dict):
+    """
+    Copy-on-write sample returned by CompactRoidb.
+
+    Array fields are read-only views of the columnar storage, a field is
+    copied into a writable array when it is got by a transform for the
+    first time, so fields never touched by transforms are never copied.
+    Fields set by transforms replace the views directly.
+    """
+
+    def __init__(self, fields, views):
+        super(CowSample, self).__init__(fields)
+        self._views = set(views)
+
+    def _own(self, key):
+        if key in self._views:
+            self._views.discard(key)
+            value = dict.__getitem__(self, key).copy()
+            dict.__setitem__(self, key, value)
+            return value
+        return dict.__getitem__(self, key)
+
+    def __getitem__(self, key):
+        return self._own(key)
+
+    def __setitem__(self, key, value):
+        self._views.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._views.discard(key)
+        dict.__delitem__(self, key)
+
+    def get(self, key, default=None):
+        return self._own(key) if key in self else default
+
+    def pop(self, key, *args):
+        if key in self:
+            value = self._own(key)
+            dict.__delitem__(self, key)
+            return value
+        return dict.pop(self, key, *args)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self._own(key)
+        dict.__setitem__(self, key, default)
+        return default
+
+    def values(self):
+        return [self._own(k) for k in self.keys()]
+
+    def items(self):
+        return [(k, self._own(k)) for k in self.keys()]
+
+    def copy(self):
+        return dict(self.items())
+
+    def __reduce__(self):
+        # pickle and deepcopy as a plain dict with owned arrays
+        return (dict, (self.items(), ))
+
+
+class CompactRoidb(object):
+    """
+    Columnar storage of roidbs.
+
+    Array fields with the same dtype and trailing shape in all records, e.g.
+    gt_bbox, gt_class and is_crowd, are concatenated into one array with
+    per-image offsets. Other fields are kept as python lists. It behaves like
+    the roidbs list: `len(roidb)` and `roidb[idx]` which returns a CowSample,
+    or a list of them for a slice.
+
+    Compared with deepcopying the record dicts, it saves python object
+    overhead for large datasets, and its arrays are not touched by reference
+    counting, so the memory pages stay shared by forked DataLoader workers.
+
+    Args:
+        records (list): roidbs, list of record dicts.
+    """
+
+    def __init__(self, records):
+        self.num = len(records)
+        self.keys = []
+        for rec in records:
+            for k in rec.keys():
+                if k not in self.keys:
+                    self.keys.append(k)
+
+        self.array_fields = {}
+        self.object_fields = {}
+        for k in self.keys:
+            values = [rec.get(k, _MISSING) for rec in records]
+            if self._is_columnar(values):
+                lengths = [v.shape[0] for v in values]
+                offsets = np.zeros((self.num + 1, ), dtype=np.int64)
+                offsets[1:] = np.cumsum(lengths)
+                data = np.concatenate(values, axis=0)
+                self.array_fields[k] = (data, offsets)
+            else:
+                self.object_fields[k] = values
+
+    @staticmethod
+    def _is_columnar(values):
+        if len(values) == 0:
+            return False
+        first = values[0]
+        if not isinstance(first, np.ndarray) or first.ndim < 1:
+            return False
+        for v in values:
+            if not isinstance(v, np.ndarray) or v.dtype != first.dtype or \
+                    v.ndim != first.ndim or v.shape[1:] != first.shape[1:]:
+                return False
+        return True
+
+    def __len__(self):
+        return self.num
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self.num))]
+        if idx < 0:
+            idx += self.num
+        if idx < 0 or idx >= self.num:
+            raise IndexError("roidb index {} out of range".format(idx))
+        fields, views = {}, []
+        for k in self.keys:
+            if k in self.array_fields:
+                data, offsets = self.array_fields[k]
+                view = data[offsets[idx]:offsets[idx + 1]]
+                view.flags.writeable = False
+                fields[k] = view
+                views.append(k)
+            else:
+                value = self.object_fields[k][idx]
+                if value is _MISSING:
+                    continue
+                if k not in SHARED_FIELDS and \
+                        not isinstance(value, IMMUTABLE_TYPES):
+                    value = copy.deepcopy(value)
+                fields[k] = value
+        return CowSample(fields, views)
+
+
+class _Missing(object):
+    pass
+
+
+_MISSING = _Missing()
@@ -197,20 +197,16 @@ class ATSSAssigner(object):
                 assigned_labels = -np.ones((num_bboxes, ), dtype=np.int64)
             return assigned_gt_inds, max_overlaps
 
-        # compute iou between all bbox and gt
-        overlaps = bbox_overlaps(bboxes, gt_bboxes)
         # compute center distance between all bbox and gt
         gt_cx = (gt_bboxes[:, 0] + gt_bboxes[:, 2]) / 2.0
         gt_cy = (gt_bboxes[:, 1] + gt_bboxes[:, 3]) / 2.0
-        gt_points = np.stack((gt_cx, gt_cy), axis=1)
 
         bboxes_cx = (bboxes[:, 0] + bboxes[:, 2]) / 2.0
         bboxes_cy = (bboxes[:, 1] + bboxes[:, 3]) / 2.0
-        bboxes_points = np.stack((bboxes_cx, bboxes_cy), axis=1)
 
-        distances = np.sqrt(
-            np.power((bboxes_points[:, None, :] - gt_points[None, :, :]), 2)
-            .sum(-1))
+        dx = bboxes_cx[:, None] - gt_cx[None, :]
+        dy = bboxes_cy[:, None] - gt_cy[None, :]
+        distances = np.sqrt(dx * dx + dy * dy)
 
         # Selecting candidates based on the center distance
         candidate_idxs = []
@@ -226,10 +222,16 @@ class ATSSAssigner(object):
             candidate_idxs.append(topk_idxs_per_level + start_idx)
             start_idx = end_idx
         candidate_idxs = np.concatenate(candidate_idxs, axis=0)
+        candidate_gt_idxs = np.broadcast_to(
+            np.arange(num_gt), candidate_idxs.shape)
 
         # get corresponding iou for the these candidates, and compute the
-        # mean and std, set mean + std as the iou threshold
-        candidate_overlaps = overlaps[candidate_idxs, np.arange(num_gt)]
+        # mean and std, set mean + std as the iou threshold. iou is only
+        # computed for candidates, the others are never positive.
+        candidate_overlaps = bbox_overlaps(
+            bboxes[candidate_idxs],
+            gt_bboxes[candidate_gt_idxs],
+            is_aligned=True)
         overlaps_mean_per_gt = candidate_overlaps.mean(0)
         overlaps_std_per_gt = candidate_overlaps.std(0)
         overlaps_thr_per_gt = overlaps_mean_per_gt + overlaps_std_per_gt
@@ -237,32 +239,27 @@ class ATSSAssigner(object):
         is_pos = candidate_overlaps >= overlaps_thr_per_gt[None, :]
 
         # limit the positive sample's center in gt
-        for gt_idx in range(num_gt):
-            candidate_idxs[:, gt_idx] += gt_idx * num_bboxes
-        ep_bboxes_cx = np.broadcast_to(
-            bboxes_cx.reshape(1, -1), [num_gt, num_bboxes]).reshape(-1)
-        ep_bboxes_cy = np.broadcast_to(
-            bboxes_cy.reshape(1, -1), [num_gt, num_bboxes]).reshape(-1)
-        candidate_idxs = candidate_idxs.reshape(-1)
-
         # calculate the left, top, right, bottom distance between positive
         # bbox center and gt side
-        l_ = ep_bboxes_cx[candidate_idxs].reshape(-1, num_gt) - gt_bboxes[:, 0]
-        t_ = ep_bboxes_cy[candidate_idxs].reshape(-1, num_gt) - gt_bboxes[:, 1]
-        r_ = gt_bboxes[:, 2] - ep_bboxes_cx[candidate_idxs].reshape(-1, num_gt)
-        b_ = gt_bboxes[:, 3] - ep_bboxes_cy[candidate_idxs].reshape(-1, num_gt)
+        l_ = bboxes_cx[candidate_idxs] - gt_bboxes[:, 0]
+        t_ = bboxes_cy[candidate_idxs] - gt_bboxes[:, 1]
+        r_ = gt_bboxes[:, 2] - bboxes_cx[candidate_idxs]
+        b_ = gt_bboxes[:, 3] - bboxes_cy[candidate_idxs]
         is_in_gts = np.stack([l_, t_, r_, b_], axis=1).min(axis=1) > 0.01
         is_pos = is_pos & is_in_gts
 
         # if an anchor box is assigned to multiple gts,
-        # the one with the highest IoU will be selected.
-        overlaps_inf = -np.inf * np.ones_like(overlaps).T.reshape(-1)
-        index = candidate_idxs.reshape(-1)[is_pos.reshape(-1)]
-        overlaps_inf[index] = overlaps.T.reshape(-1)[index]
-        overlaps_inf = overlaps_inf.reshape(num_gt, -1).T
-
-        max_overlaps = overlaps_inf.max(axis=1)
-        argmax_overlaps = overlaps_inf.argmax(axis=1)
+        # the one with the highest IoU will be selected, the first one of
+        # them if there are ties, as argmax.
+        pos_idxs = candidate_idxs[is_pos]
+        pos_gt_idxs = candidate_gt_idxs[is_pos]
+        pos_overlaps = candidate_overlaps[is_pos]
+        max_overlaps = -np.inf * np.ones(
+            (num_bboxes, ), dtype=candidate_overlaps.dtype)
+        np.maximum.at(max_overlaps, pos_idxs, pos_overlaps)
+        is_max = pos_overlaps == max_overlaps[pos_idxs]
+        argmax_overlaps = np.full((num_bboxes, ), num_gt, dtype=np.int64)
+        np.minimum.at(argmax_overlaps, pos_idxs[is_max], pos_gt_idxs[is_max])
         assigned_gt_inds[max_overlaps !=
                          -np.inf] = argmax_overlaps[max_overlaps != -np.inf] + 1
 
@@ -26,14 +26,15 @@ except Exception:
 import cv2
 import math
 import numpy as np
+from functools import lru_cache
 from .operators import register_op, BaseOperator, Resize
-from .op_helper import jaccard_overlap, gaussian2D, gaussian_radius, draw_umich_gaussian
+from .op_helper import gaussian2D, gaussian_radius, gaussian_patches
 from .atss_assigner import ATSSAssigner
 from scipy import ndimage
 
 from ppdet.modeling import bbox_utils
 from ppdet.utils.logger import setup_logger
-from ppdet.modeling.keypoint_utils import get_affine_transform, affine_transform
+from ppdet.modeling.keypoint_utils import get_affine_transform
 logger = setup_logger(__name__)
 
 __all__ = [
@@ -51,6 +52,39 @@ __all__ = [
 ]
 
 
+@lru_cache(maxsize=64)
+def _grid_points(h, w, stride, offset):
+    """
+    Points (x, y) of a feature map of stride on an image of (h, w), row by
+    row. They are cached by image shape and stride and shared by batches,
+    so they are read only.
+    """
+    shift_x = np.arange(0, w, stride).astype(np.float32)
+    shift_y = np.arange(0, h, stride).astype(np.float32)
+    shift_x, shift_y = np.meshgrid(shift_x, shift_y)
+    points = np.stack(
+        [shift_x.flatten(), shift_y.flatten()], axis=1) + offset
+    points.flags.writeable = False
+    return points
+
+
+@lru_cache(maxsize=64)
+def _grid_cells(h, w, downsample_ratios, scale, offset):
+    """
+    Grid cells of all levels of Gt2GFLTarget on an image of (h, w) and the
+    number of cells of each level, cached as `_grid_points`.
+    """
+    grid_cells = []
+    for stride in downsample_ratios:
+        featmap_size = (int(math.ceil(h / stride)), int(math.ceil(w / stride)))
+        grid_cells.append(
+            Gt2GFLTarget.get_grid_cells(featmap_size, scale, stride, offset))
+    num_level_cells = tuple(cells.shape[0] for cells in grid_cells)
+    grid_cells = np.concatenate(grid_cells)
+    grid_cells.flags.writeable = False
+    return grid_cells, num_level_cells
+
+
 @register_op
 class PadBatch(BaseOperator):
     """
@@ -177,6 +211,26 @@ class Gt2YoloTarget(BaseOperator):
     """
     Generate YOLOv3 targets by groud truth data, this operator is only used in
     fine grained YOLOv3 loss mode
+
+    Targets of all samples in the batch are computed together, the IoUs
+    between gt boxes and anchors are computed in one call and targets are
+    scattered by advanced indexing.
+
+    Args:
+        anchors (list): anchor sizes of all levels
+        anchor_masks (list): anchor indexes of each level
+        downsample_ratios (list): downsample ratio of each level
+        num_classes (int): number of classes
+        iou_thresh (float): anchors whose IoU with the gt box is larger than
+            iou_thresh are also assigned to the gt box, besides the best one
+        sparse_target (bool): whether to output sparse targets. If False,
+            `target{i}` in shape [A, 6 + num_classes, H, W] is generated
+            for level i. If True, `target{i}_index` in shape [K] and
+            `target{i}_value` in shape [K, 6 + num_classes] are generated
+            instead, which are the positions in flattened [A, H, W] and
+            the target vectors of the K non-zero positions, padded by -1
+            indexes to the max K of the batch. They are scattered to dense
+            targets by YOLOv3Loss.
     """
 
     def __init__(self,
@@ -184,13 +238,28 @@ class Gt2YoloTarget(BaseOperator):
                  anchor_masks,
                  downsample_ratios,
                  num_classes=80,
-                 iou_thresh=1.):
+                 iou_thresh=1.,
+                 sparse_target=False):
         super(Gt2YoloTarget, self).__init__()
         self.anchors = anchors
         self.anchor_masks = anchor_masks
         self.downsample_ratios = downsample_ratios
         self.num_classes = num_classes
         self.iou_thresh = iou_thresh
+        self.sparse_target = sparse_target
+
+    def _anchor_ious(self, gw, gh, an_hw):
+        # IoU of [0, 0, gw, gh] and [0, 0, aw, ah] as jaccard_overlap, gt
+        # sizes are float32 and anchor sizes are float64, the same types as
+        # computed by scalars are kept so argmax breaks ties the same way
+        aw, ah = an_hw[None, :, 0], an_hw[None, :, 1]
+        gw, gh = gw[:, None], gh[:, None]
+        gt_area = (gw * gh).astype(np.float64)
+        gw_min, gh_min = gw <= aw, gh <= ah
+        inter = np.minimum(gw.astype(np.float64), aw) * np.minimum(
+            gh.astype(np.float64), ah)
+        inter = np.where(gw_min & gh_min, gt_area, inter)
+        return inter / (gt_area + aw * ah - inter)
 
     def __call__(self, samples, context=None):
         assert len(self.anchor_masks) == len(self.downsample_ratios), \
@@ -198,88 +267,140 @@ class Gt2YoloTarget(BaseOperator):
 
         h, w = samples[0]['image'].shape[1:3]
         an_hw = np.array(self.anchors) / np.array([[w, h]])
+        anchors = np.array(self.anchors, dtype=np.float64)
+        num_anchors = an_hw.shape[0]
+        batch_size = len(samples)
         for sample in samples:
-            gt_bbox = sample['gt_bbox']
-            gt_class = sample['gt_class']
             if 'gt_score' not in sample:
                 sample['gt_score'] = np.ones(
-                    (gt_bbox.shape[0], 1), dtype=np.float32)
-            gt_score = sample['gt_score']
-            for i, (
-                    mask, downsample_ratio
-            ) in enumerate(zip(self.anchor_masks, self.downsample_ratios)):
-                grid_h = int(h / downsample_ratio)
-                grid_w = int(w / downsample_ratio)
+                    (sample['gt_bbox'].shape[0], 1), dtype=np.float32)
+
+        gt_bbox = np.concatenate(
+            [s['gt_bbox'].reshape((-1, 4)) for s in samples], axis=0)
+        gt_class = np.concatenate(
+            [s['gt_class'].reshape((-1, )) for s in samples]).astype(np.int64)
+        gt_score = np.concatenate(
+            [s['gt_score'].reshape((-1, )) for s in samples])
+        im_idx = np.concatenate([
+            np.full((s['gt_bbox'].shape[0], ), i, dtype=np.int64)
+            for i, s in enumerate(samples)
+        ])
+        valid = (gt_bbox[:, 2] > 0.) & (gt_bbox[:, 3] > 0.) & (gt_score > 0.)
+        gt_bbox, gt_class = gt_bbox[valid], gt_class[valid]
+        gt_score, im_idx = gt_score[valid], im_idx[valid]
+        gx, gy, gw, gh = [gt_bbox[:, k] for k in range(4)]
+
+        # find best match anchor index
+        ious = self._anchor_ious(gw, gh, an_hw)
+        best_idx = np.argmax(ious, axis=1)
+
+        for i, (
+                mask, downsample_ratio
+        ) in enumerate(zip(self.anchor_masks, self.downsample_ratios)):
+            grid_h = int(h / downsample_ratio)
+            grid_w = int(w / downsample_ratio)
+            num_mask = len(mask)
+            mask_idx = np.array(mask, dtype=np.int64)
+            slot = np.full((num_anchors, ), -1, dtype=np.int64)
+            slot[mask_idx] = np.arange(num_mask)
+
+            # candidates of each gt box: the best match anchor, then the
+            # other anchors of this level whose IoU is larger than iou_thresh
+            cand_n = np.zeros((gt_bbox.shape[0], num_mask + 1), dtype=np.int64)
+            cand_n[:, 0] = slot[best_idx]
+            cand_n[:, 1:] = np.arange(num_mask)[None, :]
+            cand_valid = np.zeros(cand_n.shape, dtype=bool)
+            # gtbox should be regresed in this layes if best match
+            # anchor index in anchor mask of this layer
+            cand_valid[:, 0] = cand_n[:, 0] >= 0
+            if self.iou_thresh < 1:
+                cand_valid[:, 1:] = (ious[:, mask_idx] > self.iou_thresh) & (
+                    mask_idx[None, :] != best_idx[:, None])
+            cand_anchor = np.concatenate(
+                [best_idx[:, None], np.tile(mask_idx[None, :],
+                                            (gt_bbox.shape[0], 1))],
+                axis=1)
+            # a non-best candidate is only assigned if the position has not
+            # been assigned by previous gt boxes or candidates
+            conditional = np.zeros(cand_n.shape, dtype=bool)
+            conditional[:, 1:] = True
+
+            gt_ind, cand_ind = np.nonzero(cand_valid)
+            n = cand_n[gt_ind, cand_ind]
+            an_idx = cand_anchor[gt_ind, cand_ind]
+            conditional = conditional[gt_ind, cand_ind]
+
+            # positions and offsets are computed in float64, as the float32
+            # scalars of gt boxes times python ints were
+            gxs = gx[gt_ind].astype(np.float64) * grid_w
+            gys = gy[gt_ind].astype(np.float64) * grid_h
+            gi = gxs.astype(np.int64)
+            gj = gys.astype(np.int64)
+            key = np.ravel_multi_index(
+                (im_idx[gt_ind], n, gj, gi),
+                (batch_size, num_mask, grid_h, grid_w))
+            _, first = np.unique(key, return_index=True)
+            assigned = ~conditional
+            assigned[first] = True
+
+            gt_ind, n, an_idx = gt_ind[assigned], n[assigned], an_idx[assigned]
+            gxs, gys = gxs[assigned], gys[assigned]
+            gi, gj, key = gi[assigned], gj[assigned], key[assigned]
+            gw_i, gh_i = gw[gt_ind], gh[gt_ind]
+            values = np.stack(
+                [
+                    # x, y, w, h, scale
+                    gxs - gi,
+                    gys - gj,
+                    np.log(gw_i.astype(np.float64) * w / anchors[an_idx, 0]),
+                    np.log(gh_i.astype(np.float64) * h / anchors[an_idx, 1]),
+                    2.0 - gw_i * gh_i,
+                    # objectness record gt_score
+                    gt_score[gt_ind],
+                ],
+                axis=1).astype(np.float32)
+            # the last assignment of a position takes effect, while classes
+            # of all assignments are set
+            rev_uniq, rev_last = np.unique(key[::-1], return_index=True)
+            last = key.shape[0] - 1 - rev_last
+            cls = 6 + gt_class[gt_ind]
+
+            if not self.sparse_target:
                 target = np.zeros(
-                    (len(mask), 6 + self.num_classes, grid_h, grid_w),
+                    (batch_size, num_mask, 6 + self.num_classes, grid_h,
+                     grid_w),
                     dtype=np.float32)
-                for b in range(gt_bbox.shape[0]):
-                    gx, gy, gw, gh = gt_bbox[b, :]
-                    cls = gt_class[b]
-                    score = gt_score[b]
-                    if gw <= 0. or gh <= 0. or score <= 0.:
-                        continue
+                b = im_idx[gt_ind]
+                target[b[last], n[last], :6, gj[last], gi[last]] = \
+                    values[last]
+                # classification
+                target[b, n, cls, gj, gi] = 1.
+                for k, sample in enumerate(samples):
+                    sample['target{}'.format(i)] = target[k]
+                continue
 
-                    # find best match anchor index
-                    best_iou = 0.
-                    best_idx = -1
-                    for an_idx in range(an_hw.shape[0]):
-                        iou = jaccard_overlap(
-                            [0., 0., gw, gh],
-                            [0., 0., an_hw[an_idx, 0], an_hw[an_idx, 1]])
-                        if iou > best_iou:
-                            best_iou = iou
-                            best_idx = an_idx
-
-                    gi = int(gx * grid_w)
-                    gj = int(gy * grid_h)
-
-                    # gtbox should be regresed in this layes if best match 
-                    # anchor index in anchor mask of this layer
-                    if best_idx in mask:
-                        best_n = mask.index(best_idx)
-
-                        # x, y, w, h, scale
-                        target[best_n, 0, gj, gi] = gx * grid_w - gi
-                        target[best_n, 1, gj, gi] = gy * grid_h - gj
-                        target[best_n, 2, gj, gi] = np.log(
-                            gw * w / self.anchors[best_idx][0])
-                        target[best_n, 3, gj, gi] = np.log(
-                            gh * h / self.anchors[best_idx][1])
-                        target[best_n, 4, gj, gi] = 2.0 - gw * gh
-
-                        # objectness record gt_score
-                        target[best_n, 5, gj, gi] = score
-
-                        # classification
-                        target[best_n, 6 + cls, gj, gi] = 1.
-
-                    # For non-matched anchors, calculate the target if the iou 
-                    # between anchor and gt is larger than iou_thresh
-                    if self.iou_thresh < 1:
-                        for idx, mask_i in enumerate(mask):
-                            if mask_i == best_idx: continue
-                            iou = jaccard_overlap(
-                                [0., 0., gw, gh],
-                                [0., 0., an_hw[mask_i, 0], an_hw[mask_i, 1]])
-                            if iou > self.iou_thresh and target[idx, 5, gj,
-                                                                gi] == 0.:
-                                # x, y, w, h, scale
-                                target[idx, 0, gj, gi] = gx * grid_w - gi
-                                target[idx, 1, gj, gi] = gy * grid_h - gj
-                                target[idx, 2, gj, gi] = np.log(
-                                    gw * w / self.anchors[mask_i][0])
-                                target[idx, 3, gj, gi] = np.log(
-                                    gh * h / self.anchors[mask_i][1])
-                                target[idx, 4, gj, gi] = 2.0 - gw * gh
-
-                                # objectness record gt_score
-                                target[idx, 5, gj, gi] = score
-
-                                # classification
-                                target[idx, 6 + cls, gj, gi] = 1.
-                sample['target{}'.format(i)] = target
+            # rev_uniq is sorted, positions of a sample are contiguous
+            cell = np.searchsorted(rev_uniq, key)
+            cell_value = np.zeros(
+                (rev_uniq.shape[0], 6 + self.num_classes), dtype=np.float32)
+            cell_value[cell[last], :6] = values[last]
+            cell_value[cell, cls] = 1.
+            level_size = num_mask * grid_h * grid_w
+            cell_im = rev_uniq // level_size
+            counts = np.bincount(cell_im, minlength=batch_size)
+            max_num = max(1, int(counts.max()) if batch_size > 0 else 1)
+            offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            pos = np.arange(rev_uniq.shape[0]) - offsets[cell_im]
+            index = np.full((batch_size, max_num), -1, dtype=np.int64)
+            index[cell_im, pos] = rev_uniq % level_size
+            value = np.zeros(
+                (batch_size, max_num, 6 + self.num_classes), dtype=np.float32)
+            value[cell_im, pos] = cell_value
+            for k, sample in enumerate(samples):
+                sample['target{}_index'.format(i)] = index[k]
+                sample['target{}_value'.format(i)] = value[k]
 
+        for sample in samples:
             # remove useless gt_class and gt_score after target calculated
             sample.pop('gt_class')
             sample.pop('gt_score')
@@ -318,15 +439,10 @@ class Gt2FCOSTarget(BaseOperator):
         :param w: image width
         :return: points from all feature map
         """
-        locations = []
-        for stride in self.downsample_ratios:
-            shift_x = np.arange(0, w, stride).astype(np.float32)
-            shift_y = np.arange(0, h, stride).astype(np.float32)
-            shift_x, shift_y = np.meshgrid(shift_x, shift_y)
-            shift_x = shift_x.flatten()
-            shift_y = shift_y.flatten()
-            location = np.stack([shift_x, shift_y], axis=1) + stride // 2
-            locations.append(location)
+        locations = [
+            _grid_points(h, w, stride, stride // 2)
+            for stride in self.downsample_ratios
+        ]
         num_points_each_level = [len(location) for location in locations]
         locations = np.concatenate(locations, axis=0)
         return locations, num_points_each_level
@@ -351,35 +467,24 @@ class Gt2FCOSTarget(BaseOperator):
         """
         check if points is within the clipped boxes
         :param gt_bbox: bounding boxes
-        :param xs: horizontal coordinate of points
-        :param ys: vertical coordinate of points
+        :param xs: horizontal coordinate of points, shape [num_points, 1]
+        :param ys: vertical coordinate of points, shape [num_points, 1]
         :return: the mask of points is within gt_box or not
         """
-        bboxes = np.reshape(
-            gt_bbox, newshape=[1, gt_bbox.shape[0], gt_bbox.shape[1]])
-        bboxes = np.tile(bboxes, reps=[xs.shape[0], 1, 1])
-        ct_x = (bboxes[:, :, 0] + bboxes[:, :, 2]) / 2
-        ct_y = (bboxes[:, :, 1] + bboxes[:, :, 3]) / 2
-        beg = 0
-        clipped_box = bboxes.copy()
-        for lvl, stride in enumerate(self.downsample_ratios):
-            end = beg + num_points_each_level[lvl]
-            stride_exp = self.center_sampling_radius * stride
-            clipped_box[beg:end, :, 0] = np.maximum(
-                bboxes[beg:end, :, 0], ct_x[beg:end, :] - stride_exp)
-            clipped_box[beg:end, :, 1] = np.maximum(
-                bboxes[beg:end, :, 1], ct_y[beg:end, :] - stride_exp)
-            clipped_box[beg:end, :, 2] = np.minimum(
-                bboxes[beg:end, :, 2], ct_x[beg:end, :] + stride_exp)
-            clipped_box[beg:end, :, 3] = np.minimum(
-                bboxes[beg:end, :, 3], ct_y[beg:end, :] + stride_exp)
-            beg = end
-        l_res = xs - clipped_box[:, :, 0]
-        r_res = clipped_box[:, :, 2] - xs
-        t_res = ys - clipped_box[:, :, 1]
-        b_res = clipped_box[:, :, 3] - ys
-        clipped_box_reg_targets = np.stack([l_res, t_res, r_res, b_res], axis=2)
-        inside_gt_box = np.min(clipped_box_reg_targets, axis=2) > 0
+        ct_x = (gt_bbox[:, 0] + gt_bbox[:, 2]) / 2
+        ct_y = (gt_bbox[:, 1] + gt_bbox[:, 3]) / 2
+        stride_exp = np.repeat(
+            np.array(
+                [self.center_sampling_radius * stride
+                 for stride in self.downsample_ratios],
+                dtype=gt_bbox.dtype),
+            num_points_each_level)[:, None]
+        l_res = xs - np.maximum(gt_bbox[:, 0], ct_x - stride_exp)
+        t_res = ys - np.maximum(gt_bbox[:, 1], ct_y - stride_exp)
+        r_res = np.minimum(gt_bbox[:, 2], ct_x + stride_exp) - xs
+        b_res = np.minimum(gt_bbox[:, 3], ct_y + stride_exp) - ys
+        inside_gt_box = np.minimum(
+            np.minimum(l_res, t_res), np.minimum(r_res, b_res)) > 0
         return inside_gt_box
 
     def __call__(self, samples, context=None):
@@ -393,70 +498,52 @@ class Gt2FCOSTarget(BaseOperator):
             # calculate the locations
             h, w = im.shape[1:3]
             points, num_points_each_level = self._compute_points(w, h)
-            object_scale_exp = []
-            for i, num_pts in enumerate(num_points_each_level):
-                object_scale_exp.append(
-                    np.tile(
-                        np.array([self.object_sizes_of_interest[i]]),
-                        reps=[num_pts, 1]))
-            object_scale_exp = np.concatenate(object_scale_exp, axis=0)
+            object_scale_exp = np.repeat(
+                np.array(self.object_sizes_of_interest),
+                num_points_each_level,
+                axis=0)
 
+            # targets of all points and gt boxes, shape [num_points, num_gt]
             gt_area = (bboxes[:, 2] - bboxes[:, 0]) * (
                 bboxes[:, 3] - bboxes[:, 1])
-            xs, ys = points[:, 0], points[:, 1]
-            xs = np.reshape(xs, newshape=[xs.shape[0], 1])
-            xs = np.tile(xs, reps=[1, bboxes.shape[0]])
-            ys = np.reshape(ys, newshape=[ys.shape[0], 1])
-            ys = np.tile(ys, reps=[1, bboxes.shape[0]])
-
+            xs, ys = points[:, 0:1], points[:, 1:2]
             l_res = xs - bboxes[:, 0]
             r_res = bboxes[:, 2] - xs
             t_res = ys - bboxes[:, 1]
             b_res = bboxes[:, 3] - ys
-            reg_targets = np.stack([l_res, t_res, r_res, b_res], axis=2)
             if self.center_sampling_radius > 0:
                 is_inside_box = self._check_inside_boxes_limited(
                     bboxes, xs, ys, num_points_each_level)
             else:
-                is_inside_box = np.min(reg_targets, axis=2) > 0
+                is_inside_box = np.minimum(
+                    np.minimum(l_res, t_res), np.minimum(r_res, b_res)) > 0
             # check if the targets is inside the corresponding level
-            max_reg_targets = np.max(reg_targets, axis=2)
-            lower_bound = np.tile(
-                np.expand_dims(
-                    object_scale_exp[:, 0], axis=1),
-                reps=[1, max_reg_targets.shape[1]])
-            high_bound = np.tile(
-                np.expand_dims(
-                    object_scale_exp[:, 1], axis=1),
-                reps=[1, max_reg_targets.shape[1]])
+            max_reg_targets = np.maximum(
+                np.maximum(l_res, t_res), np.maximum(r_res, b_res))
             is_match_current_level = \
-                (max_reg_targets > lower_bound) & \
-                (max_reg_targets < high_bound)
-            points2gtarea = np.tile(
-                np.expand_dims(
-                    gt_area, axis=0), reps=[xs.shape[0], 1])
-            points2gtarea[is_inside_box == 0] = self.INF
-            points2gtarea[is_match_current_level == 0] = self.INF
+                (max_reg_targets > object_scale_exp[:, 0:1]) & \
+                (max_reg_targets < object_scale_exp[:, 1:2])
+            points2gtarea = np.where(is_inside_box & is_match_current_level,
+                                     gt_area[None, :], self.INF)
             points2min_area = points2gtarea.min(axis=1)
             points2min_area_ind = points2gtarea.argmin(axis=1)
             labels = gt_class[points2min_area_ind] + 1
             labels[points2min_area == self.INF] = 0
-            reg_targets = reg_targets[range(xs.shape[0]), points2min_area_ind]
+            point_inds = np.arange(points.shape[0])
+            reg_targets = np.stack(
+                [
+                    res[point_inds, points2min_area_ind]
+                    for res in [l_res, t_res, r_res, b_res]
+                ],
+                axis=1)
             ctn_targets = np.sqrt((reg_targets[:, [0, 2]].min(axis=1) / \
                                   reg_targets[:, [0, 2]].max(axis=1)) * \
                                   (reg_targets[:, [1, 3]].min(axis=1) / \
                                    reg_targets[:, [1, 3]].max(axis=1))).astype(np.float32)
             ctn_targets = np.reshape(
-                ctn_targets, newshape=[ctn_targets.shape[0], 1])
+                ctn_targets, [ctn_targets.shape[0], 1])
             ctn_targets[labels <= 0] = 0
-            pos_ind = np.nonzero(labels != 0)
-            reg_targets_pos = reg_targets[pos_ind[0], :]
-            split_sections = []
-            beg = 0
-            for lvl in range(len(num_points_each_level)):
-                end = beg + num_points_each_level[lvl]
-                split_sections.append(end)
-                beg = end
+            split_sections = np.cumsum(num_points_each_level)[:-1]
             labels_by_level = np.split(labels, split_sections, axis=0)
             reg_targets_by_level = np.split(reg_targets, split_sections, axis=0)
             ctn_targets_by_level = np.split(ctn_targets, split_sections, axis=0)
@@ -468,15 +555,15 @@ class Gt2FCOSTarget(BaseOperator):
                         np.reshape(
                             reg_targets_by_level[lvl] / \
                             self.downsample_ratios[lvl],
-                            newshape=[grid_h, grid_w, 4])
+                            [grid_h, grid_w, 4])
                 else:
                     sample['reg_target{}'.format(lvl)] = np.reshape(
                         reg_targets_by_level[lvl],
-                        newshape=[grid_h, grid_w, 4])
+                        [grid_h, grid_w, 4])
                 sample['labels{}'.format(lvl)] = np.reshape(
-                    labels_by_level[lvl], newshape=[grid_h, grid_w, 1])
+                    labels_by_level[lvl], [grid_h, grid_w, 1])
                 sample['centerness{}'.format(lvl)] = np.reshape(
-                    ctn_targets_by_level[lvl], newshape=[grid_h, grid_w, 1])
+                    ctn_targets_by_level[lvl], [grid_h, grid_w, 1])
 
             sample.pop('is_crowd', None)
             sample.pop('difficult', None)
@@ -504,7 +591,8 @@ class Gt2GFLTarget(BaseOperator):
 
         self.assigner = ATSSAssigner()
 
-    def get_grid_cells(self, featmap_size, scale, stride, offset=0):
+    @staticmethod
+    def get_grid_cells(featmap_size, scale, stride, offset=0):
         """
         Generate grid cells of a feature map for target assignment.
         Args:
@@ -547,30 +635,13 @@ class Gt2GFLTarget(BaseOperator):
 
     def __call__(self, samples, context=None):
         assert len(samples) > 0
-        batch_size = len(samples)
-        # get grid cells of image
+        # get grid cells of image, the same for all images of the batch
         h, w = samples[0]['image'].shape[1:3]
-        multi_level_grid_cells = []
-        for stride in self.downsample_ratios:
-            featmap_size = (int(math.ceil(h / stride)),
-                            int(math.ceil(w / stride)))
-            multi_level_grid_cells.append(
-                self.get_grid_cells(featmap_size, self.grid_cell_scale, stride,
-                                    self.cell_offset))
-        mlvl_grid_cells_list = [
-            multi_level_grid_cells for i in range(batch_size)
-        ]
-        # pixel cell number of multi-level feature maps
-        num_level_cells = [
-            grid_cells.shape[0] for grid_cells in mlvl_grid_cells_list[0]
-        ]
-        num_level_cells_list = [num_level_cells] * batch_size
-        # concat all level cells and to a single array
-        for i in range(batch_size):
-            mlvl_grid_cells_list[i] = np.concatenate(mlvl_grid_cells_list[i])
+        grid_cells, num_level_cells = _grid_cells(
+            h, w, tuple(self.downsample_ratios), self.grid_cell_scale,
+            self.cell_offset)
         # target assign on all images
-        for sample, grid_cells, num_level_cells in zip(
-                samples, mlvl_grid_cells_list, num_level_cells_list):
+        for sample in samples:
             gt_bboxes = sample['gt_bbox']
             gt_labels = sample['gt_class'].squeeze()
             if gt_labels.size == 1:
@@ -668,21 +739,37 @@ class Gt2TTFTarget(BaseOperator):
             h_radiuses_alpha = (feat_hs / 2. * self.alpha).astype('int32')
             w_radiuses_alpha = (feat_ws / 2. * self.alpha).astype('int32')
 
-            for k in range(len(gt_bbox)):
-                cls_id = gt_class[k]
-                fake_heatmap = np.zeros((feat_size, feat_size), dtype='float32')
-                self.draw_truncate_gaussian(fake_heatmap, ct_inds[k],
-                                            h_radiuses_alpha[k],
-                                            w_radiuses_alpha[k])
-
-                heatmap[cls_id] = np.maximum(heatmap[cls_id], fake_heatmap)
-                box_target_inds = fake_heatmap > 0
-                box_target[:, box_target_inds] = gt_bbox[k][:, None]
-
-                local_heatmap = fake_heatmap[box_target_inds]
-                ct_div = np.sum(local_heatmap)
-                local_heatmap *= boxes_area_topk_log[k]
-                reg_weight[0, box_target_inds] = local_heatmap / ct_div
+            # gaussians of all boxes, the same as draw_truncate_gaussian
+            inds, ys, xs, values = gaussian_patches(
+                ct_inds, h_radiuses_alpha, w_radiuses_alpha, feat_size,
+                feat_size)
+            values = values.astype('float32')
+            np.maximum.at(heatmap, (gt_class.reshape(-1)[inds], ys, xs),
+                          values)
+
+            # points of the gaussians, box by box, with the weights of boxes
+            keep = values > 0
+            inds, ys, xs, values = inds[keep], ys[keep], xs[keep], values[keep]
+            if inds.shape[0] > 0:
+                # sum of each box by np.sum to be the same as drawing them
+                # one by one, which is pairwise
+                num_points = np.bincount(inds, minlength=len(gt_bbox))
+                ct_div = np.array(
+                    [
+                        local_heatmap.sum()
+                        for local_heatmap in np.split(
+                            values, np.cumsum(num_points)[:-1])
+                    ],
+                    dtype=values.dtype)
+                weights = values * boxes_area_topk_log[inds] / ct_div[inds]
+                # boxes are sorted by area descendingly, a point belongs to
+                # the last one, the smallest box, as boxes overwrite before
+                flat_inds = ys * feat_size + xs
+                _, last = np.unique(flat_inds[::-1], return_index=True)
+                last = inds.shape[0] - 1 - last
+                ys, xs = ys[last], xs[last]
+                box_target[:, ys, xs] = gt_bbox[inds[last]].T
+                reg_weight[0, ys, xs] = weights[last]
             sample['ttf_heatmap'] = heatmap
             sample['ttf_box_target'] = box_target
             sample['ttf_reg_weight'] = reg_weight
@@ -1019,43 +1106,40 @@ class Gt2CenterNetTarget(BaseOperator):
 
         hm = np.zeros((num_classes, output_h, output_w), dtype=np.float32)
         wh = np.zeros((self.max_objs, 2), dtype=np.float32)
-        dense_wh = np.zeros((2, output_h, output_w), dtype=np.float32)
         reg = np.zeros((self.max_objs, 2), dtype=np.float32)
         ind = np.zeros((self.max_objs), dtype=np.int64)
         reg_mask = np.zeros((self.max_objs), dtype=np.int32)
-        cat_spec_wh = np.zeros(
-            (self.max_objs, num_classes * 2), dtype=np.float32)
-        cat_spec_mask = np.zeros(
-            (self.max_objs, num_classes * 2), dtype=np.int32)
 
         trans_output = get_affine_transform(c, [s, s], 0, [output_w, output_h])
 
-        gt_det = []
-        for i, (bbox, cls) in enumerate(zip(gt_bbox, gt_class)):
-            cls = int(cls)
-            bbox[:2] = affine_transform(bbox[:2], trans_output)
-            bbox[2:] = affine_transform(bbox[2:], trans_output)
-            bbox[[0, 2]] = np.clip(bbox[[0, 2]], 0, output_w - 1)
-            bbox[[1, 3]] = np.clip(bbox[[1, 3]], 0, output_h - 1)
-            h, w = bbox[3] - bbox[1], bbox[2] - bbox[0]
-            if h > 0 and w > 0:
-                radius = gaussian_radius((math.ceil(h), math.ceil(w)), 0.7)
-                radius = max(0, int(radius))
-                ct = np.array(
-                    [(bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2],
-                    dtype=np.float32)
-                ct_int = ct.astype(np.int32)
-                draw_umich_gaussian(hm[cls], ct_int, radius)
-                wh[i] = 1. * w, 1. * h
-                ind[i] = ct_int[1] * output_w + ct_int[0]
-                reg[i] = ct - ct_int
-                reg_mask[i] = 1
-                cat_spec_wh[i, cls * 2:cls * 2 + 2] = wh[i]
-                cat_spec_mask[i, cls * 2:cls * 2 + 2] = 1
-                gt_det.append([
-                    ct[0] - w / 2, ct[1] - h / 2, ct[0] + w / 2, ct[1] + h / 2,
-                    1, cls
-                ])
+        # transform and clip all boxes at once
+        bbox = np.array(gt_bbox, dtype=np.float32).reshape((-1, 2))
+        bbox = np.concatenate(
+            [bbox, np.ones_like(bbox[:, :1])], axis=1).astype(np.float64)
+        bbox = np.matmul(bbox, trans_output.T).astype(np.float32)
+        bbox = bbox.reshape((-1, 4))
+        bbox[:, [0, 2]] = np.clip(bbox[:, [0, 2]], 0, output_w - 1)
+        bbox[:, [1, 3]] = np.clip(bbox[:, [1, 3]], 0, output_h - 1)
+        h, w = bbox[:, 3] - bbox[:, 1], bbox[:, 2] - bbox[:, 0]
+        valid = np.nonzero((h > 0) & (w > 0))[0]
+        if valid.shape[0] > 0:
+            bbox, h, w = bbox[valid], h[valid], w[valid]
+            cls = gt_class.reshape(-1)[valid].astype(np.int64)
+            radius = gaussian_radius((np.ceil(h).astype(np.int64),
+                                      np.ceil(w).astype(np.int64)), 0.7)
+            radius = np.maximum(0, radius.astype(np.int64))
+            ct = np.stack(
+                [(bbox[:, 0] + bbox[:, 2]) / 2, (bbox[:, 1] + bbox[:, 3]) / 2],
+                axis=1)
+            ct_int = ct.astype(np.int32)
+            # the same as draw_umich_gaussian of each box
+            inds, ys, xs, values = gaussian_patches(ct_int, radius, radius,
+                                                    output_h, output_w)
+            np.maximum.at(hm, (cls[inds], ys, xs), values.astype(np.float32))
+            wh[valid] = np.stack([w, h], axis=1)
+            ind[valid] = ct_int[:, 1] * output_w + ct_int[:, 0]
+            reg[valid] = ct - ct_int
+            reg_mask[valid] = 1
 
         sample.pop('gt_bbox', None)
         sample.pop('gt_class', None)
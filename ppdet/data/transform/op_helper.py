@@ -433,7 +433,8 @@ def gaussian_radius(bbox_size, min_overlap):
     c3 = (min_overlap - 1) * width * height
     sq3 = np.sqrt(b3**2 - 4 * a3 * c3)
     radius3 = (b3 + sq3) / 2
-    return min(radius1, radius2, radius3)
+    # elementwise for arrays of sizes
+    return np.minimum(np.minimum(radius1, radius2), radius3)
 
 
 def draw_gaussian(heatmap, center, radius, k=1, delte=6):
@@ -487,6 +488,54 @@ def draw_umich_gaussian(heatmap, center, radius, k=1):
     return heatmap
 
 
+def gaussian_patches(centers, h_radius, w_radius, height, width):
+    """
+    Gaussians of gaussian2D of many boxes at once, truncated to the radiuses
+    and clipped to the heatmap as draw_truncate_gaussian and
+    draw_umich_gaussian, with sigma of (2 * radius + 1) / 6.
+
+    Args:
+        centers (np.ndarray): centers (x, y) of boxes, shape [N, 2], which
+            are truncated to int.
+        h_radius (np.ndarray): int radiuses along y, shape [N].
+        w_radius (np.ndarray): int radiuses along x, shape [N].
+        height (int): height of the heatmap.
+        width (int): width of the heatmap.
+
+    Returns:
+        inds (np.ndarray): index of the box of each point, points of a box
+            are contiguous and in row major order.
+        ys (np.ndarray): y of the points on the heatmap.
+        xs (np.ndarray): x of the points on the heatmap.
+        values (np.ndarray): float64 value of the gaussian at the points.
+    """
+    x = centers[:, 0].astype(np.int64)
+    y = centers[:, 1].astype(np.int64)
+    h_radius = np.asarray(h_radius, dtype=np.int64)
+    w_radius = np.asarray(w_radius, dtype=np.int64)
+    x0 = np.maximum(x - w_radius, 0)
+    y0 = np.maximum(y - h_radius, 0)
+    patch_w = np.maximum(np.minimum(x + w_radius + 1, width) - x0, 0)
+    patch_h = np.maximum(np.minimum(y + h_radius + 1, height) - y0, 0)
+    num_points = patch_w * patch_h
+
+    inds = np.repeat(np.arange(num_points.shape[0]), num_points)
+    offsets = np.arange(inds.shape[0]) - np.repeat(
+        np.cumsum(num_points) - num_points, num_points)
+    ys = y0[inds] + offsets // patch_w[inds]
+    xs = x0[inds] + offsets % patch_w[inds]
+
+    dx = (xs - x[inds]).astype(np.float64)
+    dy = (ys - y[inds]).astype(np.float64)
+    sigma_x = ((2 * w_radius + 1) / 6)[inds]
+    sigma_y = ((2 * h_radius + 1) / 6)[inds]
+    values = np.exp(-(dx * dx / (2 * sigma_x * sigma_x) + dy * dy /
+                      (2 * sigma_y * sigma_y)))
+    # the max of each gaussian is 1 at its center
+    values[values < np.finfo(values.dtype).eps] = 0
+    return inds, ys, xs, values
+
+
 def get_border(border, size):
     i = 1
     while size - border // i <= border // i:
@@ -36,13 +36,10 @@ import copy
 import logging
 import cv2
 from PIL import Image, ImageDraw
-import pickle
-import threading
-MUTEX = threading.Lock()
-
 from ppdet.core.workspace import serializable
 from ppdet.modeling import bbox_utils
 from ..reader import Compose
+from ..cache_utils import SharedImageCache
 
 from .op_helper import (satisfy_sample_constraint, filter_and_process,
                         generate_sample_bbox, clip_bbox, data_anchor_sampling,
@@ -153,35 +150,41 @@ class Decode(BaseOperator):
         return sample
 
 
-def _make_dirs(dirname):
-    try:
-        from pathlib import Path
-    except ImportError:
-        from pathlib2 import Path
-    Path(dirname).mkdir(exist_ok=True)
-
-
 @register_op
 class DecodeCache(BaseOperator):
-    def __init__(self, cache_root=None):
-        '''decode image and caching
-        '''
+    def __init__(self,
+                 cache_root=None,
+                 cache_size_in_M=4096,
+                 low_watermark=0.9):
+        """ Decode image and cache the decoded image in a bounded cache
+        shared by all DataLoader workers, see `SharedImageCache`.
+        Args:
+            cache_root (str|None): directory of the cache, a tmpfs directory
+                such as /dev/shm/ppdet_cache is recommended. None means
+                decoding without caching.
+            cache_size_in_M (int): byte budget of the cache in MB, least
+                recently used images are evicted when it is exceeded.
+            low_watermark (float): ratio of budget to keep after eviction.
+        """
         super(DecodeCache, self).__init__()
 
         self.use_cache = False if cache_root is None else True
         self.cache_root = cache_root
+        self.cache = None
 
         if cache_root is not None:
-            _make_dirs(cache_root)
+            self.cache = SharedImageCache(
+                cache_root,
+                cache_size=int(cache_size_in_M * 1024**2),
+                low_watermark=low_watermark)
 
     def apply(self, sample, context=None):
+        im = None
+        if self.use_cache and 'im_file' in sample:
+            key = self.cache.key(sample['im_file'])
+            im = self.cache.get(key)
 
-        if self.use_cache and os.path.exists(
-                self.cache_path(self.cache_root, sample['im_file'])):
-            path = self.cache_path(self.cache_root, sample['im_file'])
-            im = self.load(path)
-
-        else:
+        if im is None:
             if 'image' not in sample:
                 with open(sample['im_file'], 'rb') as f:
                     sample['image'] = f.read()
@@ -193,10 +196,8 @@ class DecodeCache(BaseOperator):
                 sample['ori_image'] = im
             im = cv2.cvtColor(im, cv2.COLOR_BGR2RGB)
 
-            if self.use_cache and not os.path.exists(
-                    self.cache_path(self.cache_root, sample['im_file'])):
-                path = self.cache_path(self.cache_root, sample['im_file'])
-                self.dump(im, path)
+            if self.use_cache and 'im_file' in sample:
+                self.cache.put(key, im)
 
         sample['image'] = im
         sample['h'] = im.shape[0]
@@ -205,32 +206,12 @@ class DecodeCache(BaseOperator):
         sample['im_shape'] = np.array(im.shape[:2], dtype=np.float32)
         sample['scale_factor'] = np.array([1., 1.], dtype=np.float32)
 
-        sample.pop('im_file')
+        sample.pop('im_file', None)
 
         return sample
 
-    @staticmethod
-    def cache_path(dir_oot, im_file):
-        return os.path.join(dir_oot, os.path.basename(im_file) + '.pkl')
-
-    @staticmethod
-    def load(path):
-        with open(path, 'rb') as f:
-            im = pickle.load(f)
-        return im
-
-    @staticmethod
-    def dump(obj, path):
-        MUTEX.acquire()
-        try:
-            with open(path, 'wb') as f:
-                pickle.dump(obj, f)
-
-        except Exception as e:
-            logger.warning('dump {} occurs exception {}'.format(path, str(e)))
-
-        finally:
-            MUTEX.release()
+    def cache_stats(self):
+        return self.cache.stats() if self.use_cache else None
 
 
 @register_op
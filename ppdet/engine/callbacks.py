@@ -140,12 +140,29 @@ class LogPrinter(Callback):
                         btime=str(batch_time),
                         dtime=str(data_time),
                         ips=ips)
+                    cache_stats = self._decode_cache_stats()
+                    if cache_stats is not None:
+                        fmt = ' '.join([
+                            fmt, 'cache_hit_rate: {:.4f}'.format(cache_stats[
+                                'hit_rate']), 'cache_mem: {:.1f}M'.format(
+                                    cache_stats['bytes'] / 1024.**2)
+                        ])
                     logger.info(fmt)
             if mode == 'eval':
                 step_id = status['step_id']
                 if step_id % 100 == 0:
                     logger.info("Eval iter: {}".format(step_id))
 
+    def _decode_cache_stats(self):
+        # stats of DecodeCache in sample transforms of TrainReader, which
+        # are shared by all DataLoader workers
+        loader = getattr(self.model, 'loader', None)
+        transform = getattr(getattr(loader, 'dataset', None), 'transform', None)
+        for op in getattr(transform, 'transforms_cls', []):
+            if hasattr(op, 'cache_stats'):
+                return op.cache_stats()
+        return None
+
     def on_epoch_end(self, status):
         if dist.get_world_size() < 2 or dist.get_rank() == 0:
             mode = status['mode']
@@ -163,6 +163,8 @@ def _dump_infer_config(config, path, image_shape, model):
     if 'mask_head' in config[config['architecture']] and config[config[
             'architecture']]['mask_head']:
         infer_cfg['mask'] = True
+        if config['MaskPostProcess']['paste_in_box']:
+            infer_cfg['mask_paste_in_box'] = True
     label_arch = 'detection_arch'
     if infer_arch in KEYPOINT_ARCH:
         label_arch = 'keypoint_arch'
@@ -19,7 +19,10 @@ from __future__ import print_function
 import os
 import glob
 import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import paddle
+import paddle.distributed as dist
 import numpy as np
 from tqdm import tqdm
 from collections import defaultdict
@@ -32,6 +35,8 @@ from ppdet.modeling.mot.tracker import JDETracker, DeepSORTTracker
 
 from ppdet.metrics import Metric, MOTMetric, KITTIMOTMetric, MCMOTMetric
 import ppdet.utils.stats as stats
+from ppdet.utils.dist_utils import all_gather_object
+from ppdet.utils.video_sink import VideoSink
 
 from .callbacks import Callback, ComposeCallback
 
@@ -43,6 +48,9 @@ MOT_ARCH_JDE = ['JDE', 'FairMOT']
 MOT_ARCH_SDE = ['DeepSORT', 'ByteTrack']
 MOT_DATA_TYPE = ['mot', 'mcmot', 'kitti']
 
+# metrics which can evaluate sequences in a process pool
+ASYNC_MOT_METRICS = (MOTMetric, MCMOTMetric, KITTIMOTMetric)
+
 __all__ = ['Tracker']
 
 
@@ -63,6 +71,13 @@ class Tracker(object):
         self.status = {}
         self.start_epoch = 0
 
+        self._nranks = dist.get_world_size()
+        self._local_rank = dist.get_rank()
+        # track contiguous shards of sequences in each rank and evaluate
+        # all of them in rank 0
+        self._distributed_eval = self._nranks > 1 and cfg.get(
+            'distributed_eval', False)
+
         # initial default callbacks
         self._init_callbacks()
 
@@ -128,7 +143,8 @@ class Tracker(object):
                       save_dir=None,
                       show_image=False,
                       frame_rate=30,
-                      draw_threshold=0):
+                      draw_threshold=0,
+                      video_sink=None):
         if save_dir:
             if not os.path.exists(save_dir): os.makedirs(save_dir)
         tracker = self.model.tracker
@@ -173,7 +189,7 @@ class Tracker(object):
             timer.toc()
             save_vis_results(data, frame_id, online_ids, online_tlwhs,
                              online_scores, timer.average_time, show_image,
-                             save_dir, self.cfg.num_classes)
+                             save_dir, self.cfg.num_classes, video_sink)
             frame_id += 1
 
         return results, frame_id, timer.average_time, timer.calls
@@ -186,7 +202,8 @@ class Tracker(object):
                       seq_name='',
                       scaled=False,
                       det_file='',
-                      draw_threshold=0):
+                      draw_threshold=0,
+                      video_sink=None):
         if save_dir:
             if not os.path.exists(save_dir): os.makedirs(save_dir)
         use_detector = False if not self.model.detector else True
@@ -283,7 +300,7 @@ class Tracker(object):
                 online_ids, online_tlwhs, online_scores = None, None, None
                 save_vis_results(data, frame_id, online_ids, online_tlwhs,
                                  online_scores, timer.average_time, show_image,
-                                 save_dir, self.cfg.num_classes)
+                                 save_dir, self.cfg.num_classes, video_sink)
                 frame_id += 1
                 # thus will not inference reid model
                 continue
@@ -331,7 +348,7 @@ class Tracker(object):
                     (frame_id + 1, online_tlwhs, online_scores, online_ids))
                 save_vis_results(data, frame_id, online_ids, online_tlwhs,
                                  online_scores, timer.average_time, show_image,
-                                 save_dir, self.cfg.num_classes)
+                                 save_dir, self.cfg.num_classes, video_sink)
 
             elif isinstance(tracker, JDETracker):
                 # trick hyperparams only used for MOTChallenge (MOT17, MOT20) Test-set
@@ -362,7 +379,7 @@ class Tracker(object):
                 timer.toc()
                 save_vis_results(data, frame_id, online_ids, online_tlwhs,
                                  online_scores, timer.average_time, show_image,
-                                 save_dir, self.cfg.num_classes)
+                                 save_dir, self.cfg.num_classes, video_sink)
 
             frame_id += 1
 
@@ -378,7 +395,8 @@ class Tracker(object):
                      save_videos=False,
                      show_image=False,
                      scaled=False,
-                     det_results_dir=''):
+                     det_results_dir='',
+                     vis_scale=1.):
         if not os.path.exists(output_dir): os.makedirs(output_dir)
         result_root = os.path.join(output_dir, 'mot_results')
         if not os.path.exists(result_root): os.makedirs(result_root)
@@ -387,9 +405,21 @@ class Tracker(object):
         assert model_type in MOT_ARCH, \
             "model_type should be 'JDE', 'DeepSORT', 'FairMOT' or 'ByteTrack'"
 
+        # sequences of this rank, the shards of ranks are in order of seqs
+        all_seqs = seqs
+        if self._distributed_eval:
+            seqs = seqs[len(seqs) * self._local_rank // self._nranks:len(
+                seqs) * (self._local_rank + 1) // self._nranks]
+        is_main = not self._distributed_eval or self._local_rank == 0
+
+        # sequences are evaluated in a process pool overlapped with tracking
+        executor = self._create_executor(self.cfg.get('mot_eval_workers', 0))
+
         # run tracking
-        n_frame = 0
-        timer_avgs, timer_calls = [], []
+        seq_stats = {}
+        # results of the other ranks are sent to rank 0, which writes them
+        # to its result_root, so no shared file system is needed
+        seq_texts = {}
         for seq in seqs:
             infer_dir = os.path.join(data_root, seq)
             if not os.path.exists(infer_dir) or not os.path.isdir(infer_dir):
@@ -407,7 +437,12 @@ class Tracker(object):
                                            meta_info.find('\nseqLength')])
 
             save_dir = os.path.join(output_dir, 'mot_outputs',
-                                    seq) if save_images or save_videos else None
+                                    seq) if save_images else None
+            video_sink = VideoSink(
+                os.path.join(output_dir, 'mot_outputs', '{}_vis.mp4'.format(
+                    seq)),
+                fps=frame_rate,
+                scale=vis_scale) if save_videos else None
             logger.info('Evaluate seq: {}'.format(seq))
 
             self.dataset.set_images(self.get_infer_images(infer_dir))
@@ -421,7 +456,8 @@ class Tracker(object):
                         dataloader,
                         save_dir=save_dir,
                         show_image=show_image,
-                        frame_rate=frame_rate)
+                        frame_rate=frame_rate,
+                        video_sink=video_sink)
                 elif model_type in MOT_ARCH_SDE:
                     results, nf, ta, tc = self._eval_seq_sde(
                         dataloader,
@@ -431,43 +467,88 @@ class Tracker(object):
                         seq_name=seq,
                         scaled=scaled,
                         det_file=os.path.join(det_results_dir,
-                                              '{}.txt'.format(seq)))
+                                              '{}.txt'.format(seq)),
+                        video_sink=video_sink)
                 else:
                     raise ValueError(model_type)
 
             write_mot_results(result_filename, results, data_type,
                               self.cfg.num_classes)
-            n_frame += nf
-            timer_avgs.append(ta)
-            timer_calls.append(tc)
-
-            if save_videos:
-                output_video_path = os.path.join(save_dir, '..',
-                                                 '{}_vis.mp4'.format(seq))
-                cmd_str = 'ffmpeg -f image2 -i {}/%05d.jpg {}'.format(
-                    save_dir, output_video_path)
-                os.system(cmd_str)
-                logger.info('Save video in {}.'.format(output_video_path))
-
-            # update metrics
+            seq_stats[seq] = (nf, ta, tc)
+            if not is_main:
+                with open(result_filename, 'r') as f:
+                    seq_texts[seq] = f.read()
+            if video_sink is not None:
+                video_sink.release()
+
+            # update metrics of the sequences of rank 0 while tracking
+            if is_main:
+                self._update_metrics(data_root, seq, data_type, result_root,
+                                     result_filename, executor)
+
+        if self._distributed_eval:
+            rank_outputs = all_gather_object((seq_stats, seq_texts))
+            for rank in range(1, self._nranks):
+                rank_stats, rank_texts = rank_outputs[rank]
+                seq_stats.update(rank_stats)
+                if not is_main:
+                    continue
+                for seq in all_seqs:
+                    if seq not in rank_texts:
+                        continue
+                    result_filename = os.path.join(result_root,
+                                                   '{}.txt'.format(seq))
+                    with open(result_filename, 'w') as f:
+                        f.write(rank_texts[seq])
+                    self._update_metrics(data_root, seq, data_type,
+                                         result_root, result_filename, executor)
+
+        if is_main:
+            # in order of all_seqs, the same as evaluating in one process
+            seq_stats = [seq_stats[seq] for seq in all_seqs if seq in seq_stats]
+            n_frame = sum([s[0] for s in seq_stats])
+            timer_avgs = np.asarray([s[1] for s in seq_stats])
+            timer_calls = np.asarray([s[2] for s in seq_stats])
+            all_time = np.dot(timer_avgs, timer_calls)
+            avg_time = all_time / np.sum(timer_calls)
+            logger.info('Time elapsed: {:.2f} seconds, FPS: {:.2f}'.format(
+                all_time, 1.0 / avg_time))
+
+            # accumulate metric to log out
             for metric in self._metrics:
-                metric.update(data_root, seq, data_type, result_root,
-                              result_filename)
+                metric.accumulate()
+                metric.log()
 
-        timer_avgs = np.asarray(timer_avgs)
-        timer_calls = np.asarray(timer_calls)
-        all_time = np.dot(timer_avgs, timer_calls)
-        avg_time = all_time / np.sum(timer_calls)
-        logger.info('Time elapsed: {:.2f} seconds, FPS: {:.2f}'.format(
-            all_time, 1.0 / avg_time))
-
-        # accumulate metric to log out
-        for metric in self._metrics:
-            metric.accumulate()
-            metric.log()
+        if executor is not None:
+            executor.shutdown()
         # reset metric states for metric may performed multiple times
         self._reset_metrics()
 
+    def _create_executor(self, num_workers):
+        if num_workers < 1:
+            return None
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            logger.warning('fork is not supported, evaluate sequences in '
+                           'one process.')
+            return None
+        return ProcessPoolExecutor(
+            num_workers, mp_context=multiprocessing.get_context('fork'))
+
+    def _update_metrics(self, data_root, seq, data_type, result_root,
+                        result_filename, executor):
+        for metric in self._metrics:
+            if isinstance(metric, ASYNC_MOT_METRICS):
+                metric.update(
+                    data_root,
+                    seq,
+                    data_type,
+                    result_root,
+                    result_filename,
+                    executor=executor)
+            else:
+                metric.update(data_root, seq, data_type, result_root,
+                              result_filename)
+
     def get_infer_images(self, infer_dir):
         assert infer_dir is None or os.path.isdir(infer_dir), \
             "{} is not a directory".format(infer_dir)
@@ -496,7 +577,8 @@ class Tracker(object):
                         show_image=False,
                         scaled=False,
                         det_results_dir='',
-                        draw_threshold=0.5):
+                        draw_threshold=0.5,
+                        vis_scale=1.):
         assert video_file is not None or image_dir is not None, \
             "--video_file or --image_dir should be set."
         assert video_file is None or os.path.isfile(video_file), \
@@ -532,12 +614,16 @@ class Tracker(object):
             raise ValueError('--video_file or --image_dir should be set.')
 
         save_dir = os.path.join(output_dir, 'mot_outputs',
-                                seq) if save_images or save_videos else None
+                                seq) if save_images else None
 
         dataloader = create('TestMOTReader')(self.dataset, 0)
         result_filename = os.path.join(result_root, '{}.txt'.format(seq))
         if frame_rate == -1:
             frame_rate = self.dataset.frame_rate
+        video_sink = VideoSink(
+            os.path.join(output_dir, 'mot_outputs', '{}_vis.mp4'.format(seq)),
+            fps=frame_rate,
+            scale=vis_scale) if save_videos else None
 
         with paddle.no_grad():
             if model_type in MOT_ARCH_JDE:
@@ -546,7 +632,8 @@ class Tracker(object):
                     save_dir=save_dir,
                     show_image=show_image,
                     frame_rate=frame_rate,
-                    draw_threshold=draw_threshold)
+                    draw_threshold=draw_threshold,
+                    video_sink=video_sink)
             elif model_type in MOT_ARCH_SDE:
                 results, nf, ta, tc = self._eval_seq_sde(
                     dataloader,
@@ -557,17 +644,13 @@ class Tracker(object):
                     scaled=scaled,
                     det_file=os.path.join(det_results_dir,
                                           '{}.txt'.format(seq)),
-                    draw_threshold=draw_threshold)
+                    draw_threshold=draw_threshold,
+                    video_sink=video_sink)
             else:
                 raise ValueError(model_type)
 
-        if save_videos:
-            output_video_path = os.path.join(save_dir, '..',
-                                             '{}_vis.mp4'.format(seq))
-            cmd_str = 'ffmpeg -f image2 -i {}/%05d.jpg {}'.format(
-                save_dir, output_video_path)
-            os.system(cmd_str)
-            logger.info('Save video in {}'.format(output_video_path))
+        if video_sink is not None:
+            video_sink.release()
 
         write_mot_results(result_filename, results, data_type,
                           self.cfg.num_classes)
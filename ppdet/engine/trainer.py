@@ -45,6 +45,7 @@ from ppdet.data.source.sniper_coco import SniperCOCODataSet
 from ppdet.data.source.category import get_categories
 import ppdet.utils.stats as stats
 from ppdet.utils import profiler
+from ppdet.utils.dist_utils import all_gather_object, ShardedBatchSampler
 
 from .callbacks import Callback, ComposeCallback, LogPrinter, Checkpointer, WiferFaceEval, VisualDLWriter, SniperProposalsGenerator
 from .export_utils import _dump_infer_config, _prune_input_spec
@@ -56,6 +57,9 @@ __all__ = ['Trainer']
 
 MOT_ARCH = ['DeepSORT', 'JDE', 'FairMOT', 'ByteTrack']
 
+# metrics supporting evaluation on multiple devices by gather_results
+DIST_EVAL_METRICS = ['COCO', 'SNIPERCOCO', 'VOC', 'KeyPointTopDownCOCOEval']
+
 
 class Trainer(object):
     def __init__(self, cfg, mode='train'):
@@ -132,14 +136,24 @@ class Trainer(object):
                 ema_decay_type=ema_decay_type,
                 cycle_epoch=cycle_epoch)
 
-        # EvalDataset build with BatchSampler to evaluate in single device
-        # TODO: multi-device evaluate
+        self._nranks = dist.get_world_size()
+        self._local_rank = dist.get_rank()
+        # shard EvalDataset to ranks and gather the results to rank 0
+        self._distributed_eval = self._nranks > 1 and cfg.get(
+            'distributed_eval', False)
+        if self._distributed_eval and cfg.metric not in DIST_EVAL_METRICS:
+            logger.warning("distributed_eval is not supported by metric {}, "
+                           "evaluate in single device.".format(cfg.metric))
+            self._distributed_eval = False
+
+        # EvalDataset build with BatchSampler to evaluate in single device,
+        # or ShardedBatchSampler to evaluate in all devices
         if self.mode == 'eval':
             if cfg.architecture == 'FairMOT':
                 self.loader = create('EvalMOTReader')(self.dataset, 0)
             else:
-                self._eval_batch_sampler = paddle.io.BatchSampler(
-                    self.dataset, batch_size=self.cfg.EvalReader['batch_size'])
+                self._eval_batch_sampler = self._create_eval_batch_sampler(
+                    self.dataset)
                 reader_name = '{}Reader'.format(self.mode.capitalize())
                 # If metric is VOC, need to be set collate_batch=False.
                 if cfg.metric == 'VOC':
@@ -159,9 +173,6 @@ class Trainer(object):
                 self.pruner = create('UnstructuredPruner')(self.model,
                                                            steps_per_epoch)
 
-        self._nranks = dist.get_world_size()
-        self._local_rank = dist.get_rank()
-
         self.status = {}
 
         self.start_epoch = 0
@@ -174,6 +185,12 @@ class Trainer(object):
         self._init_metrics()
         self._reset_metrics()
 
+    def _create_eval_batch_sampler(self, dataset):
+        batch_size = self.cfg.EvalReader['batch_size']
+        if self._distributed_eval:
+            return ShardedBatchSampler(dataset, batch_size=batch_size)
+        return paddle.io.BatchSampler(dataset, batch_size=batch_size)
+
     def _init_callbacks(self):
         if self.mode == 'train':
             self._callbacks = [LogPrinter(self), Checkpointer(self)]
@@ -231,7 +248,14 @@ class Trainer(object):
                         output_eval=output_eval,
                         bias=bias,
                         IouType=IouType,
-                        save_prediction_only=save_prediction_only)
+                        save_prediction_only=save_prediction_only,
+                        columnar_results=self.cfg.get('columnar_results',
+                                                      False),
+                        result_format=self.cfg.get('result_format', 'json'),
+                        incremental_eval=self.cfg.get('incremental_eval',
+                                                      False),
+                        coco_eval_workers=self.cfg.get('coco_eval_workers',
+                                                       0))
                 ]
             elif self.cfg.metric == "SNIPERCOCO":  # sniper
                 self._metrics = [
@@ -464,9 +488,15 @@ class Trainer(object):
             if self.cfg.get('unstructured_prune'):
                 self.pruner.update_params()
 
+            is_eval_epoch = (epoch_id + 1) % self.cfg.snapshot_epoch == 0 \
+                or epoch_id == self.end_epoch - 1
             is_snapshot = (self._nranks < 2 or self._local_rank == 0) \
-                       and ((epoch_id + 1) % self.cfg.snapshot_epoch == 0 or epoch_id == self.end_epoch - 1)
-            if is_snapshot and self.use_ema:
+                       and is_eval_epoch
+            # all ranks validate in distributed evaluation
+            is_validate = validate and (is_snapshot or
+                                        self._distributed_eval and
+                                        is_eval_epoch)
+            if (is_snapshot or is_validate) and self.use_ema:
                 # apply ema weight on model
                 weight = copy.deepcopy(self.model.state_dict())
                 self.model.set_dict(self.ema.apply())
@@ -474,14 +504,12 @@ class Trainer(object):
 
             self._compose_callback.on_epoch_end(self.status)
 
-            if validate and is_snapshot:
+            if is_validate:
                 if not hasattr(self, '_eval_loader'):
                     # build evaluation dataset and loader
                     self._eval_dataset = self.cfg.EvalDataset
                     self._eval_batch_sampler = \
-                        paddle.io.BatchSampler(
-                            self._eval_dataset,
-                            batch_size=self.cfg.EvalReader['batch_size'])
+                        self._create_eval_batch_sampler(self._eval_dataset)
                     # If metric is VOC, need to be set collate_batch=False.
                     if self.cfg.metric == 'VOC':
                         self.cfg['EvalReader']['collate_batch'] = False
@@ -500,7 +528,7 @@ class Trainer(object):
                     self.status['save_best_model'] = True
                     self._eval_with_loader(self._eval_loader)
 
-            if is_snapshot and self.use_ema:
+            if (is_snapshot or is_validate) and self.use_ema:
                 # reset original weight
                 self.model.set_dict(weight)
                 self.status.pop('weight')
@@ -534,13 +562,20 @@ class Trainer(object):
                 sample_num += data['im_id'].numpy().shape[0]
             self._compose_callback.on_step_end(self.status)
 
+        if self._distributed_eval:
+            # gather results of all ranks to rank 0
+            for metric in self._metrics:
+                metric.gather_results()
+            sample_num = sum(all_gather_object(sample_num))
+
         self.status['sample_num'] = sample_num
         self.status['cost_time'] = time.time() - tic
 
         # accumulate metric to log out
-        for metric in self._metrics:
-            metric.accumulate()
-            metric.log()
+        if not self._distributed_eval or self._local_rank == 0:
+            for metric in self._metrics:
+                metric.accumulate()
+                metric.log()
         self._compose_callback.on_epoch_end(self.status)
         # reset metric states for metric may performed multiple times
         self._reset_metrics()
@@ -0,0 +1,341 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import json
+from collections import defaultdict
+
+import numpy as np
+
+from ppdet.utils.logger import setup_logger
+logger = setup_logger(__name__)
+
+__all__ = ['COCOResults', 'IncrementalCOCOEval']
+
+INT_FIELDS = ['image_id', 'category_id']
+
+
+class COCOResults(object):
+    """
+    Columnar buffer of COCO results, e.g. bbox.json or mask.json.
+
+    Instead of a python dict per result, scalar fields are kept in 1-D numpy
+    arrays, list fields (bbox, keypoints) in 2-D arrays, and the RLE counts
+    of segmentations in a byte arena with their lengths and sizes. Results
+    are converted to dicts only when they are iterated, which gives the
+    same dicts as the ones extended.
+    """
+
+    def __init__(self):
+        self.num = 0
+        self.keys = None
+        self.kinds = {}
+        self._chunks = defaultdict(list)
+        self._columns = None
+
+    def __len__(self):
+        return self.num
+
+    def _kind(self, key, value):
+        if key in INT_FIELDS:
+            return 'int'
+        if isinstance(value, dict):
+            return 'rle'
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return 'list'
+        return 'float'
+
+    def extend(self, results):
+        """
+        Append results, a list of dicts with the same keys as returned by
+        get_infer_results.
+        """
+        if not results:
+            return
+        if self.keys is None:
+            self.keys = list(results[0].keys())
+            self.kinds = {k: self._kind(k, results[0][k]) for k in self.keys}
+        for k in self.keys:
+            values = [r[k] for r in results]
+            kind = self.kinds[k]
+            if kind == 'int':
+                self._chunks[k].append(np.array(values, dtype=np.int64))
+            elif kind == 'float':
+                self._chunks[k].append(np.array(values, dtype=np.float64))
+            elif kind == 'list':
+                self._chunks[k].append(
+                    np.array(
+                        values, dtype=np.float64).reshape((len(values), -1)))
+            else:
+                counts = [v['counts'] for v in values]
+                counts = [
+                    c.encode('ascii') if not isinstance(c, bytes) else c
+                    for c in counts
+                ]
+                self._chunks[k + '.size'].append(
+                    np.array(
+                        [v['size'] for v in values], dtype=np.int64))
+                self._chunks[k + '.length'].append(
+                    np.array(
+                        [len(c) for c in counts], dtype=np.int64))
+                self._chunks[k + '.arena'].append(
+                    np.frombuffer(
+                        b''.join(counts), dtype=np.uint8))
+        self.num += len(results)
+        self._columns = None
+
+    def columns(self):
+        """
+        Merged columns, a dict of field name to numpy array, RLE fields are
+        `<name>.size`, `<name>.length`, `<name>.offset` and `<name>.arena`.
+        """
+        if self._columns is None:
+            self._columns = {}
+            for k, chunks in self._chunks.items():
+                column = np.concatenate(chunks, axis=0)
+                # keep the merged column only to free the chunks
+                self._chunks[k] = [column]
+                self._columns[k] = column
+            for k in self.keys or []:
+                if self.kinds[k] == 'rle':
+                    length = self._columns[k + '.length']
+                    offset = np.zeros((length.shape[0] + 1, ), dtype=np.int64)
+                    offset[1:] = np.cumsum(length)
+                    self._columns[k + '.offset'] = offset
+        return self._columns
+
+    def _record(self, columns, idx):
+        record = {}
+        for k in self.keys:
+            kind = self.kinds[k]
+            if kind == 'rle':
+                start, end = columns[k + '.offset'][idx:idx + 2]
+                counts = columns[k + '.arena'][start:end].tobytes()
+                record[k] = {
+                    'size': columns[k + '.size'][idx].tolist(),
+                    'counts': counts.decode('ascii')
+                }
+            else:
+                record[k] = columns[k][idx].tolist()
+        return record
+
+    def __iter__(self):
+        if self.num == 0:
+            return
+        columns = self.columns()
+        for idx in range(self.num):
+            yield self._record(columns, idx)
+
+    def to_list(self):
+        return list(self)
+
+    def select(self, image_ids):
+        """
+        Get results of the images in image_ids as a list of dicts, in the
+        order they were extended.
+        """
+        if self.num == 0:
+            return []
+        columns = self.columns()
+        mask = np.isin(columns['image_id'], np.asarray(list(image_ids)))
+        return [self._record(columns, idx) for idx in np.nonzero(mask)[0]]
+
+    def dump_json(self, path, chunk_size=10000):
+        """
+        Write results to a json file chunk by chunk, the file is the same
+        as json.dump of the list of dicts.
+        """
+        columns = self.columns() if self.num > 0 else None
+        with open(path, 'w') as f:
+            f.write('[')
+            for start in range(0, self.num, chunk_size):
+                end = min(start + chunk_size, self.num)
+                chunk = [self._record(columns, i) for i in range(start, end)]
+                if start > 0:
+                    f.write(', ')
+                f.write(json.dumps(chunk)[1:-1])
+            f.write(']')
+
+    def save(self, path):
+        """
+        Save results in the npz format, which is loaded by `load`.
+        """
+        arrays = dict(self.columns()) if self.num > 0 else {}
+        meta = {'keys': self.keys or [], 'kinds': self.kinds, 'num': self.num}
+        arrays['__meta__'] = np.frombuffer(
+            json.dumps(meta).encode('utf8'), dtype=np.uint8)
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        results = cls()
+        with np.load(path) as data:
+            meta = json.loads(data['__meta__'].tobytes().decode('utf8'))
+            results.num = meta['num']
+            results.keys = meta['keys'] or None
+            results.kinds = meta['kinds']
+            for k in data.files:
+                if k != '__meta__' and not k.endswith('.offset'):
+                    results._chunks[k].append(data[k])
+        return results
+
+
+class IncrementalCOCOEval(object):
+    """
+    Run per image matching of COCOeval while results are updated, so only
+    accumulation is left after all results are got. evalImgs are the same
+    as COCOeval.evaluate, so the summary is the same.
+
+    Results of an image are expected to be updated at once. If an image is
+    updated again, its matching is deferred and rerun with all its results
+    by `evaluate`.
+
+    Args:
+        coco_gt (COCO): ground truth.
+        iou_type (str): 'bbox', 'segm' or 'keypoints'.
+    """
+
+    def __init__(self, coco_gt, iou_type):
+        from pycocotools.cocoeval import COCOeval
+        self.coco_gt = coco_gt
+        self.coco_eval = COCOeval(coco_gt, iouType=iou_type)
+        p = self.coco_eval.params
+        p.imgIds = list(np.unique(p.imgIds))
+        p.catIds = list(np.unique(p.catIds))
+        p.maxDets = sorted(p.maxDets)
+        self.gt_img_ids = set(p.imgIds)
+        self.eval_imgs = {}
+        self.evaluated = set()
+        self.deferred = set()
+        self.num_dets = 0
+
+    def _load_dts(self, results):
+        # the same fields as COCO.loadRes set
+        iou_type = self.coco_eval.params.iouType
+        for ann in results:
+            self.num_dets += 1
+            if 'bbox' in ann and not ann['bbox'] == []:
+                bb = ann['bbox']
+                if iou_type == 'segm' and 'segmentation' not in ann:
+                    x1, x2, y1, y2 = [bb[0], bb[0] + bb[2], bb[1], bb[1] + bb[3]]
+                    ann['segmentation'] = [[x1, y1, x1, y2, x2, y2, x2, y1]]
+                ann['area'] = bb[2] * bb[3]
+                ann['iscrowd'] = 0
+            elif 'segmentation' in ann:
+                import pycocotools.mask as mask_util
+                ann['area'] = mask_util.area(ann['segmentation'])
+                if 'bbox' not in ann:
+                    ann['bbox'] = mask_util.toBbox(ann['segmentation'])
+                ann['iscrowd'] = 0
+            elif 'keypoints' in ann:
+                s = ann['keypoints']
+                x0, x1 = np.min(s[0::3]), np.max(s[0::3])
+                y0, y1 = np.min(s[1::3]), np.max(s[1::3])
+                ann['area'] = (x1 - x0) * (y1 - y0)
+                ann['bbox'] = [x0, y0, x1 - x0, y1 - y0]
+            ann['id'] = self.num_dets
+            if iou_type == 'segm':
+                ann['segmentation'] = self.coco_gt.annToRLE(ann)
+        return results
+
+    def _load_gts(self, img_ids):
+        # the same as COCOeval._prepare
+        p = self.coco_eval.params
+        gts = self.coco_gt.loadAnns(
+            self.coco_gt.getAnnIds(
+                imgIds=img_ids, catIds=p.catIds))
+        for gt in gts:
+            if p.iouType == 'segm':
+                gt['segmentation'] = self.coco_gt.annToRLE(gt)
+            gt['ignore'] = gt['ignore'] if 'ignore' in gt else 0
+            gt['ignore'] = 'iscrowd' in gt and gt['iscrowd']
+            if p.iouType == 'keypoints':
+                gt['ignore'] = (gt['num_keypoints'] == 0) or gt['ignore']
+        return gts
+
+    def _evaluate(self, img_ids, dts):
+        E = self.coco_eval
+        p = E.params
+        E._gts = defaultdict(list)
+        E._dts = defaultdict(list)
+        for gt in self._load_gts(img_ids):
+            E._gts[gt['image_id'], gt['category_id']].append(gt)
+        for dt in dts:
+            E._dts[dt['image_id'], dt['category_id']].append(dt)
+        if p.iouType == 'keypoints':
+            compute_iou = E.computeOks
+        else:
+            compute_iou = E.computeIoU
+        E.ious = {(img_id, cat_id): compute_iou(img_id, cat_id)
+                  for img_id in img_ids for cat_id in p.catIds}
+        max_det = p.maxDets[-1]
+        for cat_id in p.catIds:
+            for area_idx, area_rng in enumerate(p.areaRng):
+                for img_id in img_ids:
+                    eval_img = E.evaluateImg(img_id, cat_id, area_rng, max_det)
+                    if eval_img is not None:
+                        self.eval_imgs[cat_id, area_idx, img_id] = eval_img
+        E._gts, E._dts, E.ious = None, None, None
+        self.evaluated.update(img_ids)
+
+    def update(self, results):
+        """
+        Match results, a list of dicts of some images, with ground truth.
+        Results are modified as COCO.loadRes.
+        """
+        img_ids = set([r['image_id'] for r in results])
+        assert img_ids <= self.gt_img_ids, \
+            'Results do not correspond to current coco set'
+        again = img_ids & (self.evaluated | self.deferred)
+        if again:
+            for key in [
+                    k for k in self.eval_imgs.keys() if k[2] in again
+            ]:
+                del self.eval_imgs[key]
+            self.evaluated -= again
+            self.deferred |= again
+            results = [r for r in results if r['image_id'] not in again]
+        img_ids = sorted(img_ids - again)
+        if img_ids:
+            self._evaluate(img_ids, self._load_dts(results))
+
+    def evaluate(self, results=None, batch_size=1000):
+        """
+        Match the images not updated yet and the deferred ones, the results
+        of deferred images are selected from `results`, a COCOResults of all
+        results. Then COCOeval is ready for accumulate and summarize.
+        """
+        E = self.coco_eval
+        p = E.params
+        if self.deferred:
+            assert results is not None, \
+                "results are needed to evaluate images updated more than once"
+            img_ids = sorted(self.deferred)
+            self.deferred = set()
+            self._evaluate(img_ids, self._load_dts(results.select(img_ids)))
+        remains = sorted(self.gt_img_ids - self.evaluated)
+        for i in range(0, len(remains), batch_size):
+            self._evaluate(remains[i:i + batch_size], [])
+        E.evalImgs = [
+            self.eval_imgs.get((cat_id, area_idx, img_id))
+            for cat_id in p.catIds for area_idx in range(len(p.areaRng))
+            for img_id in p.imgIds
+        ]
+        E._paramsEval = copy.deepcopy(p)
+        return E
@@ -16,10 +16,15 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import io
 import os
 import sys
-import numpy as np
+import copy
+import time
+import contextlib
 import itertools
+import multiprocessing
+import numpy as np
 
 from ppdet.metrics.json_results import get_det_res, get_det_poly_res, get_seg_res, get_solov2_segm_res, get_keypoint_res
 from ppdet.metrics.map_utils import draw_pr_curve
@@ -54,8 +59,13 @@ def get_infer_results(outs, catid, bias=0):
 
     if 'mask' in outs:
         # mask post process
-        infer_res['mask'] = get_seg_res(outs['mask'], outs['bbox'],
-                                        outs['bbox_num'], im_id, catid)
+        infer_res['mask'] = get_seg_res(
+            outs['mask'],
+            outs['bbox'],
+            outs['bbox_num'],
+            im_id,
+            catid,
+            mask_box=outs.get('mask_box'))
 
     if 'segm' in outs:
         infer_res['segm'] = get_solov2_segm_res(outs, im_id, catid)
@@ -74,10 +84,12 @@ def cocoapi_eval(jsonfile,
                  max_dets=(100, 300, 1000),
                  classwise=False,
                  sigmas=None,
-                 use_area=True):
+                 use_area=True,
+                 num_workers=0):
     """
     Args:
-        jsonfile (str): Evaluation json file, eg: bbox.json, mask.json.
+        jsonfile (str|list): Evaluation json file, eg: bbox.json, mask.json,
+            or the list of results.
         style (str): COCOeval style, can be `bbox` , `segm` , `proposal`, `keypoints` and `keypoints_crowd`.
         coco_gt (str): Whether to load COCOAPI through anno_file,
                  eg: coco_gt = COCO(anno_file)
@@ -87,6 +99,8 @@ def cocoapi_eval(jsonfile,
         sigmas (nparray): keypoint labelling sigmas.
         use_area (bool): If gt annotations (eg. CrowdPose, AIC)
                          do not have 'area', please set use_area=False.
+        num_workers (int): If > 1, per image evaluation is sharded to a
+                         process pool of num_workers, see `parallel_evaluate`.
     """
     assert coco_gt != None or anno_file != None
     if style == 'keypoints_crowd':
@@ -109,7 +123,98 @@ def cocoapi_eval(jsonfile,
         coco_eval = COCOeval(coco_gt, coco_dt, style, sigmas, use_area)
     else:
         coco_eval = COCOeval(coco_gt, coco_dt, style)
-    coco_eval.evaluate()
+    if num_workers > 1:
+        parallel_evaluate(coco_eval, num_workers)
+    else:
+        coco_eval.evaluate()
+    return summarize_coco_eval(coco_eval, style, classwise=classwise)
+
+
+# COCOeval shared with forked workers of parallel_evaluate
+_SHARED_COCO_EVAL = None
+
+
+def _evaluate_shard(img_ids):
+    coco_eval = _SHARED_COCO_EVAL
+    coco_eval.params.imgIds = img_ids
+    with contextlib.redirect_stdout(io.StringIO()):
+        coco_eval.evaluate()
+    return coco_eval.evalImgs
+
+
+def parallel_evaluate(coco_eval, num_workers=8, num_shards=None):
+    """
+    The same as COCOeval.evaluate, but per image evaluation is run in a
+    pool of forked processes. Images are split into contiguous shards, each
+    worker evaluates its shards by COCOeval.evaluate, and evalImgs of the
+    shards are merged in the order of COCOeval.evaluate, so the results of
+    accumulate and summarize are the same.
+
+    Args:
+        coco_eval (COCOeval): COCOeval to evaluate.
+        num_workers (int): number of processes.
+        num_shards (int): number of image shards, default 4 * num_workers.
+    """
+    global _SHARED_COCO_EVAL
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        logger.warning('fork is not supported, evaluate in one process.')
+        coco_eval.evaluate()
+        return coco_eval
+
+    p = coco_eval.params
+    if p.useSegm is not None:
+        p.iouType = 'segm' if p.useSegm == 1 else 'bbox'
+    p.imgIds = list(np.unique(p.imgIds))
+    if p.useCats:
+        p.catIds = list(np.unique(p.catIds))
+    p.maxDets = sorted(p.maxDets)
+    cat_ids = p.catIds if p.useCats else [-1]
+    num_img = len(p.imgIds)
+    num_area = len(p.areaRng)
+    num_shards = num_shards or num_workers * 4
+    shard_size = max(1, int(np.ceil(num_img / float(num_shards))))
+    shards = [
+        p.imgIds[i:i + shard_size] for i in range(0, num_img, shard_size)
+    ]
+
+    logger.info('Running per image evaluation in {} processes...'.format(
+        num_workers))
+    tic = time.time()
+    _SHARED_COCO_EVAL = copy.copy(coco_eval)
+    _SHARED_COCO_EVAL.params = copy.deepcopy(p)
+    try:
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(min(num_workers, len(shards))) as pool:
+            shard_evals = pool.map(_evaluate_shard, shards, chunksize=1)
+    finally:
+        _SHARED_COCO_EVAL = None
+
+    eval_imgs = [None] * (len(cat_ids) * num_area * num_img)
+    start = 0
+    for shard, evals in zip(shards, shard_evals):
+        n = len(shard)
+        for k in range(len(cat_ids)):
+            for a in range(num_area):
+                dst = (k * num_area + a) * num_img + start
+                src = (k * num_area + a) * n
+                eval_imgs[dst:dst + n] = evals[src:src + n]
+        start += n
+    coco_eval.evalImgs = eval_imgs
+    coco_eval._paramsEval = copy.deepcopy(p)
+    logger.info('DONE (t={:0.2f}s).'.format(time.time() - tic))
+    return coco_eval
+
+
+def summarize_coco_eval(coco_eval, style, classwise=False):
+    """
+    Accumulate and summarize an evaluated COCOeval.
+
+    Args:
+        coco_eval (COCOeval): COCOeval whose evaluate is done.
+        style (str): COCOeval style, used as the name of PR curve folder.
+        classwise (bool): Whether per-category AP and draw P-R Curve or not.
+    """
+    coco_gt = coco_eval.cocoGt
     coco_eval.accumulate()
     coco_eval.summarize()
     if classwise:
@@ -73,26 +73,74 @@ def strip_mask(mask):
     return mask[:, :im_h, :im_w]
 
 
-def get_seg_res(masks, bboxes, mask_nums, image_id, label_to_cat_id_map):
+def encode_box_mask(masks, mask_box):
+    """
+    Encode the mask pasted in box by MaskPostProcess to the RLE of the whole
+    image, runs are computed in the window without pasting it to the image,
+    and the result is the same as mask_util.encode of the pasted mask.
+
+    Args:
+        masks (np.ndarray): flattened binary masks of all windows.
+        mask_box (np.ndarray): [8], the window x0, y0, x1, y1, image h, w,
+            offset of the window in masks and its row stride.
+    """
+    import pycocotools.mask as mask_util
+    x0, y0, x1, y1, im_h, im_w, offset, stride = [int(v) for v in mask_box]
+    h, w = y1 - y0, x1 - x0
+    mask = masks[offset:offset + h * stride].reshape((h, stride))[:, :w]
+    # column major as RLE, padded by 0 to find runs in each column
+    col = np.zeros((w, h + 2), dtype=np.int8)
+    col[:, 1:-1] = mask.T
+    diff = np.diff(col, axis=1)
+    start = np.stack(np.nonzero(diff == 1), axis=1)
+    end = np.stack(np.nonzero(diff == -1), axis=1)
+    start = (x0 + start[:, 0]) * im_h + y0 + start[:, 1]
+    end = (x0 + end[:, 0]) * im_h + y0 + end[:, 1]
+    # merge runs continued from the bottom of a column to the top of next
+    keep = start[1:] != end[:-1]
+    start = np.concatenate([start[:1], start[1:][keep]])
+    end = np.concatenate([end[:-1][keep], end[-1:]])
+    bounds = np.concatenate(
+        [[0], np.stack([start, end], axis=1).reshape(-1), [im_h * im_w]])
+    counts = np.diff(bounds)
+    if len(counts) > 1 and counts[-1] == 0:
+        counts = counts[:-1]
+    return mask_util.frPyObjects({
+        'counts': counts.tolist(),
+        'size': [im_h, im_w]
+    }, im_h, im_w)
+
+
+def get_seg_res(masks,
+                bboxes,
+                mask_nums,
+                image_id,
+                label_to_cat_id_map,
+                mask_box=None):
     import pycocotools.mask as mask_util
     seg_res = []
     k = 0
     for i in range(len(mask_nums)):
         cur_image_id = int(image_id[i][0])
         det_nums = mask_nums[i]
-        mask_i = masks[k:k + det_nums]
-        mask_i = strip_mask(mask_i)
+        if mask_box is None:
+            mask_i = masks[k:k + det_nums]
+            mask_i = strip_mask(mask_i)
         for j in range(det_nums):
-            mask = mask_i[j].astype(np.uint8)
             score = float(bboxes[k][1])
             label = int(bboxes[k][0])
             k = k + 1
             if label == -1:
                 continue
             cat_id = label_to_cat_id_map[label]
-            rle = mask_util.encode(
-                np.array(
-                    mask[:, :, None], order="F", dtype="uint8"))[0]
+            if mask_box is not None:
+                # masks pasted in boxes
+                rle = encode_box_mask(masks, mask_box[k - 1])
+            else:
+                mask = mask_i[j].astype(np.uint8)
+                rle = mask_util.encode(
+                    np.array(
+                        mask[:, :, None], order="F", dtype="uint8"))[0]
             if six.PY3:
                 if 'counts' in rle:
                     rle['counts'] = rle['counts'].decode("utf8")
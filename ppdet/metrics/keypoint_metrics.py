@@ -20,6 +20,8 @@ from pycocotools.coco import COCO
 from pycocotools.cocoeval import COCOeval
 from ..modeling.keypoint_utils import oks_nms
 from scipy.io import loadmat, savemat
+import paddle.distributed as dist
+from ppdet.utils.dist_utils import all_gather_object
 from ppdet.utils.logger import setup_logger
 logger = setup_logger(__name__)
 
@@ -81,6 +83,25 @@ class KeyPointTopDownCOCOEval(object):
 
         self.idx += num_images
 
+    def gather_results(self):
+        """
+        Gather results of all ranks to rank 0 in distributed evaluation,
+        they are appended in the order of ranks.
+        """
+        rank = dist.get_rank()
+        results = None if rank == 0 else (
+            self.results['all_preds'][:self.idx],
+            self.results['all_boxes'][:self.idx], self.results['image_path'])
+        all_results = all_gather_object(results)
+        if rank != 0:
+            return
+        for preds, boxes, image_path in all_results[1:]:
+            num = preds.shape[0]
+            self.results['all_preds'][self.idx:self.idx + num] = preds
+            self.results['all_boxes'][self.idx:self.idx + num] = boxes
+            self.results['image_path'].extend(image_path)
+            self.idx += num
+
     def _write_coco_keypoint_results(self, keypoints):
         data_pack = [{
             'cat_id': 1,
@@ -19,6 +19,7 @@ from __future__ import unicode_literals
 
 import os
 import sys
+import math
 import numpy as np
 import itertools
 import paddle
@@ -31,6 +32,7 @@ __all__ = [
     'draw_pr_curve',
     'bbox_area',
     'jaccard_overlap',
+    'jaccard_overlap_matrix',
     'prune_zero_padding',
     'DetectionMAP',
     'ap_per_class',
@@ -91,6 +93,36 @@ def jaccard_overlap(pred, gt, is_bbox_normalized=False):
     return overlap
 
 
+def jaccard_overlap_matrix(pred, gt, is_bbox_normalized=False):
+    """
+    Calculate jaccard overlap ratio between every prediction and every
+    ground truth bounding box, same as jaccard_overlap for each pair.
+
+    Args:
+        pred (np.ndarray): prediction boxes in shape [P, 4]
+        gt (np.ndarray): ground truth boxes in shape [G, 4]
+
+    Returns:
+        overlap (np.ndarray): overlap ratio in shape [P, G]
+    """
+    norm = 1. - float(is_bbox_normalized)
+    pred = np.asarray(pred, dtype=np.float64).reshape(-1, 4)[:, None, :]
+    gt = np.asarray(gt, dtype=np.float64).reshape(-1, 4)[None, :, :]
+    disjoint = (pred[..., 0] >= gt[..., 2]) | (pred[..., 2] <= gt[..., 0]) | \
+               (pred[..., 1] >= gt[..., 3]) | (pred[..., 3] <= gt[..., 1])
+    inter_w = np.minimum(pred[..., 2], gt[..., 2]) - np.maximum(
+        pred[..., 0], gt[..., 0]) + norm
+    inter_h = np.minimum(pred[..., 3], gt[..., 3]) - np.maximum(
+        pred[..., 1], gt[..., 1]) + norm
+    inter_size = inter_w * inter_h
+    pred_size = (pred[..., 2] - pred[..., 0] + norm) * (
+        pred[..., 3] - pred[..., 1] + norm)
+    gt_size = (gt[..., 2] - gt[..., 0] + norm) * (gt[..., 3] - gt[..., 1] + norm)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        overlap = inter_size / (pred_size + gt_size - inter_size)
+    return np.where(disjoint, 0., overlap)
+
+
 def calc_rbox_iou(pred, gt_rbox):
     """
     calc iou between rotated bbox
@@ -195,49 +227,76 @@ class DetectionMAP(object):
         """
         Update metric statics from given prediction and ground
         truth infomations.
+
+        Predictions are matched in the given order, each one is matched
+        to the ground truth of the same class with max overlap, and only
+        the first prediction matched to a ground truth is true positive.
         """
+        gt_label = np.asarray(gt_label).reshape(-1).astype(np.int64)
         if difficult is None:
             difficult = np.zeros_like(gt_label)
+        difficult = np.asarray(difficult).reshape(-1).astype(np.int64)
 
         # record class gt count
-        for gtl, diff in zip(gt_label, difficult):
-            if self.evaluate_difficult or int(diff) == 0:
-                self.class_gt_counts[int(np.array(gtl))] += 1
-
-        # record class score positive
-        visited = [False] * len(gt_label)
-        for b, s, l in zip(bbox, score, label):
-            pred = b.tolist() if isinstance(b, np.ndarray) else b
-            max_idx = -1
-            max_overlap = -1.0
-            for i, gl in enumerate(gt_label):
-                if int(gl) == int(l):
-                    if len(gt_box[i]) == 5:
-                        overlap = calc_rbox_iou(pred, gt_box[i])
-                    else:
-                        overlap = jaccard_overlap(pred, gt_box[i],
-                                                  self.is_bbox_normalized)
-                    if overlap > max_overlap:
-                        max_overlap = overlap
-                        max_idx = i
-
-            if max_overlap > self.overlap_thresh:
-                if self.evaluate_difficult or \
-                        int(np.array(difficult[max_idx])) == 0:
-                    if not visited[max_idx]:
-                        self.class_score_poss[int(l)].append([s, 1.0])
-                        visited[max_idx] = True
-                    else:
-                        self.class_score_poss[int(l)].append([s, 0.0])
-            else:
-                self.class_score_poss[int(l)].append([s, 0.0])
+        gt_valid = np.ones_like(gt_label, dtype=bool) \
+            if self.evaluate_difficult else difficult == 0
+        self.class_gt_counts += np.bincount(
+            gt_label[gt_valid], minlength=self.class_num)[:self.class_num]
+
+        score = np.asarray(score).reshape(-1)
+        label = np.asarray(label).reshape(-1).astype(np.int64)
+        if len(score) == 0:
+            return
+
+        # [num_pred, num_gt] overlaps, -1 for ground truth of other classes
+        overlaps = self._get_overlaps(bbox, label, gt_box, gt_label)
+        if overlaps.shape[1] > 0:
+            max_idx = np.argmax(overlaps, axis=1)
+            max_overlap = overlaps[np.arange(len(label)), max_idx]
+        else:
+            max_idx = np.zeros_like(label)
+            max_overlap = np.full(len(label), -1.0)
+
+        matched = max_overlap > self.overlap_thresh
+        keep = np.ones_like(matched)
+        if not self.evaluate_difficult and len(difficult) > 0:
+            # predictions matched to difficult ground truth are ignored
+            keep = ~matched | (difficult[max_idx] == 0)
+
+        # record class score positive, the first matched prediction of
+        # each ground truth is positive
+        pos = np.zeros(len(label), dtype=np.float64)
+        cand = np.nonzero(matched & keep)[0]
+        _, first = np.unique(max_idx[cand], return_index=True)
+        pos[cand[first]] = 1.0
+
+        # negative labels index classes from the end as python lists do
+        keep_idx = np.nonzero(keep)[0]
+        class_idx = np.where(label < 0, label + self.class_num, label)[keep_idx]
+        for c in np.unique(class_idx):
+            idx = keep_idx[class_idx == c]
+            self.class_score_poss[int(c)].append(
+                np.stack([score[idx].astype(np.float64), pos[idx]], axis=1))
+
+    def _get_overlaps(self, bbox, label, gt_box, gt_label):
+        gt_box = np.asarray(gt_box)
+        if len(gt_box) > 0 and gt_box.shape[-1] == 5:
+            overlaps = np.full((len(label), len(gt_label)), -1.0)
+            for i, (b, l) in enumerate(zip(bbox, label)):
+                pred = b.tolist() if isinstance(b, np.ndarray) else b
+                for j in np.nonzero(gt_label == l)[0]:
+                    overlaps[i, j] = calc_rbox_iou(pred, gt_box[j])
+            return overlaps
+        overlaps = jaccard_overlap_matrix(bbox, gt_box,
+                                          self.is_bbox_normalized)
+        return np.where(label[:, None] == gt_label[None, :], overlaps, -1.0)
 
     def reset(self):
         """
         Reset metric statics
         """
         self.class_score_poss = [[] for _ in range(self.class_num)]
-        self.class_gt_counts = [0] * self.class_num
+        self.class_gt_counts = np.zeros(self.class_num, dtype=np.int64)
         self.mAP = 0.0
 
     def accumulate(self):
@@ -249,44 +308,23 @@ class DetectionMAP(object):
         eval_results = []
         for score_pos, count in zip(self.class_score_poss,
                                     self.class_gt_counts):
+            count = int(count)
             if count == 0: continue
             if len(score_pos) == 0:
                 valid_cnt += 1
                 continue
 
-            accum_tp_list, accum_fp_list = \
-                    self._get_tp_fp_accum(score_pos)
-            precision = []
-            recall = []
-            for ac_tp, ac_fp in zip(accum_tp_list, accum_fp_list):
-                precision.append(float(ac_tp) / (ac_tp + ac_fp))
-                recall.append(float(ac_tp) / count)
+            accum_tp, accum_fp = self._get_tp_fp_accum(score_pos)
+            precision = accum_tp / (accum_tp + accum_fp)
+            recall = accum_tp / float(count)
 
             one_class_ap = 0.0
             if self.map_type == '11point':
-                max_precisions = [0.] * 11
-                start_idx = len(precision) - 1
-                for j in range(10, -1, -1):
-                    for i in range(start_idx, -1, -1):
-                        if recall[i] < float(j) / 10.:
-                            start_idx = i
-                            if j > 0:
-                                max_precisions[j - 1] = max_precisions[j]
-                                break
-                        else:
-                            if max_precisions[j] < precision[i]:
-                                max_precisions[j] = precision[i]
-                one_class_ap = sum(max_precisions) / 11.
+                one_class_ap = self._calc_11point_ap(precision, recall)
                 mAP += one_class_ap
                 valid_cnt += 1
             elif self.map_type == 'integral':
-                import math
-                prev_recall = 0.
-                for i in range(len(precision)):
-                    recall_gap = math.fabs(recall[i] - prev_recall)
-                    if recall_gap > 1e-6:
-                        one_class_ap += precision[i] * recall_gap
-                        prev_recall = recall[i]
+                one_class_ap = self._calc_integral_ap(precision, recall)
                 mAP += one_class_ap
                 valid_cnt += 1
             else:
@@ -295,12 +333,46 @@ class DetectionMAP(object):
             eval_results.append({
                 'class': self.classes[valid_cnt - 1],
                 'ap': one_class_ap,
-                'precision': precision,
-                'recall': recall,
+                'precision': precision.tolist(),
+                'recall': recall.tolist(),
             })
         self.eval_results = eval_results
         self.mAP = mAP / float(valid_cnt) if valid_cnt > 0 else mAP
 
+    @staticmethod
+    def _calc_11point_ap(precision, recall):
+        """
+        Max precision of recall no less than each of 11 points, walking
+        from the highest recall down as the previous per-prediction loop did.
+        """
+        max_precisions = [0.] * 11
+        start_idx = len(precision) - 1
+        for j in range(10, -1, -1):
+            # first index with recall >= j / 10, recall is non-decreasing
+            k = int(np.searchsorted(recall, float(j) / 10., side='left'))
+            if start_idx >= k:
+                max_precisions[j] = max(max_precisions[j],
+                                        float(precision[k:start_idx + 1].max()))
+            if k > 0:
+                start_idx = min(start_idx, k - 1)
+                if j > 0:
+                    max_precisions[j - 1] = max_precisions[j]
+        return sum(max_precisions) / 11.
+
+    @staticmethod
+    def _calc_integral_ap(precision, recall):
+        one_class_ap = 0.0
+        prev_recall = 0.
+        # only points where recall changes can add area
+        change = np.nonzero(np.diff(recall, prepend=0.) != 0)[0]
+        precision, recall = precision.tolist(), recall.tolist()
+        for i in change:
+            recall_gap = math.fabs(recall[i] - prev_recall)
+            if recall_gap > 1e-6:
+                one_class_ap += precision[i] * recall_gap
+                prev_recall = recall[i]
+        return one_class_ap
+
     def get_map(self):
         """
         Get mAP result
@@ -346,17 +418,12 @@ class DetectionMAP(object):
         Calculate accumulating true/false positive results from
         [score, pos] records
         """
-        sorted_list = sorted(score_pos_list, key=lambda s: s[0], reverse=True)
-        accum_tp = 0
-        accum_fp = 0
-        accum_tp_list = []
-        accum_fp_list = []
-        for (score, pos) in sorted_list:
-            accum_tp += int(pos)
-            accum_tp_list.append(accum_tp)
-            accum_fp += 1 - int(pos)
-            accum_fp_list.append(accum_fp)
-        return accum_tp_list, accum_fp_list
+        score_pos = np.concatenate(score_pos_list, axis=0)
+        order = np.argsort(-score_pos[:, 0], kind='stable')
+        pos = score_pos[order, 1].astype(np.int64)
+        accum_tp = np.cumsum(pos)
+        accum_fp = np.cumsum(1 - pos)
+        return accum_tp.astype(np.float64), accum_fp.astype(np.float64)
 
 
 def ap_per_class(tp, conf, pred_cls, target_cls):
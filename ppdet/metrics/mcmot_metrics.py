@@ -21,12 +21,14 @@ import copy
 import sys
 import math
 from collections import defaultdict
+from concurrent.futures import Future
 from motmetrics.math_util import quiet_divide
 
 import numpy as np
 import pandas as pd
 
 from .metrics import Metric
+from .mot_metrics import eval_seq_file
 import motmetrics as mm
 import openpyxl
 metrics = mm.metrics.motchallenge_metrics
@@ -430,14 +432,32 @@ class MCMOTMetric(Metric):
         self.accs = []
         self.seqs = []
 
-    def update(self, data_root, seq, data_type, result_root, result_filename):
+    def update(self,
+               data_root,
+               seq,
+               data_type,
+               result_root,
+               result_filename,
+               executor=None):
+        """
+        If executor is not None, the sequence is evaluated in it, and the
+        accumulators are waited for in accumulate.
+        """
+        self.seqs.append(seq)
+        self.result_root = result_root
+        if executor is not None:
+            self.accs.append(
+                executor.submit(eval_seq_file, self.MCMOTEvaluator,
+                                result_filename, data_root, seq, data_type,
+                                self.num_classes))
+            return
         evaluator = self.MCMOTEvaluator(data_root, seq, data_type,
                                         self.num_classes)
         seq_acc = evaluator.eval_file(result_filename)
         self.accs.append(seq_acc)
-        self.seqs.append(seq)
-        self.result_root = result_root
+        self._update_summary(seq, seq_acc)
 
+    def _update_summary(self, seq, seq_acc):
         cls_index_name = [
             '{}_{}'.format(seq, i) for i in range(self.num_classes)
         ]
@@ -448,6 +468,11 @@ class MCMOTMetric(Metric):
             self.seqs_overall[row].append(summary.iloc[row:row + 1])
 
     def accumulate(self):
+        # summaries of sequences evaluated in executor, in order of update
+        for i, (seq, seq_acc) in enumerate(zip(self.seqs, self.accs)):
+            if isinstance(seq_acc, Future):
+                self.accs[i] = seq_acc.result()
+                self._update_summary(seq, self.accs[i])
         self.cls_summary_list = []
         for row in range(self.num_classes):
             seqs_cls_df = pd.concat(self.seqs_overall[row])
@@ -20,14 +20,17 @@ import os
 import sys
 import json
 import paddle
+import paddle.distributed as dist
 import numpy as np
 import typing
 from pathlib import Path
 
 from .map_utils import prune_zero_padding, DetectionMAP
-from .coco_utils import get_infer_results, cocoapi_eval
+from .coco_utils import get_infer_results, cocoapi_eval, summarize_coco_eval
+from .coco_results import COCOResults, IncrementalCOCOEval
 from .widerface_utils import face_eval_run
 from ppdet.data.source.category import get_categories
+from ppdet.utils.dist_utils import all_gather_object
 
 from ppdet.utils.logger import setup_logger
 logger = setup_logger(__name__)
@@ -80,6 +83,23 @@ class COCOMetric(Metric):
         self.bias = kwargs.get('bias', 0)
         self.save_prediction_only = kwargs.get('save_prediction_only', False)
         self.iou_type = kwargs.get('IouType', 'bbox')
+        # keep results in COCOResults instead of lists of dicts, they are
+        # evaluated in memory and saved as json or npz (result_format)
+        self.columnar_results = kwargs.get('columnar_results', False)
+        self.result_format = kwargs.get('result_format', 'json')
+        # match results with ground truth in update, which needs columnar
+        # results to rerun the images updated more than once
+        self.incremental_eval = kwargs.get('incremental_eval', False) and \
+            not self.save_prediction_only
+        self.columnar_results = self.columnar_results or self.incremental_eval
+        # shard per image evaluation of cocoapi_eval to a process pool
+        self.coco_eval_workers = kwargs.get('coco_eval_workers', 0)
+        assert self.result_format in ['json', 'npz'], \
+            "result_format should be json or npz"
+        assert self.columnar_results or self.result_format == 'json', \
+            "npz result_format needs columnar_results"
+        self.coco_gt = None
+        self.coco_evals = {}
 
         if not self.save_prediction_only:
             assert os.path.isfile(anno_file), \
@@ -92,8 +112,32 @@ class COCOMetric(Metric):
 
     def reset(self):
         # only bbox and mask evaluation support currently
-        self.results = {'bbox': [], 'mask': [], 'segm': [], 'keypoint': []}
+        if self.columnar_results:
+            self.results = {
+                k: COCOResults()
+                for k in ['bbox', 'mask', 'segm', 'keypoint']
+            }
+        else:
+            self.results = {'bbox': [], 'mask': [], 'segm': [], 'keypoint': []}
         self.eval_results = {}
+        self.coco_evals = {}
+
+    def _incremental_eval(self, key):
+        if key == 'keypoint' and self.iou_type == 'keypoints_crowd':
+            # xtcocotools is not supported
+            return None
+        if key not in self.coco_evals:
+            from pycocotools.coco import COCO
+            if self.coco_gt is None:
+                self.coco_gt = COCO(self.anno_file)
+            iou_type = {
+                'bbox': 'bbox',
+                'mask': 'segm',
+                'segm': 'segm',
+                'keypoint': 'keypoints'
+            }[key]
+            self.coco_evals[key] = IncrementalCOCOEval(self.coco_gt, iou_type)
+        return self.coco_evals[key]
 
     def update(self, inputs, outputs):
         outs = {}
@@ -111,6 +155,18 @@ class COCOMetric(Metric):
 
         infer_results = get_infer_results(
             outs, self.clsid2catid, bias=self.bias)
+        if self.columnar_results:
+            for k, results in self.results.items():
+                res = infer_results.get(k)
+                if not res:
+                    continue
+                # dicts are modified by matching after saved in results
+                results.extend(res)
+                coco_eval = self._incremental_eval(k) \
+                    if self.incremental_eval else None
+                if coco_eval is not None:
+                    coco_eval.update(res)
+            return
         self.results['bbox'] += infer_results[
             'bbox'] if 'bbox' in infer_results else []
         self.results['mask'] += infer_results[
@@ -120,74 +176,116 @@ class COCOMetric(Metric):
         self.results['keypoint'] += infer_results[
             'keypoint'] if 'keypoint' in infer_results else []
 
+    def _image_ids(self, results):
+        if isinstance(results, COCOResults):
+            return results.columns()['image_id'].tolist() if results else []
+        return [r['image_id'] for r in results]
+
+    def gather_results(self):
+        """
+        Gather results of all ranks to rank 0 in distributed evaluation,
+        results of the images got from a lower rank are dropped.
+        """
+        rank = dist.get_rank()
+        all_results = all_gather_object(None if rank == 0 else self.results)
+        if rank != 0:
+            return
+        for key, results in self.results.items():
+            im_ids = set(self._image_ids(results))
+            for rank_results in all_results[1:]:
+                res = rank_results[key]
+                keep = set(self._image_ids(res)) - im_ids
+                if not keep:
+                    continue
+                if isinstance(res, COCOResults):
+                    res = res.select(keep)
+                else:
+                    res = [r for r in res if r['image_id'] in keep]
+                im_ids |= keep
+                if self.columnar_results:
+                    results.extend(res)
+                    coco_eval = self._incremental_eval(key) \
+                        if self.incremental_eval else None
+                    if coco_eval is not None:
+                        coco_eval.update(res)
+                else:
+                    results += res
+
+    def _save_results(self, key):
+        results = self.results[key]
+        if isinstance(results, COCOResults) and self.result_format == 'npz':
+            output = "{}.npz".format(key)
+            save_func = results.save
+        elif isinstance(results, COCOResults):
+            output = "{}.json".format(key)
+            save_func = results.dump_json
+        else:
+            output = "{}.json".format(key)
+
+            def save_func(path):
+                with open(path, 'w') as f:
+                    json.dump(results, f)
+
+        name = output
+        if self.output_eval:
+            output = os.path.join(self.output_eval, output)
+        save_func(output)
+        logger.info('The {} result is saved to {}.'.format(key, name))
+        return output
+
+    def _evaluate(self, key, output, style, **kwargs):
+        results = self.results[key]
+        if key in self.coco_evals:
+            coco_eval = self.coco_evals[key].evaluate(results)
+            return summarize_coco_eval(
+                coco_eval, style, classwise=self.classwise)
+        if isinstance(results, COCOResults):
+            # evaluate in memory instead of parsing the saved file
+            output = results.to_list()
+        return cocoapi_eval(
+            output,
+            style,
+            anno_file=self.anno_file,
+            classwise=self.classwise,
+            num_workers=self.coco_eval_workers,
+            **kwargs)
+
     def accumulate(self):
         if len(self.results['bbox']) > 0:
-            output = "bbox.json"
-            if self.output_eval:
-                output = os.path.join(self.output_eval, output)
-            with open(output, 'w') as f:
-                json.dump(self.results['bbox'], f)
-                logger.info('The bbox result is saved to bbox.json.')
+            output = self._save_results('bbox')
 
             if self.save_prediction_only:
                 logger.info('The bbox result is saved to {} and do not '
                             'evaluate the mAP.'.format(output))
             else:
-                bbox_stats = cocoapi_eval(
-                    output,
-                    'bbox',
-                    anno_file=self.anno_file,
-                    classwise=self.classwise)
+                bbox_stats = self._evaluate('bbox', output, 'bbox')
                 self.eval_results['bbox'] = bbox_stats
                 sys.stdout.flush()
 
         if len(self.results['mask']) > 0:
-            output = "mask.json"
-            if self.output_eval:
-                output = os.path.join(self.output_eval, output)
-            with open(output, 'w') as f:
-                json.dump(self.results['mask'], f)
-                logger.info('The mask result is saved to mask.json.')
+            output = self._save_results('mask')
 
             if self.save_prediction_only:
                 logger.info('The mask result is saved to {} and do not '
                             'evaluate the mAP.'.format(output))
             else:
-                seg_stats = cocoapi_eval(
-                    output,
-                    'segm',
-                    anno_file=self.anno_file,
-                    classwise=self.classwise)
+                seg_stats = self._evaluate('mask', output, 'segm')
                 self.eval_results['mask'] = seg_stats
                 sys.stdout.flush()
 
         if len(self.results['segm']) > 0:
-            output = "segm.json"
-            if self.output_eval:
-                output = os.path.join(self.output_eval, output)
-            with open(output, 'w') as f:
-                json.dump(self.results['segm'], f)
-                logger.info('The segm result is saved to segm.json.')
+            output = self._save_results('segm')
 
             if self.save_prediction_only:
                 logger.info('The segm result is saved to {} and do not '
                             'evaluate the mAP.'.format(output))
             else:
-                seg_stats = cocoapi_eval(
-                    output,
-                    'segm',
-                    anno_file=self.anno_file,
-                    classwise=self.classwise)
+                seg_stats = self._evaluate('segm', output, 'segm')
                 self.eval_results['mask'] = seg_stats
                 sys.stdout.flush()
 
         if len(self.results['keypoint']) > 0:
-            output = "keypoint.json"
-            if self.output_eval:
-                output = os.path.join(self.output_eval, output)
-            with open(output, 'w') as f:
-                json.dump(self.results['keypoint'], f)
-                logger.info('The keypoint result is saved to keypoint.json.')
+            output = self._save_results('keypoint')
 
             if self.save_prediction_only:
                 logger.info('The keypoint result is saved to {} and do not '
@@ -200,11 +298,10 @@ class COCOMetric(Metric):
                     style = 'keypoints_crowd'
                     use_area = False
                     sigmas = CROWD_SIGMAS
-                keypoint_stats = cocoapi_eval(
+                keypoint_stats = self._evaluate(
+                    'keypoint',
                     output,
                     style,
-                    anno_file=self.anno_file,
-                    classwise=self.classwise,
                     sigmas=sigmas,
                     use_area=use_area)
                 self.eval_results['keypoint'] = keypoint_stats
@@ -246,6 +343,8 @@ class VOCMetric(Metric):
 
     def reset(self):
         self.detection_map.reset()
+        # per image results, which are added to detection_map in accumulate
+        self.image_results = []
 
     def update(self, inputs, outputs):
         bbox_np = outputs['bbox'].numpy()
@@ -264,6 +363,7 @@ class VOCMetric(Metric):
         scale_factor = inputs['scale_factor'].numpy(
         ) if 'scale_factor' in inputs else np.ones(
             (gt_boxes.shape[0], 2)).astype('float32')
+        im_ids = inputs['im_id'].numpy() if 'im_id' in inputs else None
 
         bbox_idx = 0
         for i in range(len(gt_boxes)):
@@ -279,12 +379,36 @@ class VOCMetric(Metric):
             label = labels[bbox_idx:bbox_idx + bbox_num]
             gt_box, gt_label, difficult = prune_zero_padding(gt_box, gt_label,
                                                              difficult)
-            self.detection_map.update(bbox, score, label, gt_box, gt_label,
-                                      difficult)
+            im_id = None if im_ids is None else int(im_ids[i][0])
+            self.image_results.append((im_id, bbox, score, label, gt_box,
+                                       gt_label, difficult))
             bbox_idx += bbox_num
 
+    def gather_results(self):
+        """
+        Gather results of all ranks to rank 0 in distributed evaluation,
+        results of the images got from a lower rank are dropped.
+        """
+        rank = dist.get_rank()
+        all_results = all_gather_object(None
+                                        if rank == 0 else self.image_results)
+        if rank != 0:
+            return
+        im_ids = set([res[0] for res in self.image_results])
+        for rank_results in all_results[1:]:
+            for res in rank_results:
+                if res[0] is not None and res[0] in im_ids:
+                    continue
+                im_ids.add(res[0])
+                self.image_results.append(res)
+
     def accumulate(self):
         logger.info("Accumulating evaluatation results...")
+        self.detection_map.reset()
+        for _, bbox, score, label, gt_box, gt_label, difficult in \
+                self.image_results:
+            self.detection_map.update(bbox, score, label, gt_box, gt_label,
+                                      difficult)
         self.detection_map.accumulate()
 
     def log(self):
@@ -429,6 +553,16 @@ class SNIPERCOCOMetric(COCOMetric):
 
         self.chip_results.append(outs)
 
+    def gather_results(self):
+        # chips of an image may be evaluated on different ranks, they are
+        # aggregated in accumulate
+        rank = dist.get_rank()
+        all_results = all_gather_object(None
+                                        if rank == 0 else self.chip_results)
+        if rank == 0:
+            for chip_results in all_results[1:]:
+                self.chip_results.extend(chip_results)
+
     def accumulate(self):
         results = self.dataset.anno_cropper.aggregate_chips_detections(
             self.chip_results)
@@ -21,6 +21,7 @@ import copy
 import sys
 import math
 from collections import defaultdict
+from concurrent.futures import Future
 import numpy as np
 
 from ppdet.modeling.bbox_utils import bbox_iou_np_expand
@@ -213,6 +214,14 @@ class MOTEvaluator(object):
         writer.save()
 
 
+def eval_seq_file(evaluator, result_filename, *args):
+    """
+    Evaluate the results file of a sequence by evaluator(*args), as a
+    picklable function to be submitted to a process pool.
+    """
+    return evaluator(*args).eval_file(result_filename)
+
+
 class MOTMetric(Metric):
     def __init__(self, save_summary=False):
         self.save_summary = save_summary
@@ -224,15 +233,34 @@ class MOTMetric(Metric):
         self.accs = []
         self.seqs = []
 
-    def update(self, data_root, seq, data_type, result_root, result_filename):
-        evaluator = self.MOTEvaluator(data_root, seq, data_type)
-        self.accs.append(evaluator.eval_file(result_filename))
+    def update(self,
+               data_root,
+               seq,
+               data_type,
+               result_root,
+               result_filename,
+               executor=None):
+        """
+        If executor is not None, the sequence is evaluated in it, and the
+        accumulator is waited for in accumulate.
+        """
+        if executor is not None:
+            acc = executor.submit(eval_seq_file, self.MOTEvaluator,
+                                  result_filename, data_root, seq, data_type)
+        else:
+            evaluator = self.MOTEvaluator(data_root, seq, data_type)
+            acc = evaluator.eval_file(result_filename)
+        self.accs.append(acc)
         self.seqs.append(seq)
         self.result_root = result_root
 
     def accumulate(self):
         import motmetrics as mm
         import openpyxl
+        self.accs = [
+            acc.result() if isinstance(acc, Future) else acc
+            for acc in self.accs
+        ]
         metrics = mm.metrics.motchallenge_metrics
         mh = mm.metrics.create()
         summary = self.MOTEvaluator.get_summary(self.accs, self.seqs, metrics)
@@ -1178,7 +1206,15 @@ class KITTIMOTMetric(Metric):
         self.n_frames = []
         self.strsummary = ''
 
-    def update(self, data_root, seq, data_type, result_root, result_filename):
+    def update(self,
+               data_root,
+               seq,
+               data_type,
+               result_root,
+               result_filename,
+               executor=None):
+        # sequences are evaluated all together in accumulate, executor
+        # is not used
         assert data_type == 'kitti', "data_type should 'kitti'"
         self.result_root = result_root
         self.gt_path = data_root
@@ -140,4 +140,7 @@ class CascadeRCNN(BaseArch):
         }
         if self.with_mask:
             output.update({'mask': mask_pred})
+            mask_box = self.mask_post_process.get_mask_box()
+            if mask_box is not None:
+                output['mask_box'] = mask_box
         return output
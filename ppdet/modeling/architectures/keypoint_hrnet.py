@@ -18,11 +18,10 @@ from __future__ import print_function
 
 import paddle
 import numpy as np
-import math
 import cv2
 from ppdet.core.workspace import register, create
 from .meta_arch import BaseArch
-from ..keypoint_utils import transform_preds
+from ..keypoint_utils import batch_transform_preds
 from .. import layers as L
 
 __all__ = ['TopDownHRNet']
@@ -165,55 +164,71 @@ class HRNetPostProcess(object):
 
         return preds, maxvals
 
-    def gaussian_blur(self, heatmap, kernel):
+    def gaussian_blur(self, heatmap, kernel, chunk_size=64):
+        """
+        Blur heatmaps in place with the max of each one kept. Heatmaps are
+        padded by zeros and stacked to one image of `chunk_size` heatmaps,
+        the border of the padding splits them, so it is the same as
+        blurring them one by one.
+        """
         border = (kernel - 1) // 2
-        batch_size = heatmap.shape[0]
-        num_joints = heatmap.shape[1]
-        height = heatmap.shape[2]
-        width = heatmap.shape[3]
-        for i in range(batch_size):
-            for j in range(num_joints):
-                origin_max = np.max(heatmap[i, j])
-                dr = np.zeros((height + 2 * border, width + 2 * border))
-                dr[border:-border, border:-border] = heatmap[i, j].copy()
-                dr = cv2.GaussianBlur(dr, (kernel, kernel), 0)
-                heatmap[i, j] = dr[border:-border, border:-border].copy()
-                heatmap[i, j] *= origin_max / np.max(heatmap[i, j])
+        batch_size, num_joints, height, width = heatmap.shape
+        heatmaps = heatmap.reshape((-1, height, width))
+        origin_max = heatmaps.max(axis=(1, 2))
+        num_chunk = min(chunk_size, heatmaps.shape[0])
+        dr = np.zeros((num_chunk, height + 2 * border, width + 2 * border))
+        for start in range(0, heatmaps.shape[0], chunk_size):
+            chunk = heatmaps[start:start + chunk_size]
+            num = chunk.shape[0]
+            dr[:num, border:-border, border:-border] = chunk
+            blur = cv2.GaussianBlur(dr[:num].reshape((-1, dr.shape[2])),
+                                    (kernel, kernel), 0)
+            blur = blur.reshape((num, ) + dr.shape[1:])
+            chunk[...] = blur[:, border:-border, border:-border]
+        ratio = origin_max / heatmaps.max(axis=(1, 2))
+        heatmaps *= ratio[:, None, None]
+        heatmap[...] = heatmaps.reshape(heatmap.shape)
         return heatmap
 
-    def dark_parse(self, hm, coord):
-        heatmap_height = hm.shape[0]
-        heatmap_width = hm.shape[1]
-        px = int(coord[0])
-        py = int(coord[1])
-        if 1 < px < heatmap_width - 2 and 1 < py < heatmap_height - 2:
-            dx = 0.5 * (hm[py][px + 1] - hm[py][px - 1])
-            dy = 0.5 * (hm[py + 1][px] - hm[py - 1][px])
-            dxx = 0.25 * (hm[py][px + 2] - 2 * hm[py][px] + hm[py][px - 2])
-            dxy = 0.25 * (hm[py+1][px+1] - hm[py-1][px+1] - hm[py+1][px-1] \
-                + hm[py-1][px-1])
-            dyy = 0.25 * (
-                hm[py + 2 * 1][px] - 2 * hm[py][px] + hm[py - 2 * 1][px])
-            derivative = np.matrix([[dx], [dy]])
-            hessian = np.matrix([[dxx, dxy], [dxy, dyy]])
-            if dxx * dyy - dxy**2 != 0:
-                hessianinv = hessian.I
-                offset = -hessianinv * derivative
-                offset = np.squeeze(np.array(offset.T), axis=0)
-                coord += offset
-        return coord
-
     def dark_postprocess(self, hm, coords, kernelsize):
         '''DARK postpocessing, Zhang et al. Distribution-Aware Coordinate
         Representation for Human Pose Estimation (CVPR 2020).
-        '''
 
+        The Taylor expansion of DARK is done for all keypoints at once,
+        keypoints too close to the border or with a singular hessian are
+        kept. The log of heatmaps is only taken at the points used.
+        '''
         hm = self.gaussian_blur(hm, kernelsize)
-        hm = np.maximum(hm, 1e-10)
-        hm = np.log(hm)
-        for n in range(coords.shape[0]):
-            for p in range(coords.shape[1]):
-                coords[n, p] = self.dark_parse(hm[n][p], coords[n][p])
+        heatmap_height, heatmap_width = hm.shape[2:]
+        px = coords[..., 0].astype(np.int64)
+        py = coords[..., 1].astype(np.int64)
+        valid = (1 < px) & (px < heatmap_width - 2) & (1 < py) & (
+            py < heatmap_height - 2)
+        n, p = np.nonzero(valid)
+        if n.shape[0] == 0:
+            return coords
+        px, py = px[n, p], py[n, p]
+        # log of the blurred heatmaps is only needed around the keypoints
+        offsets = [(0, 0), (0, 1), (0, -1), (1, 0), (-1, 0), (0, 2), (0, -2),
+                   (2, 0), (-2, 0), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+        dy, dx = np.array(offsets).T[:, :, None]
+        log_hm = np.log(np.maximum(hm[n, p, py + dy, px + dx], 1e-10))
+        at = dict(zip(offsets, log_hm))
+        dx = 0.5 * (at[0, 1] - at[0, -1])
+        dy = 0.5 * (at[1, 0] - at[-1, 0])
+        dxx = 0.25 * (at[0, 2] - 2 * at[0, 0] + at[0, -2])
+        dxy = 0.25 * (at[1, 1] - at[-1, 1] - at[1, -1] + at[-1, -1])
+        dyy = 0.25 * (at[2, 0] - 2 * at[0, 0] + at[-2, 0])
+        invertible = dxx * dyy - dxy**2 != 0
+        if not invertible.any():
+            return coords
+        derivative = np.stack((dx, dy), axis=-1)[invertible, :, None]
+        hessian = np.stack(
+            (np.stack(
+                (dxx, dxy), axis=-1), np.stack(
+                    (dxy, dyy), axis=-1)), axis=-2)[invertible]
+        offset = np.matmul(-np.linalg.inv(hessian), derivative)[..., 0]
+        coords[n[invertible], p[invertible]] += offset
         return coords
 
     def get_final_preds(self, heatmaps, center, scale, kernelsize=3):
@@ -237,23 +252,22 @@ class HRNetPostProcess(object):
         if self.use_dark:
             coords = self.dark_postprocess(heatmaps, coords, kernelsize)
         else:
-            for n in range(coords.shape[0]):
-                for p in range(coords.shape[1]):
-                    hm = heatmaps[n][p]
-                    px = int(math.floor(coords[n][p][0] + 0.5))
-                    py = int(math.floor(coords[n][p][1] + 0.5))
-                    if 1 < px < heatmap_width - 1 and 1 < py < heatmap_height - 1:
-                        diff = np.array([
-                            hm[py][px + 1] - hm[py][px - 1],
-                            hm[py + 1][px] - hm[py - 1][px]
-                        ])
-                        coords[n][p] += np.sign(diff) * .25
-        preds = coords.copy()
+            px = np.floor(coords[..., 0] + 0.5).astype(np.int64)
+            py = np.floor(coords[..., 1] + 0.5).astype(np.int64)
+            valid = (1 < px) & (px < heatmap_width - 1) & (1 < py) & (
+                py < heatmap_height - 1)
+            n, p = np.nonzero(valid)
+            px, py = px[n, p], py[n, p]
+            diff = np.stack(
+                (heatmaps[n, p, py, px + 1] - heatmaps[n, p, py, px - 1],
+                 heatmaps[n, p, py + 1, px] - heatmaps[n, p, py - 1, px]),
+                axis=-1)
+            coords[n, p] += np.sign(diff) * .25
 
         # Transform back
-        for i in range(coords.shape[0]):
-            preds[i] = transform_preds(coords[i], center[i], scale[i],
-                                       [heatmap_width, heatmap_height])
+        preds = batch_transform_preds(coords, center, scale,
+                                      [heatmap_width, heatmap_height])
+        preds = preds.astype(coords.dtype)
 
         return preds, maxvals
 
@@ -132,4 +132,7 @@ class MaskRCNN(BaseArch):
     def get_pred(self):
         bbox_pred, bbox_num, mask_pred = self._forward()
         output = {'bbox': bbox_pred, 'bbox_num': bbox_num, 'mask': mask_pred}
+        mask_box = self.mask_post_process.get_mask_box()
+        if mask_box is not None:
+            output['mask_box'] = mask_box
         return output
@@ -20,7 +20,7 @@ import numpy as np
 import paddle.nn.functional as F
 
 from ppdet.modeling.losses.varifocal_loss import varifocal_loss
-from ppdet.modeling.bbox_utils import batch_bbox_overlaps
+from ppdet.modeling.bbox_utils import batch_bbox_overlaps, bbox_iou
 from ppdet.core.workspace import register
 
 
@@ -233,7 +233,7 @@ class SimOTAAssigner(object):
         )] = match_fg_mask_inmatrix
 
         assigned_gt_inds[match_fg_mask_inall.astype(
-            np.bool)] = match_gt_inds_to_fg + 1
+            bool)] = match_gt_inds_to_fg + 1
 
         pos_inds, neg_inds, pos_gt_bboxes, pos_assigned_gt_inds \
             = self.get_sample(assigned_gt_inds, gt_bboxes.numpy())
@@ -260,3 +260,166 @@ class SimOTAAssigner(object):
         pos_num = max(pos_inds.size, 1)
 
         return pos_num, label, label_weight, bbox_target
+
+    @paddle.no_grad()
+    def assign_batch(self,
+                     pred_scores,
+                     center_and_strides,
+                     pred_bboxes,
+                     gt_labels,
+                     gt_bboxes,
+                     pad_gt_mask,
+                     eps=1e-7):
+        r"""Assign gt to priors of all images at once using SimOTA, the
+        same as `__call__` image by image, but on padded gts and without
+        copying to host. Priors out of all gt boxes and gt centers, and the
+        padded gts are masked with a cost larger than any other one, and
+        the dynamic-k top-k of each gt is the candidate_topk smallest costs
+        masked by the rank less than its dynamic k.
+        Args:
+            pred_scores (Tensor, float32): predicted class probability, shape(B, L, C)
+            center_and_strides (Tensor, float32): center and stride of priors,
+                shape(B, L, 4) or shape(L, 4)
+            pred_bboxes (Tensor, float32): predicted bounding boxes, shape(B, L, 4)
+            gt_labels (Tensor, int64|int32): Label of gt_bboxes, shape(B, n, 1)
+            gt_bboxes (Tensor, float32): Ground truth bboxes, shape(B, n, 4)
+            pad_gt_mask (Tensor, float32): 1 means bbox, 0 means no bbox, shape(B, n, 1)
+        Returns:
+            pos_num (Tensor, int64): number of positive priors of each image,
+                at least 1 if the image has gts, shape(B)
+            labels (Tensor, int64): shape(B, L)
+            label_weights (Tensor, float32): shape(B, L)
+            bbox_targets (Tensor, float32): shape(B, L, 4)
+        """
+        batch_size, num_priors, num_classes = pred_scores.shape
+        num_max_boxes = gt_bboxes.shape[1]
+        labels = paddle.full(
+            [batch_size, num_priors], self.num_classes, dtype='int64')
+        label_weights = paddle.ones([batch_size, num_priors], dtype='float32')
+
+        # negative batch
+        if num_max_boxes == 0 or num_priors == 0:
+            pos_num = paddle.zeros([batch_size], dtype='int64')
+            return pos_num, labels, label_weights, paddle.zeros_like(
+                pred_bboxes)
+
+        if center_and_strides.ndim == 2:
+            center_and_strides = center_and_strides.unsqueeze(0)
+        # priors and gts, shape: [B, 1, L] and [B, n, 1]
+        x, y, stride_x, stride_y = [
+            center_and_strides[:, :, i].unsqueeze(1) for i in range(4)
+        ]
+        xmin, ymin, xmax, ymax = [
+            gt_bboxes[:, :, i].unsqueeze(2) for i in range(4)
+        ]
+        gt_mask = pad_gt_mask.squeeze(-1).astype('bool').unsqueeze(2)
+
+        # is prior centers in gt bboxes, shape: [B, n, L]
+        deltas = paddle.minimum(
+            paddle.minimum(x - xmin, y - ymin),
+            paddle.minimum(xmax - x, ymax - y))
+        is_in_gts = paddle.logical_and(deltas > 0, gt_mask)
+
+        # is prior centers in gt centers, shape: [B, n, L]
+        gt_center_xs = (xmin + xmax) / 2.0
+        gt_center_ys = (ymin + ymax) / 2.0
+        radius_x = self.center_radius * stride_x
+        radius_y = self.center_radius * stride_y
+        ct_deltas = paddle.minimum(
+            radius_x - (gt_center_xs - x).abs(),
+            radius_y - (gt_center_ys - y).abs())
+        is_in_cts = paddle.logical_and(ct_deltas > 0, gt_mask)
+
+        # in any of gts or gt centers, shape: [B, 1, L]
+        is_in_gts_or_centers_all = paddle.any(
+            paddle.logical_or(is_in_gts, is_in_cts), axis=1, keepdim=True)
+        is_in_boxes_and_center = paddle.logical_and(is_in_gts, is_in_cts)
+        is_valid = paddle.logical_and(is_in_gts_or_centers_all, gt_mask)
+
+        pred_box = [pred_bboxes[:, :, i].unsqueeze(1) for i in range(4)]
+        gt_box = [xmin, ymin, xmax, ymax]
+        pairwise_ious = bbox_iou(pred_box, gt_box) * is_valid.astype('float32')
+
+        # score of the gt class of each prior, shape: [B, n, L]
+        gt_onehot_label = F.one_hot(
+            gt_labels.squeeze(-1).astype('int64'), num_classes)
+        gt_cls_scores = paddle.bmm(gt_onehot_label,
+                                   pred_scores.transpose([0, 2, 1]))
+        gt_cls_scores = gt_cls_scores.reshape([-1, 1])
+        # the loss of one-hot targets is the loss of all zero targets, with
+        # the one of the gt class replaced
+        if self.use_vfl:
+            zero_scores = paddle.zeros_like(gt_cls_scores)
+            losses_neg = varifocal_loss(
+                pred_scores.reshape([-1, num_classes]),
+                paddle.zeros_like(pred_scores.reshape([-1, num_classes])),
+                use_sigmoid=False).reshape([batch_size, 1, num_priors])
+            losses_gt = varifocal_loss(
+                gt_cls_scores,
+                pairwise_ious.reshape([-1, 1]),
+                use_sigmoid=False) - varifocal_loss(
+                    gt_cls_scores, zero_scores, use_sigmoid=False)
+            cls_cost = losses_neg + losses_gt.reshape(pairwise_ious.shape)
+            iou_cost = 1 - bbox_iou(pred_box, gt_box, giou=True)
+        else:
+            losses_neg = F.binary_cross_entropy(
+                pred_scores, paddle.zeros_like(pred_scores),
+                reduction='none').sum(-1).unsqueeze(1)
+            losses_gt = F.binary_cross_entropy(
+                gt_cls_scores,
+                paddle.ones_like(gt_cls_scores),
+                reduction='none') - F.binary_cross_entropy(
+                    gt_cls_scores,
+                    paddle.zeros_like(gt_cls_scores),
+                    reduction='none')
+            cls_cost = losses_neg + losses_gt.reshape(pairwise_ious.shape)
+            iou_cost = -paddle.log(pairwise_ious + eps)
+
+        cost_matrix = (
+            cls_cost * self.cls_weight + iou_cost * self.iou_weight +
+            paddle.logical_not(is_in_boxes_and_center).astype('float32') *
+            100000000)
+        cost_matrix = paddle.where(is_valid, cost_matrix,
+                                   paddle.full_like(cost_matrix, 1e10))
+
+        # dynamic k of each gt is not larger than candidate_topk
+        topk = min(self.candidate_topk, num_priors)
+        topk_ious, _ = paddle.topk(pairwise_ious, topk, axis=-1)
+        dynamic_ks = paddle.clip(
+            topk_ious.sum(-1).astype('int64'), min=1).unsqueeze(-1)
+        _, topk_idxs = paddle.topk(cost_matrix, topk, axis=-1, largest=False)
+        is_in_dynamic_k = (paddle.arange(
+            end=topk, dtype='int64') < dynamic_ks).astype('float32')
+        match_matrix = paddle.put_along_axis(
+            paddle.zeros_like(cost_matrix), topk_idxs, is_in_dynamic_k, -1)
+        match_matrix = match_matrix * is_valid.astype('float32')
+
+        # match points more than two gts to the one with min cost
+        is_min_cost = F.one_hot(
+            cost_matrix.argmin(axis=1), num_max_boxes).transpose([0, 2, 1])
+        extra_match_gts_mask = (match_matrix.sum(axis=1, keepdim=True) >
+                                1).tile([1, num_max_boxes, 1])
+        match_matrix = paddle.where(extra_match_gts_mask, is_min_cost,
+                                    match_matrix)
+        match_matrix_sum = match_matrix.sum(axis=1)
+        is_fg = match_matrix_sum > 0
+        batch_ind = paddle.arange(
+            end=batch_size, dtype='int64').unsqueeze(-1)
+        assigned_gt_index = match_matrix.argmax(axis=1) + \
+            batch_ind * num_max_boxes
+
+        # assigned target
+        assigned_labels = paddle.gather(
+            gt_labels.flatten().astype('int64'),
+            assigned_gt_index.flatten(),
+            axis=0).reshape([batch_size, num_priors])
+        labels = paddle.where(is_fg, assigned_labels, labels)
+        bbox_targets = paddle.gather(
+            gt_bboxes.reshape([-1, 4]), assigned_gt_index.flatten(),
+            axis=0).reshape([batch_size, num_priors, 4])
+        bbox_targets = bbox_targets * is_fg.unsqueeze(-1).astype(
+            bbox_targets.dtype)
+
+        pos_num = paddle.clip(is_fg.astype('int64').sum(-1), min=1)
+        pos_num = pos_num * (pad_gt_mask.sum([1, 2]) > 0).astype('int64')
+        return pos_num, labels, label_weights, bbox_targets
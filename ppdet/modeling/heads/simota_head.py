@@ -31,6 +31,7 @@ from paddle.nn.initializer import Normal, Constant
 from ppdet.core.workspace import register
 
 from ppdet.modeling.bbox_utils import distance2bbox, bbox2distance
+from ppdet.modeling.assigners.utils import pad_gt
 from ppdet.data.transform.atss_assigner import bbox_overlaps
 
 from .gfl_head import GFLHead
@@ -114,6 +115,19 @@ class OTAHead(GFLHead):
 
         return (pos_num, label, label_weight, bbox_target)
 
+    def _get_targets(self, flatten_cls_preds, flatten_center_and_strides,
+                     flatten_bboxes, gt_meta):
+        """Compute targets for priors of all images at once.
+        """
+        gt_labels, gt_bboxes, _, pad_gt_mask = pad_gt(gt_meta['gt_class'],
+                                                      gt_meta['gt_bbox'])
+        if 'pad_gt_mask' in gt_meta:
+            pad_gt_mask = gt_meta['pad_gt_mask']
+        return self.assigner.assign_batch(
+            F.sigmoid(flatten_cls_preds.detach()),
+            flatten_center_and_strides.detach(),
+            flatten_bboxes.detach(), gt_labels, gt_bboxes, pad_gt_mask)
+
     def get_loss(self, head_outs, gt_meta):
         cls_scores, bbox_preds = head_outs
         num_level_anchors = [
@@ -153,22 +167,9 @@ class OTAHead(GFLHead):
         flatten_bboxes = paddle.concat(decode_bbox_preds, axis=1)
         flatten_center_and_strides = paddle.concat(center_and_strides, axis=1)
 
-        gt_boxes, gt_labels = gt_meta['gt_bbox'], gt_meta['gt_class']
-        pos_num_l, label_l, label_weight_l, bbox_target_l = [], [], [], []
-        for flatten_cls_pred,flatten_center_and_stride,flatten_bbox,gt_box, gt_label \
-            in zip(flatten_cls_preds.detach(),flatten_center_and_strides.detach(), \
-                   flatten_bboxes.detach(),gt_boxes, gt_labels):
-            pos_num, label, label_weight, bbox_target = self._get_target_single(
-                flatten_cls_pred, flatten_center_and_stride, flatten_bbox,
-                gt_box, gt_label)
-            pos_num_l.append(pos_num)
-            label_l.append(label)
-            label_weight_l.append(label_weight)
-            bbox_target_l.append(bbox_target)
-
-        labels = paddle.to_tensor(np.stack(label_l, axis=0))
-        label_weights = paddle.to_tensor(np.stack(label_weight_l, axis=0))
-        bbox_targets = paddle.to_tensor(np.stack(bbox_target_l, axis=0))
+        pos_num, labels, label_weights, bbox_targets = self._get_targets(
+            flatten_cls_preds, flatten_center_and_strides, flatten_bboxes,
+            gt_meta)
 
         center_and_strides_list = self._images_to_levels(
             flatten_center_and_strides, num_level_anchors)
@@ -177,12 +178,8 @@ class OTAHead(GFLHead):
                                                     num_level_anchors)
         bbox_targets_list = self._images_to_levels(bbox_targets,
                                                    num_level_anchors)
-        num_total_pos = sum(pos_num_l)
-        try:
-            num_total_pos = paddle.distributed.all_reduce(num_total_pos.clone(
-            )) / paddle.distributed.get_world_size()
-        except:
-            num_total_pos = max(num_total_pos, 1)
+        num_total_pos = paddle.clip(
+            pos_num.sum().astype('float32'), min=1)
 
         loss_bbox_list, loss_dfl_list, loss_qfl_list, avg_factor = [], [], [], []
         for cls_score, bbox_pred, center_and_strides, labels, label_weights, bbox_targets, stride in zip(
@@ -370,22 +367,9 @@ class OTAVFLHead(OTAHead):
         flatten_bboxes = paddle.concat(decode_bbox_preds, axis=1)
         flatten_center_and_strides = paddle.concat(center_and_strides, axis=1)
 
-        gt_boxes, gt_labels = gt_meta['gt_bbox'], gt_meta['gt_class']
-        pos_num_l, label_l, label_weight_l, bbox_target_l = [], [], [], []
-        for flatten_cls_pred, flatten_center_and_stride, flatten_bbox,gt_box,gt_label \
-                in zip(flatten_cls_preds.detach(), flatten_center_and_strides.detach(), \
-                       flatten_bboxes.detach(),gt_boxes,gt_labels):
-            pos_num, label, label_weight, bbox_target = self._get_target_single(
-                flatten_cls_pred, flatten_center_and_stride, flatten_bbox,
-                gt_box, gt_label)
-            pos_num_l.append(pos_num)
-            label_l.append(label)
-            label_weight_l.append(label_weight)
-            bbox_target_l.append(bbox_target)
-
-        labels = paddle.to_tensor(np.stack(label_l, axis=0))
-        label_weights = paddle.to_tensor(np.stack(label_weight_l, axis=0))
-        bbox_targets = paddle.to_tensor(np.stack(bbox_target_l, axis=0))
+        pos_num, labels, label_weights, bbox_targets = self._get_targets(
+            flatten_cls_preds, flatten_center_and_strides, flatten_bboxes,
+            gt_meta)
 
         center_and_strides_list = self._images_to_levels(
             flatten_center_and_strides, num_level_anchors)
@@ -394,12 +378,8 @@ class OTAVFLHead(OTAHead):
                                                     num_level_anchors)
         bbox_targets_list = self._images_to_levels(bbox_targets,
                                                    num_level_anchors)
-        num_total_pos = sum(pos_num_l)
-        try:
-            num_total_pos = paddle.distributed.all_reduce(num_total_pos.clone(
-            )) / paddle.distributed.get_world_size()
-        except:
-            num_total_pos = max(num_total_pos, 1)
+        num_total_pos = paddle.clip(
+            pos_num.sum().astype('float32'), min=1)
 
         loss_bbox_list, loss_dfl_list, loss_vfl_list, avg_factor = [], [], [], []
         for cls_score, bbox_pred, center_and_strides, labels, label_weights, bbox_targets, stride in zip(
@@ -25,6 +25,7 @@ from ..initializer import bias_init_with_prob, constant_
 from ..backbones.csp_darknet import BaseConv, DWConv
 from ..losses import IouLoss
 from ppdet.modeling.assigners.simota_assigner import SimOTAAssigner
+from ppdet.modeling.assigners.utils import pad_gt
 from ppdet.modeling.bbox_utils import bbox_overlaps
 
 __all__ = ['YOLOv3Head', 'YOLOXHead']
@@ -306,17 +307,13 @@ class YOLOXHead(nn.Layer):
         # label assignment
         center_and_strides = paddle.concat(
             [anchor_points, stride_tensor, stride_tensor], axis=-1)
-        pos_num_list, label_list, bbox_target_list = [], [], []
-        for pred_score, pred_bbox, gt_box, gt_label in zip(
-                pred_scores.detach(),
-                pred_bboxes.detach() * stride_tensor, gt_bboxes, gt_labels):
-            pos_num, label, _, bbox_target = self.assigner(
-                pred_score, center_and_strides, pred_bbox, gt_box, gt_label)
-            pos_num_list.append(pos_num)
-            label_list.append(label)
-            bbox_target_list.append(bbox_target)
-        labels = paddle.to_tensor(np.stack(label_list, axis=0))
-        bbox_targets = paddle.to_tensor(np.stack(bbox_target_list, axis=0))
+        gt_labels, gt_bboxes, _, pad_gt_mask = pad_gt(gt_labels, gt_bboxes)
+        if 'pad_gt_mask' in targets:
+            pad_gt_mask = targets['pad_gt_mask']
+        pos_num, labels, _, bbox_targets = self.assigner.assign_batch(
+            pred_scores.detach(), center_and_strides,
+            pred_bboxes.detach() * stride_tensor, gt_labels, gt_bboxes,
+            pad_gt_mask)
         bbox_targets /= stride_tensor  # rescale bbox
 
         # 1. obj score loss
@@ -326,10 +323,10 @@ class YOLOXHead(nn.Layer):
             mask_positive.astype(pred_obj.dtype).unsqueeze(-1),
             reduction='sum')
 
-        num_pos = sum(pos_num_list)
+        num_pos = pos_num.sum()
 
         if num_pos > 0:
-            num_pos = paddle.to_tensor(num_pos, dtype=self._dtype).clip(min=1)
+            num_pos = num_pos.astype(self._dtype).clip(min=1)
             loss_obj /= num_pos
 
             # 2. iou loss
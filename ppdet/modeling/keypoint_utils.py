@@ -214,6 +214,20 @@ def transform_preds(coords, center, scale, output_size):
     return target_coords
 
 
+def batch_transform_preds(coords, center, scale, output_size):
+    """
+    transform_preds of a batch, coords ([N, J, 2]) of each person are
+    transformed by its affine matrix at once.
+    """
+    trans = np.stack([
+        get_affine_transform(c, s * 200, 0, output_size, inv=1)
+        for c, s in zip(center, scale)
+    ]) if len(coords) > 0 else np.zeros((0, 2, 3))
+    coords = coords[..., :2].astype(np.float64)
+    return np.matmul(coords, trans[:, :, :2].transpose(
+        (0, 2, 1))) + trans[:, None, :, 2]
+
+
 def oks_iou(g, d, a_g, a_d, sigmas=None, in_vis_thre=None):
     if not isinstance(sigmas, np.ndarray):
         sigmas = np.array([
@@ -182,9 +182,32 @@ class YOLOv3Loss(nn.Layer):
         loss['loss_cls'] = loss_cls
         return loss
 
+    def dense_target(self, index, value, na, h, w):
+        # scatter sparse targets of Gt2YoloTarget to [b, na, c, h, w], the
+        # index padding -1 is sent to an extra row which is dropped
+        b, k, c = value.shape
+        size = na * h * w
+        offset = paddle.arange(b, dtype=index.dtype).unsqueeze(1) * size
+        index = paddle.where(index >= 0, index + offset,
+                             paddle.full_like(index, b * size))
+        target = paddle.zeros((b * size + 1, c), dtype=value.dtype)
+        target = paddle.scatter(
+            target, index.reshape((-1, )), value.reshape((-1, c)))
+        target = target[:-1].reshape((b, na, h, w, c))
+        return target.transpose((0, 1, 4, 2, 3))
+
     def forward(self, inputs, targets, anchors):
         np = len(inputs)
-        gt_targets = [targets['target{}'.format(i)] for i in range(np)]
+        gt_targets = []
+        for i in range(np):
+            if 'target{}'.format(i) not in targets:
+                h, w = inputs[i].shape[2:]
+                gt_targets.append(
+                    self.dense_target(targets['target{}_index'.format(i)],
+                                      targets['target{}_value'.format(i)],
+                                      len(anchors[i]), h, w))
+            else:
+                gt_targets.append(targets['target{}'.format(i)])
         gt_box = targets['gt_bbox']
         yolo_losses = dict()
         self.distill_pairs.clear()
@@ -145,29 +145,94 @@ class NearestNeighborDistanceMetric(object):
     A nearest neighbor distance metric that, for each target, returns
     the closest distance to any sample that has been observed so far.
 
+    Samples are kept in a gallery of ring buffers, a preallocated
+    CxBxD float32 array of C target slots, B samples per target and feature
+    dimension D, with the number of samples and the next position to write
+    of each slot. Slots of targets which are no longer active are recycled,
+    and the distances of all targets to all features are computed in one
+    batch.
+
     Args:
         metric (str): Either "euclidean" or "cosine".
         matching_threshold (float): The matching threshold. Samples with larger
             distance are considered an invalid match.
         budget (Optional[int]): If not None, fix samples per class to at most
             this number. Removes the oldest samples when the budget is reached.
+        capacity (int): initial number of target slots, doubled when it is
+            full.
 
     Attributes: 
         samples (Dict[int -> List[ndarray]]): A dictionary that maps from target
             identities to the list of samples that have been observed so far.
     """
 
-    def __init__(self, metric, matching_threshold, budget=None):
+    def __init__(self, metric, matching_threshold, budget=None, capacity=256):
         if metric == "euclidean":
-            self._metric = _nn_euclidean_distance
+            self._cosine = False
         elif metric == "cosine":
-            self._metric = _nn_cosine_distance
+            self._cosine = True
         else:
             raise ValueError(
                 "Invalid metric; must be either 'euclidean' or 'cosine'")
         self.matching_threshold = matching_threshold
         self.budget = budget
-        self.samples = {}
+        self.capacity = capacity
+        # allocated by the first features
+        self.gallery = None
+        self.sq_norms = None
+        self.counts = np.zeros((capacity, ), dtype=np.int64)
+        self.heads = np.zeros((capacity, ), dtype=np.int64)
+        self.free_slots = list(range(capacity - 1, -1, -1))
+        self.slots = {}
+
+    @property
+    def samples(self):
+        samples = {}
+        for target, slot in self.slots.items():
+            length = self.gallery.shape[1]
+            count, head = self.counts[slot], self.heads[slot]
+            order = (head - count + np.arange(count)) % length
+            samples[target] = list(self.gallery[slot, order])
+        return samples
+
+    def _alloc(self, target):
+        if len(self.free_slots) == 0:
+            num = self.counts.shape[0]
+            self.counts = np.concatenate(
+                [self.counts, np.zeros_like(self.counts)])
+            self.heads = np.concatenate(
+                [self.heads, np.zeros_like(self.heads)])
+            if self.gallery is not None:
+                self.gallery = np.concatenate(
+                    [self.gallery, np.zeros_like(self.gallery)], axis=0)
+                self.sq_norms = np.concatenate(
+                    [self.sq_norms, np.zeros_like(self.sq_norms)], axis=0)
+            self.free_slots = list(range(2 * num - 1, num - 1, -1))
+        slot = self.free_slots.pop()
+        self.slots[target] = slot
+        return slot
+
+    def _release(self, target):
+        slot = self.slots.pop(target)
+        self.counts[slot] = 0
+        self.heads[slot] = 0
+        self.free_slots.append(slot)
+
+    def _reserve(self, dim, length):
+        """Make room of at least length samples per slot."""
+        if self.gallery is None:
+            length = self.budget or max(length, 16)
+            self.gallery = np.zeros(
+                (self.counts.shape[0], length, dim), dtype=np.float32)
+            self.sq_norms = np.zeros(
+                (self.counts.shape[0], length), dtype=np.float32)
+        elif self.budget is None and self.gallery.shape[1] < length:
+            # no budget, samples of each slot are never wrapped and the next
+            # position of full slots is the end of the old buffer
+            pad = max(length, 2 * self.gallery.shape[1]) - self.gallery.shape[1]
+            self.gallery = np.pad(self.gallery, ((0, 0), (0, pad), (0, 0)))
+            self.sq_norms = np.pad(self.sq_norms, ((0, 0), (0, pad)))
+            self.heads = self.counts.copy()
 
     def partial_fit(self, features, targets, active_targets):
         """
@@ -179,11 +244,46 @@ class NearestNeighborDistanceMetric(object):
             active_targets (List[int]): A list of targets that are currently
                 present in the scene.
         """
-        for feature, target in zip(features, targets):
-            self.samples.setdefault(target, []).append(feature)
-            if self.budget is not None:
-                self.samples[target] = self.samples[target][-self.budget:]
-        self.samples = {k: self.samples[k] for k in active_targets}
+        active_targets = set(active_targets)
+        for target in [t for t in self.slots if t not in active_targets]:
+            self._release(target)
+
+        targets = np.asarray(targets).reshape([-1])
+        keep = np.asarray([t in active_targets for t in targets.tolist()],
+                          dtype=bool)
+        if not np.any(keep):
+            return
+        features = np.asarray(features, dtype=np.float32)[keep]
+        targets = targets[keep]
+        if self._cosine:
+            features = features / np.linalg.norm(
+                features, axis=1, keepdims=True)
+
+        slots = np.asarray(
+            [
+                self.slots[t] if t in self.slots else self._alloc(t)
+                for t in targets.tolist()
+            ],
+            dtype=np.int64)
+        # rank of each feature in the ones of its slot, in order of arrival
+        order = np.argsort(slots, kind='stable')
+        uniq, first, num = np.unique(
+            slots[order], return_index=True, return_counts=True)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order)) - np.repeat(first, num)
+        total = np.zeros_like(slots)
+        total[order] = np.repeat(num, num)
+
+        self._reserve(features.shape[1], int((self.counts[uniq] + num).max()))
+        length = self.gallery.shape[1]
+        # only the last ones fit in the ring buffer
+        last = rank >= total - length
+        slots, rank, features = slots[last], rank[last], features[last]
+        pos = (self.heads[slots] + rank) % length
+        self.gallery[slots, pos] = features
+        self.sq_norms[slots, pos] = np.square(features).sum(axis=1)
+        self.heads[uniq] = (self.heads[uniq] + num) % length
+        self.counts[uniq] = np.minimum(self.counts[uniq] + num, length)
 
     def distance(self, features, targets):
         """
@@ -199,8 +299,26 @@ class NearestNeighborDistanceMetric(object):
                 `targets[i]` and `features[j]`.
         """
         cost_matrix = np.zeros((len(targets), len(features)))
-        for i, target in enumerate(targets):
-            cost_matrix[i, :] = self._metric(self.samples[target], features)
+        if len(targets) == 0 or len(features) == 0:
+            return cost_matrix
+        slots = np.asarray([self.slots[t] for t in targets], dtype=np.int64)
+        features = np.asarray(features, dtype=np.float32)
+        length = self.gallery.shape[1]
+        valid = np.arange(length)[None, :] < self.counts[slots][:, None]
+
+        # TxLxD gallery of targets to TxLxN distances
+        gallery = self.gallery[slots]
+        if self._cosine:
+            features = features / np.linalg.norm(
+                features, axis=1, keepdims=True)
+            distances = 1. - np.matmul(gallery, features.T)
+        else:
+            distances = -2. * np.matmul(gallery, features.T)
+            distances += self.sq_norms[slots][:, :, None]
+            distances += np.square(features).sum(axis=1)[None, None, :]
+            distances = np.maximum(distances, 0.)
+        distances[~valid] = np.inf
+        cost_matrix[:] = distances.min(axis=1)
         return cost_matrix
 
 
@@ -371,6 +489,13 @@ def gate_cost_matrix(kf,
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
     measurements = np.asarray(
         [detections[i].to_xyah() for i in detection_indices])
+    gated_tracks = [tracks[i] for i in track_indices]
+    state_store = kalman_filter.KalmanStateMixin.shared_store(gated_tracks)
+    if state_store is not None:
+        gating_distance = state_store.gating_distance(
+            gated_tracks, measurements, only_position)
+        cost_matrix[gating_distance > gating_threshold] = gated_cost
+        return cost_matrix
     for row, track_idx in enumerate(track_indices):
         track = tracks[track_idx]
         gating_distance = kf.gating_distance(track.mean, track.covariance,
@@ -69,27 +69,26 @@ def linear_assignment(cost_matrix, thresh):
 
 
 def bbox_ious(atlbrs, btlbrs):
-    boxes = np.ascontiguousarray(atlbrs, dtype=np.float)
-    query_boxes = np.ascontiguousarray(btlbrs, dtype=np.float)
+    boxes = np.ascontiguousarray(atlbrs, dtype=np.float64).reshape(-1, 4)
+    query_boxes = np.ascontiguousarray(btlbrs, dtype=np.float64).reshape(-1, 4)
     N = boxes.shape[0]
     K = query_boxes.shape[0]
     ious = np.zeros((N, K), dtype=boxes.dtype)
     if N * K == 0:
         return ious
 
-    for k in range(K):
-        box_area = ((query_boxes[k, 2] - query_boxes[k, 0] + 1) *
-                    (query_boxes[k, 3] - query_boxes[k, 1] + 1))
-        for n in range(N):
-            iw = (min(boxes[n, 2], query_boxes[k, 2]) - max(
-                boxes[n, 0], query_boxes[k, 0]) + 1)
-            if iw > 0:
-                ih = (min(boxes[n, 3], query_boxes[k, 3]) - max(
-                    boxes[n, 1], query_boxes[k, 1]) + 1)
-                if ih > 0:
-                    ua = float((boxes[n, 2] - boxes[n, 0] + 1) * (boxes[
-                        n, 3] - boxes[n, 1] + 1) + box_area - iw * ih)
-                    ious[n, k] = iw * ih / ua
+    # pixel coordinates, width and height are x2 - x1 + 1
+    box_areas = (boxes[:, 2] - boxes[:, 0] + 1) * (boxes[:, 3] - boxes[:, 1] + 1)
+    query_areas = (query_boxes[:, 2] - query_boxes[:, 0] + 1) * (
+        query_boxes[:, 3] - query_boxes[:, 1] + 1)
+    iw = np.minimum(boxes[:, None, 2], query_boxes[None, :, 2]) - np.maximum(
+        boxes[:, None, 0], query_boxes[None, :, 0]) + 1
+    ih = np.minimum(boxes[:, None, 3], query_boxes[None, :, 3]) - np.maximum(
+        boxes[:, None, 1], query_boxes[None, :, 1]) + 1
+    overlap = (iw > 0) & (ih > 0)
+    inter = iw * ih
+    ua = box_areas[:, None] + query_areas[None, :] - inter
+    np.divide(inter, ua, out=ious, where=overlap)
     return ious
 
 
@@ -110,17 +109,33 @@ def iou_distance(atracks, btracks):
     return cost_matrix
 
 
-def embedding_distance(tracks, detections, metric='euclidean'):
+def embedding_distance(tracks,
+                       detections,
+                       metric='euclidean',
+                       track_features=None,
+                       det_features=None):
     """
     Compute cost based on features between two list[STrack].
+
+    Args:
+        tracks (list[STrack]): tracks to compute cost of.
+        detections (list[STrack]): detections to compute cost of.
+        metric (str): distance metric of scipy cdist.
+        track_features (np.ndarray): optional smooth features of tracks in
+            shape [len(tracks), dim], e.g. gathered from TrackFeatureBank,
+            avoid building it from tracks.
+        det_features (np.ndarray): optional current features of detections
+            in shape [len(detections), dim].
     """
-    cost_matrix = np.zeros((len(tracks), len(detections)), dtype=np.float)
+    cost_matrix = np.zeros((len(tracks), len(detections)), dtype=np.float64)
     if cost_matrix.size == 0:
         return cost_matrix
-    det_features = np.asarray(
-        [track.curr_feat for track in detections], dtype=np.float)
-    track_features = np.asarray(
-        [track.smooth_feat for track in tracks], dtype=np.float)
+    if det_features is None:
+        det_features = [track.curr_feat for track in detections]
+    if track_features is None:
+        track_features = [track.smooth_feat for track in tracks]
+    det_features = np.asarray(det_features, dtype=np.float64)
+    track_features = np.asarray(track_features, dtype=np.float64)
     cost_matrix = np.maximum(0.0, cdist(track_features, det_features,
                                         metric))  # Nomalized features
     return cost_matrix
@@ -137,6 +152,13 @@ def fuse_motion(kf,
     gating_dim = 2 if only_position else 4
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
     measurements = np.asarray([det.to_xyah() for det in detections])
+    state_store = kalman_filter.KalmanStateMixin.shared_store(tracks)
+    if state_store is not None:
+        gating_distance = state_store.gating_distance(
+            tracks, measurements, only_position, metric='maha')
+        cost_matrix[gating_distance > gating_threshold] = np.inf
+        cost_matrix = lambda_ * cost_matrix + (1 - lambda_) * gating_distance
+        return cost_matrix
     for row, track in enumerate(tracks):
         gating_distance = kf.gating_distance(
             track.mean,
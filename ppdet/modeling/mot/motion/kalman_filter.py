@@ -19,7 +19,7 @@ import numpy as np
 import scipy.linalg
 from ppdet.core.workspace import register, serializable
 
-__all__ = ['KalmanFilter']
+__all__ = ['KalmanFilter', 'KalmanStateStore', 'KalmanStateMixin']
 """
 Table for the 0.95 quantile of the chi-square distribution with N degrees of
 freedom (contains values for N=1, ..., 9). Taken from MATLAB/Octave's chi2inv
@@ -180,10 +180,8 @@ class KalmanFilter(object):
         ]
         sqr = np.square(np.r_[std_pos, std_vel]).T
 
-        motion_cov = []
-        for i in range(len(mean)):
-            motion_cov.append(np.diag(sqr[i]))
-        motion_cov = np.asarray(motion_cov)
+        motion_cov = np.zeros((len(mean), 8, 8), dtype=sqr.dtype)
+        motion_cov[:, np.arange(8), np.arange(8)] = sqr
 
         mean = np.dot(mean, self._motion_mat.T)
         left = np.dot(self._motion_mat, covariance).transpose((1, 0, 2))
@@ -191,6 +189,35 @@ class KalmanFilter(object):
 
         return mean, covariance
 
+    def multi_project(self, mean, covariance):
+        """
+        Project state distributions to measurement space (Vectorized version).
+
+        Args:
+            mean (ndarray): The Nx8 dimensional mean matrix of the states.
+            covariance (ndarray): The Nx8x8 dimensional covariance matrics of
+                the states.
+
+        Returns:
+            The Nx4 projected mean matrix and Nx4x4 covariance matrics of the
+            given state estimates.
+        """
+        std = np.stack(
+            [
+                self._std_weight_position * mean[:, 3],
+                self._std_weight_position * mean[:, 3],
+                1e-1 * np.ones_like(mean[:, 3]),
+                self._std_weight_position * mean[:, 3]
+            ],
+            axis=1)
+        innovation_cov = np.zeros((len(mean), 4, 4), dtype=std.dtype)
+        innovation_cov[:, np.arange(4), np.arange(4)] = np.square(std)
+
+        mean = np.dot(mean, self._update_mat.T)
+        covariance = np.matmul(
+            np.matmul(self._update_mat, covariance), self._update_mat.T)
+        return mean, covariance + innovation_cov
+
     def update(self, mean, covariance, measurement):
         """
         Run Kalman filter correction step.
@@ -220,6 +247,37 @@ class KalmanFilter(object):
             (kalman_gain, projected_cov, kalman_gain.T))
         return new_mean, new_covariance
 
+    def multi_update(self, mean, covariance, measurement):
+        """
+        Run Kalman filter correction step (Vectorized version).
+
+        Args:
+            mean (ndarray): The Nx8 dimensional mean matrix of the predicted
+                states.
+            covariance (ndarray): The Nx8x8 dimensional covariance matrics of
+                the states.
+            measurement (ndarray): The Nx4 dimensional measurement matrix, each
+                in format (x, y, a, h).
+
+        Returns:
+            The measurement-corrected state distributions.
+        """
+        projected_mean, projected_cov = self.multi_project(mean, covariance)
+
+        # K = P * H^T * S^-1, solved as S * K^T = (P * H^T)^T
+        kalman_gain = np.linalg.solve(
+            projected_cov,
+            np.matmul(covariance, self._update_mat.T).transpose(
+                (0, 2, 1))).transpose((0, 2, 1))
+        innovation = measurement - projected_mean
+
+        new_mean = mean + np.matmul(kalman_gain, innovation[:, :, None])[:, :,
+                                                                          0]
+        new_covariance = covariance - np.matmul(
+            np.matmul(kalman_gain, projected_cov),
+            kalman_gain.transpose((0, 2, 1)))
+        return new_mean, new_covariance
+
     def gating_distance(self,
                         mean,
                         covariance,
@@ -268,3 +326,234 @@ class KalmanFilter(object):
             return squared_maha
         else:
             raise ValueError('invalid distance metric')
+
+    def multi_gating_distance(self,
+                              mean,
+                              covariance,
+                              measurements,
+                              only_position=False,
+                              metric='maha'):
+        """
+        Compute gating distance between state distributions and measurements
+        (Vectorized version).
+
+        Args:
+            mean (ndarray): The Nx8 dimensional mean matrix of the states.
+            covariance (ndarray): The Nx8x8 dimensional covariance matrics of
+                the states.
+            measurements (ndarray): An Mx4 dimensional matrix of M measurements,
+                each in format (x, y, a, h).
+            only_position (Optional[bool]): If True, distance computation is 
+                done with respect to the bounding box center position only.
+            metric (str): Metric type, 'gaussian' or 'maha'.
+
+        Returns
+            An NxM matrix, where the (i, j) element contains the squared
+            Mahalanobis distance between the i-th state and `measurements[j]`.
+        """
+        mean, covariance = self.multi_project(mean, covariance)
+        measurements = np.asarray(measurements).reshape((-1, 4))
+        if only_position:
+            mean, covariance = mean[:, :2], covariance[:, :2, :2]
+            measurements = measurements[:, :2]
+
+        # N x dim x M
+        d = measurements.T[None, :, :] - mean[:, :, None]
+        if metric == 'gaussian':
+            return np.sum(d * d, axis=1)
+        elif metric == 'maha':
+            cholesky_factor = np.linalg.cholesky(covariance)
+            z = np.linalg.solve(cholesky_factor, d)
+            squared_maha = np.sum(z * z, axis=1)
+            return squared_maha
+        else:
+            raise ValueError('invalid distance metric')
+
+
+class KalmanStateStore(object):
+    """
+    Structure-of-arrays storage of Kalman filter states of tracks.
+
+    Means and covariances of all attached tracks are kept in one contiguous
+    Nx8 matrix and one Nx8x8 array, so the prediction, correction and gating
+    of all tracks in one frame are done by the vectorized methods of
+    KalmanFilter instead of one call per track. Corrections are staged by
+    tracks and run in one batch when any state is read next time.
+
+    Tracks use the store by inheriting KalmanStateMixin, whose `mean` and
+    `covariance` attributes are rows of the store once attached.
+
+    Args:
+        kalman_filter (KalmanFilter): filter to run the batched steps.
+        capacity (int): initial number of rows, doubled when it is full.
+    """
+
+    def __init__(self, kalman_filter, capacity=256):
+        self.kalman_filter = kalman_filter
+        self.means = np.zeros((capacity, 8), dtype=np.float64)
+        self.covariances = np.zeros((capacity, 8, 8), dtype=np.float64)
+        self.free_slots = list(range(capacity - 1, -1, -1))
+        self.owners = {}
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.owners)
+
+    def _alloc(self):
+        if len(self.free_slots) == 0:
+            num = self.means.shape[0]
+            self.means = np.concatenate(
+                [self.means, np.zeros_like(self.means)], axis=0)
+            self.covariances = np.concatenate(
+                [self.covariances, np.zeros_like(self.covariances)], axis=0)
+            self.free_slots = list(range(2 * num - 1, num - 1, -1))
+        return self.free_slots.pop()
+
+    def attach(self, track):
+        """Move the current state of track into the store."""
+        if track._state_store is self:
+            return
+        slot = self._alloc()
+        self.means[slot] = track._mean
+        self.covariances[slot] = track._covariance
+        track._mean, track._covariance = None, None
+        track._state_store, track._state_slot = self, slot
+        self.owners[slot] = track
+
+    def detach(self, track):
+        """Move the state of track out of the store and release its row."""
+        if track._state_store is not self:
+            return
+        self.flush()
+        slot = track._state_slot
+        track._mean = self.means[slot].copy()
+        track._covariance = self.covariances[slot].copy()
+        track._state_store, track._state_slot = None, -1
+        del self.owners[slot]
+        self.free_slots.append(slot)
+
+    def retain(self, tracks):
+        """Detach all tracks which are not in tracks."""
+        keep = set(id(t) for t in tracks)
+        for track in [t for t in self.owners.values() if id(t) not in keep]:
+            self.detach(track)
+
+    def _slots(self, tracks):
+        return np.asarray([t._state_slot for t in tracks], dtype=np.int64)
+
+    def is_attached(self, tracks):
+        return all(t._state_store is self for t in tracks)
+
+    def gather(self, tracks):
+        """Return Nx8 means and Nx8x8 covariances of tracks."""
+        self.flush()
+        slots = self._slots(tracks)
+        return self.means[slots], self.covariances[slots]
+
+    def predict(self, tracks, keep_velocity=None):
+        """
+        Run prediction step of tracks in one batch.
+
+        Args:
+            tracks (list): attached tracks.
+            keep_velocity (ndarray): optional bool mask of tracks, the height
+                velocity of tracks which are False is set 0 before prediction.
+        """
+        if len(tracks) == 0:
+            return
+        self.flush()
+        slots = self._slots(tracks)
+        mean = self.means[slots]
+        if keep_velocity is not None:
+            mean[~np.asarray(keep_velocity, dtype=bool), 7] = 0
+        self.means[slots], self.covariances[slots] = \
+            self.kalman_filter.multi_predict(mean, self.covariances[slots])
+
+    def stage_update(self, track, measurement):
+        """Stage the correction step of track with measurement."""
+        if track._state_slot in self.pending:
+            self.flush()
+        self.pending[track._state_slot] = measurement
+
+    def flush(self):
+        """Run all staged correction steps in one batch."""
+        if len(self.pending) == 0:
+            return
+        slots = np.asarray(list(self.pending.keys()), dtype=np.int64)
+        measurement = np.asarray(list(self.pending.values()), dtype=np.float64)
+        self.pending = {}
+        self.means[slots], self.covariances[slots] = \
+            self.kalman_filter.multi_update(
+                self.means[slots], self.covariances[slots], measurement)
+
+    def gating_distance(self,
+                        tracks,
+                        measurements,
+                        only_position=False,
+                        metric='maha'):
+        """Return NxM gating distance between tracks and measurements."""
+        mean, covariance = self.gather(tracks)
+        return self.kalman_filter.multi_gating_distance(
+            mean, covariance, measurements, only_position, metric)
+
+
+class KalmanStateMixin(object):
+    """
+    Kalman filter state attributes `mean` and `covariance` of tracks, which
+    are kept by the track itself, or by a KalmanStateStore after attached.
+    """
+    _mean = None
+    _covariance = None
+    _state_store = None
+    _state_slot = -1
+
+    @property
+    def mean(self):
+        if self._state_store is None:
+            return self._mean
+        self._state_store.flush()
+        return self._state_store.means[self._state_slot]
+
+    @mean.setter
+    def mean(self, value):
+        if self._state_store is None:
+            self._mean = value
+        else:
+            self._state_store.flush()
+            self._state_store.means[self._state_slot] = value
+
+    @property
+    def covariance(self):
+        if self._state_store is None:
+            return self._covariance
+        self._state_store.flush()
+        return self._state_store.covariances[self._state_slot]
+
+    @covariance.setter
+    def covariance(self, value):
+        if self._state_store is None:
+            self._covariance = value
+        else:
+            self._state_store.flush()
+            self._state_store.covariances[self._state_slot] = value
+
+    def kalman_update(self, kalman_filter, measurement):
+        """
+        Run Kalman filter correction step of the track, which is staged in
+        the store if the track is attached.
+        """
+        if self._state_store is None:
+            self.mean, self.covariance = kalman_filter.update(
+                self.mean, self.covariance, measurement)
+        else:
+            self._state_store.stage_update(self, measurement)
+
+    @staticmethod
+    def shared_store(tracks):
+        """Return the store shared by all tracks, or None."""
+        if len(tracks) == 0:
+            return None
+        store = tracks[0]._state_store
+        if store is None or not store.is_attached(tracks):
+            return None
+        return store
@@ -19,6 +19,7 @@ import numpy as np
 from collections import defaultdict
 from collections import deque, OrderedDict
 from ..matching import jde_matching as matching
+from ..motion import KalmanStateMixin
 from ppdet.core.workspace import register, serializable
 import warnings
 warnings.filterwarnings("ignore")
@@ -27,6 +28,7 @@ __all__ = [
     'TrackState',
     'BaseTrack',
     'STrack',
+    'TrackFeatureBank',
     'joint_stracks',
     'sub_stracks',
     'remove_duplicate_stracks',
@@ -101,7 +103,7 @@ class BaseTrack(object):
 
 @register
 @serializable
-class STrack(BaseTrack):
+class STrack(BaseTrack, KalmanStateMixin):
     def __init__(self,
                  tlwh,
                  score,
@@ -146,7 +148,12 @@ class STrack(BaseTrack):
 
     @staticmethod
     def multi_predict(tracks, kalman_filter):
-        if len(tracks) > 0:
+        state_store = KalmanStateMixin.shared_store(tracks)
+        if state_store is not None:
+            state_store.predict(
+                tracks,
+                keep_velocity=[st.state == TrackState.Tracked for st in tracks])
+        elif len(tracks) > 0:
             multi_mean = np.asarray([track.mean.copy() for track in tracks])
             multi_covariance = np.asarray(
                 [track.covariance for track in tracks])
@@ -162,13 +169,15 @@ class STrack(BaseTrack):
     def reset_track_id(self):
         self.reset_track_count(self.cls_id)
 
-    def activate(self, kalman_filter, frame_id):
+    def activate(self, kalman_filter, frame_id, state_store=None):
         """Start a new track"""
         self.kalman_filter = kalman_filter
         # update track id for the object class
         self.track_id = self.next_id(self.cls_id)
         self.mean, self.covariance = self.kalman_filter.initiate(
             self.tlwh_to_xyah(self._tlwh))
+        if state_store is not None:
+            state_store.attach(self)
 
         self.track_len = 0
         self.state = TrackState.Tracked  # set flag 'tracked'
@@ -180,8 +189,8 @@ class STrack(BaseTrack):
         self.start_frame = frame_id
 
     def re_activate(self, new_track, frame_id, new_id=False):
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, self.tlwh_to_xyah(new_track.tlwh))
+        self.kalman_update(self.kalman_filter,
+                           self.tlwh_to_xyah(new_track.tlwh))
         if self.use_reid:
             self.update_features(new_track.curr_feat)
         self.track_len = 0
@@ -196,8 +205,7 @@ class STrack(BaseTrack):
         self.track_len += 1
 
         new_tlwh = new_track.tlwh
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, self.tlwh_to_xyah(new_tlwh))
+        self.kalman_update(self.kalman_filter, self.tlwh_to_xyah(new_tlwh))
         self.state = TrackState.Tracked  # set flag 'tracked'
         self.is_activated = True  # set flag 'activated'
 
@@ -257,6 +265,64 @@ class STrack(BaseTrack):
                                            self.start_frame, self.end_frame)
 
 
+class TrackFeatureBank(object):
+    """
+    Contiguous matrix of smooth features of live tracks.
+
+    Each track owns one row of the matrix, which is written when the features
+    of the track are updated, so the feature matrix of a track pool can be
+    gathered by one index op instead of being stacked from tracks per frame.
+    Rows of tracks which are not retained are recycled.
+
+    Args:
+        capacity (int): initial number of rows, doubled when it is full.
+    """
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.feats = None
+        self.slots = {}
+        self.free_slots = []
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _alloc(self, dim):
+        if self.feats is None:
+            self.feats = np.zeros((self.capacity, dim), dtype=np.float64)
+            self.free_slots = list(range(self.capacity - 1, -1, -1))
+        if len(self.free_slots) == 0:
+            num = self.feats.shape[0]
+            self.feats = np.concatenate(
+                [self.feats, np.zeros_like(self.feats)], axis=0)
+            self.free_slots = list(range(2 * num - 1, num - 1, -1))
+        return self.free_slots.pop()
+
+    def update(self, tracks):
+        """Write smooth features of tracks to their rows."""
+        for track in tracks:
+            slot = self.slots.get(track)
+            if slot is None:
+                slot = self._alloc(track.smooth_feat.shape[-1])
+                self.slots[track] = slot
+            self.feats[slot] = track.smooth_feat
+
+    def gather(self, tracks):
+        """Return smooth features of tracks in shape [len(tracks), dim]."""
+        missing = [track for track in tracks if track not in self.slots]
+        if len(missing) > 0:
+            self.update(missing)
+        if self.feats is None:
+            return np.zeros((0, 0), dtype=np.float64)
+        return self.feats[[self.slots[track] for track in tracks]]
+
+    def retain(self, tracks):
+        """Release rows of tracks which are not in tracks."""
+        keep = set(tracks)
+        for track in [t for t in self.slots if t not in keep]:
+            self.free_slots.append(self.slots.pop(track))
+
+
 def joint_stracks(tlista, tlistb):
     exists = {}
     res = []
@@ -16,6 +16,7 @@ This code is based on https://github.com/nwojke/deep_sort/blob/master/deep_sort/
 """
 
 import datetime
+from ..motion import KalmanStateMixin
 from ppdet.core.workspace import register, serializable
 
 __all__ = ['TrackState', 'Track']
@@ -36,7 +37,7 @@ class TrackState(object):
 
 @register
 @serializable
-class Track(object):
+class Track(KalmanStateMixin):
     """
     A single target track with state space `(x, y, a, h)` and associated
     velocities, where `(x, y)` is the center of the bounding box, `a` is the
@@ -117,14 +118,28 @@ class Track(object):
         self.age += 1
         self.time_since_update += 1
 
+    @staticmethod
+    def multi_predict(tracks, kalman_filter):
+        """
+        Run prediction step of all tracks, in one batch if their states are
+        kept by the same KalmanStateStore.
+        """
+        state_store = KalmanStateMixin.shared_store(tracks)
+        if state_store is None:
+            for track in tracks:
+                track.predict(kalman_filter)
+            return
+        state_store.predict(tracks)
+        for track in tracks:
+            track.age += 1
+            track.time_since_update += 1
+
     def update(self, kalman_filter, detection):
         """
         Perform Kalman filter measurement update step and update the associated
         detection feature cache.
         """
-        self.mean, self.covariance = kalman_filter.update(self.mean,
-                                                          self.covariance,
-                                                          detection.to_xyah())
+        self.kalman_update(kalman_filter, detection.to_xyah())
         self.features.append(detection.feature)
         self.feat = detection.feature
         self.cls_id = detection.cls_id
@@ -17,7 +17,7 @@ This code is based on https://github.com/nwojke/deep_sort/blob/master/deep_sort/
 
 import numpy as np
 
-from ..motion import KalmanFilter
+from ..motion import KalmanFilter, KalmanStateStore
 from ..matching.deepsort_matching import NearestNeighborDistanceMetric
 from ..matching.deepsort_matching import iou_cost, min_cost_matching, matching_cascade, gate_cost_matrix
 from .base_sde_tracker import Track
@@ -79,6 +79,8 @@ class DeepSORTTracker(object):
         self.max_iou_distance = max_iou_distance
         if motion == 'KalmanFilter':
             self.motion = KalmanFilter()
+        # batched Kalman filter states of all tracks
+        self.state_store = KalmanStateStore(self.motion)
 
         self.tracks = []
         self._next_id = 1
@@ -88,8 +90,7 @@ class DeepSORTTracker(object):
         Propagate track state distributions one time step forward.
         This function should be called once every time step, before `update`.
         """
-        for track in self.tracks:
-            track.predict(self.motion)
+        Track.multi_predict(self.tracks, self.motion)
 
     def update(self, pred_dets, pred_embs):
         """
@@ -124,6 +125,7 @@ class DeepSORTTracker(object):
         for detection_idx in unmatched_detections:
             self._initiate_track(detections[detection_idx])
         self.tracks = [t for t in self.tracks if not t.is_deleted()]
+        self.state_store.retain(self.tracks)
 
         # Update distance metric.
         active_targets = [t.track_id for t in self.tracks if t.is_confirmed()]
@@ -183,7 +185,9 @@ class DeepSORTTracker(object):
 
     def _initiate_track(self, detection):
         mean, covariance = self.motion.initiate(detection.to_xyah())
-        self.tracks.append(
-            Track(mean, covariance, self._next_id, self.n_init, self.max_age,
-                  detection.cls_id, detection.score, detection.feature))
+        track = Track(mean, covariance, self._next_id, self.n_init,
+                      self.max_age, detection.cls_id, detection.score,
+                      detection.feature)
+        self.state_store.attach(track)
+        self.tracks.append(track)
         self._next_id += 1
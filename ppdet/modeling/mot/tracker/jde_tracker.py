@@ -19,8 +19,8 @@ import numpy as np
 from collections import defaultdict
 
 from ..matching import jde_matching as matching
-from ..motion import KalmanFilter
-from .base_jde_tracker import TrackState, STrack
+from ..motion import KalmanFilter, KalmanStateStore
+from .base_jde_tracker import TrackState, STrack, TrackFeatureBank
 from .base_jde_tracker import joint_stracks, sub_stracks, remove_duplicate_stracks
 
 from ppdet.core.workspace import register, serializable
@@ -98,12 +98,16 @@ class JDETracker(object):
         self.input_size = input_size
         if motion == 'KalmanFilter':
             self.motion = KalmanFilter()
+        # batched Kalman filter states of tracked and lost tracks
+        self.state_store = KalmanStateStore(self.motion)
         self.metric_type = metric_type
 
         self.frame_id = 0
         self.tracked_tracks_dict = defaultdict(list)  # dict(list[STrack])
         self.lost_tracks_dict = defaultdict(list)  # dict(list[STrack])
         self.removed_tracks_dict = defaultdict(list)  # dict(list[STrack])
+        # smooth features of tracked and lost tracks
+        self.feat_banks_dict = defaultdict(TrackFeatureBank)
 
         self.max_time_lost = 0
         # max_time_lost will be calculated: int(frame_rate / 30.0 * track_buffer)
@@ -198,10 +202,14 @@ class JDETracker(object):
                 matches, u_track, u_detection = matching.linear_assignment(
                     dists, thresh=self.match_thres)  # not self.tracked_thresh
             else:
+                # rows of pred_embs_cls are L2 normalized in place by STrack
                 dists = matching.embedding_distance(
                     track_pool_dict[cls_id],
                     detections,
-                    metric=self.metric_type)
+                    metric=self.metric_type,
+                    track_features=self.feat_banks_dict[cls_id].gather(
+                        track_pool_dict[cls_id]),
+                    det_features=pred_embs_cls)
                 dists = matching.fuse_motion(
                     self.motion, dists, track_pool_dict[cls_id], detections)
                 matches, u_track, u_detection = matching.linear_assignment(
@@ -307,7 +315,7 @@ class JDETracker(object):
                 track = detections[inew]
                 if track.score < self.det_thresh:
                     continue
-                track.activate(self.motion, self.frame_id)
+                track.activate(self.motion, self.frame_id, self.state_store)
                 activated_tracks_dict[cls_id].append(track)
             """ Step 5: Update state"""
             for track in self.lost_tracks_dict[cls_id]:
@@ -334,6 +342,13 @@ class JDETracker(object):
                     self.tracked_tracks_dict[cls_id],
                     self.lost_tracks_dict[cls_id])
 
+            if pred_embs_dict[cls_id] is not None:
+                feat_bank = self.feat_banks_dict[cls_id]
+                feat_bank.update(activated_tracks_dict[cls_id] +
+                                 refined_tracks_dict[cls_id])
+                feat_bank.retain(self.tracked_tracks_dict[cls_id] +
+                                 self.lost_tracks_dict[cls_id])
+
             # get scores of lost tracks
             output_tracks_dict[cls_id] = [
                 track for track in self.tracked_tracks_dict[cls_id]
@@ -350,4 +365,11 @@ class JDETracker(object):
             logger.debug('Removed: {}'.format(
                 [track.track_id for track in removed_tracks_dict[cls_id]]))
 
+        # release states of removed and dropped tracks
+        self.state_store.retain([
+            track
+            for cls_id in range(self.num_classes)
+            for track in self.tracked_tracks_dict[cls_id] +
+            self.lost_tracks_dict[cls_id]
+        ])
         return output_tracks_dict
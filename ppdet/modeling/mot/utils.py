@@ -17,6 +17,7 @@ import cv2
 import time
 import numpy as np
 from .visualization import plot_tracking_dict, plot_tracking
+from ppdet.utils.video_sink import scale_tlwhs
 
 __all__ = [
     'MOTTimer',
@@ -152,13 +153,19 @@ def save_vis_results(data,
                      average_time,
                      show_image,
                      save_dir,
-                     num_classes=1):
-    if show_image or save_dir is not None:
+                     num_classes=1,
+                     video_sink=None):
+    if show_image or save_dir is not None or video_sink is not None:
         assert 'ori_image' in data
         img0 = data['ori_image'].numpy()[0]
+        # draw on the downscaled copy of the video sink
+        scale = video_sink.scale if video_sink is not None else 1.
+        if scale != 1.:
+            img0 = video_sink.resize(img0)
         if online_ids is None:
             online_im = img0
         else:
+            online_tlwhs = scale_tlwhs(online_tlwhs, scale)
             if isinstance(online_tlwhs, dict):
                 online_im = plot_tracking_dict(
                     img0,
@@ -181,6 +188,8 @@ def save_vis_results(data,
     if save_dir is not None:
         cv2.imwrite(
             os.path.join(save_dir, '{:05d}.jpg'.format(frame_id)), online_im)
+    if video_sink is not None:
+        video_sink.write(online_im)
 
 
 def load_det_results(det_file, num_frames):
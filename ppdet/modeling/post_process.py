@@ -185,12 +185,23 @@ class MaskPostProcess(object):
     https://github.com/facebookresearch/detectron2/layers/mask_ops.py
 
     Get Mask output according to the output from model
+
+    Args:
+        binary_thresh (float): threshold to binarize the pasted masks
+        export_onnx (bool): whether to export for onnx
+        paste_in_box (bool): whether to paste each mask in its padded box
+            only instead of the whole image, see `paste_mask_in_box`. The
+            exported model outputs the mask probabilities in this mode, and
+            they are pasted in boxes by deploy.
     """
 
-    def __init__(self, binary_thresh=0.5, export_onnx=False):
+    def __init__(self, binary_thresh=0.5, export_onnx=False,
+                 paste_in_box=False):
         super(MaskPostProcess, self).__init__()
         self.binary_thresh = binary_thresh
         self.export_onnx = export_onnx
+        self.paste_in_box = paste_in_box
+        self.mask_box = None
 
     def paste_mask(self, masks, boxes, im_h, im_w):
         """
@@ -215,6 +226,76 @@ class MaskPostProcess(object):
         img_masks = F.grid_sample(masks, grid, align_corners=False)
         return img_masks[:, 0]
 
+    def paste_mask_in_box(self, mask_out, bboxes, bbox_num, origin_shape):
+        """
+        Paste the mask predictions in their boxes padded by the reach of
+        bilinear sampling, so the pixels out of the windows are 0 as in
+        `paste_mask`. The windows are grouped by their sizes rounded up to
+        powers of 2, and masks of a group are pasted by one grid_sample.
+
+        Returns:
+            pred_result (Tensor): the binary masks in uint8 of all windows,
+                flattened and concatenated.
+            mask_box (Tensor): [N, 8] in int64, the window x0, y0, x1, y1,
+                origin image h, w, offset of the window in pred_result and
+                its row stride.
+        """
+        num_mask, mask_h, mask_w = mask_out.shape
+        boxes = bboxes[:, 2:].numpy().astype('float64')
+        # origin shape of the image of each mask
+        im_hw = np.repeat(
+            origin_shape.numpy(), bbox_num.numpy(), axis=0).astype('int64')
+        box_w = boxes[:, 2] - boxes[:, 0]
+        box_h = boxes[:, 3] - boxes[:, 1]
+        pad_x = box_w / (2. * mask_w) + 1
+        pad_y = box_h / (2. * mask_h) + 1
+        win = np.stack(
+            [
+                np.floor(boxes[:, 0] - pad_x), np.floor(boxes[:, 1] - pad_y),
+                np.ceil(boxes[:, 2] + pad_x), np.ceil(boxes[:, 3] + pad_y)
+            ],
+            axis=1)
+        win = np.nan_to_num(win)
+        im_max = np.stack([im_hw[:, 1], im_hw[:, 0]] * 2, axis=1)
+        win = np.clip(win, 0, im_max).astype('int64')
+        win_hw = np.stack([win[:, 3] - win[:, 1], win[:, 2] - win[:, 0]], 1)
+        bucket = 2**np.ceil(np.log2(np.maximum(win_hw, 16))).astype('int64')
+
+        mask_box = np.zeros((num_mask, 8), dtype='int64')
+        mask_box[:, :4] = win
+        mask_box[:, 4:6] = im_hw
+        pred_result = []
+        offset = 0
+        buckets, group = np.unique(bucket, axis=0, return_inverse=True)
+        for g, (bucket_h, bucket_w) in enumerate(buckets.tolist()):
+            idx = np.nonzero(group.reshape([-1]) == g)[0]
+            index = paddle.to_tensor(idx)
+            masks = paddle.gather(mask_out, index)[:, None, :, :]
+            x0, y0, x1, y1 = paddle.split(
+                paddle.gather(bboxes[:, 2:], index), 4, axis=1)
+            origin = paddle.to_tensor(win[idx, :2].astype('float32'))
+            img_x = origin[:, 0:1] + paddle.arange(
+                bucket_w, dtype='float32') + 0.5
+            img_y = origin[:, 1:2] + paddle.arange(
+                bucket_h, dtype='float32') + 0.5
+            img_x = (img_x - x0) / (x1 - x0) * 2 - 1
+            img_y = (img_y - y0) / (y1 - y0) * 2 - 1
+            N = idx.shape[0]
+            gx = img_x[:, None, :].expand([N, bucket_h, bucket_w])
+            gy = img_y[:, :, None].expand([N, bucket_h, bucket_w])
+            grid = paddle.stack([gx, gy], axis=3)
+            pred_mask = F.grid_sample(masks, grid, align_corners=False)
+            pred_mask = paddle.cast(pred_mask >= self.binary_thresh, 'uint8')
+            pred_result.append(pred_mask.reshape([-1]))
+            mask_box[idx, 6] = offset + np.arange(N) * bucket_h * bucket_w
+            mask_box[idx, 7] = bucket_w
+            offset += N * bucket_h * bucket_w
+        pred_result = paddle.concat(pred_result)
+        return pred_result, paddle.to_tensor(mask_box)
+
+    def get_mask_box(self):
+        return self.mask_box
+
     def __call__(self, mask_out, bboxes, bbox_num, origin_shape):
         """
         Decode the mask_out and paste the mask to the origin image.
@@ -229,12 +310,22 @@ class MaskPostProcess(object):
                 shape is [N, 2], and each row is [h, w].
         Returns:
             pred_result (Tensor): The final prediction mask results with shape
-                [N, h, w] in binary mask style.
+                [N, h, w] in binary mask style. If paste_in_box, the binary
+                masks in boxes flattened in uint8, whose windows are got by
+                `get_mask_box`.
         """
         num_mask = mask_out.shape[0]
         origin_shape = paddle.cast(origin_shape, 'int32')
+        self.mask_box = None
 
-        if self.export_onnx:
+        if self.paste_in_box and not self.export_onnx:
+            if not paddle.in_dynamic_mode():
+                # pasted in boxes by deploy
+                return mask_out
+            pred_result, self.mask_box = self.paste_mask_in_box(
+                mask_out, bboxes, bbox_num, origin_shape)
+
+        elif self.export_onnx:
             h, w = origin_shape[0][0], origin_shape[0][1]
             mask_onnx = self.paste_mask(mask_out[:, None, :, :], bboxes[:, 2:],
                                         h, w)
@@ -253,7 +344,6 @@ class MaskPostProcess(object):
                 mask_out_i = mask_out[id_start:id_start + bbox_num[i], :, :]
                 im_h = origin_shape[i, 0]
                 im_w = origin_shape[i, 1]
-                bbox_num_i = bbox_num[id_start]
                 pred_mask = self.paste_mask(mask_out_i[:, None, :, :],
                                             bboxes_i[:, 2:], im_h, im_w)
                 pred_mask = paddle.cast(pred_mask >= self.binary_thresh,
@@ -0,0 +1,285 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import math
+import unittest
+
+import numpy as np
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.data.transform.batch_operators import Gt2FCOSTarget, Gt2GFLTarget
+from ppdet.data.transform.batch_operators import Gt2TTFTarget, Gt2CenterNetTarget
+from ppdet.data.transform.atss_assigner import ATSSAssigner, bbox_overlaps, topk_
+from ppdet.data.transform.op_helper import gaussian_radius, draw_umich_gaussian
+from ppdet.modeling.keypoint_utils import get_affine_transform, affine_transform
+
+
+def fcos_target_per_point(op, sample):
+    h, w = sample['image'].shape[1:3]
+    bboxes, gt_class = sample['gt_bbox'], sample['gt_class']
+    target = {}
+    for lvl, (stride, (lower, upper)) in enumerate(
+            zip(op.downsample_ratios, op.object_sizes_of_interest)):
+        radius = np.float32(op.center_sampling_radius * stride)
+        grid_h, grid_w = int(np.ceil(h / stride)), int(np.ceil(w / stride))
+        labels = np.zeros((grid_h, grid_w, 1), dtype=gt_class.dtype)
+        reg = np.zeros((grid_h, grid_w, 4), dtype=np.float32)
+        ctn = np.zeros((grid_h, grid_w, 1), dtype=np.float32)
+        for i, j in np.ndindex(grid_h, grid_w):
+            x = np.float32(j * stride + stride // 2)
+            y = np.float32(i * stride + stride // 2)
+            min_area, best = np.inf, 0
+            for k, (x0, y0, x1, y1) in enumerate(bboxes):
+                res = [x - x0, y - y0, x1 - x, y1 - y]
+                area = (x1 - x0) * (y1 - y0)
+                if op.center_sampling_radius > 0:
+                    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+                    x0, y0 = max(x0, cx - radius), max(y0, cy - radius)
+                    x1, y1 = min(x1, cx + radius), min(y1, cy + radius)
+                inside = min(x - x0, y - y0, x1 - x, y1 - y) > 0
+                if inside and lower < max(res) < upper and area < min_area:
+                    min_area, best = area, k
+            x0, y0, x1, y1 = bboxes[best]
+            l, t, r, b = x - x0, y - y0, x1 - x, y1 - y
+            reg[i, j] = [l, t, r, b]
+            if min_area < np.inf:
+                labels[i, j] = gt_class[best] + 1
+                ctn[i, j] = np.sqrt(
+                    (min(l, r) / max(l, r)) * (min(t, b) / max(t, b)))
+        target['reg_target{}'.format(lvl)] = reg / stride \
+            if op.norm_reg_targets else reg
+        target['labels{}'.format(lvl)] = labels
+        target['centerness{}'.format(lvl)] = ctn
+    return target
+
+
+def atss_assign_dense(assigner, bboxes, num_level_bboxes, gt_bboxes):
+    """ATSS assignment with dense [bboxes, gts] iou and distances."""
+    num_bboxes, num_gt = bboxes.shape[0], gt_bboxes.shape[0]
+    overlaps = bbox_overlaps(bboxes, gt_bboxes)
+    bboxes_ct = (bboxes[:, :2] + bboxes[:, 2:]) / 2.0
+    gt_ct = (gt_bboxes[:, :2] + gt_bboxes[:, 2:]) / 2.0
+    distances = np.sqrt(
+        np.power(bboxes_ct[:, None, :] - gt_ct[None, :, :], 2).sum(-1))
+    candidate_idxs = []
+    start = 0
+    for num in num_level_bboxes:
+        _, idxs = topk_(
+            distances[start:start + num],
+            min(assigner.topk, num),
+            axis=0,
+            largest=False)
+        candidate_idxs.append(idxs + start)
+        start += num
+    candidate_idxs = np.concatenate(candidate_idxs, axis=0)
+    gt_idxs = np.broadcast_to(np.arange(num_gt), candidate_idxs.shape)
+    candidate_overlaps = overlaps[candidate_idxs, gt_idxs]
+    thr = candidate_overlaps.mean(0) + candidate_overlaps.std(0)
+    cx, cy = bboxes_ct[candidate_idxs, 0], bboxes_ct[candidate_idxs, 1]
+    is_in_gts = np.minimum(
+        np.minimum(cx - gt_bboxes[:, 0], cy - gt_bboxes[:, 1]),
+        np.minimum(gt_bboxes[:, 2] - cx, gt_bboxes[:, 3] - cy)) > 0.01
+    is_pos = (candidate_overlaps >= thr) & is_in_gts
+    overlaps_inf = np.full((num_bboxes, num_gt), -np.inf)
+    overlaps_inf[candidate_idxs[is_pos], gt_idxs[is_pos]] = \
+        overlaps[candidate_idxs[is_pos], gt_idxs[is_pos]]
+    max_overlaps = overlaps_inf.max(axis=1)
+    assigned_gt_inds = np.where(max_overlaps != -np.inf,
+                                overlaps_inf.argmax(axis=1) + 1, 0)
+    return assigned_gt_inds, max_overlaps
+
+
+def ttf_target_per_box(op, sample):
+    feat_size = sample['image'].shape[1] // op.down_ratio
+    heatmap = np.zeros(
+        (op.num_classes, feat_size, feat_size), dtype='float32')
+    box_target = np.ones((4, feat_size, feat_size), dtype='float32') * -1
+    reg_weight = np.zeros((1, feat_size, feat_size), dtype='float32')
+    gt_bbox, gt_class = sample['gt_bbox'], sample['gt_class']
+    areas_log = np.log((gt_bbox[:, 2] - gt_bbox[:, 0] + 1) *
+                       (gt_bbox[:, 3] - gt_bbox[:, 1] + 1))
+    # from the largest box to the smallest
+    for k in np.argsort(areas_log, axis=0)[::-1]:
+        box = gt_bbox[k]
+        feat_box = np.clip(box / op.down_ratio, 0, feat_size - 1)
+        ct = np.array([(box[0] + box[2]) / 2,
+                       (box[1] + box[3]) / 2]) / op.down_ratio
+        fake_heatmap = np.zeros((feat_size, feat_size), dtype='float32')
+        op.draw_truncate_gaussian(
+            fake_heatmap, ct, int((feat_box[3] - feat_box[1]) / 2. * op.alpha),
+            int((feat_box[2] - feat_box[0]) / 2. * op.alpha))
+        cls = gt_class[k, 0]
+        heatmap[cls] = np.maximum(heatmap[cls], fake_heatmap)
+        inds = fake_heatmap > 0
+        box_target[:, inds] = box[:, None]
+        local_heatmap = fake_heatmap[inds]
+        reg_weight[0, inds] = local_heatmap * areas_log[k] / np.sum(
+            local_heatmap)
+    return {
+        'ttf_heatmap': heatmap,
+        'ttf_box_target': box_target,
+        'ttf_reg_weight': reg_weight
+    }
+
+
+def centernet_target_per_box(op, sample):
+    output_h, output_w = [s // op.down_ratio for s in sample['image'].shape[1:]]
+    hm = np.zeros((op.num_classes, output_h, output_w), dtype=np.float32)
+    wh = np.zeros((op.max_objs, 2), dtype=np.float32)
+    reg = np.zeros((op.max_objs, 2), dtype=np.float32)
+    ind = np.zeros((op.max_objs), dtype=np.int64)
+    reg_mask = np.zeros((op.max_objs), dtype=np.int32)
+    s = sample['scale']
+    trans = get_affine_transform(sample['center'], [s, s], 0,
+                                 [output_w, output_h])
+    for i, (bbox, cls) in enumerate(
+            zip(sample['gt_bbox'].copy(), sample['gt_class'])):
+        bbox[:2] = affine_transform(bbox[:2], trans)
+        bbox[2:] = affine_transform(bbox[2:], trans)
+        bbox[[0, 2]] = np.clip(bbox[[0, 2]], 0, output_w - 1)
+        bbox[[1, 3]] = np.clip(bbox[[1, 3]], 0, output_h - 1)
+        h, w = bbox[3] - bbox[1], bbox[2] - bbox[0]
+        if h > 0 and w > 0:
+            radius = gaussian_radius((math.ceil(h), math.ceil(w)), 0.7)
+            ct = np.array(
+                [(bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2],
+                dtype=np.float32)
+            ct_int = ct.astype(np.int32)
+            draw_umich_gaussian(hm[int(cls[0])], ct_int, max(0, int(radius)))
+            wh[i] = w, h
+            ind[i] = ct_int[1] * output_w + ct_int[0]
+            reg[i] = ct - ct_int
+            reg_mask[i] = 1
+    return {
+        'heatmap': hm,
+        'index_mask': reg_mask,
+        'index': ind,
+        'size': wh,
+        'offset': reg
+    }
+
+
+def make_boxes(rng, num_gts, h, w, num_classes):
+    wh = np.exp(rng.uniform(np.log(8), np.log(min(h, w) * 0.8), (num_gts, 2)))
+    xy = rng.rand(num_gts, 2) * (np.array([w, h]) - wh)
+    gt_bbox = np.concatenate([xy, xy + wh], axis=1).astype(np.float32)
+    # a repeated box
+    gt_bbox[-1] = gt_bbox[0]
+    gt_class = rng.randint(0, num_classes, (num_gts, 1)).astype(np.int32)
+    return gt_bbox, gt_class
+
+
+def make_samples(rng, batch_size, h, w, num_gts=8, num_classes=5):
+    samples = []
+    for _ in range(batch_size):
+        gt_bbox, gt_class = make_boxes(rng, num_gts, h, w, num_classes)
+        samples.append({
+            'image': np.zeros(
+                (3, h, w), dtype=np.float32),
+            'gt_bbox': gt_bbox,
+            'gt_class': gt_class,
+        })
+    return samples
+
+
+def copy_samples(samples):
+    return [{k: np.copy(v) for k, v in s.items()} for s in samples]
+
+
+class TestAnchorFreeTarget(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+
+    def assert_target_equal(self, sample, expect):
+        for k, v in expect.items():
+            self.assertEqual(sample[k].dtype, v.dtype, k)
+            np.testing.assert_array_equal(sample[k], v, err_msg=k)
+
+    def test_fcos_target(self):
+        samples = make_samples(self.rng, 2, 96, 128)
+        for radius, norm in [(1.5, True), (0., False)]:
+            op = Gt2FCOSTarget(
+                object_sizes_boundary=[16, 32, 64, 128],
+                center_sampling_radius=radius,
+                downsample_ratios=[8, 16, 32, 64, 128],
+                norm_reg_targets=norm)
+            for sample, expect in zip(
+                    op(copy_samples(samples)),
+                [fcos_target_per_point(op, s) for s in samples]):
+                self.assertNotIn('gt_bbox', sample)
+                self.assert_target_equal(sample, expect)
+
+    def test_atss_assigner(self):
+        h, w = 96, 128
+        # each level has more cells than topk of the assigner
+        strides = [8, 16, 32]
+        grid_cells = [
+            Gt2GFLTarget.get_grid_cells((int(math.ceil(h / s)), int(
+                math.ceil(w / s))), 8, s) for s in strides
+        ]
+        num_level_cells = [len(cells) for cells in grid_cells]
+        grid_cells = np.concatenate(grid_cells)
+        assigner = ATSSAssigner()
+        for sample in make_samples(self.rng, 4, h, w):
+            assigned, max_overlaps = assigner(grid_cells, num_level_cells,
+                                              sample['gt_bbox'])
+            expect, expect_overlaps = atss_assign_dense(
+                assigner, grid_cells, num_level_cells, sample['gt_bbox'])
+            self.assertGreater(np.sum(expect > 0), 0)
+            np.testing.assert_array_equal(assigned, expect)
+            np.testing.assert_array_equal(max_overlaps, expect_overlaps)
+
+        op = Gt2GFLTarget(downsample_ratios=strides, grid_cell_scale=8)
+        samples = op(make_samples(self.rng, 2, h, w))
+        for sample in samples:
+            np.testing.assert_array_equal(sample['grid_cells'], grid_cells)
+        # grid cells are cached and shared by samples, so read only
+        self.assertFalse(samples[0]['grid_cells'].flags.writeable)
+
+    def test_ttf_target(self):
+        samples = make_samples(self.rng, 3, 128, 128)
+        op = Gt2TTFTarget(num_classes=5, down_ratio=4)
+        for sample, expect in zip(
+                op(copy_samples(samples)),
+            [ttf_target_per_box(op, s) for s in samples]):
+            self.assert_target_equal(sample, expect)
+
+    def test_centernet_target(self):
+        op = Gt2CenterNetTarget(down_ratio=4, num_classes=5, max_objs=16)
+        for _ in range(3):
+            ori_h, ori_w = self.rng.randint(150, 300, 2)
+            sample = make_samples(self.rng, 1, ori_h, ori_w)[0]
+            sample['image'] = np.zeros((3, 128, 128), dtype=np.float32)
+            sample['center'] = np.array(
+                [ori_w / 2., ori_h / 2.], dtype=np.float32)
+            sample['scale'] = max(ori_h, ori_w) * self.rng.uniform(0.6, 1.4)
+            # a box of zero width is ignored
+            sample['gt_bbox'][1, 2] = sample['gt_bbox'][1, 0]
+            expect = centernet_target_per_box(op, sample)
+            self.assertEqual(expect['index_mask'][1], 0)
+            self.assert_target_equal(op(sample), expect)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.data.cache_utils import SharedImageCache
+
+
+class TestSharedImageCache(unittest.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.cache_root = os.path.join(self.save_dir, 'cache')
+        self.rng = np.random.RandomState(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def make_image(self):
+        return self.rng.randint(0, 256, (8, 6, 3)).astype(np.uint8)
+
+    def entry_size(self):
+        return self.make_image().nbytes + 128  # header of .npy
+
+    def test_put_get(self):
+        cache = SharedImageCache(self.cache_root, flush_iter=1)
+        im = self.make_image()
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', im)
+        cached = cache.get('a')
+        self.assertEqual(cached.dtype, im.dtype)
+        np.testing.assert_array_equal(cached, im)
+        # put again is ignored
+        cache.put('a', self.make_image())
+        np.testing.assert_array_equal(cache.get('a'), im)
+        # larger than the budget
+        cache.put('b', np.zeros((cache.cache_size + 1, ), dtype=np.uint8))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats(), {
+            'hits': 2,
+            'misses': 2,
+            'hit_rate': 0.5,
+            'bytes': self.entry_size(),
+            'entries': 1,
+        })
+        # stats file is kept by caches of the same cache_root
+        self.assertEqual(
+            SharedImageCache(self.cache_root).stats(), cache.stats())
+        self.assertEqual(pickle.loads(pickle.dumps(cache)).stats(),
+                         cache.stats())
+
+    def test_key(self):
+        im_file = os.path.join(self.save_dir, '0.jpg')
+        with open(im_file, 'wb') as f:
+            f.write(b'0' * 10)
+        key = SharedImageCache.key(im_file)
+        self.assertEqual(SharedImageCache.key(im_file), key)
+        # same size, modified time changed
+        st = os.stat(im_file)
+        os.utime(im_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        mtime_key = SharedImageCache.key(im_file)
+        self.assertNotEqual(mtime_key, key)
+        # same modified time, size changed
+        mtime_ns = os.stat(im_file).st_mtime_ns
+        with open(im_file, 'ab') as f:
+            f.write(b'0')
+        os.utime(im_file, ns=(mtime_ns, mtime_ns))
+        self.assertNotEqual(SharedImageCache.key(im_file), mtime_key)
+        self.assertNotEqual(SharedImageCache.key(im_file), key)
+
+    def test_evict(self):
+        size = self.entry_size()
+        cache = SharedImageCache(
+            self.cache_root, cache_size=int(size * 3.5), low_watermark=0.6)
+        for key in ['a', 'b', 'c']:
+            cache.put(key, self.make_image())
+        self.assertEqual(cache.stats()['entries'], 3)
+        # touched in order b, c, a
+        for i, key in enumerate(['b', 'c', 'a']):
+            os.utime(cache._entry_path(key), ns=(10**9 * i, 10**9 * i))
+        # held bytes exceed cache_size, evicted to 0.6 * cache_size
+        cache.put('d', self.make_image())
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNone(cache.get('c'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('d'))
+        stats = cache.stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['bytes'], 2 * size)
+        self.assertLessEqual(stats['bytes'], 0.6 * cache.cache_size)
+
+    def test_fork(self):
+        cache = SharedImageCache(self.cache_root, flush_iter=1)
+        cache.put('a', self.make_image())
+        cache.get('a')
+        pid = os.fork()
+        if pid == 0:
+            # the lock and stats file are reopened in the child
+            try:
+                cache.get('a')
+                cache.get('b')
+                cache.put('b', self.make_image())
+                cache.get('b')
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        cache.get('c')
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['bytes'], 2 * self.entry_size())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.data.source.coco import COCODataSet
+
+DATA_FIELDS = [
+    'image', 'gt_bbox', 'gt_class', 'is_crowd', 'gt_poly', 'gt_rbox'
+]
+
+
+def box_ann(ann_id, img_id, bbox, cat_id=1, segm=None, iscrowd=0):
+    ann = {
+        'id': ann_id,
+        'image_id': img_id,
+        'category_id': cat_id,
+        'bbox': bbox,
+        'area': 100.,
+        'iscrowd': iscrowd,
+    }
+    if segm is not None:
+        ann['segmentation'] = segm
+    return ann
+
+
+class TestCOCODataSet(unittest.TestCase):
+    def setUp(self):
+        self.dataset_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.dataset_dir, 'images'))
+        images = []
+        for img_id in [1, 2, 3, 4]:
+            file_name = '{}.jpg'.format(img_id)
+            open(os.path.join(self.dataset_dir, 'images', file_name),
+                 'w').close()
+            images.append({
+                'id': img_id,
+                'file_name': file_name,
+                'width': 64,
+                'height': 48
+            })
+        # image 2 is repeated, the last entry is taken
+        images.insert(0, dict(images[1], width=32))
+        poly = [[1., 1., 9., 1., 9., 9., 1., 9.]]
+        self.anns = [
+            # boxes with coordinates rounded differently by np.round
+            box_ann(1, 1, [0.0005, 1.0015, 2.0025, 3.0035]),
+            box_ann(2, 1, [10.1235, 5.55550, 0.3335, 7.7775], cat_id=3),
+            box_ann(3, 1, [1., 1., 5., 5.], iscrowd=1),
+            # an rbox followed by an invalid box, the image has no rboxes as
+            # the last annotation with a box decides
+            box_ann(4, 2, [20., 20., 10., 8., 0.5]),
+            box_ann(5, 2, [20., 20., 10., 0.]),
+            # image 3 has an instance with empty polygons only
+            box_ann(6, 3, [1., 1., 8., 8.], segm=poly),
+            box_ann(7, 3, [2., 2., 8., 8.], segm=[[]], cat_id=3),
+            box_ann(8, 3, [3., 3., 8., 8.], segm=poly, cat_id=3),
+            # image 4 only has invalid boxes
+            box_ann(9, 4, [3., 3., 0., 8.]),
+        ]
+        dataset = {
+            'images': images,
+            'annotations': self.anns,
+            'categories': [{
+                'id': 1,
+                'name': 'a'
+            }, {
+                'id': 3,
+                'name': 'b'
+            }]
+        }
+        with open(os.path.join(self.dataset_dir, 'anno.json'), 'w') as f:
+            json.dump(dataset, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.dataset_dir)
+
+    def parse(self, **kwargs):
+        dataset = COCODataSet(
+            dataset_dir=self.dataset_dir,
+            image_dir='images',
+            anno_path='anno.json',
+            data_fields=DATA_FIELDS,
+            **kwargs)
+        dataset.parse_dataset()
+        return dataset
+
+    def check_records(self, dataset):
+        self.assertEqual(dataset.catid2clsid, {1: 0, 3: 1})
+        self.assertEqual(dataset.cname2cid, {'a': 0, 'b': 1})
+        records = {int(r['im_id'][0]): r for r in dataset.roidbs}
+        self.assertEqual(sorted(records.keys()), [1, 2, 3])
+
+        rec = records[1]
+        expect = []
+        for ann in self.anns[:2]:
+            x1, y1, w, h = ann['bbox']
+            expect.append(
+                [round(float(x), 3) for x in [x1, y1, x1 + w, y1 + h]])
+        np.testing.assert_array_equal(rec['gt_bbox'],
+                                      np.array(expect, dtype=np.float32))
+        np.testing.assert_array_equal(rec['gt_class'], [[0], [1]])
+        np.testing.assert_array_equal(rec['is_crowd'], [[0], [0]])
+        self.assertNotIn('gt_rbox', rec)
+
+        rec = records[2]
+        self.assertEqual(rec['w'], 64.)
+        np.testing.assert_array_equal(rec['gt_bbox'], [[15., 16., 25., 24.]])
+        self.assertNotIn('gt_rbox', rec)
+
+        rec = records[3]
+        np.testing.assert_array_equal(rec['gt_bbox'],
+                                      [[1., 1., 9., 9.], [3., 3., 11., 11.]])
+        np.testing.assert_array_equal(rec['gt_class'], [[0], [1]])
+        self.assertEqual(rec['gt_poly'], [self.anns[5]['segmentation']] * 2)
+
+    def test_parse(self):
+        self.check_records(self.parse())
+
+    def test_cache(self):
+        cache_dir = os.path.join(self.dataset_dir, 'cache')
+        self.check_records(self.parse(cache_dir=cache_dir))
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        # loaded from the cache
+        self.check_records(self.parse(cache_dir=cache_dir))
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import copy
+import json
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+import numpy as np
+import pycocotools.mask as mask_util
+from pycocotools.coco import COCO
+from pycocotools.cocoeval import COCOeval
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.metrics.coco_results import COCOResults, IncrementalCOCOEval
+
+IM_SIZE = 64
+
+
+def make_coco_gt(rng, num_images=6, num_cats=3):
+    images, annotations = [], []
+    for img_id in range(1, num_images + 1):
+        images.append({'id': img_id, 'height': IM_SIZE, 'width': IM_SIZE})
+        for _ in range(rng.randint(0, 5)):
+            x, y = rng.randint(0, IM_SIZE // 2, size=2)
+            w, h = rng.randint(4, IM_SIZE // 2, size=2)
+            annotations.append({
+                'id': len(annotations) + 1,
+                'image_id': img_id,
+                'category_id': int(rng.randint(1, num_cats + 1)),
+                'bbox': [float(x), float(y), float(w), float(h)],
+                'segmentation':
+                [[x, y, x + w, y, x + w, y + h, x, y + h]],
+                'area': float(w * h),
+                'iscrowd': int(rng.rand() < 0.1),
+            })
+    coco_gt = COCO()
+    coco_gt.dataset = {
+        'images': images,
+        'annotations': annotations,
+        'categories': [{
+            'id': i
+        } for i in range(1, num_cats + 1)]
+    }
+    with contextlib.redirect_stdout(None):
+        coco_gt.createIndex()
+    return coco_gt
+
+
+def make_results(coco_gt, rng, num_dets=3):
+    """Results of each image as get_infer_results, jittered from gt."""
+    results = {}
+    for img_id in coco_gt.getImgIds():
+        img_results = []
+        anns = coco_gt.loadAnns(coco_gt.getAnnIds(imgIds=[img_id]))
+        for ann in anns + anns[:1]:
+            for _ in range(num_dets):
+                x, y, w, h = np.array(ann['bbox']) + rng.randn(4) * 2
+                x, y = max(x, 0.), max(y, 0.)
+                w, h = max(w, 1.), max(h, 1.)
+                mask = np.zeros((IM_SIZE, IM_SIZE), dtype=np.uint8)
+                mask[int(y):int(y + h), int(x):int(x + w)] = 1
+                rle = mask_util.encode(np.asfortranarray(mask))
+                rle['counts'] = rle['counts'].decode('utf8')
+                img_results.append({
+                    'image_id': img_id,
+                    'category_id': int(rng.choice([ann['category_id'], 1])),
+                    'bbox': [float(x), float(y), float(w), float(h)],
+                    'segmentation': rle,
+                    'score': float(rng.rand()),
+                })
+        results[img_id] = img_results
+    return results
+
+
+class TestCOCOResults(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.coco_gt = make_coco_gt(rng)
+        self.results = make_results(self.coco_gt, rng)
+        self.save_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def all_results(self):
+        return [r for rs in self.results.values() for r in rs]
+
+    def test_round_trip(self):
+        expect = self.all_results()
+        results = COCOResults()
+        self.assertEqual(results.to_list(), [])
+        for img_results in self.results.values():
+            results.extend(img_results)
+        self.assertEqual(len(results), len(expect))
+        self.assertEqual(results.to_list(), expect)
+        img_ids = [2, 5]
+        self.assertEqual(
+            results.select(img_ids),
+            [r for r in expect if r['image_id'] in img_ids])
+
+        json_file = os.path.join(self.save_dir, 'bbox.json')
+        results.dump_json(json_file, chunk_size=4)
+        with open(json_file) as f:
+            self.assertEqual(json.load(f), expect)
+
+        npz_file = os.path.join(self.save_dir, 'bbox.npz')
+        results.save(npz_file)
+        loaded = COCOResults.load(npz_file)
+        self.assertEqual(loaded.to_list(), expect)
+        # extended after loaded
+        loaded.extend(expect[:2])
+        self.assertEqual(loaded.to_list(), expect + expect[:2])
+
+    def test_empty_round_trip(self):
+        results = COCOResults()
+        json_file = os.path.join(self.save_dir, 'bbox.json')
+        results.dump_json(json_file)
+        with open(json_file) as f:
+            self.assertEqual(json.load(f), [])
+        npz_file = os.path.join(self.save_dir, 'bbox.npz')
+        results.save(npz_file)
+        self.assertEqual(COCOResults.load(npz_file).to_list(), [])
+
+    def coco_eval_stats(self, results, iou_type):
+        with contextlib.redirect_stdout(None):
+            coco_dt = self.coco_gt.loadRes(copy.deepcopy(results))
+            coco_eval = COCOeval(self.coco_gt, coco_dt, iou_type)
+            coco_eval.evaluate()
+            coco_eval.accumulate()
+            coco_eval.summarize()
+        return coco_eval.stats
+
+    def incremental_eval_stats(self, results, iou_type):
+        coco_eval = IncrementalCOCOEval(self.coco_gt, iou_type)
+        img_ids = sorted(self.results.keys())
+        # the first image has no results, the last is updated twice
+        for img_id in img_ids[1:]:
+            results.extend(self.results[img_id])
+            coco_eval.update(copy.deepcopy(self.results[img_id]))
+        again = self.results[img_ids[-1]][:2]
+        results.extend(again)
+        coco_eval.update(copy.deepcopy(again))
+        self.assertIn(img_ids[-1], coco_eval.deferred)
+
+        with contextlib.redirect_stdout(None):
+            coco_eval = coco_eval.evaluate(results)
+            coco_eval.accumulate()
+            coco_eval.summarize()
+        return coco_eval.stats
+
+    def test_incremental_eval(self):
+        for iou_type in ['bbox', 'segm']:
+            results = COCOResults()
+            stats = self.incremental_eval_stats(results, iou_type)
+            expect = self.coco_eval_stats(results.to_list(), iou_type)
+            self.assertGreater(expect[0], 0.)
+            np.testing.assert_array_equal(stats, expect)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import os
+import sys
+import copy
+import unittest
+import contextlib
+
+import numpy as np
+import pycocotools.mask as mask_util
+from pycocotools.coco import COCO
+from pycocotools.cocoeval import COCOeval
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.metrics.coco_utils import parallel_evaluate
+
+IM_SIZE = 64
+NUM_KPTS = 17
+
+
+def make_coco_gt(rng, num_images=13, num_cats=3):
+    images, annotations = [], []
+    for img_id in rng.permutation(num_images) + 1:
+        images.append({'id': int(img_id), 'height': IM_SIZE, 'width': IM_SIZE})
+        for _ in range(rng.randint(0, 5)):
+            x, y = rng.randint(0, IM_SIZE // 2, size=2)
+            w, h = rng.randint(4, IM_SIZE // 2, size=2)
+            kpts = np.concatenate(
+                [
+                    rng.rand(NUM_KPTS, 2) * [w, h] + [x, y],
+                    rng.randint(0, 3, size=(NUM_KPTS, 1))
+                ],
+                axis=1)
+            annotations.append({
+                'id': len(annotations) + 1,
+                'image_id': int(img_id),
+                'category_id': int(rng.randint(1, num_cats + 1)),
+                'bbox': [float(x), float(y), float(w), float(h)],
+                'segmentation': [[x, y, x + w, y, x + w, y + h, x, y + h]],
+                'keypoints': kpts.reshape(-1).tolist(),
+                'num_keypoints': int(np.sum(kpts[:, 2] > 0)),
+                'area': float(w * h),
+                'iscrowd': int(rng.rand() < 0.1),
+            })
+    coco_gt = COCO()
+    coco_gt.dataset = {
+        'images': images,
+        'annotations': annotations,
+        'categories': [{
+            'id': i
+        } for i in range(1, num_cats + 1)]
+    }
+    with contextlib.redirect_stdout(io.StringIO()):
+        coco_gt.createIndex()
+    return coco_gt
+
+
+def make_results(coco_gt, style, rng, num_dets=3):
+    """Detections of each gt jittered by its size."""
+    results = []
+    for ann in coco_gt.dataset['annotations']:
+        x, y, w, h = ann['bbox']
+        for _ in range(num_dets):
+            dx, dy, dw, dh = rng.randn(4) * 0.1
+            box = [x + dx * w, y + dy * h, w * (1 + dw), h * (1 + dh)]
+            res = {
+                'image_id': ann['image_id'],
+                'category_id': int(rng.choice([ann['category_id'], 1])),
+                'score': float(rng.rand())
+            }
+            if style == 'bbox':
+                res['bbox'] = box
+            elif style == 'segm':
+                x0, y0, x1, y1 = box[0], box[1], box[0] + box[2], box[
+                    1] + box[3]
+                rle = mask_util.merge(
+                    mask_util.frPyObjects([[x0, y0, x1, y0, x1, y1, x0, y1]],
+                                          IM_SIZE, IM_SIZE))
+                rle['counts'] = rle['counts'].decode('utf8')
+                res['segmentation'] = rle
+            else:
+                kpts = np.asarray(ann['keypoints']).reshape((-1, 3))
+                kpts[:, :2] += rng.randn(NUM_KPTS, 2) * 0.05 * (w + h)
+                kpts[:, 2] = 1
+                res['keypoints'] = kpts.reshape(-1).tolist()
+            results.append(res)
+    return results
+
+
+class TestParallelEvaluate(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+        self.coco_gt = make_coco_gt(self.rng)
+
+    def evaluate(self, results, style, num_workers, num_shards=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            coco_dt = self.coco_gt.loadRes(copy.deepcopy(results))
+            coco_eval = COCOeval(self.coco_gt, coco_dt, style)
+            if num_workers > 1:
+                parallel_evaluate(coco_eval, num_workers, num_shards)
+            else:
+                coco_eval.evaluate()
+            coco_eval.accumulate()
+            coco_eval.summarize()
+        return coco_eval
+
+    def test_same_as_evaluate(self):
+        for style in ['bbox', 'segm', 'keypoints']:
+            results = make_results(self.coco_gt, style, self.rng)
+            expect = self.evaluate(results, style, 0)
+            # default shards, uneven shards and more shards than images
+            for num_workers, num_shards in [(2, None), (3, 5), (4, 100)]:
+                coco_eval = self.evaluate(results, style, num_workers,
+                                          num_shards)
+                self.assertEqual(len(coco_eval.evalImgs),
+                                 len(expect.evalImgs))
+                for k in ['precision', 'recall', 'scores']:
+                    np.testing.assert_array_equal(coco_eval.eval[k],
+                                                  expect.eval[k])
+                np.testing.assert_array_equal(coco_eval.stats, expect.stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.modeling.mot.matching.deepsort_matching import (
+    NearestNeighborDistanceMetric, _nn_cosine_distance,
+    _nn_euclidean_distance)
+
+
+class ListDistanceMetric(object):
+    """Samples of each target in a list, the latest budget ones are kept."""
+
+    def __init__(self, metric, budget=None):
+        self._metric = _nn_cosine_distance \
+            if metric == 'cosine' else _nn_euclidean_distance
+        self.budget = budget
+        self.samples = {}
+
+    def partial_fit(self, features, targets, active_targets):
+        for feature, target in zip(features, targets):
+            self.samples.setdefault(target, []).append(feature)
+            if self.budget is not None:
+                self.samples[target] = self.samples[target][-self.budget:]
+        self.samples = {k: self.samples[k] for k in active_targets}
+
+    def distance(self, features, targets):
+        cost_matrix = np.zeros((len(targets), len(features)))
+        for i, target in enumerate(targets):
+            cost_matrix[i, :] = self._metric(self.samples[target], features)
+        return cost_matrix
+
+
+def make_frames(rng, num_tracks, num_frames, dim, death_rate=0.1):
+    """
+    Features and targets per frame, tracks die and are born, some tracks are
+    missed and some have several features in a frame.
+    """
+    next_id = num_tracks
+    tracks = list(range(num_tracks))
+    confirmed = set()
+    frames = []
+    for _ in range(num_frames):
+        dead = rng.rand(len(tracks)) < death_rate
+        born = list(range(next_id, next_id + int(dead.sum())))
+        next_id += len(born)
+        tracks = [t for t, d in zip(tracks, dead) if not d] + born
+        seen = [t for t in tracks if rng.rand() > 0.2]
+        seen += [t for t in seen if rng.rand() < 0.2] * 3
+        features = rng.randn(len(seen), dim).astype('float32')
+        confirmed.update(seen)
+        frames.append((features, np.asarray(seen, dtype=np.int64),
+                       [t for t in tracks if t in confirmed]))
+    return frames
+
+
+class TestNearestNeighborDistanceMetric(unittest.TestCase):
+    def check(self, metric, budget, capacity=4):
+        rng = np.random.RandomState(0)
+        frames = make_frames(rng, num_tracks=6, num_frames=40, dim=8)
+        expect = ListDistanceMetric(metric, budget)
+        ring = NearestNeighborDistanceMetric(
+            metric, 0.2, budget, capacity=capacity)
+        for features, targets, active_targets in frames:
+            expect.partial_fit(features, targets, active_targets)
+            ring.partial_fit(features, targets, active_targets)
+            samples = ring.samples
+            self.assertEqual(sorted(samples.keys()), sorted(expect.samples))
+            for target, target_samples in expect.samples.items():
+                if metric == 'cosine':
+                    target_samples = [
+                        s / np.linalg.norm(s) for s in target_samples
+                    ]
+                np.testing.assert_allclose(
+                    np.array(samples[target]),
+                    np.array(target_samples),
+                    rtol=1e-6,
+                    atol=1e-6)
+            np.testing.assert_allclose(
+                ring.distance(features, active_targets),
+                expect.distance(features, active_targets),
+                rtol=1e-4,
+                atol=1e-4)
+
+    def test_budget_overflow(self):
+        for metric in ['cosine', 'euclidean']:
+            self.check(metric, budget=3)
+
+    def test_no_budget(self):
+        for metric in ['cosine', 'euclidean']:
+            self.check(metric, budget=None)
+
+
+if __name__ == '__main__':
+    unittest.main()
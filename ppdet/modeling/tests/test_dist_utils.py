@@ -0,0 +1,125 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.utils import dist_utils
+from ppdet.utils.dist_utils import all_gather_object, ShardedBatchSampler
+
+
+class SimulatedRanks(object):
+    """
+    Run a function of each rank on a thread, all_gather of the ranks meet
+    at a barrier as the collective does.
+    """
+
+    def __init__(self, nranks):
+        self.nranks = nranks
+        self.barrier = threading.Barrier(nranks, timeout=60)
+        self.tensors = [None] * nranks
+        self.local = threading.local()
+
+    def all_gather(self, tensor_list, tensor):
+        self.tensors[self.local.rank] = tensor
+        self.barrier.wait()
+        tensor_list.extend(self.tensors)
+        self.barrier.wait()
+
+    def run(self, func):
+        outputs = [None] * self.nranks
+
+        def target(rank):
+            self.local.rank = rank
+            outputs[rank] = func(rank)
+
+        threads = [
+            threading.Thread(
+                target=target, args=(rank, )) for rank in range(self.nranks)
+        ]
+        with mock.patch.object(dist_utils.dist, 'all_gather', self.all_gather), \
+                mock.patch.object(dist_utils.dist, 'get_world_size',
+                                  lambda: self.nranks):
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        return outputs
+
+
+class TestShardedBatchSampler(unittest.TestCase):
+    def samplers(self, num_samples, batch_size, nranks):
+        dataset = list(range(num_samples))
+        return [
+            ShardedBatchSampler(
+                dataset, batch_size, num_replicas=nranks, rank=rank)
+            for rank in range(nranks)
+        ]
+
+    def test_shards(self):
+        for num_samples in [0, 3, 10, 17]:
+            for nranks in [1, 3, 4]:
+                shards = []
+                for sampler in self.samplers(num_samples, 2, nranks):
+                    batches = list(sampler)
+                    self.assertEqual(len(batches), len(sampler))
+                    self.assertTrue(all(0 < len(b) <= 2 for b in batches))
+                    shards.append([idx for b in batches for idx in b])
+                # disjoint shards covering the dataset in order
+                self.assertEqual([idx for s in shards for idx in s],
+                                 list(range(num_samples)))
+                sizes = [len(s) for s in shards]
+                self.assertLessEqual(max(sizes) - min(sizes), 1)
+
+    def test_gather_order(self):
+        for num_samples, nranks in [(10, 3), (17, 4), (3, 4)]:
+            samplers = self.samplers(num_samples, 3, nranks)
+
+            def eval_rank(rank):
+                # results of different sizes on each rank
+                results = [{
+                    'id': idx,
+                    'bbox': [idx] * idx
+                } for batch in samplers[rank] for idx in batch]
+                return all_gather_object(results)
+
+            gathered = SimulatedRanks(nranks).run(eval_rank)
+            expect = [{
+                'id': idx,
+                'bbox': [idx] * idx
+            } for idx in range(num_samples)]
+            for rank_results in gathered:
+                self.assertEqual(len(rank_results), nranks)
+                self.assertEqual([r for rs in rank_results for r in rs],
+                                 expect)
+
+    def test_gather_single_rank(self):
+        obj = {'a': [1, 2]}
+        self.assertEqual(all_gather_object(obj), [obj])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+from collections import defaultdict
+
+import numpy as np
+from scipy.ndimage import maximum_filter
+from scipy.optimize import linear_sum_assignment
+
+# add python path of deploy/python to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+deploy_path = os.path.join(parent_path, 'deploy', 'python')
+if deploy_path not in sys.path:
+    sys.path.append(deploy_path)
+
+from keypoint_postprocess import HrHRNetPostProcess, transpred
+
+
+def group_per_image(post_process, heats, tags, coords):
+    """Group joints of one image with lists of tags of each cluster."""
+    J = heats.shape[0]
+    cluster = defaultdict(lambda: {
+        'coords': np.zeros((J, 2), dtype=np.float32),
+        'scores': np.zeros(J, dtype=np.float32),
+        'tags': []
+    })
+    for jid, m in enumerate(heats > post_process.heat_thresh):
+        valid_inds = np.where(m)[0]
+        if len(valid_inds) == 0:
+            continue
+        if len(cluster) == 0:
+            keys = [tags[jid, i, 0] for i in valid_inds]
+        else:
+            candidates = list(cluster.keys())[:post_process.max_num_people]
+            centroids = np.array(
+                [np.mean(
+                    cluster[k]['tags'], axis=0) for k in candidates])
+            l2_dist = np.linalg.norm(
+                tags[jid, m, None, :] - centroids[None], ord=2, axis=2)
+            cost = np.round(l2_dist) * 100 - heats[jid, m, None]
+            if len(valid_inds) > len(candidates):
+                cost = np.pad(cost, ((0, 0), (0, len(valid_inds) - len(
+                    candidates))), 'constant', constant_values=1e-10)
+            rows, cols = linear_sum_assignment(cost)
+            valid_inds = valid_inds[rows]
+            keys = [
+                candidates[c] if c < len(candidates) and
+                l2_dist[r, c] < post_process.tag_thresh else tags[jid, i, 0]
+                for r, c, i in zip(rows, cols, valid_inds)
+            ]
+        for key, i in zip(keys, valid_inds):
+            cluster[key]['tags'].append(tags[jid, i])
+            cluster[key]['scores'][jid] = heats[jid, i]
+            cluster[key]['coords'][jid] = coords[jid, i]
+    return [cluster[k] for k in cluster]
+
+
+def postprocess_per_image(post_process, heatmap, tagmap, heat_k, inds_k,
+                          size):
+    """HrHRNetPostProcess of one image, joints are salvaged per person."""
+    J, H, W = heatmap.shape
+    y, x = inds_k // W, inds_k % W
+    tags = tagmap[np.arange(J)[:, None], y, x]
+    people = group_per_image(post_process, heat_k, tags,
+                             np.stack((y, x), axis=2))
+    pose_coords = np.array([p['coords'] for p in people])
+    pose_scores = np.array([p['scores'] for p in people])
+    pose_kpts = np.zeros((len(people), J, 3), dtype=np.float32)
+    valid = pose_scores > 0
+    if valid.sum() == 0:
+        return pose_kpts, pose_kpts
+
+    valid_coords = pose_coords[valid].astype(np.int32)
+    offsets = post_process.lerp(
+        np.nonzero(valid)[1], valid_coords[:, 0], valid_coords[:, 1], heatmap)
+    pose_coords[valid, 0] += offsets[0]
+    pose_coords[valid, 1] += offsets[1]
+    mean_score = pose_scores.mean(axis=1)
+    pose_kpts[valid, 2] = pose_scores[valid]
+
+    for pid, person in enumerate(people):
+        norm = np.sum((tagmap - np.mean(person['tags'], axis=0))**2, axis=3)
+        score = (heatmap - np.round(norm**0.5)).reshape(J, -1)
+        max_inds, max_scores = score.argmax(axis=1), score.max(axis=1)
+        salvage = (pose_scores[pid] == 0) & (max_scores > 0)
+        y, x = max_inds[salvage] // W, max_inds[salvage] % W
+        offsets = post_process.lerp(np.nonzero(salvage)[0], y, x, heatmap)
+        pose_coords[pid, salvage, 0] = y + offsets[0]
+        pose_coords[pid, salvage, 1] = x + offsets[1]
+        pose_kpts[pid, salvage, 2] = max_scores[salvage]
+    pose_kpts[..., :2] = transpred(pose_coords[..., ::-1], size, size,
+                                   min(H, W))
+    return pose_kpts, mean_score
+
+
+def make_outputs(rng, batch_size, num_people, num_joints, size, top_k):
+    """
+    Heatmaps with a gaussian peak for each visible joint of each person,
+    tagmaps with the tag of the person around its joints and noise
+    elsewhere, and the top k peaks of each joint as the model outputs.
+    """
+    H = W = size
+    heatmap = rng.rand(batch_size, num_joints, H, W).astype('float32') * 0.05
+    tagmap = rng.uniform(-20, 20, (batch_size, num_joints, H, W, 1))
+    tagmap = tagmap.astype('float32')
+    grid_y, grid_x = np.mgrid[:H, :W]
+    for n in range(batch_size):
+        # tags of people are apart by more than tag_thresh
+        person_tags = rng.permutation(num_people) * 3. - num_people
+        for p in range(num_people):
+            cy, cx = rng.uniform(8, H - 8, 2)
+            for j in range(num_joints):
+                if rng.rand() < 0.15:  # invisible
+                    continue
+                y = int(np.clip(cy + rng.randn() * 4, 0, H - 1))
+                x = int(np.clip(cx + rng.randn() * 4, 0, W - 1))
+                peak = rng.uniform(0.3, 1.)
+                blob = peak * np.exp(-((grid_y - y)**2 + (grid_x - x)**2) / 2.)
+                heatmap[n, j] = np.maximum(heatmap[n, j], blob)
+                tagmap[n, j, max(y - 2, 0):y + 3, max(x - 2, 0):x + 3, 0] = \
+                    person_tags[p] + rng.randn() * 0.1
+    peaks = heatmap * (heatmap == maximum_filter(
+        heatmap, size=(1, 1, 3, 3)))
+    flat = peaks.reshape(batch_size, num_joints, -1)
+    inds_k = np.argsort(-flat, axis=2, kind='stable')[..., :top_k]
+    heat_k = np.take_along_axis(flat, inds_k, axis=2)
+    return heatmap, tagmap, heat_k, inds_k
+
+
+class TestHrHRNetPostProcess(unittest.TestCase):
+    def test_same_as_per_image(self):
+        rng = np.random.RandomState(0)
+        post_process = HrHRNetPostProcess(max_num_people=10)
+        size = 48
+        for num_people, batch_size in [(3, 1), (8, 3), (15, 2)]:
+            heatmap, tagmap, heat_k, inds_k = make_outputs(
+                rng, batch_size, num_people, 14, size,
+                post_process.max_num_people)
+            kpts, scores = post_process(heatmap, tagmap, heat_k, inds_k,
+                                        size * 4, size * 4)
+            if batch_size == 1:
+                kpts, scores = [kpts], [scores]
+            self.assertEqual(len(kpts), batch_size)
+            for n in range(batch_size):
+                expect_kpts, expect_scores = postprocess_per_image(
+                    post_process, heatmap[n], tagmap[n], heat_k[n],
+                    inds_k[n], size * 4)
+                self.assertGreater(len(expect_kpts), 0)
+                self.assertEqual(kpts[n].shape, expect_kpts.shape)
+                # centroids are rounded to float32 in the batched grouping
+                np.testing.assert_allclose(kpts[n], expect_kpts, atol=1e-4)
+                np.testing.assert_array_equal(scores[n], expect_scores)
+
+    def test_no_joint(self):
+        post_process = HrHRNetPostProcess()
+        heatmap = np.zeros((1, 14, 16, 16), dtype=np.float32)
+        tagmap = np.zeros((1, 14, 16, 16, 1), dtype=np.float32)
+        heat_k = np.zeros((1, 14, 30), dtype=np.float32)
+        inds_k = np.zeros((1, 14, 30), dtype=np.int64)
+        kpts, scores = post_process(heatmap, tagmap, heat_k, inds_k, 64, 64)
+        self.assertEqual(kpts.shape, (0, 14, 3))
+        self.assertEqual(scores.shape, (0, 14, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.modeling.mot.matching import jde_matching as matching
+from ppdet.modeling.mot.tracker.base_jde_tracker import STrack, TrackFeatureBank
+
+
+def bbox_ious_per_pair(boxes, query_boxes):
+    ious = np.zeros((boxes.shape[0], query_boxes.shape[0]), dtype=np.float64)
+    for k in range(query_boxes.shape[0]):
+        box_area = ((query_boxes[k, 2] - query_boxes[k, 0] + 1) *
+                    (query_boxes[k, 3] - query_boxes[k, 1] + 1))
+        for n in range(boxes.shape[0]):
+            iw = (min(boxes[n, 2], query_boxes[k, 2]) - max(
+                boxes[n, 0], query_boxes[k, 0]) + 1)
+            if iw > 0:
+                ih = (min(boxes[n, 3], query_boxes[k, 3]) - max(
+                    boxes[n, 1], query_boxes[k, 1]) + 1)
+                if ih > 0:
+                    ua = float((boxes[n, 2] - boxes[n, 0] + 1) * (boxes[
+                        n, 3] - boxes[n, 1] + 1) + box_area - iw * ih)
+                    ious[n, k] = iw * ih / ua
+    return ious
+
+
+def make_boxes(rng, num):
+    xy = rng.rand(num, 2) * 200
+    return np.concatenate([xy, xy + rng.rand(num, 2) * 60], axis=1)
+
+
+class TestJDEMatching(unittest.TestCase):
+    def test_bbox_ious(self):
+        rng = np.random.RandomState(0)
+        for num_a, num_b in [(30, 20), (1, 7), (0, 5), (5, 0)]:
+            boxes, query_boxes = make_boxes(rng, num_a), make_boxes(rng, num_b)
+            np.testing.assert_array_equal(
+                matching.bbox_ious(boxes, query_boxes),
+                bbox_ious_per_pair(boxes, query_boxes))
+        # boxes which touch or are one pixel apart
+        boxes = np.array([[0., 0., 9., 9.]])
+        query_boxes = np.array([[9., 0., 19., 9.], [10., 0., 19., 9.],
+                                [-10., -10., -1., 0.], [0., 0., 9., 9.]])
+        np.testing.assert_array_equal(
+            matching.bbox_ious(boxes, query_boxes),
+            bbox_ious_per_pair(boxes, query_boxes))
+
+    def test_feature_bank(self):
+        rng = np.random.RandomState(0)
+        bank = TrackFeatureBank(capacity=4)
+        tracks = []
+        for frame in range(20):
+            # tracks are born and die, features of live tracks are updated
+            tracks = [t for t in tracks if rng.rand() > 0.2]
+            tracks += [
+                STrack(
+                    np.array([0., 0., 10., 10.]), 0.9, 0, 30,
+                    rng.randn(16).astype('float32'))
+                for _ in range(rng.randint(0, 4))
+            ]
+            for track in tracks:
+                if rng.rand() < 0.5:
+                    track.update_features(rng.randn(16).astype('float32'))
+            bank.update(tracks)
+            bank.retain(tracks)
+            self.assertEqual(len(bank), len(tracks))
+
+            detections = [
+                STrack(
+                    np.array([0., 0., 10., 10.]), 0.9, 0, 30,
+                    rng.randn(16).astype('float32')) for _ in range(5)
+            ]
+            # gathered in another order than updated
+            order = rng.permutation(len(tracks))
+            pool = [tracks[i] for i in order]
+            np.testing.assert_array_equal(
+                matching.embedding_distance(
+                    pool,
+                    detections,
+                    track_features=bank.gather(pool),
+                    det_features=np.asarray(
+                        [d.curr_feat for d in detections])),
+                matching.embedding_distance(pool, detections))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.modeling.mot.motion.kalman_filter import KalmanFilter
+from ppdet.modeling.mot.motion.kalman_filter import KalmanStateStore, KalmanStateMixin
+
+
+class Track(KalmanStateMixin):
+    def __init__(self, mean, covariance):
+        self.mean, self.covariance = mean, covariance
+
+
+def make_measurements(rng, num):
+    return np.concatenate(
+        [
+            rng.rand(num, 2) * 1000, rng.rand(num, 1) + 0.3,
+            rng.rand(num, 1) * 100 + 20
+        ],
+        axis=1)
+
+
+class TestKalmanFilter(unittest.TestCase):
+    def setUp(self):
+        self.kf = KalmanFilter()
+        self.rng = np.random.RandomState(0)
+
+    def test_multi_steps(self):
+        num = 20
+        states = [self.kf.initiate(m) for m in make_measurements(self.rng, num)]
+        means = np.asarray([m for m, _ in states])
+        covs = np.asarray([c for _, c in states])
+        meas = make_measurements(self.rng, num)
+
+        multi_means, multi_covs = self.kf.multi_predict(means, covs)
+        multi_dists = {}
+        for only_position in [False, True]:
+            for metric in ['maha', 'gaussian']:
+                multi_dists[only_position, metric] = \
+                    self.kf.multi_gating_distance(
+                        multi_means, multi_covs, meas, only_position, metric)
+        multi_means, multi_covs = self.kf.multi_update(multi_means, multi_covs,
+                                                       meas)
+
+        for i, (mean, cov) in enumerate(states):
+            mean, cov = self.kf.predict(mean, cov)
+            for (only_position, metric), dists in multi_dists.items():
+                np.testing.assert_allclose(
+                    dists[i],
+                    self.kf.gating_distance(mean, cov, meas, only_position,
+                                            metric),
+                    rtol=1e-6)
+            mean, cov = self.kf.update(mean, cov, meas[i])
+            np.testing.assert_allclose(multi_means[i], mean, rtol=1e-6)
+            np.testing.assert_allclose(
+                multi_covs[i], cov, rtol=1e-6, atol=1e-8)
+
+    def test_state_store(self):
+        store = KalmanStateStore(self.kf, capacity=4)
+        tracks, expects = [], []
+        for frame in range(20):
+            # tracks are born and die, the states of the others are
+            # predicted and some of them are corrected
+            keep = [i for i in range(len(tracks)) if self.rng.rand() > 0.2]
+            tracks = [tracks[i] for i in keep]
+            expects = [expects[i] for i in keep]
+            store.retain(tracks)
+            for m in make_measurements(self.rng, self.rng.randint(0, 4)):
+                mean, cov = self.kf.initiate(m)
+                track = Track(mean.copy(), cov.copy())
+                store.attach(track)
+                tracks.append(track)
+                expects.append((mean, cov))
+            self.assertEqual(len(store), len(tracks))
+
+            keep_velocity = self.rng.rand(len(tracks)) > 0.3
+            store.predict(tracks, keep_velocity)
+            meas = make_measurements(self.rng, len(tracks))
+            for i, (mean, cov) in enumerate(expects):
+                if not keep_velocity[i]:
+                    mean = mean.copy()
+                    mean[7] = 0
+                mean, cov = self.kf.predict(mean, cov)
+                if self.rng.rand() < 0.5:
+                    tracks[i].kalman_update(self.kf, meas[i])
+                    mean, cov = self.kf.update(mean, cov, meas[i])
+                expects[i] = (mean, cov)
+
+            if len(tracks):
+                dists = store.gating_distance(tracks, meas)
+            for i, (mean, cov) in enumerate(expects):
+                np.testing.assert_allclose(tracks[i].mean, mean, rtol=1e-6)
+                np.testing.assert_allclose(
+                    tracks[i].covariance, cov, rtol=1e-6, atol=1e-8)
+                np.testing.assert_allclose(
+                    dists[i],
+                    self.kf.gating_distance(mean, cov, meas),
+                    rtol=1e-6)
+
+        # detached tracks keep their states
+        track, (mean, cov) = tracks[0], expects[0]
+        store.retain([])
+        self.assertEqual(len(store), 0)
+        self.assertIsNone(track._state_store)
+        np.testing.assert_allclose(track.mean, mean, rtol=1e-6)
+        np.testing.assert_allclose(track.covariance, cov, rtol=1e-6, atol=1e-8)
+
+
+if __name__ == '__main__':
+    unittest.main()
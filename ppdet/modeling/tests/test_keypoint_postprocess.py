@@ -0,0 +1,140 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import math
+import unittest
+
+import cv2
+import numpy as np
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.modeling.architectures.keypoint_hrnet import HRNetPostProcess
+from ppdet.modeling.keypoint_utils import transform_preds
+
+
+def blur_per_heatmap(heatmap, kernel):
+    border = (kernel - 1) // 2
+    height, width = heatmap.shape[2:]
+    for i in range(heatmap.shape[0]):
+        for j in range(heatmap.shape[1]):
+            origin_max = np.max(heatmap[i, j])
+            dr = np.zeros((height + 2 * border, width + 2 * border))
+            dr[border:-border, border:-border] = heatmap[i, j].copy()
+            dr = cv2.GaussianBlur(dr, (kernel, kernel), 0)
+            heatmap[i, j] = dr[border:-border, border:-border].copy()
+            heatmap[i, j] *= origin_max / np.max(heatmap[i, j])
+    return heatmap
+
+
+def dark_per_keypoint(hm, coord):
+    height, width = hm.shape
+    px, py = int(coord[0]), int(coord[1])
+    if 1 < px < width - 2 and 1 < py < height - 2:
+        dx = 0.5 * (hm[py][px + 1] - hm[py][px - 1])
+        dy = 0.5 * (hm[py + 1][px] - hm[py - 1][px])
+        dxx = 0.25 * (hm[py][px + 2] - 2 * hm[py][px] + hm[py][px - 2])
+        dxy = 0.25 * (hm[py + 1][px + 1] - hm[py - 1][px + 1] -
+                      hm[py + 1][px - 1] + hm[py - 1][px - 1])
+        dyy = 0.25 * (hm[py + 2][px] - 2 * hm[py][px] + hm[py - 2][px])
+        if dxx * dyy - dxy**2 != 0:
+            hessian = np.array([[dxx, dxy], [dxy, dyy]])
+            coord += -np.linalg.inv(hessian).dot(np.array([dx, dy]))
+    return coord
+
+
+def final_preds_per_keypoint(post_process, heatmaps, center, scale):
+    coords, maxvals = post_process.get_max_preds(heatmaps)
+    height, width = heatmaps.shape[2:]
+    if post_process.use_dark:
+        hm = np.log(np.maximum(blur_per_heatmap(heatmaps, 3), 1e-10))
+        for n in range(coords.shape[0]):
+            for p in range(coords.shape[1]):
+                coords[n, p] = dark_per_keypoint(hm[n][p], coords[n][p])
+    else:
+        for n in range(coords.shape[0]):
+            for p in range(coords.shape[1]):
+                hm = heatmaps[n][p]
+                px = int(math.floor(coords[n][p][0] + 0.5))
+                py = int(math.floor(coords[n][p][1] + 0.5))
+                if 1 < px < width - 1 and 1 < py < height - 1:
+                    diff = np.array([
+                        hm[py][px + 1] - hm[py][px - 1],
+                        hm[py + 1][px] - hm[py - 1][px]
+                    ])
+                    coords[n][p] += np.sign(diff) * .25
+    preds = coords.copy()
+    for i in range(coords.shape[0]):
+        preds[i] = transform_preds(coords[i], center[i], scale[i],
+                                   [width, height])
+    return preds, maxvals
+
+
+def make_heatmaps(rng, num_people, num_joints, width, height):
+    """
+    Heatmaps with a gaussian peak of each visible joint, some near or out of
+    the border, noise elsewhere, and centers and scales of the boxes.
+    """
+    heatmap = rng.rand(num_people, num_joints, height, width) * 0.02
+    heatmap = heatmap.astype('float32')
+    grid_y, grid_x = np.mgrid[:height, :width]
+    for n in range(num_people):
+        for j in range(num_joints):
+            if rng.rand() < 0.1:
+                continue
+            y, x = rng.uniform(-2, [height + 2, width + 2])
+            peak = rng.uniform(0.2, 1.)
+            heatmap[n, j] += peak * np.exp(-(
+                (grid_y - y)**2 + (grid_x - x)**2) / 8.)
+    center = rng.uniform(100, 900, (num_people, 2)).astype('float32')
+    scale = rng.uniform(0.5, 3, (num_people, 2)).astype('float32')
+    scale[:, 1] = scale[:, 0] * height / width
+    return heatmap, center, scale
+
+
+class TestHRNetPostProcess(unittest.TestCase):
+    def check(self, use_dark):
+        rng = np.random.RandomState(0)
+        post_process = HRNetPostProcess(use_dark=use_dark)
+        # more heatmaps than a chunk of gaussian_blur
+        for num_people in [1, 5]:
+            heatmap, center, scale = make_heatmaps(rng, num_people, 17, 48,
+                                                   64)
+            # heatmaps are blurred in place
+            preds, maxvals = post_process.get_final_preds(heatmap.copy(),
+                                                          center, scale)
+            expect_preds, expect_maxvals = final_preds_per_keypoint(
+                post_process, heatmap.copy(), center, scale)
+            self.assertEqual(preds.dtype, expect_preds.dtype)
+            np.testing.assert_allclose(preds, expect_preds, rtol=0, atol=1e-3)
+            np.testing.assert_array_equal(maxvals, expect_maxvals)
+
+    def test_dark(self):
+        self.check(True)
+
+    def test_no_dark(self):
+        self.check(False)
+
+
+if __name__ == '__main__':
+    unittest.main()
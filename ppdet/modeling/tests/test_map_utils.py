@@ -0,0 +1,162 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import math
+import unittest
+
+import numpy as np
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.metrics.map_utils import DetectionMAP, jaccard_overlap
+
+
+def per_pred_score_pos(metric, scenes):
+    """Class gt counts and [score, pos] records, prediction by prediction."""
+    class_score_poss = [[] for _ in range(metric.class_num)]
+    class_gt_counts = [0] * metric.class_num
+    for bbox, score, label, gt_box, gt_label, difficult in scenes:
+        for gtl, diff in zip(gt_label, difficult):
+            if metric.evaluate_difficult or int(diff) == 0:
+                class_gt_counts[int(gtl)] += 1
+
+        visited = [False] * len(gt_label)
+        for b, s, l in zip(bbox, score, label):
+            max_idx = -1
+            max_overlap = -1.0
+            for i, gl in enumerate(gt_label):
+                if int(gl) == int(l):
+                    overlap = jaccard_overlap(b.tolist(), gt_box[i],
+                                              metric.is_bbox_normalized)
+                    if overlap > max_overlap:
+                        max_overlap = overlap
+                        max_idx = i
+
+            if max_overlap > metric.overlap_thresh:
+                if metric.evaluate_difficult or int(difficult[max_idx]) == 0:
+                    class_score_poss[int(l)].append(
+                        [s, 0.0 if visited[max_idx] else 1.0])
+                    visited[max_idx] = True
+            else:
+                class_score_poss[int(l)].append([s, 0.0])
+    return class_score_poss, class_gt_counts
+
+
+def per_pred_map(metric, scenes):
+    """mAP with the walks over predictions sorted by score."""
+    class_score_poss, class_gt_counts = per_pred_score_pos(metric, scenes)
+    mAP = 0.
+    valid_cnt = 0
+    for score_pos, count in zip(class_score_poss, class_gt_counts):
+        if count == 0:
+            continue
+        valid_cnt += 1
+        if len(score_pos) == 0:
+            continue
+        precision, recall = [], []
+        accum_tp = accum_fp = 0
+        for _, pos in sorted(score_pos, key=lambda s: s[0], reverse=True):
+            accum_tp += int(pos)
+            accum_fp += 1 - int(pos)
+            precision.append(float(accum_tp) / (accum_tp + accum_fp))
+            recall.append(float(accum_tp) / count)
+
+        if metric.map_type == '11point':
+            max_precisions = [0.] * 11
+            start_idx = len(precision) - 1
+            for j in range(10, -1, -1):
+                for i in range(start_idx, -1, -1):
+                    if recall[i] < float(j) / 10.:
+                        start_idx = i
+                        if j > 0:
+                            max_precisions[j - 1] = max_precisions[j]
+                            break
+                    elif max_precisions[j] < precision[i]:
+                        max_precisions[j] = precision[i]
+            mAP += sum(max_precisions) / 11.
+        else:
+            one_class_ap = 0.
+            prev_recall = 0.
+            for i in range(len(precision)):
+                recall_gap = math.fabs(recall[i] - prev_recall)
+                if recall_gap > 1e-6:
+                    one_class_ap += precision[i] * recall_gap
+                    prev_recall = recall[i]
+            mAP += one_class_ap
+    return mAP / float(valid_cnt) if valid_cnt > 0 else mAP
+
+
+def make_scene(rng, class_num, num_gts, num_preds):
+    gt_xy = rng.rand(num_gts, 2) * 800
+    gt_box = np.concatenate(
+        [gt_xy, gt_xy + rng.rand(num_gts, 2) * 200 + 2], axis=1)
+    gt_label = rng.randint(0, class_num, (num_gts, ))
+    difficult = (rng.rand(num_gts) < 0.2).astype('int32')
+    idx = rng.randint(0, max(num_gts, 1), num_preds)
+    if num_gts > 0:
+        bbox = np.round(gt_box[idx] + rng.randn(num_preds, 4) * 10, 1)
+        label = gt_label[idx].astype('float64')
+    else:
+        bbox = np.round(rng.rand(num_preds, 4) * 800, 1)
+        label = np.zeros((num_preds, ), dtype='float64')
+    # rounded scores have ties
+    score = np.round(rng.rand(num_preds), 2)
+    noise = rng.rand(num_preds) < 0.3
+    label[noise] = rng.randint(0, class_num, noise.sum())
+    return bbox, score, label, gt_box, gt_label, difficult
+
+
+class TestDetectionMAP(unittest.TestCase):
+    def setUp(self):
+        self.class_num = 5
+        rng = np.random.RandomState(0)
+        self.scenes = [
+            make_scene(rng, self.class_num, rng.randint(0, 12),
+                       rng.randint(0, 40)) for _ in range(30)
+        ]
+
+    def check(self, map_type, evaluate_difficult):
+        metric = DetectionMAP(
+            self.class_num,
+            map_type=map_type,
+            evaluate_difficult=evaluate_difficult,
+            catid2name={i: str(i)
+                        for i in range(self.class_num)})
+        for scene in self.scenes:
+            metric.update(*scene)
+        metric.accumulate()
+        expect = per_pred_map(metric, self.scenes)
+        self.assertGreater(expect, 0.)
+        self.assertEqual(metric.get_map(), expect)
+
+    def test_11point(self):
+        self.check('11point', False)
+        self.check('11point', True)
+
+    def test_integral(self):
+        self.check('integral', False)
+        self.check('integral', True)
+
+
+if __name__ == '__main__':
+    unittest.main()
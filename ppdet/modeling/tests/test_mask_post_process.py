@@ -0,0 +1,123 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+
+import numpy as np
+import paddle
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+deploy_path = os.path.join(parent_path, 'deploy', 'python')
+if deploy_path not in sys.path:
+    sys.path.append(deploy_path)
+
+from ppdet.modeling.post_process import MaskPostProcess
+from ppdet.metrics.json_results import get_seg_res
+from mask_postprocess import paste_masks_in_box
+
+
+def make_outputs(rng, num_masks, im_w, im_h, mask_size=28):
+    x0 = rng.rand(num_masks) * im_w * 0.8
+    y0 = rng.rand(num_masks) * im_h * 0.8
+    w = rng.rand(num_masks) * (im_w - x0) + 1
+    h = rng.rand(num_masks) * (im_h - y0) + 1
+    bbox = np.stack(
+        [
+            np.zeros(num_masks), rng.rand(num_masks), x0, y0,
+            np.minimum(x0 + w, im_w), np.minimum(y0 + h, im_h)
+        ],
+        axis=1).astype('float32')
+    # boxes touching the image borders, tiny and out of the image
+    bbox[0, 2:] = [0., 0., im_w, im_h]
+    bbox[1, 2:] = [im_w - 3.5, im_h - 2.5, im_w, im_h]
+    bbox[2, 2:] = [5.2, 6.1, 5.7, 6.3]
+    bbox[3, 2:] = [im_w + 4., 2., im_w + 10., 8.]
+    mask_out = rng.rand(num_masks, mask_size, mask_size).astype('float32')
+    origin_shape = np.tile(np.array([[im_h, im_w]]), (num_masks, 1))
+    return mask_out, bbox, origin_shape
+
+
+class TestMaskPostProcess(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        self.im_w, self.im_h = 97, 61
+        self.mask_out, self.bbox, self.origin_shape = make_outputs(
+            np.random.RandomState(0), 20, self.im_w, self.im_h)
+        self.bbox_num = np.array([self.bbox.shape[0]], dtype='int32')
+
+    def paste(self, paste_in_box):
+        post_process = MaskPostProcess(paste_in_box=paste_in_box)
+        mask = post_process(
+            paddle.to_tensor(self.mask_out),
+            paddle.to_tensor(self.bbox),
+            paddle.to_tensor(self.bbox_num), paddle.to_tensor(
+                self.origin_shape[np.cumsum(self.bbox_num) - 1]))
+        mask_box = post_process.get_mask_box()
+        return mask.numpy(), (mask_box.numpy()
+                              if mask_box is not None else None)
+
+    def check_seg_res(self):
+        seg_res = []
+        im_ids = np.arange(len(self.bbox_num))[:, None]
+        for paste_in_box in [False, True]:
+            mask, mask_box = self.paste(paste_in_box)
+            self.assertEqual(mask_box is not None, paste_in_box)
+            seg_res.append(
+                get_seg_res(
+                    mask,
+                    self.bbox,
+                    self.bbox_num,
+                    im_ids, {0: 1},
+                    mask_box=mask_box))
+        self.assertEqual(len(seg_res[0]), self.bbox.shape[0])
+        self.assertEqual(seg_res[0], seg_res[1])
+
+    def test_paste_in_box(self):
+        self.check_seg_res()
+
+    def test_paste_in_box_multi_image(self):
+        # images of different sizes and numbers of masks
+        rng = np.random.RandomState(1)
+        outputs = [
+            make_outputs(rng, num_masks, im_w, im_h)
+            for num_masks, im_w, im_h in [(5, 97, 61), (12, 40, 75), (4, 64,
+                                                                       64)]
+        ]
+        self.mask_out, self.bbox, self.origin_shape = [
+            np.concatenate(out) for out in zip(*outputs)
+        ]
+        self.bbox_num = np.array([5, 12, 4], dtype='int32')
+        self.check_seg_res()
+
+    def test_deploy_paste_in_box(self):
+        mask, _ = self.paste(False)
+        deploy_mask = paste_masks_in_box(self.mask_out, self.bbox,
+                                         self.bbox_num, self.origin_shape[:1])
+        self.assertEqual(deploy_mask.shape, mask.shape)
+        # bilinear sampling in another order, only pixels sampled at the
+        # threshold may differ
+        self.assertLess(np.mean(deploy_mask != mask), 1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# add python path of deploy/pptracking/python to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+pptracking_path = os.path.join(parent_path, 'deploy', 'pptracking', 'python')
+if pptracking_path not in sys.path:
+    sys.path.append(pptracking_path)
+
+from mot.mtmct.utils import ReRank2, euclidean_distance, find_topk
+
+
+def dense_rerank(probFea, galFea, k1, k2, lambda_value):
+    """k-reciprocal re-ranking on dense matrices, of less than 6000 features."""
+    query_num = probFea.shape[0]
+    feat = np.concatenate((probFea, galFea), axis=0)
+    all_num = feat.shape[0]
+    dist = euclidean_distance(feat, feat)
+    initial_rank = find_topk(
+        (dist / dist[:, 0].max()).T, k1 + 1, axis=1, largest=False)[1]
+
+    def k_reciprocal_neigh(i, k):
+        forward = initial_rank[i, :k + 1]
+        return forward[np.where(initial_rank[forward, :k + 1] == i)[0]]
+
+    V = np.zeros((all_num, all_num), dtype=np.float32)
+    for i in range(all_num):
+        k_reciprocal = k_reciprocal_neigh(i, k1)
+        expansion = [k_reciprocal]
+        for candidate in k_reciprocal:
+            candidate_reciprocal = k_reciprocal_neigh(candidate,
+                                                      int(np.around(k1 / 2)))
+            if len(np.intersect1d(candidate_reciprocal, k_reciprocal)) > \
+                    2. / 3 * len(candidate_reciprocal):
+                expansion.append(candidate_reciprocal)
+        expansion = np.unique(np.concatenate(expansion))
+        d = euclidean_distance(feat[i:i + 1], feat)[0]
+        weight = np.exp(-d[expansion] / d.max())
+        V[i, expansion] = weight / weight.sum()
+    if k2 != 1:
+        V = V[initial_rank[:, :k2]].mean(axis=1).astype(np.float16)
+
+    temp_min = np.minimum(V[:query_num, None], V[None]).sum(
+        axis=2, dtype=np.float32)
+    jaccard_dist = 1 - temp_min / (2. - temp_min)
+    original_dist = euclidean_distance(feat, feat[:query_num])
+    original_dist = (original_dist / original_dist[:, 0].max()).T
+    final_dist = jaccard_dist * (1 - lambda_value
+                                 ) + original_dist * lambda_value
+    return final_dist[:, query_num:]
+
+
+def make_features(rng, num_tracklets, num_query, dim, num_cameras=10):
+    """
+    L2 normalized features of tracklets, each identity is seen by a few
+    cameras with a feature jittered by camera. Queries are tracklets of
+    the same identities in another camera.
+    """
+    num_ids = max(1, num_tracklets // 4)
+    centers = rng.randn(num_ids, dim).astype('float32')
+    bias = rng.randn(num_cameras, dim).astype('float32') * 0.3
+    ids = rng.randint(0, num_ids, num_tracklets + num_query)
+    cams = rng.randint(0, num_cameras, num_tracklets + num_query)
+    feats = centers[ids] + bias[cams] + rng.randn(
+        num_tracklets + num_query, dim).astype('float32') * 0.5
+    feats /= np.linalg.norm(feats, axis=1, keepdims=True)
+    return feats[:num_query], feats[num_query:]
+
+
+class TestReRank2(unittest.TestCase):
+    def test_same_as_dense(self):
+        prb_feats, gal_feats = make_features(
+            np.random.RandomState(0), 200, 40, 32)
+        for k1, k2 in [(20, 3), (10, 1)]:
+            expect = dense_rerank(prb_feats, gal_feats, k1, k2, 0.3)
+            # a single block, and blocks of 1MB in one and two processes
+            for max_memory_mb, num_workers in [(1024, 0), (1, 0), (1, 2)]:
+                dist = ReRank2(
+                    prb_feats,
+                    gal_feats,
+                    k1,
+                    k2,
+                    0.3,
+                    max_memory_mb=max_memory_mb,
+                    num_workers=num_workers)
+                self.assertEqual(dist.shape, expect.shape)
+                # V of the query expansion is float16 in the dense one
+                np.testing.assert_allclose(dist, expect, atol=1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
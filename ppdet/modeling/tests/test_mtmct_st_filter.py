@@ -0,0 +1,147 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# add python path of deploy/pptracking/python to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+pptracking_path = os.path.join(parent_path, 'deploy', 'pptracking', 'python')
+if pptracking_path not in sys.path:
+    sys.path.append(pptracking_path)
+
+from mot.mtmct.camera_utils import st_filter, S06_TOPOLOGY
+from mot.mtmct.utils import get_dire, intracam_ignore
+
+
+def match_dire(i_tracklet, j_tracklet):
+    """Rules of st_filter for a pair of tracklets of the S06 cameras."""
+    i_cid, j_cid = i_tracklet['cam'], j_tracklet['cam']
+    i_zs, i_ze = get_dire(i_tracklet['zone_list'], i_cid)
+    j_zs, j_ze = get_dire(j_tracklet['zone_list'], j_cid)
+    i_in, i_out = i_tracklet['io_time']
+    j_in, j_out = j_tracklet['io_time']
+    dist = S06_TOPOLOGY['cam_dist'][i_cid - 41][j_cid - 41]
+
+    def to_j(zone):
+        return (zone == 3 and i_cid < j_cid) or (zone == 4 and i_cid > j_cid)
+
+    def from_j(zone):
+        return (zone == 3 and i_cid > j_cid) or (zone == 4 and i_cid < j_cid)
+
+    # if time overlapped
+    if i_in - dist < j_in < i_out + dist or i_in - dist < j_out < i_out + dist:
+        return False
+    # not match after go out
+    if i_ze in [1, 2] and (i_in < j_out + dist or from_j(i_zs)):
+        return False
+    if i_cid == 41 and i_ze == 4 and (i_in < j_out + dist or i_out > 199):
+        return False
+    if i_cid == 46 and i_ze == 3 and i_in < j_out + dist:
+        return False
+    # match after come into
+    if i_zs in [1, 2] and (i_out > j_in - dist or from_j(i_ze)):
+        return False
+
+    if (i_zs == i_ze and i_zs in [3, 4]) or (j_zs == j_ze and j_zs in [3, 4]):
+        if i_out > 199 and (from_j(i_zs) or to_j(i_zs) and i_in < j_in + dist):
+            return False
+        return not (i_in < 1 and from_j(i_ze))
+    # direction conflict
+    if (i_zs == 3 and j_zs == 4) or (i_ze == 3 and j_ze == 4):
+        return False
+    # filter before going next scene
+    return not ((to_j(i_ze) and i_out > j_out - dist) or
+                (to_j(i_zs) and i_in < j_in + dist) or
+                (from_j(i_zs) and i_out > j_in - dist) or
+                (from_j(i_ze) and i_in < j_out + dist))
+
+
+def make_tracklets(rng, num_tracklets):
+    """
+    Tracklets of random cameras of S06 in at most 30 of the io_time from
+    [-1, 201], and zones in [0, 4], a few of them without zones.
+    """
+    cid_tid_dict = dict()
+    cam_ids = S06_TOPOLOGY['cam_ids']
+    for tid in range(num_tracklets):
+        cid = cam_ids[rng.randint(len(cam_ids))]
+        io_time = rng.uniform(-1, 201)
+        io_time = [io_time, io_time + rng.uniform(0, 30)]
+        zone_list = rng.randint(0, 5, 3).tolist()
+        if rng.rand() < 0.05:
+            zone_list = [None] * 3
+        cid_tid_dict[(cid, tid)] = {
+            'cam': cid,
+            'io_time': io_time,
+            'zone_list': zone_list
+        }
+    return cid_tid_dict, sorted(cid_tid_dict.keys())
+
+
+class TestSTFilter(unittest.TestCase):
+    def setUp(self):
+        self.cid_tid_dict, self.cid_tids = make_tracklets(
+            np.random.RandomState(0), 300)
+
+    def test_intracam_ignore(self):
+        count = len(self.cid_tids)
+        st_mask = intracam_ignore(
+            np.ones((count, count), dtype=np.float32), self.cid_tids)
+        cids = [cid for cid, _ in self.cid_tids]
+        for i in range(count):
+            for j in range(count):
+                self.assertEqual(st_mask[i, j], float(cids[i] != cids[j]))
+
+    def test_same_as_per_pair(self):
+        count = len(self.cid_tids)
+        tracklets = [self.cid_tid_dict[cid_tid] for cid_tid in self.cid_tids]
+        expect = np.ones((count, count), dtype=np.float32)
+        for i in range(count):
+            for j in range(count):
+                if not match_dire(tracklets[i], tracklets[j]):
+                    expect[i, j] = expect[j, i] = 0.
+        self.assertGreater(expect.sum(), 0)
+        self.assertLess(expect.sum(), count * count)
+        # a single block and blocks not dividing the tracklets
+        for block_size in [1024, 7]:
+            st_mask = st_filter(
+                np.ones((count, count), dtype=np.float32),
+                self.cid_tids,
+                self.cid_tid_dict,
+                block_size=block_size)
+            np.testing.assert_array_equal(st_mask, expect)
+
+    def test_unknown_camera(self):
+        cid_tid_dict = {
+            (47, 0): {
+                'cam': 47,
+                'io_time': [0, 1],
+                'zone_list': [1, 2]
+            }
+        }
+        with self.assertRaises(ValueError):
+            st_filter(
+                np.ones((1, 1), dtype=np.float32), [(47, 0)], cid_tid_dict)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+
+import numpy as np
+from scipy.special import softmax
+
+# add python path of deploy/python to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+deploy_path = os.path.join(parent_path, 'deploy', 'python')
+if deploy_path not in sys.path:
+    sys.path.append(deploy_path)
+
+from picodet_postprocess import PicoDetPostProcess, batched_hard_nms
+from picodet_postprocess import get_centers, hard_nms
+
+
+def per_image_postprocess(post_process, scores, raw_boxes):
+    """PicoDetPostProcess run per image, per level and per class."""
+    p = post_process
+    reg_max = raw_boxes[0].shape[-1] // 4 - 1
+    out_boxes_list, out_boxes_num = [], []
+    for b in range(raw_boxes[0].shape[0]):
+        bboxes, confidences = [], []
+        for stride, box_distribute, score in zip(p.strides, raw_boxes, scores):
+            topk_idx = np.argsort(score[b].max(axis=1))[::-1][:p.nms_top_k]
+            distance = softmax(
+                box_distribute[b].reshape((-1, reg_max + 1)), axis=1)
+            distance = np.sum(distance * np.arange(reg_max + 1), axis=1)
+            distance = distance.reshape((-1, 4)) * stride
+            center = get_centers(p.input_shape[0], p.input_shape[1], stride)
+            bboxes.append(center[topk_idx] + [-1, -1, 1, 1] *
+                          distance[topk_idx])
+            confidences.append(score[b][topk_idx])
+        bboxes = np.concatenate(bboxes)
+        confidences = np.concatenate(confidences)
+        picked = [np.empty((0, 6))]
+        for c in range(confidences.shape[1]):
+            mask = confidences[:, c] > p.score_threshold
+            if not mask.any():
+                continue
+            box_probs = hard_nms(
+                np.concatenate(
+                    [bboxes[mask], confidences[mask, c:c + 1]], axis=1),
+                iou_threshold=p.nms_threshold,
+                top_k=p.keep_top_k)
+            picked.append(
+                np.concatenate(
+                    [
+                        np.full((len(box_probs), 1), c), box_probs[:, 4:],
+                        box_probs[:, :4]
+                    ],
+                    axis=1))
+        picked = np.concatenate(picked)
+        picked[:, 2:] = p.warp_boxes(picked[:, 2:], p.ori_shape[b])
+        picked[:, 2:] /= np.tile(p.scale_factor[b][::-1], 2)
+        out_boxes_list.append(picked)
+        out_boxes_num.append(len(picked))
+    return np.concatenate(out_boxes_list), np.asarray(
+        out_boxes_num, dtype=np.int32)
+
+
+def make_outputs(rng, batch_size, input_h, input_w, strides, num_classes,
+                 reg_max, num_objects):
+    scores, raw_boxes = [], []
+    for stride in strides:
+        num = int(np.ceil(input_h / stride) * np.ceil(input_w / stride))
+        # most scores are low, some locations are objects
+        score = rng.beta(0.5, 20, (batch_size, num, num_classes))
+        for b in range(batch_size):
+            loc = rng.randint(0, num, num_objects)
+            cls = rng.randint(0, num_classes, num_objects)
+            score[b, loc, cls] = rng.uniform(0.3, 1., num_objects)
+        scores.append(score.astype('float32'))
+        raw_boxes.append(
+            rng.randn(batch_size, num, 4 * (reg_max + 1)).astype('float32') *
+            3)
+    return scores, raw_boxes
+
+
+class TestPicoDetPostProcess(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+
+    def test_batched_hard_nms(self):
+        num_groups = 6
+        groups = np.sort(self.rng.randint(0, num_groups, 300))
+        xy = self.rng.rand(300, 2) * 100
+        boxes = np.concatenate(
+            [xy, xy + self.rng.rand(300, 2) * 40 + 1], axis=1)
+        scores = self.rng.rand(300)
+        for top_k, candidate_size, max_iou_size in [(-1, 200, 2**22),
+                                                    (3, 200, 2**22),
+                                                    (-1, 10, 100)]:
+            keep = batched_hard_nms(
+                boxes,
+                scores,
+                groups,
+                iou_threshold=0.3,
+                top_k=top_k,
+                candidate_size=candidate_size,
+                max_iou_size=max_iou_size)
+            expect = []
+            for g in range(num_groups):
+                idx = np.nonzero(groups == g)[0]
+                expect.append(
+                    hard_nms(
+                        np.concatenate(
+                            [boxes[idx], scores[idx, None]], axis=1),
+                        iou_threshold=0.3,
+                        top_k=top_k,
+                        candidate_size=candidate_size))
+            np.testing.assert_array_equal(
+                np.concatenate([boxes[keep], scores[keep, None]], axis=1),
+                np.concatenate(expect))
+        self.assertEqual(
+            batched_hard_nms(
+                boxes[:0], scores[:0], groups[:0], iou_threshold=0.3).shape,
+            (0, ))
+
+    def test_same_as_per_image(self):
+        input_h, input_w = 320, 416
+        strides = [8, 16, 32, 64]
+        for batch_size in [1, 3]:
+            scores, raw_boxes = make_outputs(self.rng, batch_size, input_h,
+                                             input_w, strides, 10, 7, 20)
+            ori_shape = self.rng.randint(300, 1000,
+                                         (batch_size, 2)).astype('float32')
+            scale_factor = np.array(
+                [[input_h, input_w]], dtype='float32') / ori_shape
+            post_process = PicoDetPostProcess(
+                (input_h, input_w),
+                ori_shape,
+                scale_factor,
+                strides=strides,
+                nms_top_k=200,
+                keep_top_k=10)
+            out_boxes, out_num = post_process(scores, raw_boxes)
+            expect_boxes, expect_num = per_image_postprocess(
+                post_process, scores, raw_boxes)
+            self.assertGreater(len(expect_boxes), 0)
+            np.testing.assert_array_equal(out_num, expect_num)
+            np.testing.assert_array_equal(out_boxes, expect_boxes)
+
+            # no box above the score threshold
+            post_process.score_threshold = 1.
+            out_boxes, out_num = post_process(scores, raw_boxes)
+            self.assertEqual(len(out_boxes), 0)
+            np.testing.assert_array_equal(out_num, [0] * batch_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.data.source.record import RecordDataSet, RecordReader, write_records
+
+
+class ParsedDataSet(object):
+    def __init__(self, roidbs):
+        self.roidbs = roidbs
+        self.cname2cid = {'a': 0, 'b': 1}
+        self.catid2clsid = {1: 0, 3: 1}
+
+
+class TestRecord(unittest.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        self.roidbs = []
+        self.images = []
+        for i in range(5):
+            im_file = os.path.join(self.save_dir, '{}.jpg'.format(i))
+            im = rng.bytes(rng.randint(1, 100))
+            with open(im_file, 'wb') as f:
+                f.write(im)
+            num = rng.randint(0, 3)
+            self.roidbs.append({
+                'im_file': im_file,
+                'im_id': np.array([i]),
+                'h': 48.,
+                'w': 64.,
+                'gt_bbox': rng.rand(num, 4).astype(np.float32),
+                'gt_class': rng.randint(
+                    0, 2, size=(num, 1)).astype(np.int32),
+            })
+            self.images.append(im)
+        # image bytes given in the record instead of a file
+        self.roidbs[3]['image'] = self.images[3]
+        # record without image
+        self.roidbs[4].pop('im_file')
+        self.images[4] = None
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def check_record(self, rec, idx):
+        expect = {
+            k: v
+            for k, v in self.roidbs[idx].items()
+            if k not in ['im_file', 'image']
+        }
+        self.assertEqual(sorted(rec.keys()),
+                         sorted(list(expect.keys()) + (
+                             ['image'] if self.images[idx] else [])))
+        for k, v in expect.items():
+            np.testing.assert_array_equal(rec[k], v)
+        self.assertEqual(rec.get('image'), self.images[idx])
+
+    def test_round_trip(self):
+        record_dir = os.path.join(self.save_dir, 'records')
+        num = write_records(
+            ParsedDataSet(self.roidbs), record_dir, shard_size=2)
+        self.assertEqual(num, len(self.roidbs))
+
+        reader = RecordReader(record_dir)
+        self.assertEqual(len(reader), len(self.roidbs))
+        for idx in range(len(reader)):
+            self.check_record(reader[idx], idx)
+        self.check_record(reader[-1], len(self.roidbs) - 1)
+        with self.assertRaises(IndexError):
+            reader[len(self.roidbs)]
+
+        # reader is re-mapped after pickled to workers
+        reader = pickle.loads(pickle.dumps(reader))
+        self.check_record(reader[2], 2)
+
+        dataset = RecordDataSet(
+            dataset_dir=self.save_dir, record_dir='records', sample_num=3)
+        dataset.check_or_download_dataset()
+        dataset.parse_dataset()
+        self.assertEqual(len(dataset.roidbs), 3)
+        self.assertEqual(dataset.cname2cid, {'a': 0, 'b': 1})
+        self.assertEqual(dataset.catid2clsid, {1: 0, 3: 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
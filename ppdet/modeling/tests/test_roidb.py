@@ -0,0 +1,161 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import copy
+import pickle
+import unittest
+
+import numpy as np
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.data.source.roidb import CompactRoidb
+from ppdet.data.source.dataset import DetDataset
+
+
+def make_roidbs(rng, num):
+    roidbs = []
+    for i in range(num):
+        num_gt = rng.randint(0, 4)
+        rec = {
+            'im_file': '{}.jpg'.format(i),
+            'im_id': np.array([i]),
+            'h': 48.,
+            'w': 64.,
+            'gt_bbox': rng.rand(num_gt, 4).astype(np.float32),
+            'gt_class': rng.randint(
+                0, 5, size=(num_gt, 1)).astype(np.int32),
+            'gt_poly': [[rng.rand(8).tolist()] for _ in range(num_gt)],
+            'info': {
+                'scores': [1.] * num_gt
+            },
+        }
+        if i % 3 == 0:
+            # a field missing in some records
+            rec['difficult'] = np.zeros((num_gt, 1), dtype=np.int32)
+        roidbs.append(rec)
+    # trailing shapes differ, kept as objects
+    roidbs[1]['gt_score'] = np.ones((2, 1), dtype=np.float32)
+    roidbs[2]['gt_score'] = np.ones((2, ), dtype=np.float32)
+    return roidbs
+
+
+class TestCompactRoidb(unittest.TestCase):
+    def setUp(self):
+        self.roidbs = make_roidbs(np.random.RandomState(0), 10)
+        self.compact = CompactRoidb(self.roidbs)
+
+    def assert_record_equal(self, rec, expect):
+        self.assertEqual(sorted(rec.keys()), sorted(expect.keys()))
+        for k, v in expect.items():
+            if isinstance(v, np.ndarray):
+                self.assertEqual(rec[k].dtype, v.dtype)
+                np.testing.assert_array_equal(rec[k], v)
+            else:
+                self.assertEqual(rec[k], v)
+
+    def test_same_as_deepcopy(self):
+        self.assertEqual(len(self.compact), len(self.roidbs))
+        self.assertIn('gt_bbox', self.compact.array_fields)
+        self.assertIn('gt_score', self.compact.object_fields)
+        for idx in range(len(self.roidbs)):
+            self.assert_record_equal(self.compact[idx],
+                                     copy.deepcopy(self.roidbs[idx]))
+        self.assert_record_equal(self.compact[-1], self.roidbs[-1])
+        with self.assertRaises(IndexError):
+            self.compact[len(self.roidbs)]
+
+    def test_copy_on_write(self):
+        expect = copy.deepcopy(self.roidbs)
+        idx = next(i for i, r in enumerate(self.roidbs) if len(r['gt_bbox']))
+        sample = self.compact[idx]
+        # modified in place by transforms
+        sample['gt_bbox'] *= 2.
+        sample['gt_class'][:] = -1
+        sample['info']['scores'].append(0.)
+        sample.pop('im_id')[0] = -1
+        sample['h'] = 96.
+        np.testing.assert_array_equal(sample['gt_bbox'],
+                                      expect[idx]['gt_bbox'] * 2.)
+        # store and other samples are unchanged
+        for i in range(len(self.roidbs)):
+            self.assert_record_equal(self.compact[i], expect[i])
+            self.assert_record_equal(self.roidbs[i], expect[i])
+
+    def test_pickle(self):
+        sample = self.compact[0]
+        for rec in [pickle.loads(pickle.dumps(sample)), copy.deepcopy(sample)]:
+            self.assertIs(type(rec), dict)
+            self.assert_record_equal(rec, self.roidbs[0])
+            rec['gt_bbox'][...] = 0.
+
+    def test_slice(self):
+        samples = self.compact[2:9:3]
+        self.assertEqual(len(samples), 3)
+        for rec, expect in zip(samples, self.roidbs[2:9:3]):
+            self.assert_record_equal(rec, expect)
+        self.assertEqual(len(self.compact[8:100]), 2)
+
+
+class ListDataset(DetDataset):
+    def __init__(self, roidbs):
+        super(ListDataset, self).__init__()
+        self.roidbs = roidbs
+        self.set_kwargs(mosaic_epoch=1)
+        self.set_transform(lambda roidb: roidb)
+
+
+class TestDetDatasetCompactRoidb(unittest.TestCase):
+    def test_compact_roidbs(self):
+        roidbs = make_roidbs(np.random.RandomState(0), 10)
+        dataset = ListDataset(copy.deepcopy(roidbs))
+        dataset.compact_roidbs()
+        # the record dicts are replaced by the compact store
+        self.assertIsInstance(dataset.roidbs, CompactRoidb)
+        self.assertEqual(len(dataset), len(roidbs))
+        # mosaic samples are drawn from the compact store
+        samples = dataset[3]
+        self.assertEqual(len(samples), 5)
+        self.assertEqual(samples[0]['im_file'], roidbs[3]['im_file'])
+        compact = dataset.roidbs
+        dataset.compact_roidbs()
+        self.assertIs(dataset.roidbs, compact)
+
+        # packed again when roidbs are replaced
+        dataset.roidbs = roidbs[:4]
+        self.assertEqual(len(dataset[0]), 5)
+        self.assertIsInstance(dataset.roidbs, CompactRoidb)
+        self.assertEqual(len(dataset), 4)
+
+    def test_not_compact(self):
+        roidbs = make_roidbs(np.random.RandomState(0), 3)
+        dataset = ListDataset(roidbs)
+        dataset.use_compact_roidb = False
+        dataset.compact_roidbs()
+        self.assertIs(dataset.roidbs, roidbs)
+        self.assertIsNot(dataset[0][0]['info'], roidbs[0]['info'])
+        self.assertEqual(dataset[0][0]['info'], roidbs[0]['info'])
+
+
+if __name__ == '__main__':
+    unittest.main()
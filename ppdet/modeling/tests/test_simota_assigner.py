@@ -0,0 +1,126 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+
+import numpy as np
+import paddle
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 4)))
+if parent_path not in sys.path:
+    sys.path.append(parent_path)
+
+from ppdet.modeling.assigners.simota_assigner import SimOTAAssigner
+from ppdet.modeling.assigners.utils import pad_gt
+
+
+def make_inputs(rng, batch_size, input_size, strides, num_classes, max_gts):
+    """
+    Gts of random sizes, predicted boxes around the priors with sizes close
+    to the gts, and scores of the gt class higher around the gts. The first
+    image has no gt.
+    """
+    centers = []
+    for stride in strides:
+        size = int(np.ceil(input_size / stride))
+        y, x = np.mgrid[:size, :size].reshape([2, -1]) * stride
+        centers.append(
+            np.stack(
+                [x, y, np.full_like(x, stride), np.full_like(y, stride)],
+                axis=1))
+    centers = np.concatenate(centers, axis=0).astype('float32')
+    num_priors = centers.shape[0]
+
+    gt_bboxes, gt_labels, scores, bboxes = [], [], [], []
+    for i in range(batch_size):
+        num_gts = rng.randint(1, max_gts + 1) if i > 0 else 0
+        wh = rng.uniform(8, input_size / 2., (num_gts, 2))
+        xy = rng.uniform(0, input_size, (num_gts, 2)) - wh / 2.
+        gt_bbox = np.clip(
+            np.concatenate([xy, xy + wh], axis=1), 0, input_size)
+        gt_label = rng.randint(0, num_classes, (num_gts, 1))
+        gt_bboxes.append(gt_bbox.astype('float32'))
+        gt_labels.append(gt_label.astype('int32'))
+
+        score = rng.beta(0.5, 20, (num_priors, num_classes))
+        pred_wh = rng.uniform(8, input_size / 2., (num_priors, 2))
+        for bbox, label in zip(gt_bbox, gt_label[:, 0]):
+            cx, cy = (bbox[:2] + bbox[2:]) / 2.
+            near = (np.abs(centers[:, 0] - cx) < (bbox[2] - bbox[0])) & \
+                   (np.abs(centers[:, 1] - cy) < (bbox[3] - bbox[1]))
+            score[near, label] = rng.uniform(0.2, 0.9, near.sum())
+            pred_wh[near] = (bbox[2:] - bbox[:2]) * rng.uniform(
+                0.7, 1.3, (near.sum(), 2))
+        scores.append(score.astype('float32'))
+        bboxes.append(
+            np.concatenate(
+                [centers[:, :2] - pred_wh / 2., centers[:, :2] + pred_wh / 2.],
+                axis=1).astype('float32'))
+    centers = np.tile(centers[None], [batch_size, 1, 1])
+    return (paddle.to_tensor(np.stack(scores)), paddle.to_tensor(centers),
+            paddle.to_tensor(np.stack(bboxes)),
+            [paddle.to_tensor(b.reshape([-1, 4])) for b in gt_bboxes],
+            [paddle.to_tensor(l.reshape([-1, 1])) for l in gt_labels])
+
+
+class TestSimOTAAssigner(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        self.rng = np.random.RandomState(0)
+
+    def test_same_as_per_image(self):
+        num_classes = 10
+        for use_vfl in [True, False]:
+            assigner = SimOTAAssigner(
+                num_classes=num_classes, use_vfl=use_vfl)
+            scores, centers, bboxes, gt_bboxes, gt_labels = make_inputs(
+                self.rng, 4, 128, [8, 16, 32], num_classes, 8)
+
+            # the same as the loop of OTAHead.get_loss
+            outputs = [
+                assigner(score, center, bbox, gt_bbox, gt_label)
+                for score, center, bbox, gt_bbox, gt_label in zip(
+                    scores, centers, bboxes, gt_bboxes, gt_labels)
+            ]
+            pos_num_l, label_l, label_weight_l, bbox_target_l = zip(*outputs)
+
+            pad_gt_labels, pad_gt_bboxes, _, pad_gt_mask = pad_gt(gt_labels,
+                                                                  gt_bboxes)
+            pos_num, labels, label_weights, bbox_targets = \
+                assigner.assign_batch(scores, centers, bboxes, pad_gt_labels,
+                                      pad_gt_bboxes, pad_gt_mask)
+
+            self.assertGreater(sum(pos_num_l), 0)
+            np.testing.assert_array_equal(pos_num.numpy(), pos_num_l)
+            np.testing.assert_array_equal(label_weights.numpy(),
+                                          np.stack(label_weight_l))
+            # costs of priors out of gt boxes and centers are around the 1e8
+            # penalty and may tie in float32, which are broken differently
+            # by the top-k of all priors and of candidates only
+            diff = np.logical_or(
+                labels.numpy() != np.stack(label_l),
+                np.any(bbox_targets.numpy() != np.stack(bbox_target_l),
+                       axis=-1))
+            self.assertLessEqual(diff.sum(), 0.01 * sum(pos_num_l))
+
+
+if __name__ == '__main__':
+    unittest.main()
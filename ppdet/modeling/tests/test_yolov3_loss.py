@@ -26,6 +26,7 @@ if parent_path not in sys.path:
     sys.path.append(parent_path)
 
 from ppdet.modeling.losses import YOLOv3Loss
+from ppdet.data.transform.batch_operators import Gt2YoloTarget
 from ppdet.data.transform.op_helper import jaccard_overlap
 import numpy as np
 
@@ -410,5 +411,137 @@ class TestYolov3LossWithScaleXY(TestYolov3LossOp):
         self.scale_x_y = 1.2
 
 
+def yolo_target_per_gt(op, samples):
+    """
+    Dense YOLOv3 targets computed gt by gt, the positions, offsets and sizes
+    are computed in float64 and the scale in float32
+    """
+    h, w = samples[0]['image'].shape[1:3]
+    an_hw = np.array(op.anchors) / np.array([[w, h]])
+    for sample in samples:
+        gt_bbox = sample['gt_bbox']
+        gt_class = sample['gt_class']
+        gt_score = np.ones((gt_bbox.shape[0], 1), np.float32)
+        for i, (mask, downsample_ratio
+                ) in enumerate(zip(op.anchor_masks, op.downsample_ratios)):
+            grid_h = int(h / downsample_ratio)
+            grid_w = int(w / downsample_ratio)
+            target = np.zeros(
+                (len(mask), 6 + op.num_classes, grid_h, grid_w),
+                dtype=np.float32)
+            for b in range(gt_bbox.shape[0]):
+                gx, gy, gw, gh = gt_bbox[b, :]
+                cls = gt_class[b, 0]
+                score = gt_score[b, 0]
+                if gw <= 0. or gh <= 0. or score <= 0.:
+                    continue
+                ious = [
+                    jaccard_overlap([0., 0., gw, gh],
+                                    [0., 0., an_hw[k, 0], an_hw[k, 1]])
+                    for k in range(an_hw.shape[0])
+                ]
+                best_idx = int(np.argmax(ious))
+                gi = int(float(gx) * grid_w)
+                gj = int(float(gy) * grid_h)
+                for idx, mask_i in enumerate(mask):
+                    if mask_i == best_idx:
+                        pass
+                    elif op.iou_thresh >= 1 or ious[mask_i] <= op.iou_thresh \
+                            or target[idx, 5, gj, gi] != 0.:
+                        continue
+                    target[idx, 0, gj, gi] = float(gx) * grid_w - gi
+                    target[idx, 1, gj, gi] = float(gy) * grid_h - gj
+                    target[idx, 2, gj, gi] = np.log(
+                        float(gw) * w / op.anchors[mask_i][0])
+                    target[idx, 3, gj, gi] = np.log(
+                        float(gh) * h / op.anchors[mask_i][1])
+                    target[idx, 4, gj, gi] = 2.0 - gw * gh
+                    target[idx, 5, gj, gi] = score
+                    target[idx, 6 + cls, gj, gi] = 1.
+            sample['target{}'.format(i)] = target
+    return samples
+
+
+class TestGt2YoloTarget(unittest.TestCase):
+    def setUp(self):
+        self.anchors = [[10, 13], [16, 30], [33, 23], [30, 61], [62, 45],
+                        [59, 119], [116, 90], [156, 198], [373, 326]]
+        self.anchor_masks = [[6, 7, 8], [3, 4, 5], [0, 1, 2]]
+        self.downsample_ratios = [32, 16, 8]
+        self.num_classes = 20
+        self.size = 256
+
+    def make_samples(self, rng, num_gts):
+        samples = []
+        for num_gt in num_gts:
+            xy = rng.rand(num_gt, 2) * 0.98 + 0.01
+            wh = rng.rand(num_gt, 2) * 0.5 + 0.01
+            samples.append({
+                'image': np.zeros(
+                    (3, self.size, self.size), dtype=np.float32),
+                'gt_bbox': np.concatenate(
+                    [xy, wh], axis=1).astype(np.float32),
+                'gt_class': rng.randint(
+                    0, self.num_classes, size=(num_gt, 1)).astype(np.int32),
+            })
+        return samples
+
+    def make_border_samples(self, rng):
+        # centers exactly on the cell borders of all levels
+        samples = self.make_samples(rng, [16, 16])
+        for sample in samples:
+            k = rng.randint(1, 8, size=(16, 2))
+            sample['gt_bbox'][:, :2] = k / 8.
+        # duplicated boxes share the same positions
+        samples[1]['gt_bbox'][8:] = samples[1]['gt_bbox'][:8]
+        return samples
+
+    def targets(self, samples, iou_thresh, sparse_target):
+        op = Gt2YoloTarget(
+            self.anchors,
+            self.anchor_masks,
+            self.downsample_ratios,
+            num_classes=self.num_classes,
+            iou_thresh=iou_thresh,
+            sparse_target=sparse_target)
+        return op, op([dict(s) for s in samples])
+
+    def to_dense(self, sample, i, num_mask, grid):
+        index = sample['target{}_index'.format(i)]
+        value = sample['target{}_value'.format(i)]
+        channels = value.shape[1]
+        dense = np.zeros((num_mask * grid * grid, channels), dtype=np.float32)
+        dense[index[index >= 0]] = value[index >= 0]
+        return dense.reshape((num_mask, grid, grid, channels)).transpose(
+            (0, 3, 1, 2))
+
+    def check(self, samples):
+        for iou_thresh in [1., 0.5, 0.1]:
+            op, dense = self.targets(samples, iou_thresh, False)
+            _, sparse = self.targets(samples, iou_thresh, True)
+            expect = yolo_target_per_gt(op, [dict(s) for s in samples])
+            for i, ratio in enumerate(self.downsample_ratios):
+                grid = self.size // ratio
+                key = 'target{}'.format(i)
+                for d, s, e in zip(dense, sparse, expect):
+                    np.testing.assert_array_equal(d[key], e[key])
+                    np.testing.assert_array_equal(
+                        self.to_dense(s, i, len(self.anchor_masks[i]), grid),
+                        d[key])
+
+    def test_random_gt(self):
+        rng = np.random.RandomState(0)
+        self.check(self.make_samples(rng, [1, 10, 50, 3]))
+
+    def test_empty_gt(self):
+        rng = np.random.RandomState(1)
+        self.check(self.make_samples(rng, [0, 5, 0]))
+        self.check(self.make_samples(rng, [0, 0]))
+
+    def test_border_gt(self):
+        rng = np.random.RandomState(2)
+        self.check(self.make_border_samples(rng))
+
+
 if __name__ == "__main__":
     unittest.main()
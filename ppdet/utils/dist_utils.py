@@ -0,0 +1,90 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pickle
+import numpy as np
+
+import paddle
+import paddle.distributed as dist
+from paddle.io import BatchSampler
+
+__all__ = ['all_gather_object', 'ShardedBatchSampler']
+
+
+def all_gather_object(obj):
+    """
+    Gather a picklable object of each rank, objects are pickled to uint8
+    tensors padded to the longest one and gathered by all_gather.
+
+    Returns:
+        list of the objects in the order of ranks.
+    """
+    if dist.get_world_size() < 2:
+        return [obj]
+    data = np.frombuffer(
+        pickle.dumps(
+            obj, protocol=pickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+    sizes = []
+    dist.all_gather(sizes, paddle.to_tensor([data.shape[0]], dtype='int64'))
+    sizes = [int(s.numpy()[0]) for s in sizes]
+    buf = np.zeros((max(sizes), ), dtype=np.uint8)
+    buf[:data.shape[0]] = data
+    tensors = []
+    dist.all_gather(tensors, paddle.to_tensor(buf))
+    return [
+        pickle.loads(t.numpy()[:size].tobytes())
+        for t, size in zip(tensors, sizes)
+    ]
+
+
+class ShardedBatchSampler(BatchSampler):
+    """
+    Batch sampler to evaluate on multiple devices. Unlike
+    DistributedBatchSampler, samples are split to contiguous shards by rank
+    without padding or shuffling, so each sample is evaluated once and the
+    results gathered in the order of ranks are in the order of the dataset.
+
+    Args:
+        dataset (Dataset): dataset to sample.
+        batch_size (int): number of samples in a batch.
+        num_replicas (int): number of shards, world size by default.
+        rank (int): index of the shard, rank of this process by default.
+    """
+
+    def __init__(self, dataset, batch_size, num_replicas=None, rank=None):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.nranks = num_replicas if num_replicas is not None \
+            else dist.get_world_size()
+        self.local_rank = rank if rank is not None else dist.get_rank()
+
+    def _shard(self):
+        # dataset is parsed after the sampler is built in reader
+        num_samples = len(self.dataset)
+        start = num_samples * self.local_rank // self.nranks
+        end = num_samples * (self.local_rank + 1) // self.nranks
+        return start, end
+
+    def __iter__(self):
+        start, end = self._shard()
+        for idx in range(start, end, self.batch_size):
+            yield list(range(idx, min(idx + self.batch_size, end)))
+
+    def __len__(self):
+        start, end = self._shard()
+        return (end - start + self.batch_size - 1) // self.batch_size
@@ -0,0 +1,71 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+
+# add python path of PadleDetection to sys.path
+parent_path = os.path.abspath(os.path.join(__file__, *(['..'] * 2)))
+sys.path.insert(0, parent_path)
+
+from ppdet.core.workspace import load_config, merge_config
+from ppdet.utils.cli import ArgsParser
+from ppdet.data.source.record import write_records
+
+from ppdet.utils.logger import setup_logger
+logger = setup_logger('convert_records')
+
+
+def parse_args():
+    parser = ArgsParser()
+    parser.add_argument(
+        "--dataset",
+        default='TrainDataset',
+        type=str,
+        help="Dataset in config to convert, e.g. TrainDataset, EvalDataset.")
+    parser.add_argument(
+        "--output_dir",
+        default=None,
+        type=str,
+        help="Directory to save record shards.")
+    parser.add_argument(
+        "--shard_size",
+        default=1024,
+        type=int,
+        help="Number of records in each shard.")
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    FLAGS = parse_args()
+    cfg = load_config(FLAGS.config)
+    merge_config(FLAGS.opt)
+
+    assert FLAGS.output_dir is not None, \
+        "Please specify --output_dir to save record shards."
+    dataset = cfg[FLAGS.dataset]
+    dataset.check_or_download_dataset()
+    dataset.parse_dataset()
+    num = write_records(dataset, FLAGS.output_dir, FLAGS.shard_size)
+    logger.info("Converted {} records of {} to {}".format(
+        num, FLAGS.dataset, FLAGS.output_dir))
+
+
+if __name__ == '__main__':
+    main()
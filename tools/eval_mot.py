@@ -32,7 +32,7 @@ import paddle
 from ppdet.core.workspace import load_config, merge_config
 from ppdet.utils.check import check_gpu, check_npu, check_xpu, check_version, check_config
 from ppdet.utils.cli import ArgsParser
-from ppdet.engine import Tracker
+from ppdet.engine import Tracker, init_parallel_env
 
 
 def parse_args():
@@ -55,6 +55,12 @@ def parse_args():
         '--save_videos',
         action='store_true',
         help='Save tracking results (video).')
+    parser.add_argument(
+        '--vis_scale',
+        type=float,
+        default=1.,
+        help='Scale of the saved video, frames are drawn on the downscaled '
+        'copies when < 1.')
     parser.add_argument(
         '--show_image',
         action='store_true',
@@ -76,6 +82,9 @@ def run(FLAGS, cfg):
     seqs = os.listdir(data_root)
     seqs.sort()
 
+    # init parallel environment if nranks > 1
+    init_parallel_env()
+
     # build Tracker
     tracker = Tracker(cfg, mode='eval')
 
@@ -96,7 +105,8 @@ def run(FLAGS, cfg):
         save_videos=FLAGS.save_videos,
         show_image=FLAGS.show_image,
         scaled=FLAGS.scaled,
-        det_results_dir=FLAGS.det_results_dir)
+        det_results_dir=FLAGS.det_results_dir,
+        vis_scale=FLAGS.vis_scale)
 
 
 def main():
@@ -66,6 +66,12 @@ def parse_args():
         '--save_videos',
         action='store_true',
         help='Save tracking results (video).')
+    parser.add_argument(
+        '--vis_scale',
+        type=float,
+        default=1.,
+        help='Scale of the saved video, frames are drawn on the downscaled '
+        'copies when < 1.')
     parser.add_argument(
         '--show_image',
         action='store_true',
@@ -108,7 +114,8 @@ def run(FLAGS, cfg):
         show_image=FLAGS.show_image,
         scaled=FLAGS.scaled,
         det_results_dir=FLAGS.det_results_dir,
-        draw_threshold=FLAGS.draw_threshold)
+        draw_threshold=FLAGS.draw_threshold,
+        vis_scale=FLAGS.vis_scale)
 
 
 def main():